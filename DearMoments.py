@@ -1,9 +1,24 @@
 from dear_moments.service import Services
-from dear_moments import DearMomentsConfig
-from dear_moments.core.pipeline import StoragePipeline, QueryPipeline
+from dear_moments import AppContext, DearMomentsConfig
+from dear_moments.core.pipeline import (
+    StoragePipeline,
+    QueryPipeline,
+    StageAutoscaler,
+    PipelineCheckpoint,
+    make_queue_factory,
+    make_priority_gate,
+)
+from dear_moments.core.storage_processors.context_window import ContextWindowManager
+from dear_moments.core.query_processors import Prefetcher, recent_window
+from dear_moments.metrics import MetricsServer, metrics
+from dear_moments.tracing import tracer
 from dear_moments.models import Message, Context, ContextList, SystemPrompt
+from typing import Dict
 import asyncio
+import contextlib
+import os
 import signal
+import time
 
 
 class DearMoments:
@@ -12,31 +27,241 @@ class DearMoments:
         self.stop_event = asyncio.Event()
 
     async def initialize(self):
-        """初始化服务"""
-        # 数据初始化
-        # 初始化服务
-        self.services = Services.get_instance()
-        # 初始化配置
-        self.config = DearMomentsConfig.get_instance()
-
-        # 初始化管道处理器
-        # 存储方向
-        self.storage_pipeline = StoragePipeline()
-        await self.storage_pipeline.create_message_processor_stage(workers=1)
-        await self.storage_pipeline.create_embedding_stage(workers=1)
-        await self.storage_pipeline.create_storage_stage(workers=1)
-        await self.storage_pipeline.start()
-
-        # 查询方向
-        self.query_pipeline = QueryPipeline()
-        await self.query_pipeline.create_query_embedding_stage(workers=1)
-        await self.query_pipeline.create_vector_search_stage(workers=1)
-        await self.query_pipeline.create_result_processing_stage(workers=1)
-        await self.query_pipeline.start()
+        """
+        初始化服务
+
+        启动按阶段依次执行, 每个阶段的耗时记录在 startup_timings 中并写入日志;
+        服务在第一次使用时才创建, 启用 app.warmup 时在预热阶段提前创建
+        """
+        self.logger = AppContext.get_instance().get("logger")
+        self.startup_timings: Dict[str, float] = {}
+        start_time = time.perf_counter()
+
+        with self._phase("服务"):
+            self.services = Services.get_instance()
+            self.config = DearMomentsConfig.get_instance()
+            workers = self.config.get("app.workers", 2)
+            queue_size = self.config.get("app.max_queue_size", 100)
+            queue_factory = make_queue_factory(self.config.get("app.scheduling"))
+        with self._phase("存储管道"):
+            await self._build_storage_pipeline(queue_factory, queue_size, workers)
+        with self._phase("查询管道"):
+            await self._build_query_pipeline(queue_factory, queue_size, workers)
+        with self._phase("调度"):
+            self._configure_scheduling()
+        with self._phase("启动管道"):
+            await self.storage_pipeline.start()
+            await self.query_pipeline.start()
+            if self.autoscaler is not None:
+                await self.autoscaler.start()
+            if self.prefetcher is not None:
+                await self.prefetcher.start()
+        with self._phase("回放检查点"):
+            await self.storage_pipeline.replay()
+        with self._phase("可观测性"):
+            self._register_gauges()
+            tracer().configure(self.config.get("app.tracing"))
+            await tracer().start()
+            self.metrics_server = MetricsServer.from_config(
+                self.config.get("app.metrics")
+            )
+            if self.metrics_server is not None:
+                await self.metrics_server.start()
+        warmup = self.config.get("app.warmup", {})
+        if warmup.get("enabled", False):
+            with self._phase("预热"):
+                await self._warm_up(warmup)
 
         self.running = True
+        self.logger.info(
+            f"DearMoments启动耗时 {time.perf_counter() - start_time:.3f}s: "
+            + ", ".join(
+                f"{phase} {seconds * 1000:.1f}ms"
+                for phase, seconds in self.startup_timings.items()
+            )
+        )
         return self
 
+    @contextlib.contextmanager
+    def _phase(self, name: str):
+        """记录一个启动阶段的耗时"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = time.perf_counter() - start_time
+
+    async def _build_storage_pipeline(self, queue_factory, queue_size, workers):
+        """创建存储管道的各个阶段"""
+        self.storage_pipeline = StoragePipeline(queue_factory)
+        # 关闭时没有处理完的消息从所在阶段继续, 已经完成的LLM和嵌入调用不会重做
+        self.storage_pipeline.checkpoint = PipelineCheckpoint(
+            os.path.join(
+                self.config.get("app.shutdown.checkpoint_dir", "data/checkpoints"),
+                "storage.ckpt",
+            )
+        )
+        # 超过截止时间仍未处理的消息已经没有意义, 在调用LLM之前丢弃
+        self.storage_pipeline.default_timeout = self.config.get("storage.deadline")
+        batch_config = self.config.get("storage.batch_extraction", {})
+        if batch_config.get("enabled", False):
+            # 批量提取依赖并发到达的消息, 工作者数量与批大小一致
+            batch_size = batch_config.get("max_batch_size", 8)
+            await self.storage_pipeline.create_message_processor_stage(
+                max_queue_size=queue_size,
+                workers=batch_size,
+                batch_size=batch_size,
+                max_linger_ms=batch_config.get("max_linger_ms", 50),
+                prompt_token_budget=batch_config.get("prompt_token_budget", 12000),
+            )
+        else:
+            await self.storage_pipeline.create_message_processor_stage(
+                max_queue_size=queue_size, workers=workers
+            )
+        embedding_batch = self.config.get("storage.embedding_batch", {})
+        await self.storage_pipeline.create_embedding_stage(
+            max_queue_size=queue_size,
+            workers=1,
+            batch_size=embedding_batch.get("max_batch_size", 1),
+            max_linger_ms=embedding_batch.get("max_linger_ms", 20),
+        )
+        # 关键词索引与嵌入计算并行, 在向量存储阶段汇合
+        keyword_search = self.config.get("query.keyword_search", False)
+        if keyword_search:
+            await self.storage_pipeline.create_keyword_stage(
+                max_queue_size=queue_size, workers=1
+            )
+        await self.storage_pipeline.create_storage_stage(
+            max_queue_size=queue_size, workers=1, keyword_index=keyword_search
+        )
+
+    async def _build_query_pipeline(self, queue_factory, queue_size, workers):
+        """创建查询管道的各个阶段"""
+        self.query_pipeline = QueryPipeline(queue_factory)
+        top_k = self.config.get("query.top_k", 5)
+        keyword_search = self.config.get("query.keyword_search", False)
+        if keyword_search:
+            # 查询解析后分叉: 查询嵌入 -> 向量搜索 与 关键词搜索 并行, 再汇合
+            await self.query_pipeline.create_query_parse_stage(
+                max_queue_size=queue_size, workers=1
+            )
+        await self.query_pipeline.create_query_embedding_stage(
+            max_queue_size=queue_size, workers=workers
+        )
+        # 搜索放在执行器中时, 工作者数量与执行器的线程/进程数一致才能用满所有核
+        search_executor = self.config.get("query.search_executor")
+        search_workers = self.config.get("query.search_workers") or os.cpu_count()
+        await self.query_pipeline.create_vector_search_stage(
+            max_queue_size=queue_size,
+            workers=search_workers if search_executor else 1,
+            executor=search_executor,
+            executor_workers=search_workers,
+            top_k=top_k,
+        )
+        if keyword_search:
+            await self.query_pipeline.create_keyword_search_stage(
+                max_queue_size=queue_size, workers=1, top_k=top_k
+            )
+            await self.query_pipeline.create_result_merge_stage(
+                max_queue_size=queue_size, workers=1, top_k=top_k
+            )
+        await self.query_pipeline.create_result_processing_stage(
+            max_queue_size=queue_size, workers=1
+        )
+        # 对话空闲时用最近的消息提前检索, recall 直接命中缓存
+        self.prefetcher = Prefetcher.from_config(
+            self.query_pipeline, self.config.get("query.prefetch")
+        )
+
+    def _configure_scheduling(self):
+        """阶段的放置、远端调用配额和自动扩缩容"""
+        # 按配置把部分阶段放到独立进程, 如嵌入计算, 减轻主进程事件循环的负担
+        placement = self.config.get("app.placement", {})
+        for pipeline in (self.storage_pipeline, self.query_pipeline):
+            pipeline.set_placement(placement)
+
+        # 两个管道共享API配额, 远端调用按优先级竞争同一组并发空位
+        self.remote_gate = make_priority_gate(self.config.get("app.scheduling"))
+        for stage in self.storage_pipeline.stages + self.query_pipeline.stages:
+            if stage.rate_limited:
+                stage.gate = self.remote_gate
+
+        # 按队列深度自动扩缩容, 远端API阶段可以扩到更高的并发
+        autoscaling = self.config.get("app.autoscaling", {})
+        for pipeline in (self.storage_pipeline, self.query_pipeline):
+            pipeline.set_worker_bounds(
+                remote_max_workers=autoscaling.get("remote_max_workers", 8),
+                local_max_workers=autoscaling.get("local_max_workers", 2),
+            )
+        self.autoscaler = StageAutoscaler.from_config(
+            self.storage_pipeline.stages + self.query_pipeline.stages, autoscaling
+        )
+
+    async def _warm_up(self, config: dict):
+        """
+        提前创建所有服务, 可选地调用一次嵌入服务建立连接
+
+        Args:
+            config (dict): 预热配置 app.warmup
+        """
+        timings = self.services.warm_up()
+        if timings:
+            self.logger.info(
+                "服务创建耗时: "
+                + ", ".join(f"{name} {t * 1000:.1f}ms" for name, t in timings.items())
+            )
+        if config.get("probe_embedding", False):
+            # 消耗一次嵌入调用的配额, 换来第一个查询不再承担TLS握手和连接建立
+            await self.services.get_embedding_service().get_embedding("预热")
+
+    def _register_gauges(self):
+        """注册导出时才读取的仪表: 队列深度、工作者数量、向量库和上下文的规模"""
+        registry = metrics()
+        stages = [
+            (pipeline.name, stage)
+            for pipeline in (self.storage_pipeline, self.query_pipeline)
+            for stage in pipeline.stages
+        ]
+        registry.gauge(
+            "stage_queue_depth",
+            "阶段输入队列中等待的请求数",
+            lambda: {
+                (("pipeline", p), ("stage", s.name)): s.backlog()
+                for p, s in stages
+            },
+        )
+        registry.gauge(
+            "stage_workers",
+            "阶段当前的工作者数量",
+            lambda: {(("pipeline", p), ("stage", s.name)): s.workers for p, s in stages},
+        )
+        registry.gauge(
+            "vector_store_size",
+            "向量库中的向量数",
+            lambda: len(Services.vector_storage()),
+        )
+        registry.gauge(
+            "startup_phase_seconds",
+            "最近一次启动中每个阶段的耗时",
+            lambda: {
+                (("phase", phase),): seconds
+                for phase, seconds in self.startup_timings.items()
+            },
+        )
+        registry.gauge(
+            "context_resident",
+            "常驻内存的上下文规模, kind为 contexts/bytes",
+            self._context_gauge,
+        )
+
+    @staticmethod
+    def _context_gauge():
+        stats = ContextList.get_instance().get_statistics()
+        return {
+            (("kind", "contexts"),): stats["resident_contexts"],
+            (("kind", "bytes"),): stats["resident_bytes"],
+        }
+
     async def run_forever(self):
         """让服务持续运行直到收到停止信号"""
         if not self.running:
@@ -50,11 +275,32 @@ class DearMoments:
         self.running = False
         self.stop_event.set()
 
+        if getattr(self, "metrics_server", None) is not None:
+            await self.metrics_server.stop()
+
         # 关闭管道
-        if hasattr(self, "storage_pipeline"):
-            await self.storage_pipeline.stop()
-        if hasattr(self, "query_pipeline"):
-            await self.query_pipeline.stop()
+        if getattr(self, "autoscaler", None) is not None:
+            await self.autoscaler.stop()
+        if getattr(self, "prefetcher", None) is not None:
+            await self.prefetcher.stop()
+        # 两个管道同时排空, 查询没有检查点, 超时后直接取消
+        drain_timeout = self.config.get("app.shutdown.drain_timeout", 30)
+        await asyncio.gather(
+            *[
+                pipeline.stop(drain_timeout)
+                for pipeline in (
+                    getattr(self, "storage_pipeline", None),
+                    getattr(self, "query_pipeline", None),
+                )
+                if pipeline is not None
+            ]
+        )
+
+        await tracer().stop()
+
+        # 取消未完成的上下文摘要任务, 并把上下文写入磁盘供下次启动加载
+        await ContextWindowManager.get_instance().close()
+        ContextList.spill_all()
 
         # 关闭服务
         if hasattr(self, "services"):
@@ -68,20 +314,78 @@ class DearMoments:
 
         Args:
             message (str): 要存储的消息内容
+
+        Returns:
+            PipelineRequest: 请求信封, 需要确认存储完成时可以 await request.future
+
+        Raises:
+            PipelineOverloadedError: 存储管道过载, 消息没有被接收
         """
         if not self.running:
             raise RuntimeError("DearMoments服务尚未初始化")
         return await self.storage_pipeline.process(message)
 
-    async def query(self, query_text):
+    async def query(self, query_text, timeout=None, memory_id=None):
         """查询消息的API
 
         Args:
             query_text (str): 要查询的文本内容
+            timeout (float, optional): 超时时间(秒), 默认使用配置 query.timeout
+            memory_id (str, optional): 发起查询的记忆ID, 用于在租户之间公平调度
+
+        Returns:
+            List[Dict]: 按相似度排序的检索结果
+
+        Raises:
+            PipelineOverloadedError: 查询管道过载, 预计无法在超时前完成
+            PipelineTimeoutError: 查询超时
         """
         if not self.running:
             raise RuntimeError("DearMoments服务尚未初始化")
-        return await self.query_pipeline.process(query_text)
+        if memory_id is not None and self.prefetcher is not None:
+            results = self.prefetcher.lookup(memory_id, query_text)
+            if results is not None:
+                return results
+        return await self._search(query_text, timeout, memory_id)
+
+    async def recall(self, memory_id, timeout=None):
+        """检索与当前对话相关的记忆的API
+
+        用该记忆最近的几条消息作为查询; 对话空闲时已经预检索过的直接返回缓存的结果
+
+        Args:
+            memory_id (str): 记忆ID
+            timeout (float, optional): 超时时间(秒), 默认使用配置 query.timeout
+
+        Returns:
+            List[Dict]: 按相似度排序的检索结果, 该记忆没有上下文时为空列表
+
+        Raises:
+            PipelineOverloadedError: 查询管道过载, 预计无法在超时前完成
+            PipelineTimeoutError: 查询超时
+        """
+        if not self.running:
+            raise RuntimeError("DearMoments服务尚未初始化")
+        context = ContextList.get_by_memory_id(memory_id)
+        if context is None or not context.context:
+            return []
+        window = self.config.get("query.prefetch.window_messages", 8)
+        version, text = context.total_count, recent_window(context, window)
+        if self.prefetcher is None:
+            return await self._search(text, timeout, memory_id) or []
+        results = self.prefetcher.lookup(memory_id, text)
+        if results is None:
+            results = await self._search(text, timeout, memory_id) or []
+            # 对话继续之前再次 recall 也能命中
+            self.prefetcher.store(memory_id, version, text, results)
+        return results
+
+    async def _search(self, query_text, timeout, memory_id):
+        if timeout is None:
+            timeout = self.config.get("query.timeout", 10)
+        return await self.query_pipeline.process(
+            query_text, wait=True, timeout=timeout, tenant=memory_id
+        )
 
 
 if __name__ == "__main__":
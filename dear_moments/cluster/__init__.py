@@ -0,0 +1,28 @@
+from .auth import CLUSTER_TOKEN_HEADER, cluster_headers, cluster_request_allowed
+from .hash_ring import HashRing
+from .router import ClusterRouter, ShardError
+
+# 迁移函数只在记忆节点上使用, 按需导入, 路由器进程不加载numpy和存储模块
+_MIGRATION = ("prepare_export", "export_memories", "import_memory", "delete_memories")
+
+
+def __getattr__(name: str):
+    if name in _MIGRATION:
+        from . import migration
+
+        return getattr(migration, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = [
+    "HashRing",
+    "ClusterRouter",
+    "ShardError",
+    "CLUSTER_TOKEN_HEADER",
+    "cluster_headers",
+    "cluster_request_allowed",
+    "prepare_export",
+    "export_memories",
+    "import_memory",
+    "delete_memories",
+]
@@ -0,0 +1,50 @@
+"""
+集群管理接口的访问控制
+
+迁移接口(导出、导入、删除)和路由器的增加分片接口可以读取或删除任意记忆, 不能对外开放:
+配置了共享密钥 cluster.token 时请求需要在 X-Cluster-Token 头中带上它,
+没有配置时只接受来自本机的请求
+"""
+
+import hmac
+import ipaddress
+from typing import Optional
+
+CLUSTER_TOKEN_HEADER = "X-Cluster-Token"
+
+
+def cluster_request_allowed(
+    headers, remote: Optional[str], token: Optional[str]
+) -> bool:
+    """
+    检查请求能否调用集群管理接口
+
+    Args:
+        headers (Mapping[str, str]): 请求头
+        remote (Optional[str]): 对端地址
+        token (Optional[str]): 共享密钥, 为空时只允许本机请求
+
+    Returns:
+        bool: 允许时为True
+    """
+    if token:
+        return hmac.compare_digest(
+            headers.get(CLUSTER_TOKEN_HEADER, "").encode("utf-8"), token.encode("utf-8")
+        )
+    try:
+        return ipaddress.ip_address(remote or "").is_loopback
+    except ValueError:
+        return False
+
+
+def cluster_headers(token: Optional[str]) -> dict:
+    """
+    调用其他节点的集群管理接口时附带的请求头
+
+    Args:
+        token (Optional[str]): 共享密钥
+
+    Returns:
+        dict: 请求头, 没有配置密钥时为空
+    """
+    return {CLUSTER_TOKEN_HEADER: token} if token else {}
@@ -0,0 +1,69 @@
+"""
+一致性哈希环, 把 memory_id 映射到分片
+"""
+
+import bisect
+import hashlib
+from typing import Dict, List, Tuple
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    一致性哈希环, 每个分片在环上有 vnodes 个虚拟节点
+
+    增加一个分片时只有落到它的虚拟节点上的 memory_id 改变归属, 其余保持不动
+    """
+
+    def __init__(self, shards: Dict[str, str], vnodes: int = 64):
+        """
+        Args:
+            shards (Dict[str, str]): 分片名称 -> 分片的服务地址
+            vnodes (int): 每个分片的虚拟节点数, 越多分布越均匀
+        """
+        if not shards:
+            raise ValueError("哈希环至少需要一个分片")
+        self.shards = dict(shards)
+        self.vnodes = vnodes
+        points: List[Tuple[int, str]] = sorted(
+            (_hash(f"{name}#{i}"), name) for name in self.shards for i in range(vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    def shard_for(self, memory_id: str) -> str:
+        """
+        查找 memory_id 所属的分片
+
+        Args:
+            memory_id (str): 记忆ID
+
+        Returns:
+            str: 分片名称
+        """
+        index = bisect.bisect(self._points, _hash(memory_id)) % len(self._points)
+        return self._owners[index]
+
+    def with_shard(self, name: str, url: str) -> "HashRing":
+        """
+        返回增加一个分片后的新哈希环
+
+        Args:
+            name (str): 分片名称
+            url (str): 分片的服务地址
+
+        Returns:
+            HashRing: 新的哈希环
+        """
+        return HashRing({**self.shards, name: url}, self.vnodes)
+
+    def to_dict(self) -> Dict:
+        """可以JSON序列化的描述, 分片节点据此判断哪些记忆需要迁出"""
+        return {"shards": self.shards, "vnodes": self.vnodes}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HashRing":
+        return cls(data["shards"], data.get("vnodes", 64))
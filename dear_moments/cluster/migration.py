@@ -0,0 +1,147 @@
+"""
+分片节点之间的记忆迁移
+
+增加分片后, 每个原有节点等待这些记忆还在存储管道中的请求完成, 再把归属改变的记忆
+(向量记录和对话上下文)逐条导出, 路由器把导出流原样转发给新分片导入,
+所有原有节点都导入完成并切换哈希环之后再通知原节点删除
+"""
+
+import base64
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from dear_moments.config import DearMomentsConfig
+from dear_moments.core.pipeline import PipelineTimeoutError
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.models import Context, ContextList
+from dear_moments.service import Services
+from dear_moments.store.keyword import text_of, tokenize
+from .hash_ring import HashRing
+
+
+def _local_memory_ids() -> Set[str]:
+    """本节点上有向量记录或上下文(包括已经换出到磁盘的)的记忆ID"""
+    return Services.vector_storage().memory_ids() | ContextList.memory_ids()
+
+
+async def prepare_export(
+    ring: HashRing,
+    node: str,
+    pipeline: Optional[BasePipeline] = None,
+    drain_timeout: Optional[float] = 30.0,
+) -> Set[str]:
+    """
+    找出按新哈希环不再归属本节点的记忆, 并等待存储管道中这些记忆未完成的请求
+
+    路由器只能暂停之后的写入, 之前已经进入本节点的消息可能还在管道中: 不等它们完成就导出,
+    它们抽取出的记录会在导出之后写入原节点, 导出的上下文也缺少这些消息
+
+    Args:
+        ring (HashRing): 增加分片之后的哈希环
+        node (str): 本节点在哈希环中的分片名称
+        pipeline (Optional[BasePipeline]): 本节点的存储管道
+        drain_timeout (Optional[float]): 等待管道中未完成请求的最长时间(秒)
+
+    Returns:
+        Set[str]: 需要迁出的记忆ID
+
+    Raises:
+        PipelineTimeoutError: 超时后仍有未完成的请求, 这次迁移应该放弃
+    """
+    candidates = _local_memory_ids()
+    if pipeline is not None:
+        # 还没有创建上下文的新对话只出现在管道中
+        candidates |= {str(tenant) for tenant in pipeline.pending_tenants()}
+    moving = {m for m in candidates if ring.shard_for(m) != node}
+    if pipeline is not None and not await pipeline.wait_for_tenants(
+        moving, drain_timeout
+    ):
+        raise PipelineTimeoutError(
+            f"等待迁出记忆的存储请求超时 ({drain_timeout}s), 放弃导出"
+        )
+    return moving
+
+
+async def export_memories(memory_ids: Set[str]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    逐条产出这些记忆的向量记录和对话上下文
+
+    导出不修改本地数据, 最后一条是 {"kind": "end"}, 带有之后需要删除的记录ID和记忆ID
+
+    Args:
+        memory_ids (Set[str]): prepare_export 返回的需要迁出的记忆ID
+
+    Yields:
+        Dict[str, Any]: "record" 为一条向量记录, 向量按float32字节base64编码;
+            "context" 为一个对话上下文
+    """
+    record_ids = []
+    for record, vector in await Services.vector_storage().export(memory_ids):
+        record_ids.append(record["id"])
+        yield {
+            "kind": "record",
+            "item": record["item"],
+            "metadata": record["metadata"],
+            "embedding": base64.b64encode(vector.astype(np.float32).tobytes()).decode(),
+        }
+    for memory_id in sorted(memory_ids):
+        context = ContextList.get_by_memory_id(memory_id)
+        if context is not None:
+            yield {"kind": "context", "context": context.to_record()}
+    yield {"kind": "end", "record_ids": record_ids, "memory_ids": sorted(memory_ids)}
+
+
+async def import_memory(entry: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """
+    导入 export_memories 产出的一条记忆
+
+    上下文只在本节点还没有该记忆的上下文时导入: 迁移期间路由器暂停了这些记忆的写入,
+    已经存在说明是迁移之后新开始的对话, 保留本地的
+
+    Args:
+        entry (Dict[str, Any]): 导出的一条记忆
+
+    Returns:
+        Tuple[str, Optional[str]]: 记忆的类型("end" 表示导出结束)和本节点新建的数据:
+            记录为新的记录ID, 上下文为记忆ID, 没有新建时为None; 迁移失败时按它们回滚
+    """
+    kind = entry["kind"]
+    if kind == "record":
+        vector = np.frombuffer(base64.b64decode(entry["embedding"]), dtype=np.float32)
+        record_id = await Services.vector_storage().store(
+            entry["item"], vector, metadata=entry["metadata"]
+        )
+        if DearMomentsConfig.get_instance().get("query.keyword_search", False):
+            await Services.keyword_index().store(
+                record_id, entry["item"], tokenize(text_of(entry["item"]))
+            )
+        return kind, record_id
+    if kind == "context":
+        record = entry["context"]
+        if ContextList.get_by_memory_id(record["memory_id"]) is None:
+            ContextList.add(Context.from_record(record))
+            return kind, record["memory_id"]
+    return kind, None
+
+
+async def delete_memories(
+    record_ids: Iterable[str], memory_ids: Iterable[str]
+) -> Dict[str, int]:
+    """
+    删除已经迁移到其他分片的记录和上下文
+
+    Args:
+        record_ids (Iterable[str]): 导出时的记录ID, 导出之后新写入的记录不受影响
+        memory_ids (Iterable[str]): 迁出的记忆ID
+
+    Returns:
+        Dict[str, int]: 删除的记录数和上下文数
+    """
+    record_ids = set(record_ids)
+    records = await Services.vector_storage().delete(record_ids)
+    await Services.keyword_index().delete(record_ids)
+    contexts = sum(
+        ContextList.remove(memory_id) is not None for memory_id in memory_ids
+    )
+    return {"records": records, "contexts": contexts}
@@ -0,0 +1,470 @@
+"""
+集群路由器: 按 memory_id 把写入转发到所属分片, 查询分发到所有分片后合并
+
+路由器本身不保存记忆, 对外提供与单个记忆节点相同的 /v1/messages 和 /v1/query 接口
+"""
+
+import asyncio
+import contextlib
+import json
+import time
+from functools import partial
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+from aiohttp import web
+
+from dear_moments.app_context import AppContext
+from dear_moments.metrics import metrics
+from .auth import cluster_headers, cluster_request_allowed
+from .hash_ring import HashRing
+
+_dumps = partial(json.dumps, ensure_ascii=False, default=str)
+
+
+class ShardError(Exception):
+    """分片返回了错误状态或无法连接"""
+
+
+class ClusterRouter:
+    """
+    集群路由器
+
+    查询对每个分片单独设置截止时间, 超时或失败的分片被跳过, 返回部分结果并标记缺失的分片;
+    增加分片时暂停归属改变的记忆的写入, 把它们的向量和上下文从原分片流式迁移到新分片
+    """
+
+    def __init__(
+        self,
+        shards: Dict[str, str],
+        host: str = "127.0.0.1",
+        port: int = 8600,
+        vnodes: int = 64,
+        shard_timeout: float = 2.0,
+        top_k: int = 5,
+        token: Optional[str] = None,
+    ):
+        """
+        Args:
+            shards (Dict[str, str]): 分片名称 -> 分片的服务地址, 如 http://127.0.0.1:8701
+            host (str): 监听地址
+            port (int): 监听端口
+            vnodes (int): 哈希环上每个分片的虚拟节点数
+            shard_timeout (float): 查询时每个分片的默认截止时间(秒)
+            top_k (int): 合并后返回的结果数
+            token (Optional[str]): 集群管理接口的共享密钥, 调用分片的迁移接口时附带,
+                也用于保护路由器自己的增加分片接口; 为空时只接受本机请求
+        """
+        self.ring = HashRing(shards, vnodes)
+        self.host = host
+        self.port = port
+        self.shard_timeout = shard_timeout
+        self.top_k = top_k
+        self.token = token
+        self.logger = AppContext.get_instance().get("logger")
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._runner: Optional[web.AppRunner] = None
+        # 正在迁移时的新哈希环, 以及迁移完成的事件; 同一时间只进行一次迁移
+        self._next_ring: Optional[HashRing] = None
+        self._migrated: Optional[asyncio.Event] = None
+        self._migration_lock = asyncio.Lock()
+        # 正在转发给分片的写入, 迁移开始时等待暂停之前发出的写入到达原分片
+        self._stores_in_flight: Set[asyncio.Future] = set()
+        registry = metrics()
+        self._partial_total = registry.counter(
+            "cluster_partial_queries_total", "缺少部分分片结果的查询数, 按缺失的分片统计"
+        )
+        self._shard_latency = registry.histogram(
+            "cluster_shard_seconds", "路由器等待单个分片响应的时间"
+        )
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "ClusterRouter":
+        """
+        根据配置创建路由器
+
+        Args:
+            config (Optional[dict]): 集群配置 cluster
+
+        Returns:
+            ClusterRouter: 路由器实例
+        """
+        config = config or {}
+        router = config.get("router", {})
+        return cls(
+            config.get("shards", {}),
+            host=router.get("host", "127.0.0.1"),
+            port=router.get("port", 8600),
+            vnodes=config.get("vnodes", 64),
+            shard_timeout=config.get("shard_timeout", 2.0),
+            top_k=config.get("top_k", 5),
+            token=config.get("token"),
+        )
+
+    # ===================================================
+    #                       写入
+    # ===================================================
+
+    async def _owners(self, memory_ids: List[str]) -> List[str]:
+        """
+        各个 memory_id 所属的分片, 其中有迁移中的记忆时等迁移完成后按新哈希环路由
+
+        所有归属在同一时刻确定, 确定之后到登记转发之前没有挂起点,
+        迁移开始时不会漏掉已经按旧哈希环确定了分片的写入
+        """
+        while self._next_ring is not None and any(
+            self._next_ring.shard_for(m) != self.ring.shard_for(m) for m in memory_ids
+        ):
+            await self._migrated.wait()
+        return [self.ring.shard_for(memory_id) for memory_id in memory_ids]
+
+    @contextlib.contextmanager
+    def _forwarding(self):
+        """登记一次写入转发, 迁移开始时等待已经登记的转发完成"""
+        marker = asyncio.get_running_loop().create_future()
+        self._stores_in_flight.add(marker)
+        try:
+            yield
+        finally:
+            self._stores_in_flight.discard(marker)
+            marker.set_result(None)
+
+    async def _handle_store(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if not isinstance(body, list):
+            if not isinstance(body, dict) or "memory_id" not in body:
+                return _json({"error": "消息缺少字段: memory_id"}, status=400)
+            (shard,) = await self._owners([str(body["memory_id"])])
+            with self._forwarding():
+                try:
+                    status, result = await self._post(shard, "/v1/messages", body)
+                except ShardError as e:
+                    return _json({"error": str(e), "shard": shard}, status=502)
+            return _json(result, status=status)
+
+        # 按分片分组, 每个分片一个批量请求, 结果按原顺序拼回
+        results: List[Any] = [None] * len(body)
+        valid: List[Tuple[int, Any]] = []
+        for index, item in enumerate(body):
+            if not isinstance(item, dict) or "memory_id" not in item:
+                results[index] = {"status": "error", "error": "消息缺少字段: memory_id"}
+                continue
+            valid.append((index, item))
+        owners = await self._owners([str(item["memory_id"]) for _, item in valid])
+        groups: Dict[str, List[Tuple[int, Any]]] = {}
+        for shard, entry in zip(owners, valid):
+            groups.setdefault(shard, []).append(entry)
+
+        async def forward(shard: str, group: List[Tuple[int, Any]]) -> None:
+            try:
+                status, replies = await self._post(
+                    shard, "/v1/messages", [item for _, item in group]
+                )
+                if status != 200:
+                    raise ShardError(replies.get("error", f"状态码 {status}"))
+            except ShardError as e:
+                replies = [{"status": "error", "error": str(e)}] * len(group)
+            for (index, _), reply in zip(group, replies):
+                results[index] = {**reply, "shard": shard}
+
+        with self._forwarding():
+            await asyncio.gather(*[forward(s, g) for s, g in groups.items()])
+        return _json(results)
+
+    # ===================================================
+    #                       查询
+    # ===================================================
+
+    async def _handle_query(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if isinstance(body, list):
+            results = await asyncio.gather(*[self._query(item) for item in body])
+            return _json([result for result, _ in results])
+        result, status = await self._query(body)
+        return _json(result, status=status)
+
+    async def _query(self, item: Any) -> Tuple[Dict[str, Any], int]:
+        """
+        把查询分发到所有分片, 合并各分片的前 top_k 条结果
+
+        Returns:
+            Tuple[Dict[str, Any], int]: 合并后的结果和状态码, 所有分片都失败时为503
+        """
+        if not isinstance(item, dict) or not isinstance(item.get("query"), str):
+            return {"error": "查询需要 query 字段"}, 400
+        timeout = item.get("timeout") or self.shard_timeout
+        # 分片在自己的截止时间内返回, 路由器多等一点网络往返
+        body = {**item, "timeout": timeout}
+        shards = list(self.ring.shards)
+        tasks = {
+            asyncio.create_task(self._post(shard, "/v1/query", body)): shard
+            for shard in shards
+        }
+        done, pending = await asyncio.wait(tasks, timeout=timeout + 0.5)
+        for task in pending:
+            task.cancel()
+
+        merged, missing = [], []
+        for task, shard in tasks.items():
+            if task not in done or task.exception() is not None:
+                missing.append(shard)
+                continue
+            status, reply = task.result()
+            if status != 200:
+                missing.append(shard)
+                continue
+            merged.extend({**record, "shard": shard} for record in reply["results"])
+        for shard in missing:
+            self._partial_total.inc(shard=shard)
+        if len(missing) == len(shards):
+            return {"error": "所有分片都没有在截止时间内返回", "missing_shards": missing}, 503
+
+        merged.sort(key=lambda record: record.get("score", 0.0), reverse=True)
+        top_k = item.get("top_k") or self.top_k
+        return {
+            "results": merged[:top_k],
+            "partial": bool(missing),
+            "missing_shards": missing,
+        }, 200
+
+    # ===================================================
+    #                     分片管理
+    # ===================================================
+
+    async def _handle_shards(self, request: web.Request) -> web.Response:
+        return _json(self.ring.to_dict())
+
+    async def _handle_add_shard(self, request: web.Request) -> web.Response:
+        if not cluster_request_allowed(request.headers, request.remote, self.token):
+            return _json({"error": "集群接口需要正确的 X-Cluster-Token"}, status=403)
+        body = await request.json()
+        name, url = body.get("name"), body.get("url")
+        if not name or not url:
+            return _json({"error": "需要 name 和 url"}, status=400)
+        if name in self.ring.shards:
+            return _json({"error": f"分片 {name} 已经存在"}, status=409)
+        try:
+            stats = await self.add_shard(name, url)
+        except ShardError as e:
+            return _json({"error": str(e)}, status=502)
+        return _json(stats)
+
+    async def add_shard(self, name: str, url: str) -> Dict[str, Any]:
+        """
+        增加分片并迁移归属改变的记忆
+
+        迁移期间这些记忆的写入在路由器中等待, 其他记忆照常写入, 查询照常分发到原有分片.
+        每个原有分片的导出流直接转发给新分片导入; 所有原有分片都导入成功后才切换哈希环,
+        切换之后才通知原分片删除已经迁出的记忆, 任何一步失败时原分片的数据都保持完整
+
+        Args:
+            name (str): 分片名称
+            url (str): 分片的服务地址
+
+        Returns:
+            Dict[str, Any]: 每个原有分片迁出的记录数和上下文数
+
+        Raises:
+            ShardError: 导出或导入失败, 哈希环保持不变, 原分片没有删除任何数据;
+                已经导入新分片的记录和上下文会被删除
+        """
+        async with self._migration_lock:
+            start_time = time.monotonic()
+            self._next_ring = self.ring.with_shard(name, url)
+            self._migrated = asyncio.Event()
+            transfers: Dict[str, Dict[str, Any]] = {}
+            try:
+                # 暂停之前已经发出的写入可能还在路上, 等它们进入原分片的管道,
+                # 原分片导出之前会等待管道中这些记忆的请求完成
+                started = list(self._stores_in_flight)
+                if started:
+                    await asyncio.wait(started)
+                try:
+                    for shard in list(self.ring.shards):
+                        await self._transfer(shard, name, transfers)
+                except BaseException:
+                    await self._rollback(name, transfers)
+                    raise
+                self.ring = self._next_ring
+            finally:
+                self._next_ring = None
+                self._migrated.set()
+
+            # 新哈希环已经生效, 原分片上的副本不再被写入; 删除之前查询可能返回重复的记录
+            stats = {}
+            for shard, transfer in transfers.items():
+                await self._release_source(shard, transfer["trailer"])
+                stats[shard] = {
+                    "records": len(transfer["imported"]["record_ids"]),
+                    "contexts": len(transfer["imported"]["memory_ids"]),
+                    "memory_ids": len(transfer["trailer"]["memory_ids"]),
+                }
+            self.logger.info(
+                f"增加分片 {name}, 迁移耗时 {time.monotonic() - start_time:.2f}s: {stats}"
+            )
+            return {"shards": self.ring.to_dict()["shards"], "moved": stats}
+
+    async def _transfer(
+        self, source: str, target: str, transfers: Dict[str, Dict[str, Any]]
+    ) -> None:
+        """
+        把 source 上归属 target 的记忆流式转发给 target 导入, 不删除 source 上的数据
+
+        新分片返回它创建的记录ID和上下文的记忆ID, 连同导出流的结束行记录在 transfers 中;
+        导入部分成功时也会记录, 回滚时删除
+        """
+        trailer: Dict[str, Any] = {}
+        export_url = self.ring.shards[source] + "/v1/cluster/export"
+        import_url = self._next_ring.shards[target] + "/v1/cluster/import"
+        export_body = {"ring": self._next_ring.to_dict(), "node": source}
+        headers = cluster_headers(self.token)
+
+        try:
+            async with self._session.post(
+                export_url, json=export_body, headers=headers
+            ) as export:
+                if export.status != 200:
+                    raise ShardError(f"分片 {source} 导出失败: 状态码 {export.status}")
+
+                async def relay():
+                    # 结束行留给路由器, 其余行原样转发, 不在路由器中缓存整个分片的数据
+                    async for line in export.content:
+                        if line.startswith(b'{"kind": "end"'):
+                            trailer.update(json.loads(line))
+                            continue
+                        yield line
+
+                async with self._session.post(
+                    import_url, data=relay(), headers=headers
+                ) as imported:
+                    reply = await imported.json()
+                    # 导入失败时新分片自己删除已经导入的部分, 成功时返回创建的ID
+                    if imported.status != 200:
+                        raise ShardError(
+                            f"分片 {target} 导入失败: {reply.get('error', imported.status)}"
+                        )
+        except (aiohttp.ClientError, json.JSONDecodeError) as e:
+            raise ShardError(f"从分片 {source} 迁移到 {target} 失败: {e}") from e
+        transfers[source] = {"trailer": trailer, "imported": reply}
+        if not trailer:
+            raise ShardError(f"分片 {source} 的导出流不完整")
+
+    async def _rollback(
+        self, target: str, transfers: Dict[str, Dict[str, Any]]
+    ) -> None:
+        """迁移失败时删除已经导入新分片的记录和上下文, 原分片没有被修改"""
+        imported = [transfer["imported"] for transfer in transfers.values()]
+        record_ids = [r for reply in imported for r in reply["record_ids"]]
+        memory_ids = [m for reply in imported for m in reply["memory_ids"]]
+        if not record_ids and not memory_ids:
+            return
+        try:
+            status, reply = await self._post(
+                target,
+                "/v1/cluster/delete",
+                {"record_ids": record_ids, "memory_ids": memory_ids},
+            )
+        except ShardError as e:
+            status, reply = None, str(e)
+        if status != 200:
+            # 新分片不在哈希环中, 残留的副本不会被查询到, 但再次加入前需要清空它的数据
+            self.logger.error(f"迁移失败后清理分片 {target} 失败, 加入前需要清空: {reply}")
+
+    async def _release_source(self, source: str, trailer: Dict[str, Any]) -> None:
+        """哈希环切换之后从原分片删除已经迁出的记录和上下文"""
+        try:
+            status, deleted = await self._post(
+                source,
+                "/v1/cluster/delete",
+                {
+                    "record_ids": trailer["record_ids"],
+                    "memory_ids": trailer["memory_ids"],
+                },
+            )
+        except ShardError as e:
+            status, deleted = None, str(e)
+        if status != 200:
+            # 新分片已经有完整的副本, 原分片残留的记录只会在查询中重复出现
+            self.logger.error(f"分片 {source} 删除已迁移的记忆失败: {deleted}")
+
+    # ===================================================
+    #                      健康检查
+    # ===================================================
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return _json({"status": "ok"})
+
+    async def _handle_ready(self, request: web.Request) -> web.Response:
+        """至少一个分片就绪时路由器就绪, 查询可以返回部分结果"""
+
+        async def probe(shard: str) -> bool:
+            try:
+                async with self._session.get(
+                    self.ring.shards[shard] + "/readyz",
+                    timeout=aiohttp.ClientTimeout(total=self.shard_timeout),
+                ) as response:
+                    return response.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return False
+
+        shards = list(self.ring.shards)
+        ready = await asyncio.gather(*[probe(shard) for shard in shards])
+        body = {
+            "status": "ready" if any(ready) else "unavailable",
+            "shards": dict(zip(shards, ready)),
+            "migrating": self._next_ring is not None,
+        }
+        return _json(body, status=200 if any(ready) else 503)
+
+    # ===================================================
+    #                       HTTP
+    # ===================================================
+
+    async def _post(self, shard: str, path: str, body: Any) -> Tuple[int, Any]:
+        """向分片发送JSON请求, 返回状态码和响应体"""
+        url = (self._next_ring or self.ring).shards[shard] + path
+        # 只有集群管理接口需要密钥, 转发的写入和查询不带
+        cluster = path.startswith("/v1/cluster/")
+        headers = cluster_headers(self.token) if cluster else None
+        start_time = time.monotonic()
+        try:
+            async with self._session.post(url, json=body, headers=headers) as response:
+                return response.status, await response.json()
+        except (aiohttp.ClientError, json.JSONDecodeError) as e:
+            raise ShardError(f"分片 {shard} 请求失败: {e}") from e
+        finally:
+            self._shard_latency.observe(time.monotonic() - start_time, shard=shard)
+
+    async def start(self) -> None:
+        """启动路由器, 与各分片之间的连接保持keep-alive复用"""
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=64),
+            json_serialize=_dumps,
+        )
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/v1/messages", self._handle_store)
+        app.router.add_post("/v1/query", self._handle_query)
+        app.router.add_get("/v1/cluster/shards", self._handle_shards)
+        app.router.add_post("/v1/cluster/shards", self._handle_add_shard)
+        app.router.add_get("/healthz", self._handle_health)
+        app.router.add_get("/readyz", self._handle_ready)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.logger.info(
+            f"集群路由器: http://{self.host}:{self.port}, 分片: {list(self.ring.shards)}"
+        )
+
+    async def stop(self) -> None:
+        """停止路由器"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def _json(body: Any, status: int = 200) -> web.Response:
+    return web.json_response(body, status=status, dumps=_dumps)
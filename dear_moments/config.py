@@ -1,4 +1,5 @@
 from typing import Dict, Any, Optional
+import os
 
 
 class DearMomentsConfig:
@@ -18,9 +19,11 @@ class DearMomentsConfig:
         if DearMomentsConfig._initialized:
             return
 
-        # 加载本地默认配置, 暂定目录为config.json
+        # 加载本地默认配置, 默认为当前目录下的config.json, 可以用环境变量
+        # DEARMOMENTS_CONFIG 指定路径, 从其他目录启动或启动多个节点时使用
+        path = os.environ.get("DEARMOMENTS_CONFIG", "config.json")
         try:
-            with open("config.json", "r", encoding="utf-8") as f:
+            with open(path, "r", encoding="utf-8") as f:
                 import json
 
                 self._config = json.load(f)
@@ -32,6 +35,7 @@ class DearMomentsConfig:
                         "api_key": "",
                         "model": "gemini-2.0-flash",
                         "timeout": 30,
+                        "context_cache": {"enabled": False, "ttl": 600},
                     },
                     "embedding": {
                         "type": "gemini",
@@ -40,11 +44,113 @@ class DearMomentsConfig:
                         "timeout": 30,
                     },
                 },
+                "storage": {
+                    "deadline": 600,
+                    "context_list": {
+                        "max_contexts": 10000,
+                        "idle_seconds": 3600,
+                        "max_tokens_per_context": 8000,
+                        "spill_dir": "data/contexts",
+                    },
+                    "context_window": {
+                        "token_budget": 2000,
+                        "keep_recent_tokens": 1000,
+                        "summary_tokens": 400,
+                        "overlap_messages": 0,
+                    },
+                    "embedding_batch": {"max_batch_size": 16, "max_linger_ms": 20},
+                    "batch_extraction": {
+                        "enabled": False,
+                        "max_batch_size": 8,
+                        "max_linger_ms": 50,
+                        "prompt_token_budget": 12000,
+                    },
+                },
+                "query": {
+                    "timeout": 10,
+                    "search_executor": "thread",
+                    "search_workers": None,
+                    # 关键词检索与向量检索并行, 结果按倒数排名融合
+                    "keyword_search": True,
+                    "top_k": 5,
+                    # 对话空闲时用最近的消息提前检索, 在预算内消耗空闲的配额
+                    "prefetch": {
+                        "enabled": False,
+                        "idle_after": 5.0,
+                        "max_idle": 600.0,
+                        "window_messages": 8,
+                        "budget_per_minute": 30,
+                        "max_in_flight": 2,
+                        "max_backlog": 0,
+                        "ttl": 300.0,
+                    },
+                },
                 "app": {
                     "language": "zh-CN",
                     "log_level": "INFO",
                     "max_queue_size": 100,
                     "workers": 2,
+                    "scheduling": {
+                        "type": "fair",
+                        "classes": ["interactive", "batch"],
+                        "tenant_weights": {},
+                        "remote_concurrency": 16,
+                    },
+                    "autoscaling": {
+                        "enabled": True,
+                        "interval": 1.0,
+                        "remote_max_workers": 8,
+                        "local_max_workers": 2,
+                        "scale_up_drain_seconds": 2.0,
+                        "scale_down_ticks": 5,
+                        "cooldown": 5.0,
+                    },
+                    "shutdown": {
+                        # 关闭时等待管道排空的最长时间(秒), 超时后未完成的存储请求写入检查点
+                        "drain_timeout": 30,
+                        "checkpoint_dir": "data/checkpoints",
+                    },
+                    # 服务默认在第一次使用时创建; 启用预热后在启动时创建,
+                    # probe_embedding 额外调用一次嵌入服务建立连接
+                    "warmup": {"enabled": False, "probe_embedding": False},
+                    "metrics": {
+                        "enabled": False,
+                        "host": "127.0.0.1",
+                        "port": 9464,
+                    },
+                    # python main.py serve 启动的HTTP服务
+                    "server": {
+                        "host": "127.0.0.1",
+                        "port": 8700,
+                        "max_concurrency": 64,
+                        "max_batch_size": 256,
+                        "keepalive_timeout": 75,
+                    },
+                    # 阶段名称 -> 放置配置, 处理函数在独立进程中运行, 如
+                    # {"嵌入计算": {"transport": "shm", "concurrency": 16}};
+                    # transport 可选 "queue"、"unix"、"tcp"、"shm"
+                    "placement": {},
+                    "tracing": {
+                        "enabled": False,
+                        "sample_rate": 0.01,
+                        # "jsonl" 写入 path 目录, "otlp" 发送到 endpoint
+                        "exporter": "jsonl",
+                        "path": "data/traces",
+                        "endpoint": "http://127.0.0.1:4318",
+                        "flush_interval": 5.0,
+                    },
+                },
+                # python main.py router 启动的集群路由器, shards 为分片名称 -> 服务地址
+                "cluster": {
+                    "shards": {},
+                    "vnodes": 64,
+                    # 查询时每个分片的截止时间(秒), 超时的分片不计入结果
+                    "shard_timeout": 2.0,
+                    "top_k": 5,
+                    # 迁移和分片管理接口的共享密钥, 节点和路由器配置相同的值;
+                    # 为空时这些接口只接受来自本机的请求
+                    "token": "",
+                    "router": {"host": "127.0.0.1", "port": 8600},
                 },
             }
         DearMomentsConfig._initialized = True
@@ -1,7 +1,38 @@
 from .storage_pipeline import StoragePipeline
 from .query_pipeline import QueryPipeline
+from .pipeline_request import (
+    PipelineOverloadedError,
+    PipelineRequest,
+    PipelineTimeoutError,
+)
+from .join_stage import JoinStage
+from .autoscaler import StageAutoscaler
+from .checkpoint import CheckpointEntry, PipelineCheckpoint
+from .remote_stage import RemoteStage, RemoteStageError
+from .transport import Transport, make_transport
+from .queues import (
+    FairPriorityQueue,
+    PriorityGate,
+    make_queue_factory,
+    make_priority_gate,
+)
 
 __all__ = [
     "StoragePipeline",
     "QueryPipeline",
+    "PipelineRequest",
+    "PipelineTimeoutError",
+    "PipelineOverloadedError",
+    "JoinStage",
+    "StageAutoscaler",
+    "CheckpointEntry",
+    "PipelineCheckpoint",
+    "RemoteStage",
+    "RemoteStageError",
+    "Transport",
+    "make_transport",
+    "FairPriorityQueue",
+    "PriorityGate",
+    "make_queue_factory",
+    "make_priority_gate",
 ]
@@ -0,0 +1,205 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from .pipeline_stage import PipelineStage
+from dear_moments.app_context import AppContext
+from dear_moments.service.rate_limit import RateLimitMonitor
+
+
+@dataclass
+class _StageSample:
+    # 上一次采样时的累计值, 用于计算区间增量
+    handled: int = 0
+    failed: int = 0
+    processing_time: float = 0.0
+    # 单个请求处理时间的滑动平均(秒), 没有样本时为None
+    avg_processing: Optional[float] = None
+    # 连续空闲的采样次数
+    idle_ticks: int = 0
+    # 上一次调整工作者数量的时间
+    last_change: float = 0.0
+
+
+class StageAutoscaler:
+    """
+    按队列深度自动调整阶段的工作者数量
+
+    - 扩容: 按当前并发排空队列的预计时间超过 scale_up_drain_seconds, 且错误率不高
+    - 缩容: 队列为空且利用率低于 scale_down_utilization, 连续 scale_down_ticks 次采样
+    - 两次调整之间至少间隔 cooldown 秒, 扩缩容的条件不同, 不会来回抖动
+    - 调用远端API的阶段在最近收到过429时不扩容, 并逐步缩容到限流以下
+    """
+
+    def __init__(
+        self,
+        stages: List[PipelineStage],
+        interval: float = 1.0,
+        scale_up_drain_seconds: float = 2.0,
+        scale_down_utilization: float = 0.3,
+        scale_down_ticks: int = 5,
+        cooldown: float = 5.0,
+        max_error_rate: float = 0.5,
+        rate_limit_window: float = 30.0,
+    ):
+        """
+        初始化自动扩缩容控制器
+
+        Args:
+            stages (List[PipelineStage]): 需要管理的阶段
+            interval (float): 采样间隔(秒)
+            scale_up_drain_seconds (float): 预计排空时间超过该值时扩容
+            scale_down_utilization (float): 利用率低于该值时视为空闲
+            scale_down_ticks (int): 连续空闲多少次采样后缩容
+            cooldown (float): 同一阶段两次调整的最短间隔(秒)
+            max_error_rate (float): 错误率超过该值时不扩容, 失败多半来自下游, 加并发无济于事
+            rate_limit_window (float): 多少秒内收到过429视为正在被限流
+        """
+        self.stages = stages
+        self.interval = interval
+        self.scale_up_drain_seconds = scale_up_drain_seconds
+        self.scale_down_utilization = scale_down_utilization
+        self.scale_down_ticks = scale_down_ticks
+        self.cooldown = cooldown
+        self.max_error_rate = max_error_rate
+        self.rate_limit_window = rate_limit_window
+        self.logger = AppContext.get_instance().get("logger")
+
+        self._samples: Dict[str, _StageSample] = {
+            stage.name: _StageSample() for stage in stages
+        }
+        self._task: Optional[asyncio.Task] = None
+
+        self.scale_ups = 0
+        self.scale_downs = 0
+        self.rate_limited_downs = 0
+
+    async def start(self):
+        """启动后台采样任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台采样任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                self.logger.error(f"自动扩缩容采样失败: {e}")
+
+    def tick(self) -> None:
+        """采样一次并调整各阶段的工作者数量"""
+        now = time.monotonic()
+        monitor = RateLimitMonitor.get_instance()
+        for stage in self.stages:
+            # 每个阶段只为自己调用的服务的配额退让
+            rate_limited = stage.rate_limited and (
+                monitor.recent(self.rate_limit_window, stage.rate_limit_service) > 0
+            )
+            self._adjust(stage, self._samples[stage.name], now, rate_limited)
+
+    def _adjust(
+        self, stage: PipelineStage, sample: _StageSample, now: float, rate_limited: bool
+    ) -> None:
+        handled = stage.processed_items + stage.failed_items
+        delta_handled = handled - sample.handled
+        delta_failed = stage.failed_items - sample.failed
+        delta_time = stage.processing_time - sample.processing_time
+        sample.handled = handled
+        sample.failed = stage.failed_items
+        sample.processing_time = stage.processing_time
+
+        if delta_handled:
+            latest = delta_time / delta_handled
+            sample.avg_processing = (
+                latest
+                if sample.avg_processing is None
+                else 0.7 * sample.avg_processing + 0.3 * latest
+            )
+        error_rate = delta_failed / delta_handled if delta_handled else 0.0
+        utilization = delta_time / (self.interval * max(stage.workers, 1))
+
+        depth = stage.backlog()
+        if sample.avg_processing is None:
+            # 还没有延迟样本时, 积压超过工作者数量就认为需要更多并发
+            drain = float("inf") if depth > stage.workers else 0.0
+        else:
+            drain = depth * sample.avg_processing / max(stage.workers, 1)
+
+        if now - sample.last_change < self.cooldown:
+            return
+
+        if rate_limited:
+            # 正在被限流, 扩容只会带来更多429
+            sample.idle_ticks = 0
+            if stage.retire_worker():
+                sample.last_change = now
+                self.rate_limited_downs += 1
+                self.logger.info(f"阶段 {stage.name} 触发限流, 缩容到 {stage.workers}")
+            return
+
+        if drain > self.scale_up_drain_seconds and error_rate <= self.max_error_rate:
+            sample.idle_ticks = 0
+            if stage.add_worker():
+                sample.last_change = now
+                self.scale_ups += 1
+                self.logger.info(
+                    f"阶段 {stage.name} 积压 {depth}, 扩容到 {stage.workers}"
+                )
+            return
+
+        if depth == 0 and utilization < self.scale_down_utilization:
+            sample.idle_ticks += 1
+            if sample.idle_ticks >= self.scale_down_ticks and stage.retire_worker():
+                sample.idle_ticks = 0
+                sample.last_change = now
+                self.scale_downs += 1
+                self.logger.info(f"阶段 {stage.name} 空闲, 缩容到 {stage.workers}")
+        else:
+            sample.idle_ticks = 0
+
+    def get_statistics(self) -> dict:
+        """获取扩缩容统计信息"""
+        return {
+            "scale_ups": self.scale_ups,
+            "scale_downs": self.scale_downs,
+            "rate_limited_downs": self.rate_limited_downs,
+            "workers": {stage.name: stage.workers for stage in self.stages},
+        }
+
+    @classmethod
+    def from_config(
+        cls, stages: List[PipelineStage], config: Optional[dict]
+    ) -> Optional["StageAutoscaler"]:
+        """
+        根据配置创建自动扩缩容控制器
+
+        Args:
+            stages (List[PipelineStage]): 需要管理的阶段
+            config (Optional[dict]): 扩缩容配置, 未配置或 enabled 为False时返回None
+
+        Returns:
+            Optional[StageAutoscaler]: 控制器实例
+        """
+        if not config or not config.get("enabled", True):
+            return None
+        return cls(
+            stages,
+            interval=config.get("interval", 1.0),
+            scale_up_drain_seconds=config.get("scale_up_drain_seconds", 2.0),
+            scale_down_utilization=config.get("scale_down_utilization", 0.3),
+            scale_down_ticks=config.get("scale_down_ticks", 5),
+            cooldown=config.get("cooldown", 5.0),
+            max_error_rate=config.get("max_error_rate", 0.5),
+            rate_limit_window=config.get("rate_limit_window", 30.0),
+        )
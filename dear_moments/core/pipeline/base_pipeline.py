@@ -1,7 +1,28 @@
 import asyncio
-from typing import Any, Dict, List, Optional, TypeVar
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+    Union,
+)
+from .pipeline_request import (
+    PipelineOverloadedError,
+    PipelineRequest,
+    PipelineTimeoutError,
+)
 from .pipeline_stage import PipelineStage
+from .join_stage import JoinStage
+from .checkpoint import CheckpointEntry, PipelineCheckpoint
 from dear_moments.app_context import AppContext
+from dear_moments.metrics import metrics
+from dear_moments.tracing import tracer
 
 
 class BasePipeline:
@@ -9,24 +30,58 @@ class BasePipeline:
     基础管道类, 存储和查询管道的基类
     """
 
-    def __init__(self, name: str):
+    # 请求的默认优先级, 查询管道为 "interactive"
+    default_priority = "batch"
+
+    def __init__(
+        self,
+        name: str,
+        queue_factory: Optional[Callable[[int], asyncio.Queue]] = None,
+    ):
         """
         初始化管道
 
         Args:
             name (str): 管道名称
+            queue_factory (Optional[Callable[[int], asyncio.Queue]]):
+                输入最大容量返回阶段输入队列的函数, 为None时使用FIFO队列
         """
         self.name = name
+        self.queue_factory = queue_factory
         self.stages: List[PipelineStage] = []
         self.logger = AppContext.get_instance().get("logger")
         self._is_running = False
+        # 关闭过程中不再接收新请求
+        self._draining = False
+        # 关闭时保存未完成请求的检查点, 为None时这些请求直接取消
+        self.checkpoint: Optional[PipelineCheckpoint] = None
+        # 未指定 timeout 时请求的默认截止时间(秒), 为None时不限时
+        self.default_timeout: Optional[float] = None
+        # 准入控制拒绝的请求: queue_time 预计排队超过截止时间, queue_full 队列已满
+        self.shed_items: Dict[str, int] = {"queue_time": 0, "queue_full": 0}
+        # 按租户分组的未完成请求, 迁移记忆之前等待它们完成
+        self._tenant_requests: Dict[Hashable, Set[asyncio.Future]] = {}
+        self._request_seconds = metrics().histogram(
+            "request_seconds", "请求从进入管道到完成的总耗时"
+        )
+        self._rejected_total = metrics().counter(
+            "admission_rejected_total", "准入控制拒绝的请求数"
+        )
 
-    def add_stage(self, stage: PipelineStage) -> "BasePipeline":
+    def add_stage(
+        self, stage: PipelineStage, after: Union[str, List[str], None] = None
+    ) -> "BasePipeline":
         """
         添加处理阶段到管道
 
+        管道是一个有向无环图: 默认接在最后添加的阶段之后(线性管道);
+        多个阶段接在同一个阶段之后时该阶段的输出分叉到所有下游并行处理,
+        JoinStage 接在多个阶段之后, 按请求ID汇合各分支的输出. 第一个阶段是入口,
+        请求由唯一一个没有下游的阶段完成
+
         Args:
             stage (PipelineStage): 处理阶段
+            after (Union[str, List[str], None]): 上游阶段名称, JoinStage 需要至少两个
 
         Returns:
             BasePipeline: 管道实例
@@ -34,11 +89,73 @@ class BasePipeline:
         if self._is_running:
             raise RuntimeError("Cannot add stage while pipeline is running")
 
-        if self.stages:
-            self.stages[-1].output_queue = stage.input_queue
+        if after is None:
+            parents = self.stages[-1:]
+        else:
+            names = [after] if isinstance(after, str) else after
+            parents = [self.get_stage(name) for name in names]
+        if isinstance(stage, JoinStage):
+            if len(parents) < 2:
+                raise ValueError(f"汇合阶段 {stage.name} 需要至少两个上游阶段")
+            stage.parents = [parent.name for parent in parents]
+        elif len(parents) > 1:
+            raise ValueError(f"阶段 {stage.name} 有多个上游, 应使用 JoinStage")
+
+        if self.queue_factory is not None:
+            stage.input_queue = self.queue_factory(stage.input_queue.maxsize)
+        for parent in parents:
+            parent.downstream.append(stage)
+        stage.pipeline_name = self.name
+        stage.index = len(self.stages)
         self.stages.append(stage)
         return self
 
+    def get_stage(self, name: str) -> PipelineStage:
+        """
+        按名称获取阶段
+
+        Raises:
+            KeyError: 没有这个阶段
+        """
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(f"{self.name} 没有阶段 {name}")
+
+    def set_worker_bounds(self, remote_max_workers: int, local_max_workers: int):
+        """
+        设置各阶段自动扩缩容时的最大工作者数量
+
+        调用远端API的阶段耗时主要在等待网络, 可以给更多并发; 本地计算的阶段保持精简
+
+        Args:
+            remote_max_workers (int): 调用远端API的阶段的最大工作者数量
+            local_max_workers (int): 本地计算阶段的最大工作者数量
+        """
+        for stage in self.stages:
+            limit = remote_max_workers if stage.rate_limited else local_max_workers
+            stage.max_workers = max(stage.workers, limit)
+
+    @property
+    def accepting(self) -> bool:
+        """管道正在运行且没有在关闭, 可以接收新请求"""
+        return self._is_running and not self._draining
+
+    def set_placement(self, placement: Optional[Dict[str, Dict[str, Any]]]) -> None:
+        """
+        按阶段名称把处理函数放到独立进程中运行, 需要在 start 之前调用
+
+        Args:
+            placement (Optional[Dict[str, Dict[str, Any]]]): 阶段名称 -> 放置配置,
+                不属于本管道的阶段名称会被忽略
+        """
+        for stage in self.stages:
+            config = (placement or {}).get(stage.name)
+            if config is not None:
+                if stage.executor_type is not None:
+                    raise ValueError(f"阶段 {stage.name} 放到独立进程时不能再使用执行器")
+                stage.placement = config
+
     async def start(self):
         """
         启动所有处理阶段
@@ -46,29 +163,309 @@ class BasePipeline:
         self.logger.info(f"Starting pipeline: {self.name}")
         for stage in self.stages:
             await stage.start()
+        self._draining = False
         self._is_running = True
 
-    async def stop(self):
+    async def stop(self, drain_timeout: Optional[float] = None):
         """
-        停止所有处理阶段
+        排空并停止所有处理阶段
+
+        先停止接收新请求, 再从上游到下游逐个等待阶段处理完队列中的请求后停止,
+        上游停止时它的输出已经全部进入下游队列, 下游不会在停止后收到新请求;
+        超过 drain_timeout 时中止剩余的阶段, 未完成的请求写入检查点或取消
+
+        Args:
+            drain_timeout (Optional[float]): 排空的最长时间(秒), 为None时一直等待
         """
         self.logger.info(f"Stopping pipeline: {self.name}")
-        for stage in reversed(self.stages):
+        self._draining = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + drain_timeout if drain_timeout is not None else None
+
+        for index, stage in enumerate(self.stages):
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                await asyncio.wait_for(stage.input_queue.join(), remaining)
+            except asyncio.TimeoutError:
+                await self._abort(self.stages[index:])
+                break
             await stage.stop()
         self._is_running = False
 
-    async def process(self, item: Any):
+    async def _abort(self, stages: List[PipelineStage]) -> None:
+        """
+        中止排空超时的阶段, 未完成的请求写入检查点, 调用方的等待被取消
+
+        Args:
+            stages (List[PipelineStage]): 从第一个没有排空的阶段开始的剩余阶段
+        """
+        pending: Dict[int, PipelineRequest] = {}
+        # 先中止上游, 中止下游时不会再有新的请求流入
+        for stage in stages:
+            for request in await stage.abort():
+                if not request.future.done():
+                    pending[request.id] = request
+
+        saved = 0
+        if self.checkpoint is not None and pending:
+            saved = self.checkpoint.save(
+                # 按到达顺序保存, 恢复后保持原来的处理顺序
+                [
+                    self._checkpoint_entry(request)
+                    for _, request in sorted(pending.items())
+                ]
+            )
+        for request in pending.values():
+            request.future.cancel()
+        self.logger.warning(
+            f"{self.name} 排空超时, {len(pending)} 个请求未完成, 已保存 {saved} 个"
+        )
+
+    def _checkpoint_entry(self, request: PipelineRequest) -> CheckpointEntry:
+        if request.forks:
+            # 分叉还没有汇合, 从最外层的分叉点重新分发, 各分支重新执行
+            index, payload = request.forks[0]
+            forward = True
+        else:
+            index, payload = request.stage_index, request.payload
+            forward = False
+        return CheckpointEntry(
+            stage=self.stages[index].name,
+            payload=payload,
+            priority=request.priority,
+            tenant=request.tenant,
+            forward=forward,
+        )
+
+    async def replay(self) -> int:
+        """
+        把上次关闭时保存的请求放回各自的阶段, 需要在 start 之后调用
+
+        Returns:
+            int: 重新进入管道的请求数
+        """
+        if self.checkpoint is None:
+            return 0
+        entries = self.checkpoint.load()
+        indexes = {stage.name: i for i, stage in enumerate(self.stages)}
+        replayed = 0
+        for entry in entries:
+            index = indexes.get(entry.stage)
+            if index is None:
+                self.logger.error(f"{self.name} 没有阶段 {entry.stage}, 丢弃检查点中的请求")
+                continue
+            # 已经被接收的请求不再受截止时间限制
+            request = PipelineRequest.create(
+                entry.payload, priority=entry.priority, tenant=entry.tenant
+            )
+            request.stage_index = index
+            self._track_tenant(request)
+            if entry.forward:
+                await self.stages[index]._forward(request, entry.payload)
+            else:
+                await self.stages[index].input_queue.put(request)
+            replayed += 1
+        self.checkpoint.clear()
+        if replayed:
+            self.logger.info(f"{self.name} 从检查点恢复了 {replayed} 个请求")
+        return replayed
+
+    async def process(
+        self,
+        item: Any,
+        wait: bool = False,
+        timeout: Optional[float] = None,
+        priority: Optional[str] = None,
+        tenant: Optional[str] = None,
+    ) -> Any:
         """
         将一个东西放入管道的第一个阶段
 
         Args:
             item (Any): 要处理的项目
+            wait (bool): 是否等待最后一个阶段的输出
+            timeout (Optional[float]): 请求的截止时间(秒), 超时后剩余阶段会跳过该请求,
+                默认为管道的 default_timeout
+            priority (Optional[str]): 优先级, 默认为管道的 default_priority
+            tenant (Optional[str]): 租户, 默认取 item 的 memory_id 属性
+
+        Returns:
+            Any: wait 为True时返回最后一个阶段的输出(中途被过滤时为None),
+                否则返回请求信封, 可以稍后 await request.future
+
+        Raises:
+            PipelineOverloadedError: 有截止时间的请求预计无法按时完成, 第一个阶段的队列已满,
+                或管道正在关闭
+            PipelineTimeoutError: 等待结果超时
+            Exception: 任一阶段处理失败时抛出该阶段的异常
         """
         if not self.stages:
             raise ValueError(f"Pipeline{self.name} has no stages")
         if not self._is_running:
             raise RuntimeError(f"Pipeline{self.name} is not running")
-        await self.stages[0].input_queue.put(item)
+        if self._draining:
+            raise PipelineOverloadedError(f"{self.name} 正在关闭, 不再接收新请求")
+
+        if timeout is None:
+            timeout = self.default_timeout
+        request = PipelineRequest.create(
+            item,
+            timeout,
+            priority=priority or self.default_priority,
+            tenant=tenant if tenant is not None else getattr(item, "memory_id", None),
+        )
+        request.trace = tracer().start_trace(
+            self.name,
+            request_id=request.id,
+            priority=request.priority,
+            tenant=str(request.tenant),
+        )
+        request.future.add_done_callback(
+            lambda future: self._record_request(request, future)
+        )
+        if timeout is None:
+            # 没有截止时间的调用方接受背压, 队列满时等待
+            await self.stages[0].input_queue.put(request)
+        else:
+            try:
+                self._admit(request, timeout)
+            except PipelineOverloadedError as e:
+                if request.trace is not None:
+                    request.trace.record_error(e)
+                    request.trace.end()
+                raise
+        self._track_tenant(request)
+        if not wait:
+            return request
+        return await self.wait_for(request)
+
+    def _track_tenant(self, request: PipelineRequest) -> None:
+        """记录已经进入管道的请求, 完成(包括失败和取消)后移除"""
+        tenant = request.tenant
+        if tenant is None:
+            return
+        self._tenant_requests.setdefault(tenant, set()).add(request.future)
+
+        def untrack(future: asyncio.Future) -> None:
+            pending = self._tenant_requests.get(tenant)
+            if pending is not None:
+                pending.discard(future)
+                if not pending:
+                    del self._tenant_requests[tenant]
+
+        request.future.add_done_callback(untrack)
+
+    def pending_tenants(self) -> Set[Hashable]:
+        """
+        有未完成请求的租户
+
+        Returns:
+            Set[Hashable]: 租户(memory_id)集合
+        """
+        return set(self._tenant_requests)
+
+    async def wait_for_tenants(
+        self, tenants: Iterable[Hashable], timeout: Optional[float] = None
+    ) -> bool:
+        """
+        等待这些租户当前未完成的请求结束, 之后进入管道的请求不计入
+
+        Args:
+            tenants (Iterable[Hashable]): 租户(memory_id)
+            timeout (Optional[float]): 最长等待时间(秒), 为None时一直等待
+
+        Returns:
+            bool: 全部结束时为True, 超时为False
+        """
+        futures = [
+            future
+            for tenant in tenants
+            for future in self._tenant_requests.get(tenant, ())
+        ]
+        if not futures:
+            return True
+        _, pending = await asyncio.wait(futures, timeout=timeout)
+        return not pending
+
+    def _record_request(self, request: PipelineRequest, future: asyncio.Future):
+        """请求完成时按结果记录端到端耗时"""
+        if future.cancelled():
+            outcome = "cancelled"
+        elif future.exception() is None:
+            outcome = "ok"
+        elif isinstance(future.exception(), asyncio.TimeoutError):
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        self._request_seconds.observe(
+            time.monotonic() - request.created_at, pipeline=self.name, outcome=outcome
+        )
+        if request.trace is not None:
+            request.trace.set_attribute("outcome", outcome)
+            if outcome in ("error", "timeout"):
+                request.trace.record_error(future.exception())
+            request.trace.end()
+
+    def estimate_wait(self) -> float:
+        """
+        估算新请求走完整个管道的时间(秒)
+
+        Returns:
+            float: 关键路径上各阶段排队加处理时间的估算之和, 并行分支取最慢的一条
+        """
+        # 阶段按添加顺序排列, 上游总在下游之前
+        finish: Dict[str, float] = {}
+        for stage in self.stages:
+            start = finish.get(stage.name, 0.0)
+            done = start + stage.estimate_wait()
+            for child in stage.downstream:
+                finish[child.name] = max(finish.get(child.name, 0.0), done)
+            finish[stage.name] = done
+        return max(finish.values(), default=0.0)
+
+    def _admit(self, request: PipelineRequest, timeout: float) -> None:
+        """
+        准入控制: 预计无法在截止时间前完成时立即拒绝, 而不是让调用方在满队列上无限等待
+
+        Raises:
+            PipelineOverloadedError: 拒绝请求
+        """
+        estimate = self.estimate_wait()
+        if estimate > timeout:
+            self.shed_items["queue_time"] += 1
+            self._rejected_total.inc(pipeline=self.name, reason="queue_time")
+            raise PipelineOverloadedError(
+                f"{self.name} 过载: 预计耗时 {estimate:.2f}s 超过截止时间 {timeout:.2f}s"
+            )
+        try:
+            self.stages[0].input_queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.shed_items["queue_full"] += 1
+            self._rejected_total.inc(pipeline=self.name, reason="queue_full")
+            raise PipelineOverloadedError(f"{self.name} 过载: 输入队列已满")
+
+    async def wait_for(self, request: PipelineRequest) -> Any:
+        """
+        等待请求的最终结果
+
+        Args:
+            request (PipelineRequest): process 返回的请求信封
+
+        Returns:
+            Any: 最后一个阶段的输出
+        """
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(request.future), request.remaining()
+            )
+        except asyncio.TimeoutError:
+            # 结束future, 后续阶段看到后直接跳过这个请求
+            request.set_exception(
+                PipelineTimeoutError(f"请求 {request.id} 超时 ({self.name})")
+            )
+            raise PipelineTimeoutError(f"请求 {request.id} 超时 ({self.name})")
+        finally:
+            self.logger.debug(f"{self.name} 请求耗时: {request.get_timings()}")
 
     async def join(self):
         """
@@ -77,13 +474,12 @@ class BasePipeline:
         for stage in self.stages:
             await stage.input_queue.join()
 
-    def get_statistics(self) -> Dict[str, Dict[str, int]]:
+    def get_statistics(self) -> Dict[str, Dict[str, Any]]:
         stats = {}
         for stage in self.stages:
-            stats[stage.name] = {
-                "queue_size": stage.input_queue.qsize(),
-                "workers": stage.workers,
-                "processed_items": stage.processed_items,
-                "failed_items": stage.failed_items,
-            }
+            stats[stage.name] = stage.get_statistics()
+        stats["admission"] = {
+            "shed_items": dict(self.shed_items),
+            "estimated_wait_ms": self.estimate_wait() * 1000,
+        }
         return stats
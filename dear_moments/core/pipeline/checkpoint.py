@@ -0,0 +1,86 @@
+"""
+管道检查点: 关闭时没有处理完的请求写入磁盘, 下次启动时从原来的阶段继续
+"""
+
+import os
+import pickle
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from dear_moments.app_context import AppContext
+
+
+@dataclass
+class CheckpointEntry:
+    # 请求应该进入的阶段名称, 之前的阶段已经完成, 不会重复调用付费API
+    stage: str
+    # 该阶段的输入数据
+    payload: Any
+    priority: str = "batch"
+    tenant: Optional[str] = None
+    # 为True时 payload 是该阶段的输出, 恢复时重新分发给它的下游(用于没有汇合的分叉请求)
+    forward: bool = False
+
+
+class PipelineCheckpoint:
+    """
+    单个文件的检查点, 写入时先写临时文件再替换, 中途崩溃不会留下损坏的文件
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 检查点文件路径
+        """
+        self.path = path
+        self.logger = AppContext.get_instance().get("logger")
+
+    def save(self, entries: List[CheckpointEntry]) -> int:
+        """
+        写入检查点, 无法序列化的请求会被跳过并记录日志
+
+        Args:
+            entries (List[CheckpointEntry]): 未完成的请求
+
+        Returns:
+            int: 实际写入的请求数
+        """
+        records = []
+        for entry in entries:
+            try:
+                records.append(pickle.dumps(entry))
+            except Exception as e:
+                self.logger.error(f"无法保存阶段 {entry.stage} 的请求: {e}")
+        if not records:
+            return 0
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "wb") as f:
+            pickle.dump(records, f)
+        os.replace(f"{self.path}.tmp", self.path)
+        return len(records)
+
+    def load(self) -> List[CheckpointEntry]:
+        """
+        读取检查点, 请求重新进入管道后应调用 clear 删除
+
+        Returns:
+            List[CheckpointEntry]: 上次关闭时未完成的请求, 没有检查点时为空列表
+        """
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            records = pickle.load(f)
+
+        entries = []
+        for record in records:
+            try:
+                entries.append(pickle.loads(record))
+            except Exception as e:
+                self.logger.error(f"无法恢复检查点中的请求: {e}")
+        return entries
+
+    def clear(self) -> None:
+        """删除检查点文件"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,73 @@
+from typing import Any, Callable, Dict, List
+
+from .pipeline_request import PipelineRequest
+from .pipeline_stage import PipelineStage
+
+
+class JoinStage(PipelineStage):
+    """
+    汇合阶段: 按请求ID收集各个上游分支的输出, 全部到齐后调用合并函数
+
+    合并函数的输入是 {上游阶段名称: 该分支的输出}, 分支过滤掉的请求对应的值为None
+    """
+
+    def __init__(
+        self,
+        name: str,
+        merge_func: Callable[[Dict[str, Any]], Any],
+        max_queue_size: int = 100,
+        workers: int = 1,
+        **kwargs,
+    ):
+        """
+        初始化汇合阶段
+
+        Args:
+            name: 阶段名称
+            merge_func: 合并函数, 可以是同步或异步函数
+            max_queue_size: 队列最大容量, 所有上游分支共用
+            workers: 并行工作者数量
+            **kwargs: 传给 PipelineStage 的其他参数, 不支持批处理
+        """
+        super().__init__(name, merge_func, max_queue_size, workers, **kwargs)
+        # 上游阶段名称, 由 BasePipeline.add_stage 设置
+        self.parents: List[str] = []
+        # 已经到达一部分分支的请求: 请求ID -> {上游阶段名称: 分支信封}
+        self._partial: Dict[int, Dict[str, PipelineRequest]] = {}
+
+    async def _process_request(self, request: PipelineRequest) -> None:
+        if request.future.done():
+            # 其他分支已经失败或调用方已放弃, 丢弃已到达的部分
+            self._partial.pop(request.id, None)
+            self.shed_items["abandoned"] += 1
+            return
+
+        arrived = self._partial.get(request.id)
+        if arrived is None:
+            arrived = self._partial[request.id] = {}
+            # 请求提前结束时(分支失败、超时)释放已经到达的部分, 避免一直占用内存
+            request.future.add_done_callback(
+                lambda _, request_id=request.id: self._partial.pop(request_id, None)
+            )
+        arrived[request.branch] = request
+        if len(arrived) < len(self.parents):
+            return
+
+        del self._partial[request.id]
+        request.payload = {name: branch.payload for name, branch in arrived.items()}
+        request.forks.pop()
+        await super()._process_request(request)
+
+    def pending(self) -> List[PipelineRequest]:
+        """等待其他分支的请求, 每个请求ID一个信封"""
+        return [next(iter(arrived.values())) for arrived in self._partial.values()]
+
+    async def abort(self) -> List[PipelineRequest]:
+        requests = self.pending()
+        self._partial.clear()
+        return await super().abort() + requests
+
+    def get_statistics(self) -> Dict[str, Any]:
+        stats = super().get_statistics()
+        stats["waiting_for_branches"] = len(self._partial)
+        return stats
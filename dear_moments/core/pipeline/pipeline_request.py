@@ -0,0 +1,148 @@
+import asyncio
+import copy
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+_request_ids = itertools.count(1)
+
+
+class PipelineTimeoutError(asyncio.TimeoutError):
+    """请求在截止时间前没有走完管道"""
+
+
+class PipelineOverloadedError(Exception):
+    """管道过载, 请求在进入管道前被拒绝"""
+
+
+@dataclass
+class StageTiming:
+    # 在阶段输入队列中等待的时间(秒)
+    queued: float = 0.0
+    # 阶段处理函数的执行时间(秒)
+    processing: float = 0.0
+
+
+@dataclass
+class PipelineRequest:
+    """
+    在管道各阶段之间传递的请求信封
+
+    携带请求ID、当前阶段的数据和结果future, 最后一个阶段的输出写入future,
+    中途失败、被过滤(返回None)或超过截止时间时同样会完成future, 调用方不会无限等待
+    """
+
+    # 当前阶段要处理的数据, 每经过一个阶段替换为该阶段的输出
+    payload: Any
+    # 最终结果, 由管道完成
+    future: asyncio.Future
+    # 请求ID
+    id: int = field(default_factory=lambda: next(_request_ids))
+    # 截止时间(time.monotonic), 为None时不限时
+    deadline: Optional[float] = None
+    # 优先级, 如 "interactive"、"batch", 由支持优先级的队列使用
+    priority: str = "batch"
+    # 租户(memory_id), 同一优先级内按租户公平调度
+    tenant: Optional[str] = None
+    # 进入管道的时间
+    created_at: float = field(default_factory=time.monotonic)
+    # 进入当前阶段队列的时间
+    enqueued_at: float = field(default_factory=time.monotonic)
+    # 每个阶段的排队和处理时间
+    timings: Dict[str, StageTiming] = field(default_factory=dict)
+    # 追踪的根span, 未被采样时为None
+    trace: Optional[Any] = None
+    # payload 对应的阶段下标, 关闭时据此把未完成的请求写入检查点
+    stage_index: int = 0
+    # 最近一次转发这个请求的阶段名称, 汇合阶段据此区分来自哪个分支
+    branch: Optional[str] = None
+    # 尚未汇合的分叉, 每项为 (分叉阶段下标, 分叉阶段的输出), 嵌套分叉时由外到内
+    forks: List[Tuple[int, Any]] = field(default_factory=list)
+
+    @classmethod
+    def create(
+        cls,
+        payload: Any,
+        timeout: Optional[float] = None,
+        priority: str = "batch",
+        tenant: Optional[str] = None,
+    ) -> "PipelineRequest":
+        """
+        创建请求
+
+        Args:
+            payload (Any): 输入管道的数据
+            timeout (Optional[float]): 从现在开始的超时时间(秒)
+            priority (str): 优先级
+            tenant (Optional[str]): 租户
+
+        Returns:
+            PipelineRequest: 请求信封
+        """
+        now = time.monotonic()
+        return cls(
+            payload=payload,
+            future=asyncio.get_running_loop().create_future(),
+            deadline=now + timeout if timeout is not None else None,
+            priority=priority,
+            tenant=tenant,
+            created_at=now,
+            enqueued_at=now,
+        )
+
+    @property
+    def expired(self) -> bool:
+        """是否已经超过截止时间"""
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def remaining(self) -> Optional[float]:
+        """距离截止时间还剩多少秒, 不限时为None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def set_result(self, result: Any) -> None:
+        """完成请求, 已经完成(如调用方超时取消)时忽略"""
+        if not self.future.done():
+            self.future.set_result(result)
+
+    def set_exception(self, exc: BaseException) -> None:
+        """以异常结束请求, 已经完成时忽略"""
+        if not self.future.done():
+            self.future.set_exception(exc)
+            # 没有调用方等待时避免 "exception was never retrieved" 警告
+            self.future.exception()
+
+    def fork(self) -> "PipelineRequest":
+        """
+        复制一个分支信封, 与原请求共享ID、future、截止时间、追踪和耗时记录
+
+        Returns:
+            PipelineRequest: 分支信封
+        """
+        branch = copy.copy(self)
+        branch.forks = list(self.forks)
+        return branch
+
+    def get_timings(self) -> Dict[str, Any]:
+        """
+        获取请求在各阶段的耗时
+
+        Returns:
+            Dict[str, Any]: 总耗时、总排队时间和每个阶段的排队/处理时间(毫秒)
+        """
+        stages = {
+            name: {
+                "queued_ms": round(timing.queued * 1000, 3),
+                "processing_ms": round(timing.processing * 1000, 3),
+            }
+            for name, timing in self.timings.items()
+        }
+        return {
+            "id": self.id,
+            "priority": self.priority,
+            "total_ms": round((time.monotonic() - self.created_at) * 1000, 3),
+            "queued_ms": round(sum(t.queued for t in self.timings.values()) * 1000, 3),
+            "stages": stages,
+        }
@@ -1,64 +1,186 @@
 import asyncio
+import os
+import time
 import traceback
-from typing import Any, Callable, Dict, List, Optional, TypeVar
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    TypeVar,
+)
 from dear_moments.app_context import AppContext
+from .pipeline_request import PipelineRequest, PipelineTimeoutError, StageTiming
+from .remote_stage import RemoteStage
+from dear_moments.service.hedging import LatencyTracker
+from dear_moments.metrics import metrics
+from dear_moments.tracing.span import NOOP_SPAN
 
 T = TypeVar("T")
 U = TypeVar("U")
 
 
+def _warm_up() -> None:
+    """执行器预热: 导入NumPy并执行一次小矩阵运算, 触发BLAS初始化"""
+    import numpy as np
+
+    np.ones((8, 8), dtype=np.float32) @ np.ones(8, dtype=np.float32)
+
+
 class PipelineStage:
     """表示流水线中的一个处理阶段"""
 
     def __init__(
         self,
         name: str,
-        process_func: Callable[[T], U],
+        process_func: Optional[Callable[[T], U]] = None,
         max_queue_size: int = 100,
         workers: int = 1,
+        process_batch: Optional[Callable[[List[T]], List[U]]] = None,
+        max_batch_size: int = 1,
+        max_linger_ms: float = 0,
+        min_workers: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        rate_limited: bool = False,
+        rate_limit_service: Optional[str] = None,
+        executor: Optional[str] = None,
+        executor_workers: Optional[int] = None,
+        key_func: Optional[Callable[[T], Optional[Hashable]]] = None,
+        max_parked: Optional[int] = None,
+        placement: Optional[Dict[str, Any]] = None,
     ):
         """
         初始化处理阶段
 
+        提供 process_batch 时阶段工作在批处理模式: 工作者取到第一个请求后,
+        最多再等待 max_linger_ms 凑满 max_batch_size 个请求, 然后一次性处理
+
         Args:
             name: 阶段名称
             process_func: 处理函数
             max_queue_size: 队列最大容量
             workers: 并行工作者数量
+            process_batch: 批处理函数, 输入一组数据, 返回等长的结果列表,
+                结果中的 Exception 实例表示对应的单个数据处理失败
+            max_batch_size: 每批最多包含的请求数
+            max_linger_ms: 凑批时最多等待的毫秒数
+            min_workers: 自动扩缩容时的最少工作者数量, 默认等于 workers
+            max_workers: 自动扩缩容时的最多工作者数量, 默认等于 workers
+            rate_limited: 阶段是否调用有限流的远端API, 收到429时不再扩容
+            rate_limit_service: 阶段调用的服务名称, 与 RateLimitMonitor.record 的一致,
+                只有这个服务的429才让阶段缩容; 为None时任何服务的429都算
+            executor: CPU密集阶段的执行器, "thread" 为线程池(适合释放GIL的NumPy计算),
+                "process" 为进程池; 同步的处理函数会在执行器中运行,
+                异步的处理函数可以通过 offload 把计算部分交给执行器
+            executor_workers: 执行器的线程/进程数, 默认为CPU核数
+            key_func: 从输入数据中取出保序键(如 memory_id)的函数, 同一个键的请求
+                按进入队列的顺序逐个处理, 不同的键由多个工作者并行处理;
+                返回None的请求不保序. 不支持批处理模式
+            max_parked: 按键保序时最多积压在各个键后面的请求数, 默认等于 max_queue_size;
+                达到上限后工作者不再从队列取请求, 上游的 put 重新受队列容量约束
+            placement: 把处理函数放到独立进程中运行的配置, 如 {"transport": "shm"},
+                见 RemoteStage.from_config; 排队、保序和检查点仍在当前进程,
+                处理函数需要是模块级函数. 与 executor 不能同时使用
         """
+        if process_func is None and process_batch is None:
+            raise ValueError(f"阶段 {name} 需要 process_func 或 process_batch")
+        if executor not in (None, "thread", "process"):
+            raise ValueError(f"不支持的执行器类型: {executor}")
+        if key_func is not None and process_batch is not None:
+            raise ValueError(f"阶段 {name} 的批处理模式不支持按键保序")
+        if placement is not None and executor is not None:
+            raise ValueError(f"阶段 {name} 放到独立进程时不能再使用执行器")
         self.name = name
+        # 所属管道的名称, 由 BasePipeline.add_stage 设置, 用作指标的标签
+        self.pipeline_name = ""
         self.process_func = process_func
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_linger = max_linger_ms / 1000
         self.input_queue = asyncio.Queue(maxsize=max_queue_size)
-        self.output_queue = None  # 将在pipeline中设置
+        # 下游阶段和本阶段在管道中的下标, 由 BasePipeline.add_stage 设置
+        self.downstream: List["PipelineStage"] = []
+        self.index = 0
         self.workers = workers
+        self.min_workers = workers if min_workers is None else min_workers
+        self.max_workers = max(workers, max_workers or workers)
+        self.rate_limited = rate_limited
+        self.rate_limit_service = rate_limit_service
+        # 跨管道共享的远端调用闸门(PriorityGate), 只用于 rate_limited 的阶段
+        self.gate = None
+        self.executor_type = executor
+        self.executor_workers = executor_workers or os.cpu_count() or 1
+        self.executor: Optional[Executor] = None
+        # 独立进程的放置配置, 以及 start 后的阶段进程代理
+        self.placement = placement
+        self.remote: Optional[RemoteStage] = None
         self.worker_tasks = []
+        # 正在等待新请求的工作者, 缩容时优先取消它们
+        self._idle_tasks = set()
+        # 等待退出的工作者数量, 忙碌的工作者处理完当前请求后退出
+        self._retiring = 0
+        # 已经从队列取出但还没有交给下一个阶段的请求, 中止时写入检查点
+        self._in_flight: Dict[int, PipelineRequest] = {}
+        self.key_func = key_func
+        # 正在被某个工作者处理的键, 以及排在它后面的同键请求
+        self._key_backlogs: Dict[Hashable, Deque[PipelineRequest]] = {}
+        self.max_parked = max(1, max_queue_size if max_parked is None else max_parked)
+        # 积压的请求数, 以及正在等待队列的工作者数(每个都可能再积压一个请求)
+        self._parked = 0
+        self._pulling = 0
+        # 积压减少时通知等待取请求的工作者
+        self._park_space = asyncio.Event()
         self.logger = AppContext.get_instance().get("logger")
         self.processed_items = 0
         self.failed_items = 0
+        # 按原因统计的丢弃请求: deadline 超过截止时间, abandoned 调用方已放弃
+        self.shed_items: Dict[str, int] = {"deadline": 0, "abandoned": 0}
+        # 单个请求处理时间的滑动平均(秒), 用于估算排队时间
+        self.avg_item_time: Optional[float] = None
+        # 累计排队和处理时间(秒)
+        self.queued_time = 0.0
+        self.processing_time = 0.0
+        self.batches = 0
+        # 每个优先级的排队时间分布
+        self.class_queue_times: Dict[str, LatencyTracker] = {}
+        # 导出到 /metrics 的排队和处理时间直方图, 在 start 时绑定
+        self._queue_histogram = None
+        self._processing_histogram = None
 
     async def worker(self):
-        """阶段工作者，不断从输入队列获取数据并处理"""
+        """阶段工作者，不断从输入队列获取请求并处理"""
         self.logger.info(f"启动阶段 {self.name}")
         while True:
             try:
-                item = await self.input_queue.get()
-                if item is None:  # 结束信号
+                if self._retiring > 0:
+                    self._retiring -= 1
+                    self.logger.info(f"工作阶段 {self.name} 缩容退出")
+                    break
+                request = await self._next_request()
+                if request is None:  # 结束信号
                     self.logger.info(f"工作阶段 {self.name} 收到停止信号")
                     self.input_queue.task_done()
                     break
 
                 self.logger.debug(f"处理阶段 {self.name}")
+                self._in_flight[request.id] = request
+                if self.process_batch is not None:
+                    if not await self._process_batch(request):
+                        self.logger.info(f"工作阶段 {self.name} 收到停止信号")
+                        break
+                    continue
+                if self.key_func is not None:
+                    await self._process_keyed(request)
+                    continue
                 try:
-                    result = await self.process_func(item)
-                    self.processed_items += 1
-                    if result is not None and self.output_queue is not None:
-                        await self.output_queue.put(result)
-                except Exception as e:
-                    self.failed_items += 1
-                    error_msg = f"在处理阶段遇到错误 {self.name}: {str(e)}"
-                    stack_trace = traceback.format_exc()
-                    self.logger.error(f"{error_msg}\n{stack_trace}")
+                    await self._process_request(request)
                 finally:
+                    self._in_flight.pop(request.id, None)
                     self.input_queue.task_done()
             except asyncio.CancelledError:
                 self.logger.info(f"工作阶段 {self.name} 被取消")
@@ -66,16 +188,493 @@ class PipelineStage:
             except Exception as e:
                 self.logger.error(f"在处理阶段遇到错误 {self.name}: {e}")
 
+    def _key_of(self, request: PipelineRequest) -> Optional[Hashable]:
+        try:
+            return self.key_func(request.payload)
+        except Exception:
+            return None
+
+    async def _process_keyed(self, request: PipelineRequest) -> None:
+        """
+        按键保序处理请求
+
+        键的归属是动态的: 取到请求的工作者如果发现同一个键正在被其他工作者处理,
+        就把请求排到该键的积压队列末尾, 自己继续取下一个请求(相当于把空闲让给其他键);
+        键的持有者处理完当前请求后接着处理积压, 积压清空后释放这个键.
+        与按哈希固定分区不同, 自动扩缩容改变工作者数量时不需要重新分区, 也不会打乱顺序
+
+        Args:
+            request (PipelineRequest): 已经从队列取出的请求
+        """
+        key = self._key_of(request)
+        if key is None:
+            try:
+                await self._process_request(request)
+            finally:
+                self._in_flight.pop(request.id, None)
+                self.input_queue.task_done()
+            return
+
+        backlog = self._key_backlogs.get(key)
+        if backlog is not None:
+            # 处理完之前请求仍然留在 _in_flight 中, task_done 由键的持有者调用
+            backlog.append(request)
+            self._parked += 1
+            return
+
+        backlog = self._key_backlogs[key] = deque()
+        try:
+            while True:
+                try:
+                    await self._process_request(request)
+                finally:
+                    self._in_flight.pop(request.id, None)
+                    self.input_queue.task_done()
+                if not backlog:
+                    break
+                request = backlog.popleft()
+                self._parked -= 1
+                self._park_space.set()
+        finally:
+            del self._key_backlogs[key]
+
+    def backlog(self) -> int:
+        """等待处理的请求数: 输入队列中的请求加上排在同键请求后面的请求"""
+        return self.input_queue.qsize() + self._parked
+
+    async def _next_request(self) -> Optional[PipelineRequest]:
+        """等待下一个请求, 等待期间标记为空闲"""
+        task = asyncio.current_task()
+        self._idle_tasks.add(task)
+        try:
+            if self.key_func is None:
+                return await self.input_queue.get()
+            # 一个繁忙的键可能把队列中的请求全部转移到积压里, 让队列失去背压;
+            # 积压加上可能新增的积压达到上限时先等待持有者消化积压
+            while self._parked + self._pulling >= self.max_parked:
+                self._park_space.clear()
+                await self._park_space.wait()
+            self._pulling += 1
+            try:
+                return await self.input_queue.get()
+            finally:
+                self._pulling -= 1
+                self._park_space.set()
+        finally:
+            self._idle_tasks.discard(task)
+
+    def _admit(self, request: PipelineRequest) -> bool:
+        """
+        记录排队时间, 并检查请求是否还需要处理
+
+        Args:
+            request (PipelineRequest): 请求信封
+
+        Returns:
+            bool: 请求仍然有效时为True
+        """
+        now = time.monotonic()
+        queued = now - request.enqueued_at
+        timing = request.timings.setdefault(self.name, StageTiming())
+        timing.queued += queued
+        self.queued_time += queued
+        tracker = self.class_queue_times.get(request.priority)
+        if tracker is None:
+            tracker = self.class_queue_times[request.priority] = LatencyTracker()
+        tracker.record(queued)
+        if self._queue_histogram is not None:
+            self._queue_histogram.record(queued)
+
+        if request.future.done():
+            # 调用方已经超时放弃, 不再浪费算力
+            self.shed_items["abandoned"] += 1
+            return False
+        if request.expired:
+            # 在昂贵的LLM和嵌入调用之前丢弃过期的请求
+            self.shed_items["deadline"] += 1
+            request.set_exception(
+                PipelineTimeoutError(f"请求 {request.id} 在阶段 {self.name} 前超时")
+            )
+            return False
+        return True
+
+    async def _forward(self, request: PipelineRequest, result: Any) -> None:
+        """
+        把结果交给下游阶段, 没有下游或结果为None时完成请求
+
+        有多个下游时分叉: 每个下游收到一个分支信封, 依次阻塞写入各自的有界队列,
+        任一分支积压时分叉阶段停下, 背压沿每条边传回上游;
+        分叉之后的None结果继续向下传递, 由汇合阶段决定如何合并
+        """
+        if not self.downstream or (result is None and not request.forks):
+            # 最后一个阶段, 或者请求在这里被过滤掉
+            request.set_result(result)
+            return
+        if len(self.downstream) == 1:
+            await self._send(self.downstream[0], request, result)
+            return
+        request.forks.append((self.index, result))
+        for stage in self.downstream:
+            await self._send(stage, request.fork(), result)
+
+    async def _send(
+        self, stage: "PipelineStage", request: PipelineRequest, payload: Any
+    ) -> None:
+        request.payload = payload
+        request.stage_index = stage.index
+        request.branch = self.name
+        request.enqueued_at = time.monotonic()
+        await stage.input_queue.put(request)
+
+    def _fail(self, request: PipelineRequest, error: Exception) -> None:
+        """记录失败并以异常结束请求"""
+        self.failed_items += 1
+        error_msg = f"在处理阶段遇到错误 {self.name}: {str(error)}"
+        stack_trace = "".join(traceback.format_exception(error))
+        self.logger.error(f"{error_msg}\n{stack_trace}")
+        request.set_exception(error)
+
+    async def _process_request(self, request: PipelineRequest) -> None:
+        """
+        处理一个请求, 并把结果交给下一个阶段或写入请求的future
+
+        Args:
+            request (PipelineRequest): 请求信封
+        """
+        if not self._admit(request):
+            return
+
+        span = self._stage_span(request)
+        with span:
+            if self.gate is not None:
+                await self.gate.acquire(request.priority)
+            start_time = time.monotonic()
+            try:
+                result = await self._call(self.process_func, request.payload)
+                self.processed_items += 1
+            except Exception as e:
+                span.record_error(e)
+                self._fail(request, e)
+                return
+            finally:
+                elapsed = time.monotonic() - start_time
+                request.timings[self.name].processing += elapsed
+                self.processing_time += elapsed
+                self._record_item_time(elapsed)
+                if self.gate is not None:
+                    self.gate.release()
+
+        await self._forward(request, result)
+
+    def _stage_span(self, request: PipelineRequest, **attributes):
+        """
+        为被采样的请求创建本阶段的span, 未采样时返回空span
+
+        span从获取远端调用闸门之前开始, 期间发起的外部调用会挂在它下面
+        """
+        if request.trace is None:
+            return NOOP_SPAN
+        return request.trace.child(
+            f"stage.{self.name}",
+            queued_ms=round(request.timings[self.name].queued * 1000, 3),
+            workers=self.workers,
+            **attributes,
+        )
+
+    async def _collect_batch(self, first: PipelineRequest):
+        """
+        以 first 为第一个请求凑一批, 最多等待 max_linger
+
+        Returns:
+            Tuple[List[PipelineRequest], bool]: (这一批请求, 是否收到了停止信号)
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.max_linger
+        while len(batch) < self.max_batch_size:
+            try:
+                request = self.input_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.input_queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if request is None:
+                return batch, True
+            self._in_flight[request.id] = request
+            batch.append(request)
+        return batch, False
+
+    async def _process_batch(self, first: PipelineRequest) -> bool:
+        """
+        批处理模式下处理一批请求, 每个结果交给各自的下游请求
+
+        Args:
+            first (PipelineRequest): 已经取到的第一个请求
+
+        Returns:
+            bool: 工作者是否应该继续运行
+        """
+        batch, stopping = await self._collect_batch(first)
+        try:
+            requests = [request for request in batch if self._admit(request)]
+            if not requests:
+                return not stopping
+
+            # 批内每个被采样的请求各有一个span, 外部调用挂在第一个下面
+            spans = {
+                request.id: self._stage_span(request, batch_size=len(requests))
+                for request in requests
+                if request.trace is not None
+            }
+            with next(iter(spans.values()), NOOP_SPAN):
+                if self.gate is not None:
+                    # 一批按其中最高的优先级排队
+                    await self.gate.acquire(
+                        min((r.priority for r in requests), key=self.gate.rank)
+                    )
+                start_time = time.monotonic()
+                try:
+                    results = await self._call(
+                        self.process_batch, [r.payload for r in requests]
+                    )
+                    if len(results) != len(requests):
+                        raise ValueError(
+                            f"批处理返回了 {len(results)} 个结果, 期望 {len(requests)} 个"
+                        )
+                except Exception as e:
+                    results = [e] * len(requests)
+                finally:
+                    elapsed = time.monotonic() - start_time
+                    self.processing_time += elapsed
+                    self.batches += 1
+                    self._record_item_time(elapsed / len(requests))
+                    for request in requests:
+                        request.timings[self.name].processing += elapsed
+                    if self.gate is not None:
+                        self.gate.release()
+                for request, result in zip(requests, results):
+                    if isinstance(result, Exception) and request.id in spans:
+                        spans[request.id].record_error(result)
+            for span in spans.values():
+                span.end()
+
+            for request, result in zip(requests, results):
+                if isinstance(result, Exception):
+                    self._fail(request, result)
+                    continue
+                self.processed_items += 1
+                await self._forward(request, result)
+            return not stopping
+        finally:
+            for request in batch:
+                self._in_flight.pop(request.id, None)
+            for _ in range(len(batch) + (1 if stopping else 0)):
+                self.input_queue.task_done()
+
+    async def _call(self, func: Callable, arg: Any) -> Any:
+        """调用处理函数, 同步函数在执行器中运行, 不阻塞事件循环"""
+        if self.remote is not None:
+            kind = "batch" if func is self.process_batch else "item"
+            return await self.remote.call(kind, arg)
+        if asyncio.iscoroutinefunction(func):
+            return await func(arg)
+        return await self.offload(func, arg)
+
+    async def offload(self, func: Callable, *args) -> Any:
+        """
+        在阶段的执行器中运行同步函数, 没有配置执行器时直接调用
+
+        进程池中运行的函数和参数需要能被pickle, 大数组应通过共享内存句柄传递
+
+        Args:
+            func (Callable): 同步函数
+            *args: 参数
+
+        Returns:
+            Any: 函数的返回值
+        """
+        if self.executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, func, *args
+        )
+
+    async def _start_executor(self) -> None:
+        """创建执行器并预热, 避免第一批请求承担进程启动和导入的开销"""
+        if self.executor_type is None or self.executor is not None:
+            return
+        if self.executor_type == "process":
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.executor_workers, initializer=_warm_up
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.executor_workers,
+                thread_name_prefix=f"stage-{self.name}",
+            )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *[
+                loop.run_in_executor(self.executor, _warm_up)
+                for _ in range(self.executor_workers)
+            ]
+        )
+
+    def _record_item_time(self, elapsed: float) -> None:
+        if self._processing_histogram is not None:
+            self._processing_histogram.record(elapsed)
+        if self.avg_item_time is None:
+            self.avg_item_time = elapsed
+        else:
+            self.avg_item_time = 0.8 * self.avg_item_time + 0.2 * elapsed
+
+    def estimate_wait(self) -> float:
+        """
+        估算新请求在这个阶段的排队加处理时间(秒)
+
+        Returns:
+            float: 按当前积压、工作者数量和平均处理时间估算的耗时, 没有样本时为0
+        """
+        if self.avg_item_time is None:
+            return 0.0
+        return (self.backlog() / max(self.workers, 1) + 1) * self.avg_item_time
+
+    def _bind_metrics(self) -> None:
+        """绑定本阶段的直方图, 热路径上直接记录, 不再查找标签"""
+        registry = metrics()
+        labels = {"pipeline": self.pipeline_name, "stage": self.name}
+        self._queue_histogram = registry.histogram(
+            "stage_queue_seconds", "请求在阶段输入队列中等待的时间"
+        ).labels(**labels)
+        self._processing_histogram = registry.histogram(
+            "stage_processing_seconds", "阶段处理单个请求的时间, 批处理按批大小平摊"
+        ).labels(**labels)
+
     async def start(self):
         """启动所有工作者"""
+        self._bind_metrics()
+        await self._start_executor()
+        if self.placement is not None and self.remote is None:
+            self.remote = RemoteStage.from_config(
+                self.name, self.process_func, self.process_batch, self.placement
+            )
+            await self.remote.start()
         self.worker_tasks = [
             asyncio.create_task(self.worker()) for _ in range(self.workers)
         ]
 
+    def add_worker(self) -> bool:
+        """
+        增加一个工作者
+
+        Returns:
+            bool: 已经达到 max_workers 时返回False
+        """
+        if self.workers >= self.max_workers:
+            return False
+        self.workers += 1
+        if self._retiring > 0:
+            # 还有没来得及退出的工作者, 取消它的退出即可
+            self._retiring -= 1
+        else:
+            self.worker_tasks = [t for t in self.worker_tasks if not t.done()]
+            self.worker_tasks.append(asyncio.create_task(self.worker()))
+        return True
+
+    def retire_worker(self) -> bool:
+        """
+        减少一个工作者, 空闲的工作者立即退出, 否则处理完当前请求后退出
+
+        Returns:
+            bool: 已经达到 min_workers 时返回False
+        """
+        if self.workers <= max(self.min_workers, 1):
+            return False
+        self.workers -= 1
+        if self._idle_tasks:
+            # 取消正在等待队列的工作者是安全的, 它还没有取到请求
+            self._idle_tasks.pop().cancel()
+        else:
+            self._retiring += 1
+        return True
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取阶段的统计信息"""
+        handled = self.processed_items + self.failed_items
+        dequeued = handled + sum(self.shed_items.values())
+        return {
+            "queue_size": self.backlog(),
+            "active_keys": len(self._key_backlogs),
+            "parked_items": self._parked,
+            "workers": self.workers,
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "processed_items": self.processed_items,
+            "failed_items": self.failed_items,
+            "shed_items": dict(self.shed_items),
+            "avg_queued_ms": self.queued_time * 1000 / dequeued if dequeued else 0.0,
+            "avg_processing_ms": self.processing_time * 1000 / handled if handled else 0.0,
+            "batches": self.batches,
+            "avg_batch_size": handled / self.batches if self.batches else 0.0,
+            "queue_ms_by_class": {
+                priority: {
+                    "p50": tracker.percentile(0.5) * 1000,
+                    "p95": tracker.percentile(0.95) * 1000,
+                }
+                for priority, tracker in self.class_queue_times.items()
+            },
+        }
+
+    async def abort(self) -> List[PipelineRequest]:
+        """
+        立即停止所有工作者, 取出正在处理和仍在排队的请求
+
+        被中断的请求保持所在阶段的输入(stage_index), 可以写入检查点后从该阶段重新开始
+
+        Returns:
+            List[PipelineRequest]: 没有完成的请求
+        """
+        pending = dict(self._in_flight)
+        self._retiring = 0
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+
+        while True:
+            try:
+                request = self.input_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            self.input_queue.task_done()
+            if request is not None:
+                pending[request.id] = request
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        await self._stop_remote()
+        return list(pending.values())
+
     async def stop(self):
         """停止所有工作者"""
-        for _ in range(self.workers):
+        self._retiring = 0
+        alive = [task for task in self.worker_tasks if not task.done()]
+        for _ in range(len(alive)):
             await self.input_queue.put(None)
 
-        for task in self.worker_tasks:
+        for task in alive:
             await task
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        await self._stop_remote()
+
+    async def _stop_remote(self) -> None:
+        if self.remote is not None:
+            await self.remote.stop()
+            self.remote = None
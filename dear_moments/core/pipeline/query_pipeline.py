@@ -1,38 +1,114 @@
+import asyncio
 from typing import Any, Callable, Dict, List, Optional, Type
 from .base_pipeline import BasePipeline
 from .pipeline_stage import PipelineStage
+from .join_stage import JoinStage
+
+
+# 经过查询解析阶段时输入是 {"query", "tokens"}
+def _query_text(query: Any) -> str:
+    return query["query"] if isinstance(query, dict) else query
+
+
+# 查询嵌入的处理函数定义在模块级, 阶段可以通过 app.placement 放到独立进程中运行
+async def _calculate_query_embedding(query: Any):
+    from dear_moments.service import Services
+
+    if not query:
+        return None
+    query = _query_text(query)
+
+    embedding_service = Services.embedding_service()
+    embedding = await embedding_service.get_embedding(query)
+    return {"query": query, "embedding": embedding}
+
+
+async def _calculate_query_embeddings(queries: List[Any]):
+    from dear_moments.service import Services
+
+    queries = [_query_text(query) if query else None for query in queries]
+    texts = [query for query in queries if query]
+    embeddings = iter(
+        await Services.embedding_service().get_embeddings(texts) if texts else []
+    )
+    return [
+        {"query": query, "embedding": next(embeddings)} if query else None
+        for query in queries
+    ]
 
 
 class QueryPipeline(BasePipeline):
     """查询管道，用于处理查询请求"""
 
-    def __init__(self):
-        super().__init__("查询管道")
+    default_priority = "interactive"
 
-    async def create_query_embedding_stage(
-        self, max_queue_size: int = 100, workers: int = 2
+    def __init__(self, queue_factory: Optional[Callable[[int], asyncio.Queue]] = None):
+        super().__init__("查询管道", queue_factory)
+
+    async def create_query_parse_stage(
+        self, max_queue_size: int = 100, workers: int = 1
     ):
-        """创建查询嵌入阶段"""
-        from dear_moments.service import Services
+        """创建查询解析阶段
 
-        async def calculate_query_embedding(query: str):
+        切分查询的检索词, 之后分叉为向量检索和关键词检索两个并行分支
+        """
+        from dear_moments.store.keyword import tokenize
+
+        def parse_query(query: str):
             if not query:
                 return None
+            return {"query": query, "tokens": tokenize(query)}
 
-            embedding_service = Services.embedding_service()
-            embedding = await embedding_service.get_embedding_async(query)
-            return {"query": query, "embedding": embedding}
+        stage = PipelineStage("查询解析", parse_query, max_queue_size, workers)
+        self.add_stage(stage)
+        return self
 
-        stage = PipelineStage(
-            "查询嵌入", calculate_query_embedding, max_queue_size, workers
-        )
+    async def create_query_embedding_stage(
+        self,
+        max_queue_size: int = 100,
+        workers: int = 2,
+        batch_size: int = 1,
+        max_linger_ms: float = 5,
+    ):
+        """创建查询嵌入阶段
+
+        batch_size 大于1时, 并发到达的查询合并为一次批量嵌入请求
+        """
+        if batch_size > 1:
+            stage = PipelineStage(
+                "查询嵌入",
+                max_queue_size=max_queue_size,
+                workers=workers,
+                process_batch=_calculate_query_embeddings,
+                max_batch_size=batch_size,
+                max_linger_ms=max_linger_ms,
+                rate_limited=True,
+                rate_limit_service="embedding",
+            )
+        else:
+            stage = PipelineStage(
+                "查询嵌入",
+                _calculate_query_embedding,
+                max_queue_size,
+                workers,
+                rate_limited=True,
+                rate_limit_service="embedding",
+            )
         self.add_stage(stage)
         return self
 
     async def create_vector_search_stage(
-        self, max_queue_size: int = 100, workers: int = 2
+        self,
+        max_queue_size: int = 100,
+        workers: int = 2,
+        executor: Optional[str] = None,
+        executor_workers: Optional[int] = None,
+        top_k: int = 5,
     ):
-        """创建向量搜索阶段"""
+        """创建向量搜索阶段
+
+        executor 为 "thread" 或 "process" 时相似度计算在执行器中进行, 不阻塞事件循环
+        """
         from dear_moments.service import Services
 
         async def search_vectors(data: Any):
@@ -43,13 +119,79 @@ class QueryPipeline(BasePipeline):
             embedding = data["embedding"]
 
             storage_service = Services.vector_storage()
-            results = await storage_service.search(embedding, top_k=5)
+            results = await storage_service.search(
+                embedding, top_k=top_k, executor=stage.executor
+            )
             return {"query": query, "results": results}
 
-        stage = PipelineStage("向量搜索", search_vectors, max_queue_size, workers)
+        stage = PipelineStage(
+            "向量搜索",
+            search_vectors,
+            max_queue_size,
+            workers,
+            executor=executor,
+            executor_workers=executor_workers,
+        )
         self.add_stage(stage)
         return self
 
+    async def create_keyword_search_stage(
+        self,
+        max_queue_size: int = 100,
+        workers: int = 1,
+        top_k: int = 5,
+        after: str = "查询解析",
+    ):
+        """创建关键词检索阶段, 与查询嵌入和向量搜索并行"""
+        from dear_moments.service import Services
+
+        async def search_keywords(data: Any):
+            if not data:
+                return None
+            results = await Services.keyword_index().search(data["tokens"], top_k)
+            return {"results": results}
+
+        stage = PipelineStage("关键词搜索", search_keywords, max_queue_size, workers)
+        self.add_stage(stage, after=after)
+        return self
+
+    async def create_result_merge_stage(
+        self,
+        max_queue_size: int = 100,
+        workers: int = 1,
+        top_k: int = 5,
+        rrf_k: int = 60,
+    ):
+        """创建结果合并阶段
+
+        汇合向量搜索和关键词搜索的结果, 按倒数排名融合(RRF)重新排序:
+        score = Σ 1 / (rrf_k + 排名), 两路都命中的记录排在前面
+        """
+
+        def merge_results(branches: Dict[str, Any]):
+            vector = branches["向量搜索"]
+            if not vector:
+                return None
+            keyword = branches["关键词搜索"] or {"results": []}
+
+            merged: Dict[str, Dict] = {}
+            for source, results in (
+                ("vector", vector["results"]),
+                ("keyword", keyword["results"]),
+            ):
+                for rank, record in enumerate(results, 1):
+                    entry = merged.setdefault(
+                        record["id"], {**record, "score": 0.0, "sources": []}
+                    )
+                    entry["score"] += 1.0 / (rrf_k + rank)
+                    entry["sources"].append(source)
+            ranked = sorted(merged.values(), key=lambda r: r["score"], reverse=True)
+            return {"query": vector["query"], "results": ranked[:top_k]}
+
+        stage = JoinStage("结果合并", merge_results, max_queue_size, workers)
+        self.add_stage(stage, after=["向量搜索", "关键词搜索"])
+        return self
+
     async def create_result_processing_stage(
         self, max_queue_size: int = 100, workers: int = 2
     ):
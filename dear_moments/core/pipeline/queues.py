@@ -0,0 +1,222 @@
+"""
+阶段输入队列的调度策略
+"""
+
+import asyncio
+import heapq
+import itertools
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence
+
+# 优先级从高到低, 交互式查询总是先于批量写入被处理
+DEFAULT_CLASSES = ("interactive", "batch")
+
+
+class _FairState:
+    """
+    FairPriorityQueue 的内部存储
+
+    每个优先级一个按虚拟完成时间排序的堆(自计时公平排队, SCFQ):
+    租户的下一个请求的完成时间 = max(当前虚拟时间, 该租户上一个请求的完成时间) + 1/权重,
+    积压很多的租户完成时间被推得很远, 不会挤占其他租户
+    """
+
+    def __init__(self, classes: Sequence[str], weights: Dict[str, float]):
+        self.classes = list(classes)
+        self.weights = weights
+        self.heaps: Dict[str, List] = {name: [] for name in self.classes}
+        self.virtual_time: Dict[str, float] = {name: 0.0 for name in self.classes}
+        self.last_finish: Dict[str, Dict[str, float]] = {
+            name: {} for name in self.classes
+        }
+        # 停止信号排在所有请求之后
+        self.sentinels = deque()
+        self._seq = itertools.count()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, item) -> None:
+        self._size += 1
+        if item is None:
+            self.sentinels.append(item)
+            return
+
+        priority = getattr(item, "priority", None)
+        if priority not in self.heaps:
+            priority = self.classes[-1]
+        tenant = getattr(item, "tenant", None)
+        finishes = self.last_finish[priority]
+        start = max(self.virtual_time[priority], finishes.get(tenant, 0.0))
+        finish = start + 1.0 / self.weights.get(tenant, 1.0)
+        finishes[tenant] = finish
+        heapq.heappush(self.heaps[priority], (finish, next(self._seq), item))
+
+    def pop(self):
+        self._size -= 1
+        for priority in self.classes:
+            heap = self.heaps[priority]
+            if heap:
+                finish, _, item = heapq.heappop(heap)
+                self.virtual_time[priority] = finish
+                if not heap:
+                    # 队列清空后重置, 避免历史积压影响新到达的租户
+                    self.virtual_time[priority] = 0.0
+                    self.last_finish[priority].clear()
+                return item
+        return self.sentinels.popleft()
+
+    def depth(self, priority: str) -> int:
+        return len(self.heaps.get(priority, ()))
+
+
+class FairPriorityQueue(asyncio.Queue):
+    """
+    按优先级和租户公平调度的队列, 可以直接替换阶段的 asyncio.Queue
+
+    - 不同优先级之间严格按优先级出队
+    - 同一优先级内按租户(memory_id)加权公平排队, 一个租户的突发流量不会占满队列的处理能力
+    - 请求通过 priority 和 tenant 属性声明所属的优先级和租户
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        classes: Sequence[str] = DEFAULT_CLASSES,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Args:
+            maxsize (int): 队列最大容量
+            classes (Sequence[str]): 优先级名称, 从高到低, 未知优先级按最低处理
+            weights (Optional[Dict[str, float]]): 租户权重, 未配置的租户权重为1
+        """
+        self._classes = tuple(classes)
+        self._weights = weights or {}
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._queue = _FairState(self._classes, self._weights)
+
+    def _put(self, item):
+        self._queue.push(item)
+
+    def _get(self):
+        return self._queue.pop()
+
+    def depth(self, priority: str) -> int:
+        """
+        指定优先级当前排队的请求数
+
+        Args:
+            priority (str): 优先级名称
+
+        Returns:
+            int: 排队的请求数
+        """
+        return self._queue.depth(priority)
+
+
+class PriorityGate:
+    """
+    跨管道共享的远端调用并发闸门
+
+    查询和存储管道各有自己的队列, 但共享同一个API配额;
+    并发达到上限时, 等待者按优先级获得下一个空位, 交互式查询不会排在批量写入后面
+    """
+
+    def __init__(
+        self, max_concurrency: int, classes: Sequence[str] = DEFAULT_CLASSES
+    ):
+        """
+        Args:
+            max_concurrency (int): 同时进行的远端调用上限
+            classes (Sequence[str]): 优先级名称, 从高到低
+        """
+        self.max_concurrency = max_concurrency
+        self._rank = {name: i for i, name in enumerate(classes)}
+        self._waiters: List = []
+        self._seq = itertools.count()
+        self.in_use = 0
+
+    async def acquire(self, priority: str) -> None:
+        """
+        获取一个空位
+
+        Args:
+            priority (str): 请求的优先级
+        """
+        if self.in_use < self.max_concurrency and not self._waiters:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (self.rank(priority), next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经拿到空位后被取消, 把空位交给下一个等待者
+                self.release()
+            raise
+
+    def rank(self, priority: str) -> int:
+        """优先级的排序值, 越小越优先, 未知优先级排在最后"""
+        return self._rank.get(priority, len(self._rank))
+
+    def release(self) -> None:
+        """释放空位, 直接交给优先级最高的等待者"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+    def get_statistics(self) -> dict:
+        """获取闸门的统计信息"""
+        return {
+            "in_use": self.in_use,
+            "waiting": sum(1 for *_, f in self._waiters if not f.done()),
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+def make_queue_factory(
+    config: Optional[dict],
+) -> Optional[Callable[[int], asyncio.Queue]]:
+    """
+    根据配置创建阶段队列的工厂函数
+
+    Args:
+        config (Optional[dict]): 调度配置, type 为 "fair" 时使用 FairPriorityQueue
+
+    Returns:
+        Optional[Callable[[int], asyncio.Queue]]: 输入最大容量返回队列的函数,
+            使用默认FIFO队列时为None
+    """
+    if not config or config.get("type", "fifo") == "fifo":
+        return None
+    if config["type"] != "fair":
+        raise ValueError(f"不支持的队列类型: {config['type']}")
+
+    classes = config.get("classes", DEFAULT_CLASSES)
+    weights = config.get("tenant_weights", {})
+    return lambda maxsize: FairPriorityQueue(maxsize, classes, weights)
+
+
+def make_priority_gate(config: Optional[dict]) -> Optional[PriorityGate]:
+    """
+    根据配置创建远端调用闸门
+
+    Args:
+        config (Optional[dict]): 调度配置, 未配置 remote_concurrency 时返回None
+
+    Returns:
+        Optional[PriorityGate]: 闸门实例
+    """
+    if not config or not config.get("remote_concurrency"):
+        return None
+    return PriorityGate(
+        config["remote_concurrency"], config.get("classes", DEFAULT_CLASSES)
+    )
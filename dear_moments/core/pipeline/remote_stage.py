@@ -0,0 +1,288 @@
+"""
+放到独立进程中运行的阶段处理函数
+
+信封、future、排队和检查点都留在父进程, 阶段进程只负责调用处理函数;
+处理函数在子进程中按模块路径重新导入, 因此需要是模块级函数
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import pickle
+from typing import Any, Callable, Dict, Optional
+
+from dear_moments.app_context import AppContext
+from .transport import Endpoint, Transport, make_transport
+
+
+class RemoteStageError(RuntimeError):
+    """阶段进程异常退出, 或处理函数抛出了无法传回父进程的异常"""
+
+
+def _portable(error: Exception) -> Exception:
+    """无法pickle的异常转换为 RemoteStageError, 保留类型名和消息"""
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RemoteStageError(f"{type(error).__name__}: {error}")
+
+
+def run_stage_host(
+    endpoint: Endpoint,
+    process_func: Optional[Callable],
+    process_batch: Optional[Callable],
+    concurrency: int,
+    config: Dict[str, Any],
+) -> None:
+    """
+    阶段进程的入口
+
+    Args:
+        endpoint (Endpoint): 通道的连接端点
+        process_func (Optional[Callable]): 单个请求的处理函数
+        process_batch (Optional[Callable]): 批处理函数
+        concurrency (int): 同时处理的请求数上限
+        config (Dict[str, Any]): 父进程的配置, 子进程中的服务按同样的配置创建
+    """
+    from dear_moments.config import DearMomentsConfig
+
+    DearMomentsConfig.get_instance()._config = config
+    asyncio.run(_serve(endpoint, process_func, process_batch, concurrency))
+
+
+async def _serve(
+    endpoint: Endpoint,
+    process_func: Optional[Callable],
+    process_batch: Optional[Callable],
+    concurrency: int,
+) -> None:
+    logger = AppContext.get_instance().get("logger")
+    channel = await endpoint.connect()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def handle(call_id: int, kind: str, payload: Any) -> None:
+        func = process_batch if kind == "batch" else process_func
+        try:
+            if asyncio.iscoroutinefunction(func):
+                result = await func(payload)
+            else:
+                result = await asyncio.to_thread(func, payload)
+            if kind == "batch":
+                result = [
+                    _portable(r) if isinstance(r, Exception) else r for r in result
+                ]
+            await channel.send((call_id, True, result))
+        except Exception as e:
+            await channel.send((call_id, False, _portable(e)))
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            message = await channel.recv()
+            if message is None:
+                break
+            await slots.acquire()
+            task = asyncio.create_task(handle(*message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks, return_exceptions=True)
+    except Exception as e:
+        logger.error(f"阶段进程遇到错误: {e}")
+    finally:
+        from dear_moments.service import Services
+
+        if Services._instance is not None:
+            await Services.close()
+        await channel.close()
+
+
+class RemoteStage:
+    """
+    父进程一侧的阶段进程代理, 由 PipelineStage 在 start 时创建
+
+    每次调用分配一个调用ID, 结果按ID回到对应的future, 阶段进程内并发处理
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_func: Optional[Callable],
+        process_batch: Optional[Callable],
+        transport: Transport,
+        concurrency: int = 16,
+        startup_timeout: float = 30,
+    ):
+        """
+        Args:
+            name (str): 阶段名称
+            process_func (Optional[Callable]): 单个请求的处理函数, 需要是模块级函数
+            process_batch (Optional[Callable]): 批处理函数, 需要是模块级函数
+            transport (Transport): 与阶段进程之间的传输方式
+            concurrency (int): 阶段进程中同时处理的请求数上限
+            startup_timeout (float): 等待阶段进程连接的最长时间(秒)
+        """
+        self.name = name
+        self.process_func = process_func
+        self.process_batch = process_batch
+        self.transport = transport
+        self.concurrency = concurrency
+        self.startup_timeout = startup_timeout
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.logger = AppContext.get_instance().get("logger")
+        self._channel = None
+        self._reader: Optional[asyncio.Task] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._ids = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    @classmethod
+    def from_config(
+        cls,
+        name: str,
+        process_func: Optional[Callable],
+        process_batch: Optional[Callable],
+        config: Dict[str, Any],
+    ) -> "RemoteStage":
+        """
+        根据放置配置创建阶段进程代理
+
+        Args:
+            name (str): 阶段名称
+            process_func (Optional[Callable]): 单个请求的处理函数
+            process_batch (Optional[Callable]): 批处理函数
+            config (Dict[str, Any]): 放置配置, 包含 transport、concurrency、
+                startup_timeout 以及传输方式自己的参数
+
+        Returns:
+            RemoteStage: 阶段进程代理
+        """
+        return cls(
+            name,
+            process_func,
+            process_batch,
+            make_transport(config),
+            concurrency=config.get("concurrency", 16),
+            startup_timeout=config.get("startup_timeout", 30),
+        )
+
+    async def start(self) -> None:
+        """启动阶段进程并等待它连接"""
+        for func in (self.process_func, self.process_batch):
+            try:
+                pickle.dumps(func)
+            except Exception as e:
+                raise ValueError(
+                    f"阶段 {self.name} 的处理函数需要是模块级函数才能放到其他进程: {e}"
+                ) from e
+
+        from dear_moments.config import DearMomentsConfig
+
+        await self.transport.open()
+        self.process = multiprocessing.get_context("spawn").Process(
+            target=run_stage_host,
+            args=(
+                self.transport.endpoint(),
+                self.process_func,
+                self.process_batch,
+                self.concurrency,
+                DearMomentsConfig.get_instance()._config,
+            ),
+            name=f"stage-{self.name}",
+            daemon=True,
+        )
+        self.process.start()
+        try:
+            self._channel = await asyncio.wait_for(
+                self.transport.accept(), self.startup_timeout
+            )
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise RemoteStageError(f"阶段 {self.name} 的进程没有在规定时间内连接")
+        self._reader = asyncio.create_task(self._read_results())
+        self._watcher = asyncio.create_task(self._watch())
+        self.logger.info(f"阶段 {self.name} 运行在进程 {self.process.pid}")
+
+    async def call(self, kind: str, payload: Any) -> Any:
+        """
+        在阶段进程中调用处理函数
+
+        Args:
+            kind (str): "item" 调用 process_func, "batch" 调用 process_batch
+            payload (Any): 函数的输入
+
+        Returns:
+            Any: 函数的返回值
+        """
+        if self._reader is None or self._reader.done():
+            raise RemoteStageError(f"阶段 {self.name} 的进程没有运行")
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        try:
+            await self._channel.send((call_id, kind, payload))
+            return await future
+        finally:
+            self._pending.pop(call_id, None)
+
+    async def _read_results(self) -> None:
+        while True:
+            message = await self._channel.recv()
+            if message is None:
+                break
+            call_id, ok, result = message
+            future = self._pending.get(call_id)
+            if future is None or future.done():
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(
+                    RemoteStageError(f"阶段 {self.name} 的进程已经退出")
+                )
+
+    async def _watch(self) -> None:
+        """阶段进程退出后关闭通道, 读取完已经到达的结果后让等待中的调用失败"""
+        await asyncio.to_thread(self.process.join)
+        if self.process.exitcode:
+            self.logger.error(
+                f"阶段 {self.name} 的进程异常退出, 退出码 {self.process.exitcode}"
+            )
+        await self._channel.close()
+
+    async def stop(self, timeout: float = 5) -> None:
+        """
+        通知阶段进程退出, 等待正在处理的调用完成, 超时后强制结束
+
+        Args:
+            timeout (float): 等待阶段进程退出的最长时间(秒)
+        """
+        if self._watcher is not None:
+            try:
+                if not self._watcher.done():
+                    try:
+                        await self._channel.send(None)
+                    except ConnectionError:
+                        # 进程已经退出, 只是还没有被 _watch 回收
+                        pass
+                await asyncio.wait_for(asyncio.shield(self._watcher), timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning(f"阶段 {self.name} 的进程没有按时退出, 强制结束")
+                self.process.terminate()
+            except Exception as e:
+                self.logger.error(f"停止阶段 {self.name} 的进程时遇到错误: {e}")
+                self.process.terminate()
+            await asyncio.gather(self._watcher, self._reader, return_exceptions=True)
+            self._watcher = self._reader = None
+        elif self.process is not None and self.process.is_alive():
+            # 启动阶段就失败了, 进程还没有连接
+            self.process.terminate()
+            await asyncio.to_thread(self.process.join)
+        await self.transport.close()
+        self._channel = None
@@ -1,53 +1,181 @@
-from typing import Any, Callable, Dict, List, Optional, Type
+import asyncio
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
 from .base_pipeline import BasePipeline
 from .pipeline_stage import PipelineStage
+from .join_stage import JoinStage
+
+
+def _unwrap(data: Any) -> Tuple[Optional[str], Any]:
+    """
+    拆出消息处理阶段输出的 memory_id 和事件框架
+
+    输出是 {"memory_id", "event_frame"}; 旧检查点中恢复的是事件框架本身, 没有 memory_id
+    """
+    if isinstance(data, dict) and "event_frame" in data:
+        return data.get("memory_id"), data["event_frame"]
+    return None, data
+
+
+# 嵌入计算的处理函数定义在模块级, 阶段可以通过 app.placement 放到独立进程中运行
+async def _calculate_embedding(data: Any):
+    from dear_moments.service import Services
+
+    memory_id, event_frame = _unwrap(data)
+    if not event_frame:
+        return None
+
+    embedding_service = Services.embedding_service()
+    embedding = await embedding_service.get_embedding(
+        json.dumps(event_frame, ensure_ascii=False)
+    )
+    return {"memory_id": memory_id, "event_frame": event_frame, "embedding": embedding}
+
+
+async def _calculate_embeddings(batch: List[Any]):
+    from dear_moments.service import Services
+
+    batch = [_unwrap(data) for data in batch]
+    texts = [
+        json.dumps(event_frame, ensure_ascii=False)
+        for _, event_frame in batch
+        if event_frame
+    ]
+    embeddings = iter(
+        await Services.embedding_service().get_embeddings(texts) if texts else []
+    )
+    return [
+        (
+            {
+                "memory_id": memory_id,
+                "event_frame": event_frame,
+                "embedding": next(embeddings),
+            }
+            if event_frame
+            else None
+        )
+        for memory_id, event_frame in batch
+    ]
 
 
 class StoragePipeline(BasePipeline):
     """存储管道，用于处理和存储消息"""
 
-    def __init__(self):
-        super().__init__("存储管道")
+    def __init__(self, queue_factory: Optional[Callable[[int], asyncio.Queue]] = None):
+        super().__init__("存储管道", queue_factory)
 
     async def create_message_processor_stage(
-        self, max_queue_size: int = 100, workers: int = 2
+        self,
+        max_queue_size: int = 100,
+        workers: int = 2,
+        batch_size: int = 1,
+        max_linger_ms: float = 50,
+        prompt_token_budget: int = 12000,
     ):
-        """创建消息处理阶段"""
-        from dear_moments.core.storage_processors.message_processor import (
+        """创建消息处理阶段
+
+        batch_size 大于1时开启批量提取, 多个工作者并发到达的消息会合并为一次LLM调用,
+        因此 workers 应不小于 batch_size
+        """
+        from dear_moments.core.storage_processors import (
             MessageProcessor,
+            BatchExtractor,
         )
 
+        batch_extractor = None
+        if batch_size > 1:
+            batch_extractor = BatchExtractor(
+                max_batch_size=batch_size,
+                max_linger_ms=max_linger_ms,
+                prompt_token_budget=prompt_token_budget,
+            )
+
         async def process_message(message: Any):
             processor = MessageProcessor()
             await processor.save_to_context(message)
-            event_frame = await processor.message_to_event_frame(message)
-            return event_frame
+            if batch_extractor is not None:
+                event_frame = await batch_extractor.submit(message)
+            else:
+                event_frame = await processor.message_to_event_frame(message)
+            if not event_frame:
+                return None
+            # 记录所属的记忆随事件框架一起传到存储阶段, 集群迁移时按 memory_id 取出
+            return {"memory_id": message.memory_id, "event_frame": event_frame}
+
+        # 同一个记忆的消息按到达顺序写入上下文和提取, 不同记忆的消息并行处理
+        stage = PipelineStage(
+            "消息处理",
+            process_message,
+            max_queue_size,
+            workers,
+            rate_limited=True,
+            rate_limit_service="llm",
+            key_func=lambda message: getattr(message, "memory_id", None),
+        )
+        self.add_stage(stage)
+        return self
+
+    async def create_embedding_stage(
+        self,
+        max_queue_size: int = 100,
+        workers: int = 2,
+        batch_size: int = 1,
+        max_linger_ms: float = 20,
+    ):
+        """创建嵌入计算阶段
 
-        stage = PipelineStage("消息处理", process_message, max_queue_size, workers)
+        batch_size 大于1时, 排队中的事件框架合并为一次批量嵌入请求
+        """
+        if batch_size > 1:
+            stage = PipelineStage(
+                "嵌入计算",
+                max_queue_size=max_queue_size,
+                workers=workers,
+                process_batch=_calculate_embeddings,
+                max_batch_size=batch_size,
+                max_linger_ms=max_linger_ms,
+                rate_limited=True,
+                rate_limit_service="embedding",
+            )
+        else:
+            stage = PipelineStage(
+                "嵌入计算",
+                _calculate_embedding,
+                max_queue_size,
+                workers,
+                rate_limited=True,
+                rate_limit_service="embedding",
+            )
         self.add_stage(stage)
         return self
 
-    async def create_embedding_stage(self, max_queue_size: int = 100, workers: int = 2):
-        """创建嵌入计算阶段"""
-        from dear_moments.service import Services
-        import json
+    async def create_keyword_stage(
+        self, max_queue_size: int = 100, workers: int = 1, after: str = "消息处理"
+    ):
+        """创建关键词提取阶段
 
-        async def calculate_embedding(event_frame: Any):
+        与嵌入计算并行, 从同一个事件框架中切分检索词, 不在关键路径上
+        """
+        from dear_moments.store.keyword import text_of, tokenize
+
+        def extract_keywords(data: Any):
+            _, event_frame = _unwrap(data)
             if not event_frame:
                 return None
+            return {"tokens": tokenize(text_of(event_frame))}
 
-            embedding_service = Services.embedding_service()
-            embedding = await embedding_service.get_embedding_async(
-                json.dumps(event_frame)
-            )
-            return {"event_frame": event_frame, "embedding": embedding}
-
-        stage = PipelineStage("嵌入计算", calculate_embedding, max_queue_size, workers)
-        self.add_stage(stage)
+        stage = PipelineStage("关键词提取", extract_keywords, max_queue_size, workers)
+        self.add_stage(stage, after=after)
         return self
 
-    async def create_storage_stage(self, max_queue_size: int = 100, workers: int = 1):
-        """创建向量存储阶段"""
+    async def create_storage_stage(
+        self, max_queue_size: int = 100, workers: int = 1, keyword_index: bool = False
+    ):
+        """创建向量存储阶段
+
+        keyword_index 为True时这是嵌入计算和关键词提取两个分支的汇合阶段,
+        向量和检索词使用同一个记录ID写入
+        """
         from dear_moments.service import Services
 
         async def store_vector(data: Any):
@@ -59,10 +187,29 @@ class StoragePipeline(BasePipeline):
 
             storage_service = Services.vector_storage()
             result = await storage_service.store(
-                event_frame, embedding, metadata={"type": event_frame["type"]}
+                event_frame,
+                embedding,
+                metadata={
+                    "type": event_frame["type"],
+                    "memory_id": data.get("memory_id"),
+                },
             )
             return result
 
-        stage = PipelineStage("向量存储", store_vector, max_queue_size, workers)
-        self.add_stage(stage)
+        async def store_indexes(branches: Dict[str, Any]):
+            data = branches["嵌入计算"]
+            record_id = await store_vector(data)
+            keywords = branches["关键词提取"]
+            if record_id is not None and keywords:
+                await Services.keyword_index().store(
+                    record_id, data["event_frame"], keywords["tokens"]
+                )
+            return record_id
+
+        if keyword_index:
+            stage = JoinStage("向量存储", store_indexes, max_queue_size, workers)
+            self.add_stage(stage, after=["嵌入计算", "关键词提取"])
+        else:
+            stage = PipelineStage("向量存储", store_vector, max_queue_size, workers)
+            self.add_stage(stage)
         return self
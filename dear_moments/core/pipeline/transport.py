@@ -0,0 +1,504 @@
+"""
+阶段之间的跨进程传输
+
+阶段放到独立进程时, 父进程与阶段进程之间通过通道交换可以pickle的消息:
+    - "queue": multiprocessing 队列
+    - "unix" / "tcp": 套接字, 每条消息是4字节长度加pickle数据
+    - "shm": unix 套接字传递消息, float32向量写入共享内存环形缓冲区,
+      父进程直接映射为数组视图, 不再pickle和复制
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import struct
+import tempfile
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from dear_moments.utils.shared_array import _open
+
+_FRAME_HEADER = struct.Struct(">I")
+_socket_ids = itertools.count()
+
+
+class Channel(ABC):
+    """通道的一端, 收发可以pickle的消息"""
+
+    @abstractmethod
+    async def send(self, message: Any) -> None:
+        """发送一条消息"""
+
+    @abstractmethod
+    async def recv(self) -> Optional[Any]:
+        """
+        接收一条消息
+
+        Returns:
+            Optional[Any]: 消息, 对端关闭时为None
+        """
+
+    async def close(self) -> None:
+        """关闭本端"""
+
+
+class Endpoint(ABC):
+    """子进程连接通道所需的信息, 作为进程参数传给子进程"""
+
+    @abstractmethod
+    async def connect(self) -> Channel:
+        """在子进程中连接通道"""
+
+
+class Transport(ABC):
+    """父进程一侧的传输方式, 负责创建通道和清理资源"""
+
+    async def open(self) -> None:
+        """在启动子进程之前准备通道, 如开始监听套接字"""
+
+    @abstractmethod
+    def endpoint(self) -> Endpoint:
+        """子进程的连接端点"""
+
+    @abstractmethod
+    async def accept(self) -> Channel:
+        """等待子进程连接, 返回父进程一端的通道"""
+
+    async def close(self) -> None:
+        """释放通道占用的资源"""
+
+
+class QueueChannel(Channel):
+    """
+    基于 multiprocessing 队列的通道
+
+    发送由队列的后台线程完成序列化, 不阻塞事件循环;
+    接收由一个专用线程从队列取出消息, 再转交给事件循环
+    """
+
+    def __init__(self, outgoing, incoming):
+        self._outgoing = outgoing
+        self._incoming = incoming
+        self._closed = False
+        self._received: Optional[asyncio.Queue] = None
+
+    async def send(self, message: Any) -> None:
+        self._outgoing.put(message)
+
+    def _pump(self, loop: asyncio.AbstractEventLoop) -> None:
+        # 定期醒来检查是否已关闭, 对端进程退出时接收线程不会永远挂起;
+        # 关闭之前已经到达的消息仍然会被取走
+        while True:
+            try:
+                message = self._incoming.get(timeout=0.5)
+            except queue.Empty:
+                if self._closed:
+                    message = None
+                else:
+                    continue
+            try:
+                loop.call_soon_threadsafe(self._received.put_nowait, message)
+            except RuntimeError:
+                # 事件循环已经关闭
+                return
+            if message is None:
+                return
+
+    async def recv(self) -> Optional[Any]:
+        if self._received is None:
+            self._received = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            threading.Thread(
+                target=self._pump, args=(loop,), name="queue-channel", daemon=True
+            ).start()
+        message = await self._received.get()
+        if message is None:
+            # 之后的 recv 也立即返回None
+            self._received.put_nowait(None)
+        return message
+
+    async def close(self) -> None:
+        self._closed = True
+
+
+@dataclass
+class QueueEndpoint(Endpoint):
+    to_child: Any
+    to_parent: Any
+
+    async def connect(self) -> Channel:
+        return QueueChannel(self.to_parent, self.to_child)
+
+
+class QueueTransport(Transport):
+    """一对 multiprocessing 队列"""
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self._to_child = context.Queue()
+        self._to_parent = context.Queue()
+        self._channel = QueueChannel(self._to_child, self._to_parent)
+
+    def endpoint(self) -> Endpoint:
+        return QueueEndpoint(self._to_child, self._to_parent)
+
+    async def accept(self) -> Channel:
+        return self._channel
+
+    async def close(self) -> None:
+        await self._channel.close()
+        for q in (self._to_child, self._to_parent):
+            q.close()
+            q.cancel_join_thread()
+
+
+class StreamChannel(Channel):
+    """基于asyncio流的通道, 每条消息是4字节长度加pickle数据"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+
+    async def send(self, message: Any) -> None:
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        async with self._lock:
+            self._writer.write(_FRAME_HEADER.pack(len(data)) + data)
+            await self._writer.drain()
+
+    async def recv(self) -> Optional[Any]:
+        try:
+            header = await self._reader.readexactly(_FRAME_HEADER.size)
+            (length,) = _FRAME_HEADER.unpack(header)
+            return pickle.loads(await self._reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    async def close(self) -> None:
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+@dataclass
+class SocketEndpoint(Endpoint):
+    # unix 套接字为文件路径, tcp 为 (host, port)
+    address: Any
+
+    async def connect(self) -> Channel:
+        if isinstance(self.address, str):
+            reader, writer = await asyncio.open_unix_connection(self.address)
+        else:
+            reader, writer = await asyncio.open_connection(*self.address)
+        return StreamChannel(reader, writer)
+
+
+class SocketTransport(Transport):
+    """
+    unix 或 tcp 套接字, 只接受一个连接
+
+    tcp 的端口为0时由系统分配
+    """
+
+    def __init__(
+        self, path: Optional[str] = None, host: Optional[str] = None, port: int = 0
+    ):
+        """
+        Args:
+            path (Optional[str]): unix 套接字路径, 与 host 二选一, 默认在临时目录中生成
+            host (Optional[str]): tcp 监听地址
+            port (int): tcp 监听端口
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        if host is None and path is None:
+            self.path = os.path.join(
+                tempfile.gettempdir(),
+                f"dearmoments-{os.getpid()}-{next(_socket_ids)}.sock",
+            )
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connected: Optional[asyncio.Future] = None
+        self._channel: Optional[StreamChannel] = None
+
+    async def open(self) -> None:
+        self._connected = asyncio.get_running_loop().create_future()
+
+        def on_connect(reader, writer):
+            if self._connected.done():
+                writer.close()
+                return
+            self._connected.set_result(StreamChannel(reader, writer))
+
+        if self.host is None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._server = await asyncio.start_unix_server(on_connect, self.path)
+        else:
+            self._server = await asyncio.start_server(on_connect, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    def endpoint(self) -> Endpoint:
+        if self.host is None:
+            return SocketEndpoint(self.path)
+        return SocketEndpoint((self.host, self.port))
+
+    async def accept(self) -> Channel:
+        self._channel = await self._connected
+        return self._channel
+
+    async def close(self) -> None:
+        if self._channel is not None:
+            await self._channel.close()
+            self._channel = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self.host is None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@dataclass(frozen=True)
+class RingSlot:
+    """环形缓冲区中的一个向量, 代替数组本身在通道中传递"""
+
+    index: int
+    length: int
+
+
+@dataclass(frozen=True)
+class RingHandle:
+    name: str
+    slots: int
+    dim: int
+
+    def attach(self) -> "EmbeddingRing":
+        return EmbeddingRing(self.slots, self.dim, _open(self.name))
+
+
+class EmbeddingRing:
+    """
+    共享内存中的float32向量环形缓冲区
+
+    内存布局: 每个槽位一个占用标记, 之后是 slots 个长度为 dim 的向量.
+    写入方(阶段进程)从上次的位置向后找空闲槽位, 写入向量后标记为占用;
+    读取方(父进程)把槽位映射为只读数组视图, 视图及其派生数组全部释放后槽位重新空闲.
+    两个方向的标记各只有一方修改, 不需要跨进程锁
+    """
+
+    def __init__(
+        self,
+        slots: int = 1024,
+        dim: int = 3072,
+        shm: Optional[shared_memory.SharedMemory] = None,
+    ):
+        """
+        Args:
+            slots (int): 槽位数量
+            dim (int): 每个槽位的最大向量长度
+            shm (Optional[shared_memory.SharedMemory]): 已有的共享内存, 为None时创建并负责释放
+        """
+        self.slots = slots
+        self.dim = dim
+        header = -(-slots // 64) * 64
+        self._owner = shm is None
+        if shm is None:
+            shm = shared_memory.SharedMemory(create=True, size=header + slots * dim * 4)
+        self._shm = shm
+        self._flags = np.ndarray((slots,), dtype=np.uint8, buffer=shm.buf)
+        self._vectors = np.ndarray(
+            (slots, dim), dtype=np.float32, buffer=shm.buf, offset=header
+        )
+        if self._owner:
+            self._flags[:] = 0
+        self._cursor = 0
+        # 还没有被回收的视图数量, 以及等它们回收后才能解除映射的共享内存
+        self._live = 0
+        self._closing: Optional[shared_memory.SharedMemory] = None
+
+    @property
+    def handle(self) -> RingHandle:
+        return RingHandle(self._shm.name, self.slots, self.dim)
+
+    def put(self, vector: np.ndarray) -> Optional[RingSlot]:
+        """
+        把向量写入空闲槽位
+
+        Returns:
+            Optional[RingSlot]: 槽位, 向量过长或没有空闲槽位时为None, 调用方直接传递数组
+        """
+        if vector.shape[0] > self.dim:
+            return None
+        free = np.flatnonzero(self._flags == 0)
+        if free.size == 0:
+            return None
+        index = int(free[np.searchsorted(free, self._cursor) % free.size])
+        self._vectors[index, : vector.shape[0]] = vector
+        self._flags[index] = 1
+        self._cursor = index + 1
+        return RingSlot(index, vector.shape[0])
+
+    def view(self, slot: RingSlot) -> np.ndarray:
+        """映射槽位为只读数组视图, 视图被回收时释放槽位"""
+        # 直接切片时视图的 base 是整个向量矩阵, 它的派生数组也会越过视图直接引用矩阵,
+        # 视图回收后槽位被释放而派生数组仍在读取; 经 memoryview 创建的视图 base 不是
+        # ndarray, 派生数组的 base 停在视图上, 视图要等它们全部回收才会被回收
+        array = np.frombuffer(
+            memoryview(self._vectors[slot.index, : slot.length]), dtype=np.float32
+        )
+        array.flags.writeable = False
+        self._live += 1
+        weakref.finalize(array, self._release, slot.index)
+        return array
+
+    def _release(self, index: int) -> None:
+        self._live -= 1
+        if self._shm is not None:
+            self._flags[index] = 0
+        elif self._live == 0 and self._closing is not None:
+            self._unmap(self._closing)
+            self._closing = None
+
+    def _unmap(self, shm: shared_memory.SharedMemory) -> None:
+        self._flags = self._vectors = None
+        shm.close()
+
+    def close(self) -> None:
+        """解除映射, 创建者同时删除共享内存"""
+        if self._shm is None:
+            return
+        shm, self._shm = self._shm, None
+        if self._live == 0:
+            self._unmap(shm)
+        else:
+            # 仍有视图在使用时不能解除映射, 由最后一个视图回收时解除
+            self._closing = shm
+        if self._owner:
+            shm.unlink()
+
+
+def _pack(value: Any, ring: EmbeddingRing) -> Any:
+    if isinstance(value, np.ndarray):
+        if value.dtype == np.float32 and value.ndim == 1:
+            return ring.put(value) or value
+        return value
+    if isinstance(value, dict):
+        return {key: _pack(item, ring) for key, item in value.items()}
+    if isinstance(value, list) or type(value) is tuple:
+        return type(value)(_pack(item, ring) for item in value)
+    return value
+
+
+def _unpack(value: Any, ring: EmbeddingRing) -> Any:
+    if isinstance(value, RingSlot):
+        return ring.view(value)
+    if isinstance(value, dict):
+        return {key: _unpack(item, ring) for key, item in value.items()}
+    if isinstance(value, list) or type(value) is tuple:
+        return type(value)(_unpack(item, ring) for item in value)
+    return value
+
+
+class RingChannel(Channel):
+    """
+    在另一个通道上传递消息, 消息中的float32向量经环形缓冲区传递
+
+    只有阶段进程一端写入环形缓冲区, 父进程一端只映射
+    """
+
+    def __init__(self, inner: Channel, ring: EmbeddingRing, writer: bool):
+        self._inner = inner
+        self._ring = ring
+        self._writer = writer
+
+    async def send(self, message: Any) -> None:
+        if self._writer:
+            message = _pack(message, self._ring)
+        await self._inner.send(message)
+
+    async def recv(self) -> Optional[Any]:
+        message = await self._inner.recv()
+        if self._writer:
+            return message
+        return _unpack(message, self._ring)
+
+    async def close(self) -> None:
+        await self._inner.close()
+
+
+@dataclass
+class SharedMemoryEndpoint(Endpoint):
+    inner: Endpoint
+    ring: RingHandle
+
+    async def connect(self) -> Channel:
+        return RingChannel(await self.inner.connect(), self.ring.attach(), writer=True)
+
+
+class SharedMemoryTransport(Transport):
+    """unix 套接字传递消息, 向量经共享内存环形缓冲区传递, 适合返回嵌入向量的阶段"""
+
+    def __init__(self, slots: int = 1024, dim: int = 3072, path: Optional[str] = None):
+        """
+        Args:
+            slots (int): 环形缓冲区的槽位数量, 用完时向量退回到经套接字传递
+            dim (int): 每个槽位的最大向量长度
+            path (Optional[str]): unix 套接字路径
+        """
+        self._inner = SocketTransport(path=path)
+        self._ring = EmbeddingRing(slots, dim)
+
+    async def open(self) -> None:
+        await self._inner.open()
+
+    def endpoint(self) -> Endpoint:
+        return SharedMemoryEndpoint(self._inner.endpoint(), self._ring.handle)
+
+    async def accept(self) -> Channel:
+        return RingChannel(await self._inner.accept(), self._ring, writer=False)
+
+    async def close(self) -> None:
+        await self._inner.close()
+        self._ring.close()
+
+
+def make_transport(config: Optional[Dict[str, Any]]) -> Transport:
+    """
+    根据配置创建传输方式
+
+    Args:
+        config (Optional[Dict[str, Any]]): 阶段的放置配置, transport 为
+            "queue"、"unix"、"tcp" 或 "shm", 默认 "queue"
+
+    Returns:
+        Transport: 传输方式
+    """
+    config = config or {}
+    kind = config.get("transport", "queue")
+    if kind == "queue":
+        return QueueTransport()
+    if kind == "unix":
+        return SocketTransport(path=config.get("path"))
+    if kind == "tcp":
+        return SocketTransport(
+            host=config.get("host", "127.0.0.1"), port=config.get("port", 0)
+        )
+    if kind == "shm":
+        return SharedMemoryTransport(
+            slots=config.get("ring_slots", 1024),
+            dim=config.get("ring_dim", 3072),
+            path=config.get("path"),
+        )
+    raise ValueError(f"不支持的传输方式: {kind}")
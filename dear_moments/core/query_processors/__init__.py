@@ -0,0 +1,6 @@
+from .prefetcher import Prefetcher, recent_window
+
+__all__ = [
+    "Prefetcher",
+    "recent_window",
+]
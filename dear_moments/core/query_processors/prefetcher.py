@@ -0,0 +1,284 @@
+"""
+空闲时的预检索
+
+对话停顿时, 用最近几条消息作为查询提前检索一次, 结果按 memory_id 缓存;
+对话继续之前针对当前上下文的查询(recall)直接命中缓存, 不再等待嵌入和搜索
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from dear_moments.app_context import AppContext
+from dear_moments.core.pipeline import PipelineOverloadedError
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.metrics import metrics
+from dear_moments.models import Context, ContextList
+from dear_moments.service.rate_limit import RateLimitMonitor
+
+
+def recent_window(context: Context, messages: int = 8) -> str:
+    """
+    上下文最近几条消息的文本, 作为预检索和 recall 的查询
+
+    Args:
+        context (Context): 上下文
+        messages (int): 取最近多少条消息
+
+    Returns:
+        str: 每行一条消息, 格式: NAME: MESSAGE, 不带时间戳
+    """
+    lines = [f"{msg.sender}: {msg.content}" for msg in context.context[-messages:]]
+    return "\n".join(lines)
+
+
+@dataclass
+class PrefetchEntry:
+    # 预检索时上下文的消息总数, 之后有新消息时缓存失效
+    version: int
+    # 预检索使用的查询文本
+    text: str
+    results: List[Dict[str, Any]]
+    created: float
+
+
+class Prefetcher:
+    """
+    空闲对话的预检索
+
+    - 对话空闲 idle_after 秒之后、max_idle 秒之前, 最近活跃的对话优先
+    - 只在查询管道中排队的请求不超过 max_backlog、最近没有收到429时进行,
+      以 batch 优先级进入管道, 不与交互查询争抢API配额
+    - 每分钟最多 budget_per_minute 次, 同时最多 max_in_flight 次
+    - 缓存在上下文有新消息或超过 ttl 秒后失效
+    """
+
+    def __init__(
+        self,
+        query_pipeline: BasePipeline,
+        interval: float = 1.0,
+        idle_after: float = 5.0,
+        max_idle: float = 600.0,
+        window_messages: int = 8,
+        budget_per_minute: float = 30,
+        max_in_flight: int = 2,
+        max_backlog: int = 0,
+        ttl: float = 300.0,
+        max_entries: int = 10000,
+        timeout: float = 10.0,
+    ):
+        """
+        Args:
+            query_pipeline (BasePipeline): 查询管道
+            interval (float): 扫描空闲对话的间隔(秒)
+            idle_after (float): 对话空闲多久之后预检索(秒)
+            max_idle (float): 空闲超过该时间的对话不再预检索(秒), 多半不会马上继续
+            window_messages (int): 用最近多少条消息作为查询
+            budget_per_minute (float): 每分钟最多预检索的次数, 即最多消耗的嵌入调用次数
+            max_in_flight (int): 同时进行的预检索数
+            max_backlog (int): 查询管道各阶段排队的请求数之和超过该值时视为忙碌
+            ttl (float): 缓存的有效期(秒), 期间新写入的记忆不会出现在缓存的结果中
+            max_entries (int): 最多缓存多少个 memory_id 的结果
+            timeout (float): 单次预检索的截止时间(秒)
+        """
+        self.query_pipeline = query_pipeline
+        self.interval = interval
+        self.idle_after = idle_after
+        self.max_idle = max_idle
+        self.window_messages = window_messages
+        self.budget_per_minute = budget_per_minute
+        self.max_in_flight = max_in_flight
+        self.max_backlog = max_backlog
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.logger = AppContext.get_instance().get("logger")
+
+        self._cache: "OrderedDict[str, PrefetchEntry]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._tokens = float(budget_per_minute)
+        self._refilled = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+        registry = metrics()
+        self._prefetches = registry.counter(
+            "prefetch_total", "预检索次数, result 为 stored/failed/overloaded"
+        )
+        self._lookups = registry.counter(
+            "prefetch_lookups_total", "预检索缓存的查找次数, result 为 hit/miss/stale"
+        )
+
+    @classmethod
+    def from_config(
+        cls, query_pipeline: BasePipeline, config: Optional[dict]
+    ) -> Optional["Prefetcher"]:
+        """
+        根据配置创建预检索器
+
+        Args:
+            query_pipeline (BasePipeline): 查询管道
+            config (Optional[dict]): 预检索配置 query.prefetch,
+                未配置或 enabled 为False时返回None
+
+        Returns:
+            Optional[Prefetcher]: 预检索器实例
+        """
+        if not config or not config.get("enabled", False):
+            return None
+        return cls(
+            query_pipeline,
+            interval=config.get("interval", 1.0),
+            idle_after=config.get("idle_after", 5.0),
+            max_idle=config.get("max_idle", 600.0),
+            window_messages=config.get("window_messages", 8),
+            budget_per_minute=config.get("budget_per_minute", 30),
+            max_in_flight=config.get("max_in_flight", 2),
+            max_backlog=config.get("max_backlog", 0),
+            ttl=config.get("ttl", 300.0),
+            max_entries=config.get("max_entries", 10000),
+            timeout=config.get("timeout", 10.0),
+        )
+
+    async def start(self):
+        """启动后台扫描任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台扫描任务并取消进行中的预检索"""
+        tasks = list(self._in_flight.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                self.logger.error(f"预检索扫描失败: {e}")
+
+    def tick(self) -> int:
+        """
+        扫描一次空闲对话, 在预算内发起预检索
+
+        Returns:
+            int: 本次发起的预检索数
+        """
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.budget_per_minute),
+            self._tokens + (now - self._refilled) * self.budget_per_minute / 60,
+        )
+        self._refilled = now
+        if not self._idle():
+            return 0
+
+        started = 0
+        for context, _ in ContextList.idle_contexts(self.idle_after, self.max_idle):
+            if len(self._in_flight) >= self.max_in_flight or self._tokens < 1:
+                break
+            memory_id = context.memory_id
+            if memory_id in self._in_flight or not context.context:
+                continue
+            entry = self._cache.get(memory_id)
+            if entry is not None and self._fresh(entry, context, now):
+                continue
+            self._tokens -= 1
+            task = asyncio.create_task(self._prefetch(context))
+            self._in_flight[memory_id] = task
+            task.add_done_callback(lambda _, m=memory_id: self._in_flight.pop(m, None))
+            started += 1
+        return started
+
+    def _idle(self) -> bool:
+        """查询管道空闲且没有被限流时才使用空闲的CPU和配额"""
+        if not self.query_pipeline.accepting:
+            return False
+        backlog = sum(stage.backlog() for stage in self.query_pipeline.stages)
+        if backlog > self.max_backlog:
+            return False
+        return RateLimitMonitor.get_instance().recent(60) == 0
+
+    async def _prefetch(self, context: Context) -> None:
+        version = context.total_count
+        text = recent_window(context, self.window_messages)
+        try:
+            results = await self.query_pipeline.process(
+                text,
+                wait=True,
+                timeout=self.timeout,
+                priority="batch",
+                tenant=context.memory_id,
+            )
+        except PipelineOverloadedError:
+            self._prefetches.inc(result="overloaded")
+            return
+        except Exception as e:
+            self._prefetches.inc(result="failed")
+            self.logger.debug(f"预检索 {context.memory_id} 失败: {e}")
+            return
+        self.store(context.memory_id, version, text, results or [])
+        self._prefetches.inc(result="stored")
+
+    def _fresh(self, entry: PrefetchEntry, context: Context, now: float) -> bool:
+        return entry.version == context.total_count and now - entry.created < self.ttl
+
+    def store(
+        self, memory_id: str, version: int, text: str, results: List[Dict[str, Any]]
+    ) -> None:
+        """
+        缓存一次检索的结果
+
+        Args:
+            memory_id (str): 记忆ID
+            version (int): 检索时上下文的消息总数
+            text (str): 查询文本
+            results (List[Dict[str, Any]]): 检索结果
+        """
+        self._cache[memory_id] = PrefetchEntry(version, text, results, time.monotonic())
+        self._cache.move_to_end(memory_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def lookup(self, memory_id: str, text: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        查找缓存的检索结果, 查询文本相同且上下文没有新消息时命中
+
+        Args:
+            memory_id (str): 记忆ID
+            text (str): 查询文本
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: 命中时返回检索结果
+        """
+        entry = self._cache.get(memory_id)
+        if entry is None or entry.text != text:
+            self._lookups.inc(result="miss")
+            return None
+        context = ContextList.get_instance().memory_id_to_context.get(memory_id)
+        if context is None or not self._fresh(entry, context, time.monotonic()):
+            del self._cache[memory_id]
+            self._lookups.inc(result="stale")
+            return None
+        self._lookups.inc(result="hit")
+        return list(entry.results)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取预检索的统计信息
+
+        Returns:
+            Dict[str, Any]: 缓存条目数、进行中的预检索数和剩余预算
+        """
+        return {
+            "entries": len(self._cache),
+            "in_flight": len(self._in_flight),
+            "budget": round(self._tokens, 2),
+        }
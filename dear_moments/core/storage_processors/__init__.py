@@ -1,5 +1,7 @@
 from .message_processor import MessageProcessor
+from .batch_extractor import BatchExtractor
 
 __all__ = [
     "MessageProcessor",
+    "BatchExtractor",
 ]
@@ -0,0 +1,111 @@
+"""
+批量事件框架提取, 把并发到达的消息合并为一次LLM调用
+"""
+
+import asyncio
+from typing import List, Optional, Tuple
+from dear_moments.app_context import AppContext
+from dear_moments.models import Message
+from .message_processor import MessageProcessor
+
+
+class BatchExtractor:
+    """
+    批量提取器
+
+    并发调用 submit 的消息会在 max_linger_ms 内被收集起来,
+    达到 max_batch_size 或等待超时后一起交给 MessageProcessor 批量提取,
+    每条消息的结果通过各自的 future 返回
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 8,
+        max_linger_ms: float = 50,
+        prompt_token_budget: int = 12000,
+    ):
+        """
+        初始化批量提取器
+
+        Args:
+            max_batch_size (int): 单次请求最多包含的消息数
+            max_linger_ms (float): 第一条消息到达后最多等待的毫秒数
+            prompt_token_budget (int): 单次请求提示词的token预算
+        """
+        self.max_batch_size = max_batch_size
+        self.max_linger_ms = max_linger_ms
+        self.prompt_token_budget = prompt_token_budget
+        self.processor = MessageProcessor()
+        self.logger = AppContext.get_instance().get("logger")
+        self._pending: List[Tuple[Message, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+        self.requests = 0
+        self.messages = 0
+
+    async def submit(self, message: Message) -> Optional[dict]:
+        """
+        提交一条消息, 等待其事件框架
+
+        Args:
+            message (Message): 消息对象
+
+        Returns:
+            Optional[dict]: 事件框架, 提取失败时为None
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self.max_linger_ms / 1000, self._flush
+            )
+        return await future
+
+    def _flush(self) -> None:
+        """把当前收集到的消息作为一批发出"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Message, asyncio.Future]]) -> None:
+        """执行一批提取并把结果分发给各自的 future"""
+        messages = [message for message, _ in batch]
+        self.requests += 1
+        self.messages += len(messages)
+        try:
+            event_frames = await self.processor.messages_to_event_frames(
+                messages,
+                prompt_token_budget=self.prompt_token_budget,
+                max_batch_size=self.max_batch_size,
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), event_frame in zip(batch, event_frames):
+            if not future.done():
+                future.set_result(event_frame)
+
+    def get_statistics(self) -> dict:
+        """获取批量提取的统计信息"""
+        return {
+            "batches": self.requests,
+            "messages": self.messages,
+            "messages_per_batch": (
+                self.messages / self.requests if self.requests else 0.0
+            ),
+        }
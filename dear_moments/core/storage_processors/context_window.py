@@ -0,0 +1,209 @@
+"""
+上下文窗口管理, 在token预算内保留最近的原始消息, 较早的消息折叠为滚动摘要
+"""
+
+import asyncio
+import bisect
+from typing import Dict, Optional, Tuple
+from dear_moments.app_context import AppContext
+from dear_moments.config import DearMomentsConfig
+from dear_moments.models import Context, ContextList
+from dear_moments.resources import StoragePrompts
+from dear_moments.utils.cache_scope import cache_scope
+
+
+class ContextWindowManager:
+    """
+    单例模式, 上下文窗口管理器
+
+    - 提取只看到水位线之后的新消息和滚动摘要, 提示词大小不随对话长度增长
+    - 原始消息超过 token_budget 后, 在后台把已经提取过的较早消息折叠进摘要,
+      只保留约 keep_recent_tokens 的最近消息
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ContextWindowManager, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if ContextWindowManager._initialized:
+            return
+
+        config = DearMomentsConfig.get_instance()
+        self.token_budget = config.get("storage.context_window.token_budget", 2000)
+        self.keep_recent_tokens = config.get(
+            "storage.context_window.keep_recent_tokens", 1000
+        )
+        self.summary_tokens = config.get("storage.context_window.summary_tokens", 400)
+        self.overlap_messages = config.get(
+            "storage.context_window.overlap_messages", 0
+        )
+        self.logger = AppContext.get_instance().get("logger")
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+        ContextWindowManager._initialized = True
+
+    @classmethod
+    def get_instance(cls) -> "ContextWindowManager":
+        """
+        获取上下文窗口管理器实例
+
+        Returns:
+            ContextWindowManager: 上下文窗口管理器实例
+        """
+        if cls._instance is None:
+            cls._instance = ContextWindowManager()
+        return cls._instance
+
+    def claim(self, context: Context) -> Optional[Tuple[int, int, str]]:
+        """
+        领取消息用于提取: 优先领取等待重新提取的区间, 否则领取水位线之后的新消息并推进水位线
+
+        领取成功后固定上下文直到 complete 或 release, 避免提取期间被换出到磁盘,
+        失败时 release 修改的是一个已经不在 ContextList 中的对象
+
+        Args:
+            context (Context): 上下文对象
+
+        Returns:
+            Optional[Tuple[int, int, str]]: (领取的起始序号, 结束序号, 提取时使用的对话文本),
+                没有需要提取的消息时为None
+        """
+        while context.released:
+            start, end = context.released.pop(0)
+            # 等待期间已经被折叠的消息无法再提取
+            start = max(start, context.summarized_count)
+            if start < end:
+                ContextList.pin(context.memory_id)
+                return start, end, self._render_claim(context, start, end)
+
+        start = max(context.extracted_until, context.summarized_count)
+        end = context.total_count
+        if start >= end:
+            return None
+
+        context.extracted_until = end
+        ContextList.pin(context.memory_id)
+        return start, end, self._render_claim(context, start, end)
+
+    def complete(self, context: Context) -> None:
+        """
+        提取成功, 取消 claim 时对上下文的固定
+
+        Args:
+            context (Context): 上下文对象
+        """
+        ContextList.unpin(context.memory_id)
+
+    def release(self, context: Context, start: int, end: int) -> None:
+        """
+        提取失败时归还领取的消息, 让它们参与之后的提取, 并取消对上下文的固定
+
+        水位线仍停在 end 时直接回退到 start; 之后的消息已经被其他提取领取时,
+        回退会让它们被重复提取, 改为记录为等待重新提取的区间
+
+        Args:
+            context (Context): 上下文对象
+            start (int): claim 返回的起始序号
+            end (int): claim 返回的结束序号
+        """
+        ContextList.unpin(context.memory_id)
+        if context.extracted_until != end:
+            bisect.insort(context.released, (start, end))
+            return
+
+        context.extracted_until = start
+        # 紧挨着水位线的等待区间一并并入下一次领取
+        while context.released and context.released[-1][1] == context.extracted_until:
+            context.extracted_until = context.released.pop()[0]
+
+    def _render_claim(self, context: Context, start: int, end: int) -> str:
+        render_from = max(context.summarized_count, start - self.overlap_messages)
+        return self.render_view(context, render_from, end)
+
+    @staticmethod
+    def render_view(context: Context, start: int, end: Optional[int] = None) -> str:
+        """
+        渲染提取视图: 滚动摘要 + 指定范围的原始消息
+
+        Args:
+            context (Context): 上下文对象
+            start (int): 起始绝对序号
+            end (Optional[int]): 结束绝对序号(不包含)
+
+        Returns:
+            str: 对话文本
+        """
+        conversations = context.to_str(start, end)
+        if not context.summary:
+            return conversations
+        return f"(之前对话的摘要: {context.summary})\n{conversations}"
+
+    def maybe_summarize(self, context: Context) -> None:
+        """
+        原始消息超过token预算时, 在后台更新滚动摘要
+
+        Args:
+            context (Context): 上下文对象
+        """
+        if context.token_count <= self.token_budget:
+            return
+        task = self._tasks.get(context.memory_id)
+        if task is not None and not task.done():
+            return
+        self._tasks[context.memory_id] = asyncio.create_task(self._summarize(context))
+
+    async def _summarize(self, context: Context) -> None:
+        """把已经提取过的较早消息折叠进摘要"""
+        from dear_moments.service import Services
+
+        # 从最早的消息开始折叠, 直到剩余token不超过 keep_recent_tokens,
+        # 还没有交给提取或等待重新提取的消息不会被折叠
+        count = 0
+        remaining = context.token_count
+        extracted = context.foldable_until - context.summarized_count
+        while count < min(extracted, len(context.context)) and (
+            remaining > self.keep_recent_tokens
+        ):
+            remaining -= context.message_tokens(count)
+            count += 1
+        if count == 0:
+            return
+
+        start = context.summarized_count
+        prompt = StoragePrompts.get_context_summary_prompt(
+            previous_summary=context.summary,
+            conversations=context.to_str(start, start + count),
+            max_tokens=self.summary_tokens,
+        )
+        # 等待摘要期间固定上下文, 避免被换出到磁盘后折叠结果丢失
+        ContextList.pin(context.memory_id)
+        try:
+            with cache_scope(context.memory_id):
+                summary = await Services.llm_service().get_response(prompt)
+        except Exception as e:
+            self.logger.warning(f"更新上下文摘要失败 {context.memory_id}: {e}")
+            return
+        finally:
+            ContextList.unpin(context.memory_id)
+
+        # 等待LLM期间只会在末尾追加消息, 最早的 count 条消息保持不变
+        if context.summarized_count == start:
+            context.fold(count, summary.strip())
+            self.logger.debug(
+                f"上下文 {context.memory_id} 折叠了 {count} 条消息, 剩余约 {context.token_count} token"
+            )
+        else:
+            self.logger.debug(f"上下文 {context.memory_id} 已被其他任务折叠, 放弃本次摘要")
+
+    async def close(self) -> None:
+        """取消未完成的摘要任务"""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
@@ -2,8 +2,18 @@ from dear_moments.service import Services
 from dear_moments.app_context import AppContext
 from dear_moments.service import Services
 from dear_moments.models import Message, SystemPrompt, ContextList, Context
-from dear_moments.resources import StoragePrompts
-import json
+from dear_moments.resources import (
+    StoragePrompts,
+    EVENT_FRAME_SCHEMA,
+    EVENT_FRAME_BATCH_SCHEMA,
+)
+from dear_moments.utils.cache_scope import cache_refresh, cache_scope
+from dear_moments.utils.json_repair import loads_tolerant
+from dear_moments.utils.tokens import estimate_tokens
+from dear_moments.metrics import metrics
+from .context_window import ContextWindowManager
+from typing import Any, Dict, List, Optional
+import asyncio
 
 
 class MessageProcessor:
@@ -17,86 +27,302 @@ class MessageProcessor:
     async def message_to_event_frame(self, message: Message):
         """利用LLm提取事件框架
 
+        只提取上下文水位线之后的新消息(附带滚动摘要), 没有新消息时直接返回None
+
         Args:
             message (Message): 消息对象
         """
+        # 获取上下文
+        context = ContextList.get_by_memory_id(message.memory_id)
+        window = ContextWindowManager.get_instance()
+        claimed = window.claim(context)
+        if claimed is None:
+            self.logger.debug(f"上下文 {message.memory_id} 没有新的消息需要提取")
+            return None
+
+        start, end, conversations = claimed
+        event_frame = None
+        try:
+            event_frame = await self.conversation_to_event_frame(
+                message.memory_id, conversations
+            )
+        finally:
+            if event_frame:
+                window.complete(context)
+            else:
+                window.release(context, start, end)
+        return event_frame
+
+    async def conversation_to_event_frame(
+        self, memory_id: str, conversations: str
+    ) -> Optional[dict]:
+        """对一段对话文本提取事件框架, 失败时重试一次
+
+        Args:
+            memory_id (str): 记忆ID, 用于获取系统提示词
+            conversations (str): 对话文本
+
+        Returns:
+            Optional[dict]: 事件框架, 提取失败时为None
+        """
 
         # ===================================================
         #                     Prompt构建
         # ===================================================
-        system_prompt = SystemPrompt.get_instance().get(message.memory_id)
+        system_prompt = SystemPrompt.get_instance().get(memory_id)
 
-        # 获取上下文
-        context = ContextList.get_by_memory_id(message.memory_id)
-
-        prompt = StoragePrompts.get_information_extract_prompt(
+        # 固定的指令部分作为前缀, 支持上下文缓存的LLM服务只需上传一次
+        prefix, prompt = StoragePrompts.get_information_extract_prompt_parts(
             system_prompt=system_prompt,
             examples="",
-            conversations=context.to_str(),
+            conversations=conversations,
             topic_examples="",
-            tab=" ",
         )
 
         # ====================================================
         #               调用LLM进行事件框架提取
         # ====================================================
-        response = await Services.llm_service().get_response(prompt)
-        # 检验返回的事件框架是否符合预期格式
-        event_frame = await self.validate_event_frame(response)
-        if not event_frame:
-            self.logger.error(
-                "返回的事件框架格式不正确, 进行重试, 返回的事件框架: %s", response
-            )
-            # 进行重试
-            response = await Services.llm_service().get_response(prompt)
-            event_frame = await self.validate_event_frame(response)
+        # 使用结构化输出, 正常情况下只需要一次LLM调用
+        # 响应缓存的语义匹配只在同一个记忆内进行
+        with cache_scope(memory_id):
+            event_frame = await self.extract_event_frame(prompt, prefix)
             if not event_frame:
-                self.logger.error("重试后返回的事件框架格式仍不正确")
-                return None
+                self.logger.error("返回的事件框架格式不正确, 进行重试")
+                # 进行重试
+                metrics().counter("llm_retries_total", "LLM重试次数, 按原因").inc(
+                    reason="invalid_event_frame"
+                )
+                # 提示词不变, 不跳过缓存的话只会拿回刚才缓存的错误结果
+                with cache_refresh():
+                    event_frame = await self.extract_event_frame(prompt, prefix)
+        if not event_frame:
+            self.logger.error("重试后返回的事件框架格式仍不正确")
+            return None
         # 测试输出
         self.logger.info(f"提取的事件框架: {event_frame}")
         return event_frame
 
-    async def validate_event_frame(self, response: str) -> dict:
+    async def messages_to_event_frames(
+        self,
+        messages: List[Message],
+        prompt_token_budget: int = 12000,
+        max_batch_size: int = 16,
+    ) -> List[Optional[dict]]:
+        """批量提取事件框架, 把多条消息的对话窗口打包进同一次LLM调用
+
+        每段对话使用与memory_id无关的区段编号, 结果按编号路由回对应的消息,
+        缺失或不合法的结果会回退到单条提取, 不会把其他区段的结果错配过去
+
+        Args:
+            messages (List[Message]): 消息列表
+            prompt_token_budget (int): 单次请求提示词的token预算
+            max_batch_size (int): 单次请求最多包含的对话段数
+
+        Returns:
+            List[Optional[dict]]: 与输入顺序一致的事件框架列表, 提取失败的位置为None
+        """
+        if not messages:
+            return []
+
+        sections = [
+            self.build_section(f"c{index}", message)
+            for index, message in enumerate(messages)
+        ]
+        # 同一个上下文的新消息只会被第一条消息领取, 其余消息没有需要提取的内容
+        active = [section for section in sections if section is not None]
+        batches = self.plan_batches(active, prompt_token_budget, max_batch_size)
+        event_frames: Dict[str, dict] = {}
+        try:
+            batch_results = await asyncio.gather(
+                *[self._extract_batch(batch) for batch in batches]
+            )
+            for result in batch_results:
+                event_frames.update(result)
+
+            # 批量结果缺失的区段, 回退到单条提取
+            missing = [s for s in active if s["key"] not in event_frames]
+            if missing:
+                self.logger.warning(
+                    f"批量提取缺少 {len(missing)} 条结果, 回退到单条提取"
+                )
+                fallback = await asyncio.gather(
+                    *[self._extract_section(section) for section in missing]
+                )
+                for section, event_frame in zip(missing, fallback):
+                    if event_frame:
+                        event_frames[section["key"]] = event_frame
+        finally:
+            window = ContextWindowManager.get_instance()
+            for section in active:
+                if section["key"] in event_frames:
+                    window.complete(section["context"])
+                else:
+                    window.release(
+                        section["context"], section["start"], section["end"]
+                    )
+
+        return [
+            event_frames.get(section["key"]) if section is not None else None
+            for section in sections
+        ]
+
+    def build_section(self, key: str, message: Message) -> Optional[Dict[str, Any]]:
+        """构建批量提取中一条消息对应的对话区段, 并领取上下文中的新消息
+
+        Args:
+            key (str): 区段编号
+            message (Message): 消息对象
+
+        Returns:
+            Optional[Dict[str, Any]]: 包含 key, memory_id, system_prompt, conversations 等字段的区段,
+                没有新消息时为None
+        """
+        context = ContextList.get_by_memory_id(message.memory_id)
+        claimed = ContextWindowManager.get_instance().claim(context)
+        if claimed is None:
+            return None
+        start, end, conversations = claimed
+        return {
+            "key": key,
+            "memory_id": message.memory_id,
+            "system_prompt": SystemPrompt.get_instance().get(message.memory_id),
+            "conversations": conversations,
+            "context": context,
+            "start": start,
+            "end": end,
+        }
+
+    @staticmethod
+    def plan_batches(
+        sections: List[Dict[str, Any]], prompt_token_budget: int, max_batch_size: int
+    ) -> List[List[Dict[str, Any]]]:
+        """按提示词token预算把区段分组, 对话越长每批包含的区段越少
+
+        Args:
+            sections (List[Dict[str, Any]]): 对话区段列表
+            prompt_token_budget (int): 单次请求提示词的token预算
+            max_batch_size (int): 单批最多包含的区段数
+
+        Returns:
+            List[List[Dict[str, Any]]]: 分组后的区段
+        """
+        base_tokens = estimate_tokens(
+            StoragePrompts.get_batch_information_extract_prompt([], "", "")
+        )
+        batches: List[List[Dict[str, Any]]] = []
+        current: List[Dict[str, Any]] = []
+        current_tokens = base_tokens
+        for section in sections:
+            section_tokens = estimate_tokens(
+                section["system_prompt"] + section["conversations"]
+            ) + 16
+            if current and (
+                current_tokens + section_tokens > prompt_token_budget
+                or len(current) >= max_batch_size
+            ):
+                batches.append(current)
+                current, current_tokens = [], base_tokens
+            current.append(section)
+            current_tokens += section_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _extract_batch(self, batch: List[Dict[str, Any]]) -> Dict[str, dict]:
+        """对一组区段发起一次提取请求, 返回区段编号到事件框架的映射"""
+        if len(batch) == 1:
+            event_frame = await self._extract_section(batch[0])
+            return {batch[0]["key"]: event_frame} if event_frame else {}
+
+        prompt = StoragePrompts.get_batch_information_extract_prompt(
+            sections=batch, examples="", topic_examples=""
+        )
+        try:
+            response = await Services.llm_service().get_structured(
+                prompt, EVENT_FRAME_BATCH_SCHEMA
+            )
+        except ValueError as e:
+            self.logger.warning(f"无法解析批量提取的结果: {str(e)}")
+            return {}
+        if not isinstance(response, list):
+            self.logger.warning(f"批量提取的结果应为JSON数组: {response}")
+            return {}
+
+        expected_keys = {section["key"] for section in batch}
+        event_frames: Dict[str, dict] = {}
+        for item in response:
+            if not isinstance(item, dict):
+                continue
+            key = item.get("key")
+            # 只接受本批次内且未出现过的编号, 防止结果串到其他对话
+            if key not in expected_keys or key in event_frames:
+                continue
+            event_frame = await self.validate_event_frame(item.get("event_frame"))
+            if event_frame:
+                event_frames[key] = event_frame
+        return event_frames
+
+    async def _extract_section(self, section: Dict[str, Any]) -> Optional[dict]:
+        """对单个区段单独提取事件框架"""
+        return await self.conversation_to_event_frame(
+            section["memory_id"], section["conversations"]
+        )
+
+    async def extract_event_frame(self, prompt: str, prefix: str = "") -> dict:
+        """调用LLM的结构化输出提取事件框架并校验
+
+        Args:
+            prompt (str): 信息提取提示词中变化的部分
+            prefix (str): 信息提取提示词中固定的前缀
+
+        Returns:
+            dict: 校验通过的事件框架, 失败时返回空字典
+        """
+        try:
+            response = await Services.llm_service().get_structured(
+                prompt, EVENT_FRAME_SCHEMA, prefix=prefix
+            )
+        except ValueError as e:
+            self.logger.warning(f"无法解析LLM返回的事件框架: {str(e)}")
+            return {}
+        return await self.validate_event_frame(response)
+
+    async def validate_event_frame(self, response: Any) -> dict:
         """验证LLM返回的事件框架是否符合预期格式
 
         Args:
-            response (str): LLM返回的响应
+            response (Any): LLM返回的响应, 可以是已解析的字典或原始文本
 
         Returns:
             dict: 验证后的事件框架字典，如果验证失败则返回空字典
         """
 
         try:
-            # 尝试解析JSON
-            event_frame = json.loads(response)
+            # 原始文本先用容错解析器解析
+            event_frame = (
+                loads_tolerant(response) if isinstance(response, str) else response
+            )
+            if not isinstance(event_frame, dict):
+                self.logger.warning(f"事件框架应为JSON对象: {response}")
+                return {}
 
             # 验证必要字段
-            required_fields = [
-                "type",
-                "participants",
-                "time",
-                "location",
-                "cause",
-                "result",
-                "manner",
-            ]
-            for field in required_fields:
+            for field in EVENT_FRAME_SCHEMA["required"]:
                 if field not in event_frame:
-                    print(f"事件框架缺少必要字段: {field}")
+                    self.logger.warning(f"事件框架缺少必要字段: {field}")
                     return {}
 
             # 验证participants字段是否为字典类型
             if not isinstance(event_frame["participants"], dict):
-                print("participants字段格式错误，应为字典类型")
+                self.logger.warning("participants字段格式错误，应为字典类型")
                 return {}
 
             return event_frame
-        except json.JSONDecodeError:
-            print(f"无法解析LLM返回的JSON格式 {response}")
+        except ValueError:
+            self.logger.warning(f"无法解析LLM返回的JSON格式 {response}")
             return {}
         except Exception as e:
-            print(f"验证事件框架时发生错误: {str(e)}")
+            self.logger.warning(f"验证事件框架时发生错误: {str(e)}")
             return {}
 
     async def save_to_context(self, message: Message):
@@ -108,5 +334,14 @@ class MessageProcessor:
             context = Context(memory_id=memory_id, context=[])
             ContextList.add(context)
 
+        if message.context is None:
+            # 从检查点恢复的消息, 关闭前可能已经写入上下文, 重新关联而不是重复添加
+            message.context = context
+            if any(m.id == message.id for m in context.context):
+                return
+
         # 将消息添加到上下文中
         context.add(message)
+        # 超出token预算时在后台更新滚动摘要, 摘要跟不上时按上限截断
+        ContextWindowManager.get_instance().maybe_summarize(context)
+        ContextList.enforce_cap(context)
@@ -0,0 +1,10 @@
+from .histogram import Histogram
+from .registry import MetricsRegistry, metrics
+from .server import MetricsServer
+
+__all__ = [
+    "Histogram",
+    "MetricsRegistry",
+    "MetricsServer",
+    "metrics",
+]
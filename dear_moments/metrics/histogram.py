@@ -0,0 +1,106 @@
+"""
+HDR风格的延迟直方图: 对数分段、段内线性, 记录是O(1)的整数运算, 相对误差约3%
+"""
+
+from typing import Dict, List, Optional
+
+# 每个2的幂区间分为 2**_SUB_BITS 个桶
+_SUB_BITS = 5
+_SUB_COUNT = 1 << _SUB_BITS
+# 最大可记录约 2**36 微秒(约19小时), 更大的值计入最后一个桶
+_MAX_SHIFT = 30
+_BUCKETS = 2 * _SUB_COUNT + _MAX_SHIFT * _SUB_COUNT
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * _SUB_COUNT:
+        return value
+    shift = value.bit_length() - _SUB_BITS - 1
+    if shift > _MAX_SHIFT:
+        return _BUCKETS - 1
+    return 2 * _SUB_COUNT + (shift - 1) * _SUB_COUNT + (value >> shift) - _SUB_COUNT
+
+
+def _bucket_upper(index: int) -> int:
+    """桶的上界(微秒, 不包含)"""
+    if index < 2 * _SUB_COUNT:
+        return index + 1
+    shift = (index - 2 * _SUB_COUNT) // _SUB_COUNT + 1
+    sub = (index - 2 * _SUB_COUNT) % _SUB_COUNT + _SUB_COUNT
+    return (sub + 1) << shift
+
+
+class Histogram:
+    """
+    延迟直方图, 以秒为单位记录, 内部按微秒分桶
+    """
+
+    __slots__ = ("_counts", "count", "sum", "max")
+
+    def __init__(self):
+        self._counts: List[int] = [0] * _BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """
+        记录一次耗时
+
+        Args:
+            seconds (float): 耗时(秒)
+        """
+        if seconds < 0:
+            seconds = 0.0
+        self._counts[_bucket_index(int(seconds * 1_000_000))] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        计算分位数
+
+        Args:
+            q (float): 分位数, 0-1之间
+
+        Returns:
+            Optional[float]: 对应分位的耗时上界(秒), 没有样本时为None
+        """
+        if self.count == 0:
+            return None
+        target = max(1, int(q * self.count + 0.999999))
+        seen = 0
+        for index, bucket in enumerate(self._counts):
+            seen += bucket
+            if seen >= target:
+                return min(_bucket_upper(index) / 1_000_000, self.max)
+        return self.max
+
+    def percentiles(self, quantiles) -> Dict[float, Optional[float]]:
+        """一次遍历计算多个分位数"""
+        if self.count == 0:
+            return {q: None for q in quantiles}
+        targets = sorted((max(1, int(q * self.count + 0.999999)), q) for q in quantiles)
+        result: Dict[float, Optional[float]] = {}
+        seen = 0
+        position = 0
+        for index, bucket in enumerate(self._counts):
+            if not bucket:
+                continue
+            seen += bucket
+            while position < len(targets) and seen >= targets[position][0]:
+                value = min(_bucket_upper(index) / 1_000_000, self.max)
+                result[targets[position][1]] = value
+                position += 1
+            if position == len(targets):
+                break
+        return result
+
+    def reset(self) -> None:
+        """清空所有样本"""
+        self._counts = [0] * _BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
@@ -0,0 +1,186 @@
+"""
+指标注册表: 计数器、仪表和延迟直方图, 可以导出为Prometheus文本格式
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .histogram import Histogram
+
+# 导出直方图时报告的分位数
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """只增不减的计数器, 按标签组合分别计数"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        增加计数
+
+        Args:
+            amount (float): 增加的数量
+            **labels: 标签
+        """
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """获取指定标签组合的计数"""
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    仪表, 导出时调用回调函数读取当前值, 平时没有任何开销
+
+    回调返回一个数值, 或 {标签字典元组: 数值} 形式的多组值
+    """
+
+    def __init__(self, name: str, help: str, callback: Callable):
+        self.name = name
+        self.help = help
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        value = self.callback()
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                key = _label_key(dict(labels))
+                lines.append(f"{self.name}{_format_labels(key)} {v}")
+        elif value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class LatencyHistogram:
+    """按标签组合分别记录的延迟直方图, 以summary(分位数)的形式导出"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._histograms: Dict[LabelKey, Histogram] = {}
+
+    def labels(self, **labels) -> Histogram:
+        """
+        获取指定标签组合的直方图, 热路径上应缓存返回值
+
+        Returns:
+            Histogram: 直方图
+        """
+        key = _label_key(labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        return histogram
+
+    def observe(self, seconds: float, **labels) -> None:
+        """记录一次耗时"""
+        self.labels(**labels).record(seconds)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} summary"]
+        for key, histogram in self._histograms.items():
+            values = histogram.percentiles(QUANTILES)
+            for q in QUANTILES:
+                if values[q] is not None:
+                    labels = _format_labels(key, [("quantile", str(q))])
+                    lines.append(f"{self.name}{labels} {values[q]:.6f}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {histogram.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    单例模式, 全局指标注册表
+
+    同名指标重复注册时返回已有的实例, 各模块可以各自声明自己用到的指标
+    """
+
+    _instance = None
+
+    def __init__(self, prefix: str = "dearmoments"):
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = {}
+
+    @classmethod
+    def get_instance(cls) -> "MetricsRegistry":
+        """获取指标注册表实例"""
+        if cls._instance is None:
+            cls._instance = MetricsRegistry()
+        return cls._instance
+
+    def _register(self, name: str, factory):
+        full_name = f"{self.prefix}_{name}"
+        metric = self._metrics.get(full_name)
+        if metric is None:
+            metric = self._metrics[full_name] = factory(full_name)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        """注册或获取计数器"""
+        return self._register(name, lambda full: Counter(full, help))
+
+    def histogram(self, name: str, help: str) -> LatencyHistogram:
+        """注册或获取延迟直方图"""
+        return self._register(name, lambda full: LatencyHistogram(full, help))
+
+    def gauge(self, name: str, help: str, callback: Callable) -> Gauge:
+        """注册仪表, 同名仪表会被新的回调替换"""
+        gauge = self._register(name, lambda full: Gauge(full, help, callback))
+        gauge.callback = callback
+        return gauge
+
+    def unregister(self, name: str) -> None:
+        """移除指标"""
+        self._metrics.pop(f"{self.prefix}_{name}", None)
+
+    def render(self) -> str:
+        """
+        导出所有指标
+
+        Returns:
+            str: Prometheus文本格式
+        """
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # 某个仪表的回调出错不影响其他指标
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def metrics() -> MetricsRegistry:
+    """获取全局指标注册表"""
+    return MetricsRegistry.get_instance()
@@ -0,0 +1,71 @@
+"""
+本地HTTP指标端点, 以Prometheus文本格式导出 /metrics
+"""
+
+from typing import TYPE_CHECKING, Optional
+
+from dear_moments.app_context import AppContext
+from .registry import MetricsRegistry
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+
+class MetricsServer:
+    """
+    指标HTTP服务, 与主程序共用事件循环
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9464):
+        """
+        Args:
+            host (str): 监听地址, 默认只监听本机
+            port (int): 监听端口
+        """
+        self.host = host
+        self.port = port
+        self.logger = AppContext.get_instance().get("logger")
+        self._runner: Optional["web.AppRunner"] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> Optional["MetricsServer"]:
+        """
+        根据配置创建指标服务
+
+        Args:
+            config (Optional[dict]): 指标配置, 未配置或 enabled 为False时返回None
+
+        Returns:
+            Optional[MetricsServer]: 指标服务实例
+        """
+        if not config or not config.get("enabled", False):
+            return None
+        return cls(config.get("host", "127.0.0.1"), config.get("port", 9464))
+
+    async def _handle_metrics(self, request: "web.Request") -> "web.Response":
+        from aiohttp import web
+
+        body = MetricsRegistry.get_instance().render()
+        return web.Response(
+            body=body.encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def start(self) -> None:
+        """启动HTTP服务"""
+        # 指标端点默认关闭, 启用时才导入aiohttp
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.logger.info(f"指标端点: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        """停止HTTP服务"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,21 +1,27 @@
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Dict, Any, List, Optional, Set, Tuple
+import hashlib
+import json
+import os
 import numpy as np
 import time
+import zlib
+from dear_moments.utils.tokens import estimate_tokens
 
 
-@dataclass
+@dataclass(slots=True)
 class BaseMessage:
     # 消息id, 唯一标识
     id: str
     # 记忆id, 用于标识存储到哪个记忆库
     memory_id: str
-    # 时间戳, 记录消息进入时间, 默认为当前时间
-    timestamp: str = field(default_factory=lambda: str(int(time.time())), init=False)
+    # 时间戳(秒), 记录消息进入时间, 默认为当前时间
+    timestamp: int = field(default_factory=lambda: int(time.time()), init=False)
 
 
-@dataclass
+@dataclass(slots=True)
 class Message(BaseMessage):
     # 消息的文本内容
     content: str
@@ -23,19 +29,28 @@ class Message(BaseMessage):
     sender: str
     # 携带的上下文
     context: "Context"
-    # 处理状态跟踪器
-    processing_state: Dict[str, Any] = field(default_factory=dict)
+    # 处理状态跟踪器, 大多数消息用不到, 首次写入时才创建
+    processing_state: Optional[Dict[str, Any]] = None
+    # 渲染后的单行文本缓存
+    _line: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def line(self) -> str:
+        """
+        渲染后的单行文本, 格式: [TIME] NAME: MESSAGE, 只在第一次访问时格式化
+        """
+        if self._line is None:
+            time_str = _format_timestamp(self.timestamp)
+            self._line = f"[{time_str}] {self.sender}: {self.content}"
+        return self._line
 
     def to_str(self) -> str:
         """
-        将消息转换为字符串, 格式: [TIME] NAME: MESSAGE
+        将消息携带的上下文转换为字符串, 格式: [TIME] NAME: MESSAGE
         """
-        message_strings = []
-        for msg in self.context:
-            time_int = int(msg.timestamp)
-            time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time_int))
-            message_strings.append(f"[{time_str}] {msg.sender}: {msg.content}")
-        return "\n".join(message_strings)
+        if self.context is None:
+            return self.line
+        return self.context.to_str()
 
     def is_processed_by(self, stage_name: str) -> bool:
         """
@@ -47,7 +62,7 @@ class Message(BaseMessage):
         Returns:
             bool: 是否处理过
         """
-        return stage_name in self.processing_state
+        return self.processing_state is not None and stage_name in self.processing_state
 
     def set_embedding(self, embedding: np.ndarray):
         """
@@ -56,6 +71,8 @@ class Message(BaseMessage):
         Args:
             embedding (np.ndarray): 嵌入向量
         """
+        if self.processing_state is None:
+            self.processing_state = {}
         self.processing_state["embedding"] = embedding
 
     def set_analysis_result(self, entities: List, sentiment: float) -> None:
@@ -74,17 +91,84 @@ class Message(BaseMessage):
         Returns:
             Optional[np.ndarray]: 嵌入向量
         """
+        if self.processing_state is None:
+            return None
         return self.processing_state.get("embedding")
 
+    def __getstate__(self) -> Dict[str, Any]:
+        """序列化(如写入管道检查点)时不携带上下文, 上下文由 ContextList 单独持久化"""
+        return {
+            f.name: getattr(self, f.name)
+            for f in fields(self)
+            if f.name not in ("context", "_line")
+        }
 
-@dataclass
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        # 反序列化的消息需要重新关联到 ContextList 中的上下文
+        self.context = None
+        self._line = None
+
+
+_time_cache: Dict[int, str] = {}
+# 每条消息对象本身(slots实例、id字符串等)的大致内存开销
+_MESSAGE_OVERHEAD = 200
+
+
+def _format_timestamp(timestamp: int) -> str:
+    """格式化时间戳, 同一秒内的消息复用格式化结果"""
+    time_str = _time_cache.get(timestamp)
+    if time_str is None:
+        if len(_time_cache) > 4096:
+            _time_cache.clear()
+        time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+        _time_cache[timestamp] = time_str
+    return time_str
+
+
+@dataclass(slots=True)
 class Context:
     """
     上下文类, 用于存储上下文信息
+
+    较早的消息会被折叠进滚动摘要并从 context 中移除,
+    消息的绝对序号 = summarized_count + 在 context 中的下标
+
+    每条消息只渲染一次, 渲染结果追加到 _lines 中, to_str 只是对缓存行的切片拼接
     """
 
     memory_id: str
     context: List[Message]
+    # 滚动摘要, 概括已经从 context 中移除的早期消息
+    summary: str = ""
+    # 已经折叠进摘要的消息数量, 即 context[0] 的绝对序号
+    summarized_count: int = 0
+    # 提取水位线, 绝对序号小于它的消息已经交给提取
+    extracted_until: int = 0
+    # 提取失败、等待重新提取的区间 [start, end), 按起始序号排序
+    released: List[Tuple[int, int]] = field(default_factory=list)
+    # context 中消息的估算token总数
+    token_count: int = 0
+    # 与 context 一一对应的渲染行和token数
+    _lines: List[str] = field(default_factory=list, init=False, repr=False)
+    _line_tokens: List[int] = field(default_factory=list, init=False, repr=False)
+    # 渲染行的字符总数, 用于估算内存占用
+    _char_count: int = field(default=0, init=False, repr=False)
+    # 完整渲染结果的缓存, 追加或折叠后失效
+    _rendered: Optional[str] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        messages, self.context = self.context, []
+        for msg in messages:
+            self.add(msg)
+
+    @property
+    def total_count(self) -> int:
+        """
+        进入过该上下文的消息总数(包括已折叠的)
+        """
+        return self.summarized_count + len(self.context)
 
     def add(self, message: Message):
         """
@@ -93,36 +177,140 @@ class Context:
         Args:
             message (Message): 消息对象
         """
+        line = message.line
+        tokens = estimate_tokens(line)
         self.context.append(message)
+        self._lines.append(line)
+        self._line_tokens.append(tokens)
+        self.token_count += tokens
+        self._char_count += len(line)
+        self._rendered = None
 
-    def to_str(self) -> str:
+    def fold(self, count: int, summary: str) -> None:
+        """
+        把最早的 count 条消息折叠进摘要
+
+        Args:
+            count (int): 折叠的消息数量
+            summary (str): 包含这些消息的新摘要
+        """
+        count = min(count, len(self.context))
+        self.token_count -= sum(self._line_tokens[:count])
+        self._char_count -= sum(len(line) for line in self._lines[:count])
+        del self.context[:count]
+        del self._lines[:count]
+        del self._line_tokens[:count]
+        self.summarized_count += count
+        self.summary = summary
+        self._rendered = None
+
+    @property
+    def foldable_until(self) -> int:
+        """
+        绝对序号小于它的消息已经交给提取并且不在等待重新提取, 可以折叠进摘要
+        """
+        return min([self.extracted_until] + [start for start, _ in self.released])
+
+    @property
+    def approx_bytes(self) -> int:
+        """
+        估算的内存占用(字节), 按渲染文本长度加每条消息的固定开销计算
+        """
+        return self._char_count * 2 + len(self.context) * _MESSAGE_OVERHEAD
+
+    def message_tokens(self, index: int) -> int:
+        """
+        context 中第 index 条消息的估算token数
+
+        Args:
+            index (int): 消息在 context 中的下标
+        """
+        return self._line_tokens[index]
+
+    def to_record(self) -> Dict[str, Any]:
+        """
+        转换为可以JSON序列化的记录, 用于换出到磁盘和迁移到其他节点
+
+        Returns:
+            Dict[str, Any]: 摘要、水位线和未折叠的消息
+        """
+        return {
+            "memory_id": self.memory_id,
+            "summary": self.summary,
+            "summarized_count": self.summarized_count,
+            "extracted_until": self.extracted_until,
+            "released": [list(span) for span in self.released],
+            "messages": [
+                [msg.id, msg.timestamp, msg.sender, msg.content] for msg in self.context
+            ],
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Context":
+        """
+        从 to_record 的结果恢复上下文
+
+        Args:
+            record (Dict[str, Any]): 上下文记录
+
+        Returns:
+            Context: 上下文对象
+        """
+        context = cls(
+            memory_id=record["memory_id"],
+            context=[],
+            summary=record["summary"],
+            summarized_count=record["summarized_count"],
+            extracted_until=record["extracted_until"],
+            released=[tuple(span) for span in record.get("released", [])],
+        )
+        for message_id, timestamp, sender, content in record["messages"]:
+            message = Message(
+                id=message_id,
+                memory_id=context.memory_id,
+                content=content,
+                sender=sender,
+                context=context,
+            )
+            message.timestamp = timestamp
+            context.add(message)
+        return context
+
+    def to_str(self, start: int = 0, end: Optional[int] = None) -> str:
         """
         将上下文转换为字符串, 格式: [TIME] NAME: MESSAGE
 
+        Args:
+            start (int): 从哪个绝对序号开始渲染, 已折叠的消息不会被渲染
+            end (Optional[int]): 渲染到哪个绝对序号为止(不包含), 默认到最后一条
+
         Returns:
             str: 格式化后的上下文字符串
         """
-        message_strings = []
-        for msg in self.context:
-            time_int = int(msg.timestamp)
-            time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time_int))
-            message_strings.append(f"[{time_str}] {msg.sender}: {msg.content}")
-        return "\n".join(message_strings)
+        first = max(0, start - self.summarized_count)
+        last = None if end is None else max(0, end - self.summarized_count)
+        if first == 0 and (last is None or last >= len(self._lines)):
+            if self._rendered is None:
+                self._rendered = "\n".join(self._lines)
+            return self._rendered
+        return "\n".join(self._lines[first:last])
 
 
 @dataclass
 class ContextList:
     """
     单例模式, 上下文的列表, 存储活跃的所有上下文
+
+    - 常驻内存的上下文数量有上限, 超出容量或空闲过久的上下文按LRU写入磁盘
+    - 被换出的上下文在下一次访问时从磁盘懒加载回来
+    - 单个上下文的原始消息超过 token 上限时, 截掉已经提取过的最早消息
     """
 
     _instance = None
     _initialized = False
 
-    contexts: List[Context] = None
-
-    # 一个存储memory_id和对应context的字典, 用于查找
-    memory_id_to_context: dict = None
+    # memory_id 到上下文的映射, 按最近使用顺序排列
+    memory_id_to_context: "OrderedDict[str, Context]" = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -133,9 +321,25 @@ class ContextList:
         if ContextList._initialized:
             return
 
-        # 初始化上下文列表
-        self.contexts = []
-        self.memory_id_to_context = {}
+        from dear_moments.config import DearMomentsConfig
+
+        config = DearMomentsConfig.get_instance()
+        self.max_contexts = config.get("storage.context_list.max_contexts", 10000)
+        self.idle_seconds = config.get("storage.context_list.idle_seconds", 3600)
+        self.max_tokens_per_context = config.get(
+            "storage.context_list.max_tokens_per_context", 8000
+        )
+        self.spill_dir = config.get("storage.context_list.spill_dir", "data/contexts")
+
+        # 初始化上下文字典
+        self.memory_id_to_context = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        # 正在后台处理(如滚动摘要)的上下文引用计数, 期间不会被换出
+        self._pinned: Dict[str, int] = {}
+
+        self.evictions = 0
+        self.loads = 0
+        self.trimmed_messages = 0
 
         ContextList._initialized = True
 
@@ -151,10 +355,17 @@ class ContextList:
             cls._instance = ContextList()
         return cls._instance
 
+    @property
+    def contexts(self) -> List[Context]:
+        """
+        常驻内存的所有上下文
+        """
+        return list(self.memory_id_to_context.values())
+
     @classmethod
     def get_by_memory_id(cls, memory_id: str) -> Context:
         """
-        根据memory_id获取上下文
+        根据memory_id获取上下文, 已换出的上下文会从磁盘加载
 
         Args:
             memory_id (str): 记忆ID
@@ -163,7 +374,15 @@ class ContextList:
             Context: 上下文对象
         """
         instance = cls.get_instance()
-        return instance.memory_id_to_context.get(memory_id, None)
+        context = instance.memory_id_to_context.get(memory_id)
+        if context is None:
+            context = instance._load(memory_id)
+            if context is None:
+                return None
+            instance.memory_id_to_context[memory_id] = context
+            instance._evict()
+        instance._touch(memory_id)
+        return context
 
     @classmethod
     def add(cls, context: Context):
@@ -174,5 +393,214 @@ class ContextList:
             context (Context): 上下文对象
         """
         instance = cls.get_instance()
-        instance.contexts.append(context)
         instance.memory_id_to_context[context.memory_id] = context
+        instance._touch(context.memory_id)
+        instance._evict()
+
+    @classmethod
+    def enforce_cap(cls, context: Context) -> None:
+        """
+        单个上下文超过 token 上限时, 截掉已经提取过的最早消息
+
+        滚动摘要正常工作时不会触发, 这是摘要跟不上时的兜底
+
+        Args:
+            context (Context): 上下文对象
+        """
+        instance = cls.get_instance()
+        if context.token_count <= instance.max_tokens_per_context:
+            return
+        extracted = context.foldable_until - context.summarized_count
+        count, remaining = 0, context.token_count
+        while count < extracted and remaining > instance.max_tokens_per_context:
+            remaining -= context.message_tokens(count)
+            count += 1
+        if count:
+            context.fold(count, context.summary)
+            instance.trimmed_messages += count
+
+    @classmethod
+    def pin(cls, memory_id: str) -> None:
+        """
+        固定上下文, 在 unpin 之前不会被换出
+
+        Args:
+            memory_id (str): 记忆ID
+        """
+        instance = cls.get_instance()
+        instance._pinned[memory_id] = instance._pinned.get(memory_id, 0) + 1
+
+    @classmethod
+    def unpin(cls, memory_id: str) -> None:
+        """
+        取消固定上下文
+
+        Args:
+            memory_id (str): 记忆ID
+        """
+        instance = cls.get_instance()
+        count = instance._pinned.get(memory_id, 0) - 1
+        if count > 0:
+            instance._pinned[memory_id] = count
+        else:
+            instance._pinned.pop(memory_id, None)
+
+    @classmethod
+    def remove(cls, memory_id: str) -> Optional[Context]:
+        """
+        移除上下文, 包括已经换出到磁盘的, 用于记忆迁移到其他节点之后
+
+        Args:
+            memory_id (str): 记忆ID
+
+        Returns:
+            Optional[Context]: 被移除的上下文, 不存在时为None
+        """
+        instance = cls.get_instance()
+        context = instance.memory_id_to_context.pop(memory_id, None)
+        if context is None:
+            context = instance._load(memory_id)
+        instance._last_access.pop(memory_id, None)
+        return context
+
+    @classmethod
+    def idle_contexts(
+        cls, min_idle: float, max_idle: Optional[float] = None
+    ) -> List[Tuple[Context, float]]:
+        """
+        空闲时间在 [min_idle, max_idle) 之间的常驻上下文, 不更新访问时间
+
+        Args:
+            min_idle (float): 最短空闲时间(秒)
+            max_idle (Optional[float]): 最长空闲时间(秒), None 表示不限
+
+        Returns:
+            List[Tuple[Context, float]]: 上下文和空闲时间, 最近活跃的在前
+        """
+        instance = cls.get_instance()
+        now = time.monotonic()
+        result = []
+        # 按最近使用顺序从新到旧遍历, 超过 max_idle 之后的都更旧
+        for memory_id in reversed(instance.memory_id_to_context):
+            idle = now - instance._last_access.get(memory_id, now)
+            if max_idle is not None and idle >= max_idle:
+                break
+            if idle >= min_idle:
+                result.append((instance.memory_id_to_context[memory_id], idle))
+        return result
+
+    @classmethod
+    def memory_ids(cls) -> Set[str]:
+        """
+        所有上下文的记忆ID, 包括已经换出到磁盘的
+
+        换出文件名是 memory_id 的哈希, 需要读取文件中的记录才能得到 memory_id,
+        只用于记忆迁移这类不频繁的操作
+
+        Returns:
+            Set[str]: 记忆ID
+        """
+        instance = cls.get_instance()
+        memory_ids = set(instance.memory_id_to_context)
+        if not os.path.isdir(instance.spill_dir):
+            return memory_ids
+        for name in os.listdir(instance.spill_dir):
+            if not name.endswith(".ctx"):
+                continue
+            record = instance._read_spilled(os.path.join(instance.spill_dir, name))
+            if record is not None:
+                memory_ids.add(record["memory_id"])
+        return memory_ids
+
+    @classmethod
+    def spill_all(cls) -> None:
+        """
+        把所有常驻上下文写入磁盘, 用于关闭服务前持久化
+        """
+        instance = cls.get_instance()
+        while instance.memory_id_to_context:
+            memory_id, context = instance.memory_id_to_context.popitem(last=False)
+            instance._spill(context)
+            instance._last_access.pop(memory_id, None)
+
+    def get_statistics(self) -> Dict[str, int]:
+        """
+        获取上下文存储的统计信息
+
+        Returns:
+            Dict[str, int]: 常驻上下文数量、估算内存占用、换出和加载次数
+        """
+        return {
+            "resident_contexts": len(self.memory_id_to_context),
+            "resident_messages": sum(
+                len(context.context) for context in self.memory_id_to_context.values()
+            ),
+            "resident_bytes": sum(
+                context.approx_bytes for context in self.memory_id_to_context.values()
+            ),
+            "evictions": self.evictions,
+            "loads": self.loads,
+            "trimmed_messages": self.trimmed_messages,
+        }
+
+    # ===================================================
+    #                     换入换出
+    # ===================================================
+
+    def _touch(self, memory_id: str) -> None:
+        self.memory_id_to_context.move_to_end(memory_id)
+        self._last_access[memory_id] = time.monotonic()
+
+    def _evict(self) -> None:
+        """按LRU换出超出容量或空闲过久的上下文, 正在后台处理的上下文不会被换出"""
+        now = time.monotonic()
+        for memory_id in list(self.memory_id_to_context):
+            idle = now - self._last_access.get(memory_id, now)
+            over_capacity = len(self.memory_id_to_context) > self.max_contexts
+            if not over_capacity and (
+                self.idle_seconds is None or idle < self.idle_seconds
+            ):
+                break
+            if self._pinned.get(memory_id):
+                continue
+            context = self.memory_id_to_context.pop(memory_id)
+            self._last_access.pop(memory_id, None)
+            self._spill(context)
+            self.evictions += 1
+
+    def _spill_path(self, memory_id: str) -> str:
+        digest = hashlib.sha1(memory_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.ctx")
+
+    def _spill(self, context: Context) -> None:
+        """把上下文压缩后写入磁盘"""
+        record = context.to_record()
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = self._spill_path(context.memory_id)
+        data = zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def _load(self, memory_id: str) -> Optional[Context]:
+        """从磁盘加载被换出的上下文, 加载后删除磁盘文件"""
+        path = self._spill_path(memory_id)
+        if not os.path.exists(path):
+            return None
+        record = self._read_spilled(path)
+        if record is None:
+            return None
+        context = Context.from_record(record)
+
+        os.remove(path)
+        self.loads += 1
+        return context
+
+    @staticmethod
+    def _read_spilled(path: str) -> Optional[Dict[str, Any]]:
+        """读取换出文件中的上下文记录, 文件在读取前被删除时返回None"""
+        try:
+            with open(path, "rb") as f:
+                return json.loads(zlib.decompress(f.read()).decode("utf-8"))
+        except FileNotFoundError:
+            return None
@@ -1,5 +1,8 @@
 from .prompts_zh import StoragePrompts
+from .schemas import EVENT_FRAME_SCHEMA, EVENT_FRAME_BATCH_SCHEMA
 
 __all__ = [
     "StoragePrompts",
+    "EVENT_FRAME_SCHEMA",
+    "EVENT_FRAME_BATCH_SCHEMA",
 ]
@@ -1,3 +1,6 @@
+from typing import Dict, List, Tuple
+
+
 class StoragePrompts:
     """
     存储方向的prompts集合
@@ -20,10 +23,41 @@ class StoragePrompts:
             examples (str): 示例提示词
             conversations (str): 对话内容
             topic_examples (str): 主题示例
-            tab (str): 分隔符，默认为空格
+            tab (str): 分隔符，输出改为JSON后不再使用，保留以兼容旧调用
         """
+        prefix, tail = cls.get_information_extract_prompt_parts(
+            system_prompt=system_prompt,
+            examples=examples,
+            conversations=conversations,
+            topic_examples=topic_examples,
+        )
+        return prefix + tail
+
+    @classmethod
+    def get_information_extract_prompt_parts(
+        cls,
+        system_prompt: str,
+        examples: str,
+        conversations: str,
+        topic_examples: str,
+    ) -> Tuple[str, str]:
+        """
+        获取拆分后的信息提取提示词, 用于前缀缓存
+
+        前缀只依赖系统提示词和示例, 同一个memory_id的多次提取完全相同;
+        后缀是每次变化的对话内容
 
-        information_extract_prompt: str = f"""
+        Args:
+            system_prompt (str): 系统提示词
+            examples (str): 示例提示词
+            conversations (str): 对话内容
+            topic_examples (str): 主题示例
+
+        Returns:
+            Tuple[str, str]: (固定前缀, 变化的后缀)
+        """
+
+        prefix: str = f"""
         你是一位专业的心理学家。
         你的责任是仔细阅读用户与其他方的对话。然后提取相关且重要的事实、用户偏好，这些信息将有助于评估用户的状态。
         你不仅要提取明确陈述的信息，还要推断对话中隐含的信息。
@@ -47,42 +81,154 @@ class StoragePrompts:
         MESSAGE则是对话内容. 理解对话内容并且记住事情发生的时间
 
         ### 输出
-        你需要从对话中提取事实和偏好，并按顺序列出：
-        - TOPIC{tab}SUB_TOPIC{tab}MEMO
+        你需要从对话中提取一个事件框架，并以 JSON 对象返回，字段如下：
+        1. type: 事件类型
+        2. participants: 参与者，包含 user(用户在事件中的身份) 和 others(其他参与者列表)
+        3. time: 事件发生的时间
+        4. location: 事件发生的地点，未知时为空字符串
+        5. cause: 事件的起因
+        6. result: 事件的结果
+        7. manner: 事件发生的方式
+        8. facts: 提取的事实和偏好列表，每一项包含：
+            - topic: 主题，表示该偏好的类别
+            - sub_topic: 详细主题，表示该偏好的具体类别
+            - memo: 提取的信息、事实或偏好
         例如：
-        - 基本信息{tab}姓名{tab}melinda
-        - 工作{tab}职称{tab}软件工程师
+        {{"type": "自我介绍", "participants": {{"user": "求职者", "others": ["assistant"]}}, "time": "2025-05-01", "location": "", "cause": "用户介绍自己", "result": "assistant了解了用户的基本信息", "manner": "对话", "facts": [{{"topic": "基本信息", "sub_topic": "姓名", "memo": "melinda"}}, {{"topic": "工作", "sub_topic": "职称", "memo": "软件工程师"}}]}}
 
-        每行代表一个事实或偏好，包含：
-        1. TOPIC: 主题，表示该偏好的类别
-        2. SUB_TOPIC: 详细主题，表示该偏好的具体类别
-        3. MEMO: 提取的信息、事实或偏好
-        这些元素应以 `{tab}` 分隔，每行应以 `\n` 分隔，并以 "- " 开头。
+        只返回 JSON 对象本身，不要使用代码块，也不要添加任何解释。
 
         ## 示例
         以下是一些示例：
         {examples}
 
-        请按上述格式返回事实和偏好。
+        请按上述格式返回事件框架。
 
         请记住以下几点：
         - 如果用户有提到时间敏感的信息，试图推理出具体的日期.
         - 当可能时，请使用具体日期，而不是使用“今天”或“昨天”等相对时间。
-        - 如果在以下对话中没有找到任何相关信息，可以返回空列表。
+        - 如果在以下对话中没有找到任何相关信息，facts 返回空列表。
         - 确保按照格式和示例部分中提到的格式返回响应。
         - 你应该推断对话中隐含的内容，而不仅仅是明确陈述的内容。
         - 相同的内容不需要在不同的 topic 和 sub_topic 下重复，选择最相关的主题和子主题即可。
         - 相同的 topic 和 sub_topic 只能出现一次。
         忽视用户(user)对其他方(assistant)的称呼：比如用户称呼其他方(assistant)为小姨，因为对其他方的称呼不一定代表真实的关系，不需要推断用户有一个小姨， 只需要记录用户称呼其他方为小姨即可
 
-        以下是用户和助手之间的对话。你需要从对话中提取/推断相关的事实和偏好，并按上述格式返回。
+        以下是用户和助手之间的对话。你需要从对话中提取/推断事件框架以及相关的事实和偏好，并按上述格式返回。
         请注意，你要准确地提取和推断用户相关(user)的信息，而非其他方(assistant)的。
-        你应该检测用户输入的语言，并用相同的语言记录事实。如果在以下对话中没有找到任何相关事实、用户记忆和偏好，你可以返回"NONE"或"NO FACTS"。
+        你应该检测用户输入的语言，并用相同的语言记录事实。如果在以下对话中没有找到任何相关事实、用户记忆和偏好，facts 返回空列表即可。
 
-        {conversations}
+        """
+        tail: str = f"""{conversations}
 
         #### 主题建议
         以下是一些主题和子主题的建议，你需要参考这些主题和子主题来提取信息。
         {topic_examples}
         """
-        return information_extract_prompt
+        return prefix, tail
+
+    @classmethod
+    def get_batch_information_extract_prompt(
+        cls,
+        sections: List[Dict[str, str]],
+        examples: str,
+        topic_examples: str,
+    ) -> str:
+        """
+        获取批量信息提取的提示词, 一次请求处理多段互不相关的对话
+
+        Args:
+            sections (List[Dict[str, str]]): 对话区段列表, 每项包含 key, system_prompt, conversations
+            examples (str): 示例提示词
+            topic_examples (str): 主题示例
+        """
+
+        section_text = "\n\n        ".join(
+            f"""<<<CONVERSATION key={section['key']}>>>
+        FACT_RETRIEVAL_PROMPT = {section['system_prompt']}
+        {section['conversations']}
+        <<<END key={section['key']}>>>"""
+            for section in sections
+        )
+
+        batch_extract_prompt: str = f"""
+        你是一位专业的心理学家。
+        你的责任是仔细阅读用户与其他方的对话。然后提取相关且重要的事实、用户偏好，这些信息将有助于评估用户的状态。
+        你不仅要提取明确陈述的信息，还要推断对话中隐含的信息。
+        请注意，你要准确地提取和推断用户相关(user)的信息，而非其他方(assistant)的。
+
+        ## 格式
+        ### 输入
+        输入包含多段互不相关的对话，每段对话属于不同的用户，以 <<<CONVERSATION key=KEY>>> 开始，以 <<<END key=KEY>>> 结束。
+        每段对话开头的 FACT_RETRIEVAL_PROMPT 是该段对话专属的系统提示词。
+        对话的格式是:
+        - [TIME] NAME: MESSAGE
+        其中NAME有时候是user，有时候是assistant。
+        MESSAGE则是对话内容. 理解对话内容并且记住事情发生的时间
+
+        ### 输出
+        对每一段对话分别提取一个事件框架，返回一个 JSON 数组，数组中每一项包含：
+        - key: 对话区段的 KEY，必须与输入中的 KEY 完全一致
+        - event_frame: 该段对话的事件框架，字段包括 type, participants(包含 user 和 others), time, location, cause, result, manner, facts(每一项包含 topic, sub_topic, memo)
+        例如：
+        [{{"key": "c0", "event_frame": {{"type": "自我介绍", "participants": {{"user": "求职者", "others": ["assistant"]}}, "time": "2025-05-01", "location": "", "cause": "用户介绍自己", "result": "assistant了解了用户的基本信息", "manner": "对话", "facts": [{{"topic": "基本信息", "sub_topic": "姓名", "memo": "melinda"}}]}}}}]
+
+        只返回 JSON 数组本身，不要使用代码块，也不要添加任何解释。
+
+        ## 示例
+        以下是一些示例：
+        {examples}
+
+        请记住以下几点：
+        - 每段对话相互独立，绝对不要把一段对话中的信息写入另一段对话的事件框架。
+        - 每个 KEY 必须且只能出现一次。
+        - 如果用户有提到时间敏感的信息，试图推理出具体的日期.
+        - 当可能时，请使用具体日期，而不是使用“今天”或“昨天”等相对时间。
+        - 如果某段对话中没有找到任何相关信息，该段的 facts 返回空列表。
+        - 你应该推断对话中隐含的内容，而不仅仅是明确陈述的内容。
+        - 相同的 topic 和 sub_topic 在同一段对话中只能出现一次。
+        忽视用户(user)对其他方(assistant)的称呼：比如用户称呼其他方(assistant)为小姨，因为对其他方的称呼不一定代表真实的关系，不需要推断用户有一个小姨， 只需要记录用户称呼其他方为小姨即可
+        你应该检测用户输入的语言，并用相同的语言记录事实。
+
+        {section_text}
+
+        #### 主题建议
+        以下是一些主题和子主题的建议，你需要参考这些主题和子主题来提取信息。
+        {topic_examples}
+        """
+        return batch_extract_prompt
+
+    @classmethod
+    def get_context_summary_prompt(
+        cls,
+        previous_summary: str,
+        conversations: str,
+        max_tokens: int,
+    ) -> str:
+        """
+        获取滚动摘要的提示词, 把较早的对话合并进已有摘要
+
+        Args:
+            previous_summary (str): 已有的摘要, 可以为空
+            conversations (str): 需要合并进摘要的对话
+            max_tokens (int): 摘要的长度上限(token)
+        """
+
+        context_summary_prompt: str = f"""
+        你是一位专业的对话记录员。
+        你的责任是把用户与其他方较早的对话压缩为一段摘要，供后续理解新的对话时参考。
+
+        ## 要求
+        - 把"新增的对话"合并进"已有的摘要"，输出一段完整的新摘要。
+        - 保留对理解后续对话有帮助的信息：人物、事件、时间、用户的状态和偏好、尚未结束的话题。
+        - 当可能时，请使用具体日期，而不是使用“今天”或“昨天”等相对时间。
+        - 摘要的长度不要超过 {max_tokens} 个token，越早的内容可以越简略。
+        - 使用与对话相同的语言，只返回摘要本身，不要添加任何解释。
+
+        #### 已有的摘要
+        {previous_summary or "(无)"}
+
+        #### 新增的对话
+        {conversations}
+        """
+        return context_summary_prompt
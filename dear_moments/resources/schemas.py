@@ -0,0 +1,59 @@
+"""
+LLM结构化输出使用的JSON Schema (Gemini responseSchema 格式)
+"""
+
+# 事件框架, 与 MessageProcessor.validate_event_frame 的校验字段保持一致
+EVENT_FRAME_SCHEMA: dict = {
+    "type": "OBJECT",
+    "properties": {
+        "type": {"type": "STRING"},
+        "participants": {
+            "type": "OBJECT",
+            "properties": {
+                "user": {"type": "STRING"},
+                "others": {"type": "ARRAY", "items": {"type": "STRING"}},
+            },
+            "required": ["user", "others"],
+        },
+        "time": {"type": "STRING"},
+        "location": {"type": "STRING"},
+        "cause": {"type": "STRING"},
+        "result": {"type": "STRING"},
+        "manner": {"type": "STRING"},
+        "facts": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "topic": {"type": "STRING"},
+                    "sub_topic": {"type": "STRING"},
+                    "memo": {"type": "STRING"},
+                },
+                "required": ["topic", "sub_topic", "memo"],
+            },
+        },
+    },
+    "required": [
+        "type",
+        "participants",
+        "time",
+        "location",
+        "cause",
+        "result",
+        "manner",
+        "facts",
+    ],
+}
+
+# 批量提取, 每项通过 key 对应回输入中的对话区段
+EVENT_FRAME_BATCH_SCHEMA: dict = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "key": {"type": "STRING"},
+            "event_frame": EVENT_FRAME_SCHEMA,
+        },
+        "required": ["key", "event_frame"],
+    },
+}
@@ -0,0 +1,3 @@
+from .api_server import MemoryServer
+
+__all__ = ["MemoryServer"]
@@ -0,0 +1,405 @@
+"""
+记忆节点的HTTP服务, 多个聊天进程可以共用同一个 DearMoments 实例
+
+接口:
+    POST /v1/messages         存储消息, 请求体为单个对象或对象数组
+    POST /v1/messages/stream  流式写入, 请求体每行一个消息(NDJSON), 逐行返回确认
+    POST /v1/query            查询, 请求体为单个对象或对象数组; 只有 memory_id 没有 query
+                              时检索与该记忆当前对话相关的记忆
+    GET  /healthz             进程存活
+    GET  /readyz              管道正在运行且没有在关闭, 可以接收请求
+
+集群模式下由路由器调用的接口, 请求需要带 X-Cluster-Token 头(共享密钥 cluster.token),
+未配置密钥时只接受本机请求:
+    POST /v1/cluster/export   按新哈希环导出不再归属本节点的记忆, 逐行返回(NDJSON);
+                              先等待这些记忆还在存储管道中的请求完成
+    POST /v1/cluster/import   导入其他节点导出的记忆, 请求体为导出流
+    POST /v1/cluster/delete   删除已经迁出的记录和上下文
+"""
+
+import asyncio
+import json
+import uuid
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from dear_moments.app_context import AppContext
+from dear_moments.cluster import (
+    HashRing,
+    cluster_request_allowed,
+    delete_memories,
+    export_memories,
+    import_memory,
+    prepare_export,
+)
+from dear_moments.config import DearMomentsConfig
+from dear_moments.core.pipeline import PipelineOverloadedError, PipelineTimeoutError
+from dear_moments.metrics import metrics
+from dear_moments.models import Message, SystemPrompt
+
+_dumps = partial(json.dumps, ensure_ascii=False, default=str)
+
+
+class RequestError(ValueError):
+    """请求体格式错误, 返回400"""
+
+
+class MemoryServer:
+    """
+    记忆节点的HTTP服务, 与 DearMoments 共用事件循环
+
+    数组形式的批量请求中的每一项各自进入管道, 由阶段的微批处理合并为批量调用;
+    同时处理的HTTP请求数有上限, 超出时直接返回503, 由客户端稍后重试
+    """
+
+    def __init__(
+        self,
+        dear_moments,
+        host: str = "127.0.0.1",
+        port: int = 8700,
+        max_concurrency: int = 64,
+        max_batch_size: int = 256,
+        keepalive_timeout: float = 75,
+        cluster_token: Optional[str] = None,
+    ):
+        """
+        Args:
+            dear_moments (DearMoments): 已经初始化的 DearMoments 实例
+            host (str): 监听地址
+            port (int): 监听端口
+            max_concurrency (int): 同时处理的HTTP请求数上限, 健康检查不计入
+            max_batch_size (int): 批量请求最多包含的项数
+            keepalive_timeout (float): 空闲的keep-alive连接保留的秒数
+            cluster_token (Optional[str]): 集群迁移接口的共享密钥, 为空时只接受本机请求
+        """
+        self.dear_moments = dear_moments
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_batch_size = max_batch_size
+        self.keepalive_timeout = keepalive_timeout
+        self.cluster_token = cluster_token
+        self.logger = AppContext.get_instance().get("logger")
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._runner: Optional[web.AppRunner] = None
+        self._requests = metrics().counter(
+            "http_requests_total", "HTTP接口请求数, 按接口和状态码统计"
+        )
+
+    @classmethod
+    def from_config(cls, dear_moments, config: Optional[dict]) -> "MemoryServer":
+        """
+        根据配置创建HTTP服务
+
+        Args:
+            dear_moments (DearMoments): 已经初始化的 DearMoments 实例
+            config (Optional[dict]): 服务配置 app.server, 集群密钥取自 cluster.token
+
+        Returns:
+            MemoryServer: HTTP服务实例
+        """
+        config = config or {}
+        return cls(
+            dear_moments,
+            host=config.get("host", "127.0.0.1"),
+            port=config.get("port", 8700),
+            max_concurrency=config.get("max_concurrency", 64),
+            max_batch_size=config.get("max_batch_size", 256),
+            keepalive_timeout=config.get("keepalive_timeout", 75),
+            cluster_token=DearMomentsConfig.get_instance().get("cluster.token"),
+        )
+
+    @web.middleware
+    async def _limit(self, request: web.Request, handler) -> web.StreamResponse:
+        """限制并发并把管道异常转换为HTTP状态码"""
+        if request.path in ("/healthz", "/readyz"):
+            return await handler(request)
+        if request.path.startswith("/v1/cluster/") and not cluster_request_allowed(
+            request.headers, request.remote, self.cluster_token
+        ):
+            response = _error(403, "集群接口需要正确的 X-Cluster-Token")
+        elif self._slots.locked():
+            response = _error(503, "服务繁忙", retry_after=1)
+        else:
+            async with self._slots:
+                try:
+                    response = await handler(request)
+                except RequestError as e:
+                    response = _error(400, str(e))
+                except PipelineOverloadedError as e:
+                    response = _error(503, str(e), retry_after=1)
+                except PipelineTimeoutError as e:
+                    response = _error(504, str(e))
+                except RuntimeError as e:
+                    # 服务尚未初始化或正在关闭
+                    response = _error(503, str(e), retry_after=1)
+        self._requests.inc(path=request.path, status=str(response.status))
+        return response
+
+    async def _handle_store(self, request: web.Request) -> web.Response:
+        body = await _read_json(request)
+        if isinstance(body, list):
+            items = self._check_batch(body)
+            results = await asyncio.gather(
+                *[self._store(item) for item in items], return_exceptions=True
+            )
+            return _json([_item_result(result) for result in results])
+
+        result = await self._store(body)
+        return _json(result, status=200 if "record_id" in result else 202)
+
+    async def _store(self, item: Any) -> Dict[str, Any]:
+        message = _message_of(item)
+        envelope = await self.dear_moments.store_message(message)
+        if not item.get("wait", False):
+            return {"id": message.id, "status": "accepted"}
+        record_id = await envelope.future
+        return {"id": message.id, "status": "stored", "record_id": record_id}
+
+    async def _handle_stream(self, request: web.Request) -> web.StreamResponse:
+        """
+        流式写入: 每读到一行就放入存储管道, 管道过载时停止读取, 背压传回客户端
+        """
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/x-ndjson; charset=utf-8"}
+        )
+        await response.prepare(request)
+        accepted = rejected = 0
+        line_number = 0
+        async for line in request.content:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                if not isinstance(item, dict):
+                    raise RequestError("消息需要是JSON对象")
+                result = await self._store_streamed(item)
+                accepted += 1
+            except Exception as e:
+                rejected += 1
+                result = {"status": "rejected", "error": str(e)}
+            result["line"] = line_number
+            await response.write((_dumps(result) + "\n").encode("utf-8"))
+        summary = {"accepted": accepted, "rejected": rejected}
+        await response.write((_dumps(summary) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def _store_streamed(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """流式写入不丢弃消息: 存储管道过载时等待后重试, 直到管道开始关闭"""
+        delay = 0.05
+        while True:
+            try:
+                return await self._store({**item, "wait": False})
+            except PipelineOverloadedError:
+                if not self.dear_moments.storage_pipeline.accepting:
+                    raise
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+
+    async def _handle_query(self, request: web.Request) -> web.Response:
+        body = await _read_json(request)
+        if isinstance(body, list):
+            items = self._check_batch(body)
+            results = await asyncio.gather(
+                *[self._query(item) for item in items], return_exceptions=True
+            )
+            return _json([_item_result(result) for result in results])
+        return _json(await self._query(body))
+
+    async def _query(self, item: Any) -> Dict[str, Any]:
+        if not isinstance(item, dict):
+            raise RequestError("查询需要是JSON对象")
+        if "query" not in item and isinstance(item.get("memory_id"), str):
+            results = await self.dear_moments.recall(
+                item["memory_id"], timeout=item.get("timeout")
+            )
+            return {"results": results}
+        if not isinstance(item.get("query"), str):
+            raise RequestError("查询需要 query 字段")
+        results = await self.dear_moments.query(
+            item["query"], timeout=item.get("timeout"), memory_id=item.get("memory_id")
+        )
+        return {"results": results or []}
+
+    def _check_batch(self, body: List[Any]) -> List[Any]:
+        if not body:
+            raise RequestError("批量请求不能为空")
+        if len(body) > self.max_batch_size:
+            raise RequestError(f"批量请求最多 {self.max_batch_size} 项")
+        return body
+
+    async def _handle_export(self, request: web.Request) -> web.StreamResponse:
+        body = await _read_json(request)
+        if not isinstance(body, dict) or "ring" not in body or "node" not in body:
+            raise RequestError("导出需要 ring 和 node 字段")
+        ring = HashRing.from_dict(body["ring"])
+        if body["node"] not in ring.shards:
+            raise RequestError(f"哈希环中没有分片 {body['node']}")
+        # 在开始返回之前排空, 超时时返回504, 路由器放弃这次迁移
+        memory_ids = await prepare_export(
+            ring,
+            body["node"],
+            self.dear_moments.storage_pipeline,
+            body.get("drain_timeout", 30.0),
+        )
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/x-ndjson; charset=utf-8"}
+        )
+        await response.prepare(request)
+        async for entry in export_memories(memory_ids):
+            await response.write((_dumps(entry) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def _handle_import(self, request: web.Request) -> web.Response:
+        """
+        导入迁移流, 返回新建的记录ID和上下文的记忆ID, 路由器在迁移失败时按它们回滚;
+        导入中途失败(包括连接断开)时先删除已经导入的部分, 再返回错误
+        """
+        created: Dict[str, List[str]] = {"record": [], "context": []}
+        try:
+            async for line in request.content:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise RequestError(f"导入流中有不合法的JSON: {e}") from e
+                kind, created_id = await import_memory(entry)
+                if created_id is not None:
+                    created[kind].append(created_id)
+        except BaseException:
+            await delete_memories(created["record"], created["context"])
+            raise
+        return _json(
+            {
+                "records": len(created["record"]),
+                "contexts": len(created["context"]),
+                "record_ids": created["record"],
+                "memory_ids": created["context"],
+            }
+        )
+
+    async def _handle_delete(self, request: web.Request) -> web.Response:
+        body = await _read_json(request)
+        if not isinstance(body, dict):
+            raise RequestError("删除需要 record_ids 和 memory_ids 字段")
+        deleted = await delete_memories(
+            body.get("record_ids", []), body.get("memory_ids", [])
+        )
+        return _json(deleted)
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return _json({"status": "ok"})
+
+    async def _handle_ready(self, request: web.Request) -> web.Response:
+        """就绪检查: 两个管道都在运行且没有在关闭, 同时返回各管道的积压情况"""
+        pipelines = [
+            getattr(self.dear_moments, name, None)
+            for name in ("storage_pipeline", "query_pipeline")
+        ]
+        ready = self.dear_moments.running and all(
+            pipeline is not None and pipeline.accepting for pipeline in pipelines
+        )
+        body = {
+            "status": "ready" if ready else "unavailable",
+            "pipelines": {
+                pipeline.name: {
+                    "accepting": pipeline.accepting,
+                    "backlog": sum(stage.backlog() for stage in pipeline.stages),
+                    "estimated_wait_ms": round(pipeline.estimate_wait() * 1000, 1),
+                }
+                for pipeline in pipelines
+                if pipeline is not None
+            },
+        }
+        return _json(body, status=200 if ready else 503)
+
+    def create_app(self) -> web.Application:
+        """创建注册了所有接口的aiohttp应用"""
+        app = web.Application(
+            middlewares=[self._limit], client_max_size=16 * 1024 * 1024
+        )
+        app.router.add_post("/v1/messages", self._handle_store)
+        app.router.add_post("/v1/messages/stream", self._handle_stream)
+        app.router.add_post("/v1/query", self._handle_query)
+        app.router.add_post("/v1/cluster/export", self._handle_export)
+        app.router.add_post("/v1/cluster/import", self._handle_import)
+        app.router.add_post("/v1/cluster/delete", self._handle_delete)
+        app.router.add_get("/healthz", self._handle_health)
+        app.router.add_get("/readyz", self._handle_ready)
+        return app
+
+    async def start(self) -> None:
+        """启动HTTP服务"""
+        self._runner = web.AppRunner(
+            self.create_app(), access_log=None, keepalive_timeout=self.keepalive_timeout
+        )
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.logger.info(f"记忆服务: http://{self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        """停止接收新连接, 等待正在处理的请求完成"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _message_of(item: Any) -> Message:
+    """把请求体中的一项转换为消息, system_prompt 字段会更新该记忆的系统提示词"""
+    if not isinstance(item, dict):
+        raise RequestError("消息需要是JSON对象")
+    missing = [key for key in ("memory_id", "content", "sender") if key not in item]
+    if missing:
+        raise RequestError(f"消息缺少字段: {', '.join(missing)}")
+    if item.get("system_prompt"):
+        SystemPrompt.get_instance().set(
+            memory_id=item["memory_id"], system_prompt=item["system_prompt"]
+        )
+    # 上下文在消息处理阶段按 memory_id 关联
+    return Message(
+        id=str(item.get("id") or uuid.uuid4().hex),
+        memory_id=str(item["memory_id"]),
+        content=str(item["content"]),
+        sender=str(item["sender"]),
+        context=None,
+    )
+
+
+def _item_result(result: Any) -> Dict[str, Any]:
+    """批量请求中单项的结果, 失败的项带上错误类型, 不影响其他项"""
+    if not isinstance(result, Exception):
+        return result
+    if isinstance(result, PipelineOverloadedError):
+        status = "rejected"
+    elif isinstance(result, PipelineTimeoutError):
+        status = "timeout"
+    else:
+        status = "error"
+    return {"status": status, "error": str(result)}
+
+
+async def _read_json(request: web.Request) -> Any:
+    try:
+        return await request.json(loads=json.loads)
+    except json.JSONDecodeError as e:
+        raise RequestError(f"请求体不是合法的JSON: {e}") from e
+
+
+def _json(body: Any, status: int = 200) -> web.Response:
+    return web.json_response(body, status=status, dumps=_dumps)
+
+
+def _error(
+    status: int, message: str, retry_after: Optional[int] = None
+) -> web.Response:
+    response = _json({"error": message}, status=status)
+    if retry_after is not None:
+        response.headers["Retry-After"] = str(retry_after)
+    return response
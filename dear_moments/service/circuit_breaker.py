@@ -0,0 +1,111 @@
+"""
+熔断器: 后端连续失败时暂停向其发送请求, 冷却后放行少量探测请求
+"""
+
+import time
+
+
+class CircuitBreaker:
+    """
+    熔断器, 有三种状态
+
+    - closed: 正常放行, 连续失败达到阈值后进入 open
+    - open: 拒绝所有请求, 经过 reset_timeout 后进入 half_open
+    - half_open: 放行最多 half_open_max_calls 个探测请求, 成功则回到 closed, 失败则重新 open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        half_open_max_calls: int = 1,
+    ):
+        """
+        初始化熔断器
+
+        Args:
+            failure_threshold (int): 触发熔断的连续失败次数
+            reset_timeout (float): 熔断后多久进入半开状态(秒)
+            half_open_max_calls (int): 半开状态下同时放行的探测请求数
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        self.total_failures = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        """当前状态, open 状态超时后自动转为 half_open"""
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        是否放行一次请求, 半开状态下放行会占用一个探测名额
+
+        Returns:
+            bool: 是否放行
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """记录一次成功, 半开状态下探测成功则恢复"""
+        self._consecutive_failures = 0
+        if self._state == self.HALF_OPEN:
+            self._state = self.CLOSED
+            self._half_open_calls = 0
+
+    def release(self) -> None:
+        """
+        放行的请求没有结果就结束(如被取消)时调用, 归还半开状态下占用的探测名额,
+        否则名额一直被占用, 熔断器再也不会放行探测请求
+        """
+        if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_failure(self) -> None:
+        """记录一次失败, 半开状态下探测失败或连续失败达到阈值时熔断"""
+        self.total_failures += 1
+        self._consecutive_failures += 1
+        if (
+            self._state == self.HALF_OPEN
+            or self._consecutive_failures >= self.failure_threshold
+        ):
+            self._trip()
+
+    def _trip(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_calls = 0
+        self.times_opened += 1
+
+    def get_statistics(self) -> dict:
+        """获取熔断器统计信息"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "total_failures": self.total_failures,
+            "times_opened": self.times_opened,
+        }
@@ -1,9 +1,11 @@
 from .embedding_service import EmbeddingService
 from .embedding_service_factory import EmbeddingServiceFactory
 from .network.gemini_embedding import GeminiEmbeddingService
+from .hedged_embedding import HedgedEmbeddingService
 
 __all__ = [
     "EmbeddingService",
     "EmbeddingServiceFactory",
     "GeminiEmbeddingService",
+    "HedgedEmbeddingService",
 ]
@@ -1,6 +1,8 @@
 # 获得文本嵌入服务的抽象基类, 定义了文本嵌入服务的基本接口
 
 from abc import ABC, abstractmethod
+from typing import List
+import asyncio
 import numpy as np
 
 
@@ -28,6 +30,19 @@ class EmbeddingService(ABC):
         """
         pass
 
+    async def get_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        批量获取文本的嵌入向量, 默认并发调用 get_embedding,
+        支持批量接口的服务应重写为一次请求
+
+        Args:
+            texts (List[str]): 输入文本列表
+
+        Returns:
+            List[np.ndarray]: 与输入顺序一致的嵌入向量
+        """
+        return list(await asyncio.gather(*[self.get_embedding(t) for t in texts]))
+
     async def close(self):
         """
         关闭嵌入服务，释放资源
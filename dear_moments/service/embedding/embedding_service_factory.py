@@ -1,5 +1,7 @@
 from .embedding_service import EmbeddingService
 from .network.gemini_embedding import GeminiEmbeddingService
+from .hedged_embedding import HedgedEmbeddingService
+from dear_moments.service.hedging import RequestHedger
 
 
 class EmbeddingServiceFactory:
@@ -14,11 +16,20 @@ class EmbeddingServiceFactory:
 
         Args:
             service_type (str): 服务类型，如 'gemini', 'local-st'
-            **kwargs: 服务特定的参数
+            **kwargs: 服务特定的参数, 其中 hedging 为请求对冲配置
 
         Returns:
             EmbeddingService: 嵌入服务实例
         """
+        hedger = RequestHedger.from_config(kwargs.pop("hedging", None))
+        service = EmbeddingServiceFactory._create_backend(type, **kwargs)
+        if hedger is not None:
+            service = HedgedEmbeddingService(service, hedger)
+        return service
+
+    @staticmethod
+    def _create_backend(type: str, **kwargs) -> EmbeddingService:
+        """创建实际发起请求的嵌入服务实例"""
         if type == "gemini":
             api_key = kwargs.get("api_key")
             if not api_key:
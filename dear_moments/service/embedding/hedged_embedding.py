@@ -0,0 +1,56 @@
+from typing import List
+import numpy as np
+
+from .embedding_service import EmbeddingService
+from dear_moments.service.hedging import RequestHedger
+
+
+class HedgedEmbeddingService(EmbeddingService):
+    """
+    带请求对冲的嵌入服务, 包装另一个嵌入服务
+    """
+
+    def __init__(self, backend: EmbeddingService, hedger: RequestHedger):
+        """
+        初始化对冲嵌入服务
+
+        Args:
+            backend (EmbeddingService): 实际发起请求的嵌入服务
+            hedger (RequestHedger): 请求对冲器
+        """
+        super().__init__()
+        self.backend = backend
+        self.hedger = hedger
+        self.model = getattr(backend, "model", type(backend).__name__)
+
+    async def get_embedding(self, text: str) -> np.ndarray:
+        """
+        获取文本的嵌入向量, 超过p95延迟时发出对冲请求
+
+        Args:
+            text (str): 输入文本
+
+        Returns:
+            np.ndarray: 嵌入向量
+        """
+        return await self.hedger.run(lambda: self.backend.get_embedding(text))
+
+    async def get_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        批量获取嵌入向量, 批量请求的延迟与单条请求不可比, 不参与对冲
+
+        Args:
+            texts (List[str]): 输入文本列表
+
+        Returns:
+            List[np.ndarray]: 与输入顺序一致的嵌入向量
+        """
+        return await self.backend.get_embeddings(texts)
+
+    def get_statistics(self) -> dict:
+        """获取对冲统计信息"""
+        return {"hedging": self.hedger.get_statistics()}
+
+    async def close(self):
+        """关闭后端服务"""
+        await self.backend.close()
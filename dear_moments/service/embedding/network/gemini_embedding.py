@@ -1,7 +1,15 @@
 import aiohttp
+from typing import List
 from ..embedding_service import EmbeddingService
+from dear_moments.service.rate_limit import RateLimitError, RateLimitMonitor
+from dear_moments.metrics import metrics
+from dear_moments.tracing import tracer
 import numpy as np
 
+_calls_total = metrics().counter(
+    "gemini_calls_total", "Gemini API调用次数, 按服务和HTTP状态码"
+)
+
 
 class GeminiEmbeddingService(EmbeddingService):
     """
@@ -22,6 +30,7 @@ class GeminiEmbeddingService(EmbeddingService):
         self.model = model
         self.timeout = timeout
         self.base_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:embedContent?key={api_key}"
+        self.batch_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:batchEmbedContents?key={api_key}"
         self.client = None
 
     def _ensure_client(self):
@@ -47,19 +56,73 @@ class GeminiEmbeddingService(EmbeddingService):
             "content": {"parts": [{"text": text}]},
         }
 
-        async with client.post(
-            self.base_url, headers=headers, json=data, timeout=self.timeout
-        ) as response:
-            if response.status == 200:
-                result = await response.json()
-                if "embedding" in result and "values" in result["embedding"]:
-                    # 性能考虑, float32类型的numpy数组比list更快
-                    return np.array(result["embedding"]["values"], dtype=np.float32)
+        with tracer().span("gemini.embed", model=self.model):
+            async with client.post(
+                self.base_url, headers=headers, json=data, timeout=self.timeout
+            ) as response:
+                _calls_total.inc(service="embedding", status=str(response.status))
+                if response.status == 200:
+                    result = await response.json()
+                    if "embedding" in result and "values" in result["embedding"]:
+                        # 性能考虑, float32类型的numpy数组比list更快
+                        return np.array(
+                            result["embedding"]["values"], dtype=np.float32
+                        )
+                    else:
+                        raise ValueError(f"API返回格式异常: {result}")
+                else:
+                    error_text = await response.text()
+                    if response.status == 429:
+                        RateLimitMonitor.get_instance().record("embedding")
+                        raise RateLimitError(
+                            f"API请求失败: {response.status} - {error_text}"
+                        )
+                    raise Exception(f"API请求失败: {response.status} - {error_text}")
+
+    async def get_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        批量获取文本的嵌入向量, 一次请求完成
+
+        Args:
+            texts (List[str]): 输入文本列表
+
+        Returns:
+            List[np.ndarray]: 与输入顺序一致的嵌入向量
+        """
+        client = self._ensure_client()
+        headers = {"Content-Type": "application/json"}
+        data = {
+            "requests": [
+                {
+                    "model": f"models/{self.model}",
+                    "content": {"parts": [{"text": text}]},
+                }
+                for text in texts
+            ]
+        }
+
+        with tracer().span("gemini.batch_embed", model=self.model, texts=len(texts)):
+            async with client.post(
+                self.batch_url, headers=headers, json=data, timeout=self.timeout
+            ) as response:
+                _calls_total.inc(service="embedding", status=str(response.status))
+                if response.status == 200:
+                    result = await response.json()
+                    embeddings = result.get("embeddings", [])
+                    if len(embeddings) != len(texts):
+                        raise ValueError(f"API返回格式异常: {result}")
+                    return [
+                        np.array(embedding["values"], dtype=np.float32)
+                        for embedding in embeddings
+                    ]
                 else:
-                    raise ValueError(f"API返回格式异常: {result}")
-            else:
-                error_text = await response.text()
-                raise Exception(f"API请求失败: {response.status} - {error_text}")
+                    error_text = await response.text()
+                    if response.status == 429:
+                        RateLimitMonitor.get_instance().record("embedding")
+                        raise RateLimitError(
+                            f"API请求失败: {response.status} - {error_text}"
+                        )
+                    raise Exception(f"API请求失败: {response.status} - {error_text}")
 
     async def close(self):
         """关闭HTTP客户端"""
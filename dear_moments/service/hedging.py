@@ -0,0 +1,197 @@
+"""
+请求对冲: 请求超过观测到的p95延迟仍未返回时, 发送一个重复请求, 取先返回的结果
+"""
+
+import asyncio
+import contextlib
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+from dear_moments.metrics import metrics
+
+T = TypeVar("T")
+
+_hedges_total = metrics().counter(
+    "hedged_requests_total", "对冲请求数, result为 sent/won/budget_denied"
+)
+
+
+class LatencyTracker:
+    """
+    滑动窗口延迟统计
+    """
+
+    def __init__(self, window: int = 200):
+        """
+        Args:
+            window (int): 保留最近多少次请求的延迟
+        """
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        """记录一次延迟(秒)"""
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        计算分位数
+
+        Args:
+            q (float): 分位数, 0-1之间
+
+        Returns:
+            Optional[float]: 对应分位的延迟, 没有样本时为None
+        """
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class RequestHedger:
+    """
+    请求对冲器
+
+    - 样本不足时不对冲, 避免冷启动阶段按错误的阈值发出重复请求
+    - 最近 window 次请求中对冲的比例不超过 max_extra_load, 保证额外负载有上限
+    - 先返回的结果胜出, 另一个请求会被取消并等待其退出
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        max_extra_load: float = 0.05,
+        min_samples: int = 20,
+        min_delay: float = 0.05,
+        window: int = 200,
+    ):
+        """
+        初始化请求对冲器
+
+        Args:
+            percentile (float): 触发对冲的延迟分位数
+            max_extra_load (float): 对冲请求占总请求的最大比例
+            min_samples (int): 开始对冲前至少需要的延迟样本数
+            min_delay (float): 对冲等待的最短时间(秒)
+            window (int): 延迟和预算统计的窗口大小
+        """
+        self.percentile = percentile
+        self.max_extra_load = max_extra_load
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latency = LatencyTracker(window)
+        self._recent_hedges: Deque[bool] = deque(maxlen=window)
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """当前的对冲等待时间, 样本不足时为None"""
+        if len(self.latency) < self.min_samples:
+            return None
+        return max(self.min_delay, self.latency.percentile(self.percentile))
+
+    def _budget_allows(self) -> bool:
+        """最近窗口内的对冲比例是否仍低于预算"""
+        hedges = sum(self._recent_hedges)
+        return hedges + 1 <= self.max_extra_load * max(len(self._recent_hedges), 1)
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行一次可能被对冲的请求
+
+        Args:
+            call (Callable[[], Awaitable[T]]): 无参数的协程工厂, 每次调用发出一个新请求
+
+        Returns:
+            T: 先成功返回的结果
+        """
+        self.requests += 1
+        start_time = time.perf_counter()
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(call())
+        tasks = [primary]
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    if self._budget_allows():
+                        tasks.append(asyncio.ensure_future(call()))
+                        self.hedged += 1
+                        _hedges_total.inc(result="sent")
+                    else:
+                        self.budget_denied += 1
+                        _hedges_total.inc(result="budget_denied")
+            self._recent_hedges.append(len(tasks) > 1)
+
+            winner = await self._first_success(tasks)
+            if winner is not primary:
+                self.hedge_wins += 1
+                _hedges_total.inc(result="won")
+            self.latency.record(time.perf_counter() - start_time)
+            return winner.result()
+        finally:
+            await self._cancel(tasks)
+
+    @staticmethod
+    async def _first_success(tasks) -> asyncio.Future:
+        """等待第一个成功的请求, 全部失败时返回最早发出的请求"""
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    return task
+        return tasks[0]
+
+    @staticmethod
+    async def _cancel(tasks) -> None:
+        """取消未完成的请求并等待其退出, 释放连接"""
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+
+    def get_statistics(self) -> dict:
+        """获取对冲统计信息"""
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget_denied": self.budget_denied,
+            "extra_load": self.hedged / self.requests if self.requests else 0.0,
+            "hedge_delay": self.hedge_delay(),
+        }
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> Optional["RequestHedger"]:
+        """
+        根据配置创建对冲器
+
+        Args:
+            config (Optional[dict]): 对冲配置, 未配置或 enabled 为False时返回None
+
+        Returns:
+            Optional[RequestHedger]: 对冲器实例
+        """
+        if not config or not config.get("enabled", True):
+            return None
+        return cls(
+            percentile=config.get("percentile", 0.95),
+            max_extra_load=config.get("max_extra_load", 0.05),
+            min_samples=config.get("min_samples", 20),
+            min_delay=config.get("min_delay", 0.05),
+            window=config.get("window", 200),
+        )
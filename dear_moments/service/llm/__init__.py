@@ -1,7 +1,20 @@
 from .llm_service import LLMService
 from .llm_service_factory import LLMServiceFactory
+from .cached_llm import CachedLLMService
+from .hedged_llm import HedgedLLMService
+from .routing_llm import LLMRoute, RoutingLLMService
+from .response_cache import LLMResponseCache
+from .network.gemini_llm import GeminiLLMService
+from .local.local_llm import LocalLLMService
 
 __all__ = [
     "LLMService",
     "LLMServiceFactory",
+    "CachedLLMService",
+    "HedgedLLMService",
+    "LLMRoute",
+    "RoutingLLMService",
+    "LLMResponseCache",
+    "GeminiLLMService",
+    "LocalLLMService",
 ]
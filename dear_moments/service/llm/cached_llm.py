@@ -0,0 +1,146 @@
+from typing import Any, Optional
+import copy
+import json
+import time
+
+from .llm_service import LLMService
+from .response_cache import LLMResponseCache
+from dear_moments.utils.cache_scope import cache_refreshing, current_cache_scope
+from dear_moments.utils.tokens import estimate_tokens
+
+
+class CachedLLMService(LLMService):
+    """
+    带响应缓存的LLM服务, 包装另一个LLM服务
+
+    重复或几乎相同的提取请求(重试、重放、重复的对话)直接从缓存返回
+    """
+
+    def __init__(self, backend: LLMService, cache: LLMResponseCache) -> None:
+        """
+        初始化缓存LLM服务
+
+        Args:
+            backend (LLMService): 实际发起请求的LLM服务
+            cache (LLMResponseCache): 响应缓存
+        """
+        self.backend = backend
+        self.cache = cache
+        self.model = getattr(backend, "model", type(backend).__name__)
+
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
+        """
+        获取LLM的回复, 优先从缓存读取
+
+        Args:
+            prompt (str): 输入提示文本
+            prefix (str): 固定不变的提示词前缀
+
+        Returns:
+            str: LLM的回复文本
+        """
+        return await self._cached_call(
+            prompt,
+            prefix,
+            None,
+            lambda: self.backend.get_response(prompt, prefix=prefix),
+        )
+
+    async def get_structured(self, prompt: str, schema: dict, prefix: str = "") -> Any:
+        """
+        获取结构化响应, 优先从缓存读取
+
+        Args:
+            prompt (str): 输入提示文本
+            schema (dict): 期望的JSON Schema
+            prefix (str): 固定不变的提示词前缀
+
+        Returns:
+            Any: 解析后的JSON对象
+        """
+        return await self._cached_call(
+            prompt,
+            prefix,
+            {"responseSchema": schema},
+            lambda: self.backend.get_structured(prompt, schema, prefix=prefix),
+        )
+
+    async def _cached_call(
+        self, prompt: str, prefix: str, generation_config: Optional[dict], call
+    ) -> Any:
+        """
+        查找缓存, 未命中时调用后端并写入缓存
+
+        固定前缀计入命名空间, 语义匹配只比较变化的部分,
+        避免冗长的固定指令让所有提示词看起来都很相似
+
+        先做精确匹配, 未命中时才计算嵌入向量; 语义匹配只在当前缓存作用域
+        (通常是 memory_id)内进行, 不会把一个记忆的结果返回给另一个记忆,
+        没有作用域的调用只做精确匹配; 在 cache_refresh 中调用时跳过查找,
+        重新请求后端并覆盖缓存中的结果
+
+        Args:
+            prompt (str): 输入提示文本
+            prefix (str): 固定不变的提示词前缀
+            generation_config (Optional[dict]): 生成配置, 参与缓存键的计算
+            call: 无参数的协程工厂, 未命中时调用
+        """
+        config = dict(generation_config or {})
+        if prefix:
+            config["prefix"] = LLMResponseCache.make_key("", prefix)
+        namespace = LLMResponseCache.make_namespace(self.model, config)
+        key = LLMResponseCache.make_key(namespace, prompt)
+
+        refresh = cache_refreshing()
+        hit, value = (False, None) if refresh else self.cache.get_exact(key)
+        embedding = None
+        if not hit:
+            scope = current_cache_scope()
+            if self.cache.semantic_enabled and scope is not None:
+                namespace = LLMResponseCache.make_namespace(
+                    self.model, {**config, "scope": scope}
+                )
+                embedding = await self._embed(prompt)
+            if not refresh:
+                hit, value = self.cache.get_semantic(embedding, namespace)
+        if hit:
+            # 结构化结果会被下游修改, 返回副本避免污染缓存
+            return value if isinstance(value, str) else copy.deepcopy(value)
+
+        start_time = time.perf_counter()
+        value = await call()
+        latency = time.perf_counter() - start_time
+
+        output = value if isinstance(value, str) else json.dumps(value)
+        self.cache.put(
+            key,
+            value if isinstance(value, str) else copy.deepcopy(value),
+            namespace,
+            latency=latency,
+            tokens=estimate_tokens(prefix + prompt) + estimate_tokens(output),
+            embedding=embedding,
+        )
+        return value
+
+    async def _embed(self, prompt: str):
+        """计算提示词的嵌入向量, 嵌入服务不可用时退化为只做精确匹配"""
+        from dear_moments.service import Services
+
+        try:
+            return await Services.embedding_service().get_embedding(
+                LLMResponseCache.normalize_prompt(prompt)
+            )
+        except Exception:
+            return None
+
+    def get_statistics(self) -> dict:
+        """获取缓存统计信息, 后端有统计信息时一并返回"""
+        stats = {"response_cache": self.cache.get_statistics()}
+        if hasattr(self.backend, "get_statistics"):
+            stats["backend"] = self.backend.get_statistics()
+        return stats
+
+    async def close(self):
+        """关闭后端服务和缓存"""
+        await self.backend.close()
+        self.cache.close()
@@ -0,0 +1,64 @@
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class LLMCallRecord:
+    # 调用耗时(秒)
+    latency: float
+    # 提示词token数(包含命中缓存的部分)
+    prompt_tokens: int
+    # 命中上下文缓存的token数
+    cached_tokens: int = 0
+    # 输出token数
+    output_tokens: int = 0
+
+
+@dataclass
+class LLMCallStats:
+    """
+    LLM调用统计, 按是否命中上下文缓存分别累计延迟和token
+    """
+
+    calls: int = 0
+    cached_calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    cached_latency: float = 0.0
+    uncached_latency: float = 0.0
+    last_call: Optional[LLMCallRecord] = field(default=None)
+
+    def record(self, record: LLMCallRecord) -> None:
+        """记录一次调用"""
+        self.calls += 1
+        self.prompt_tokens += record.prompt_tokens
+        self.cached_tokens += record.cached_tokens
+        self.output_tokens += record.output_tokens
+        if record.cached_tokens:
+            self.cached_calls += 1
+            self.cached_latency += record.latency
+        else:
+            self.uncached_latency += record.latency
+        self.last_call = record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为统计字典"""
+        uncached_calls = self.calls - self.cached_calls
+        return {
+            "calls": self.calls,
+            "cached_calls": self.cached_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_token_ratio": (
+                self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+            ),
+            "avg_latency_cached": (
+                self.cached_latency / self.cached_calls if self.cached_calls else 0.0
+            ),
+            "avg_latency_uncached": (
+                self.uncached_latency / uncached_calls if uncached_calls else 0.0
+            ),
+            "last_call": asdict(self.last_call) if self.last_call else None,
+        }
@@ -0,0 +1,66 @@
+from typing import Any
+
+from .llm_service import LLMService
+from dear_moments.service.hedging import RequestHedger
+
+
+class HedgedLLMService(LLMService):
+    """
+    带请求对冲的LLM服务, 包装另一个LLM服务
+
+    单个慢响应不再占住流水线工作者直到超时
+    """
+
+    def __init__(self, backend: LLMService, hedger: RequestHedger) -> None:
+        """
+        初始化对冲LLM服务
+
+        Args:
+            backend (LLMService): 实际发起请求的LLM服务
+            hedger (RequestHedger): 请求对冲器
+        """
+        self.backend = backend
+        self.hedger = hedger
+        self.model = getattr(backend, "model", type(backend).__name__)
+
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
+        """
+        获取LLM的回复, 超过p95延迟时发出对冲请求
+
+        Args:
+            prompt (str): 输入提示文本
+            prefix (str): 固定不变的提示词前缀
+
+        Returns:
+            str: LLM的回复文本
+        """
+        return await self.hedger.run(
+            lambda: self.backend.get_response(prompt, prefix=prefix)
+        )
+
+    async def get_structured(self, prompt: str, schema: dict, prefix: str = "") -> Any:
+        """
+        获取结构化响应, 超过p95延迟时发出对冲请求
+
+        Args:
+            prompt (str): 输入提示文本
+            schema (dict): 期望的JSON Schema
+            prefix (str): 固定不变的提示词前缀
+
+        Returns:
+            Any: 解析后的JSON对象
+        """
+        return await self.hedger.run(
+            lambda: self.backend.get_structured(prompt, schema, prefix=prefix)
+        )
+
+    def get_statistics(self) -> dict:
+        """获取对冲统计信息, 后端有统计信息时一并返回"""
+        stats = {"hedging": self.hedger.get_statistics()}
+        if hasattr(self.backend, "get_statistics"):
+            stats["backend"] = self.backend.get_statistics()
+        return stats
+
+    async def close(self):
+        """关闭后端服务"""
+        await self.backend.close()
@@ -1,6 +1,10 @@
 # 用于请求llm服务的抽象基类
 
 from abc import ABC, abstractmethod
+from typing import Any
+import json
+
+from dear_moments.utils.json_repair import loads_tolerant
 
 
 class LLMService(ABC):
@@ -18,15 +22,37 @@ class LLMService(ABC):
         pass
 
     @abstractmethod
-    async def get_response(self, prompt: str) -> str:
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
         """
         获取LLM服务的响应
 
         :param prompt: 输入的提示文本
+        :param prefix: 固定不变的提示词前缀, 支持上下文缓存的服务会缓存这一部分,
+            不支持的服务直接拼接在prompt之前
         :return: LLM服务的响应文本
         """
         pass
 
+    async def get_structured(self, prompt: str, schema: dict, prefix: str = "") -> Any:
+        """
+        获取符合JSON Schema的结构化响应
+
+        默认实现把schema附加到提示词中, 再用容错解析器解析返回的文本;
+        支持原生结构化输出的服务应当覆盖此方法
+
+        :param prompt: 输入的提示文本
+        :param schema: 期望的JSON Schema
+        :param prefix: 固定不变的提示词前缀
+        :return: 解析后的JSON对象
+        :raises ValueError: 返回内容无法解析为JSON时抛出
+        """
+        schema_hint = json.dumps(schema, ensure_ascii=False)
+        response = await self.get_response(
+            f"{prompt}\n\n请严格按照以下JSON Schema返回JSON:\n{schema_hint}",
+            prefix=prefix,
+        )
+        return loads_tolerant(response)
+
     @abstractmethod
     async def close(self):
         """
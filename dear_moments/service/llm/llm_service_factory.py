@@ -1,5 +1,12 @@
 from .llm_service import LLMService
 from .network.gemini_llm import GeminiLLMService
+from .local.local_llm import LocalLLMService
+from .cached_llm import CachedLLMService
+from .hedged_llm import HedgedLLMService
+from .routing_llm import LLMRoute, RoutingLLMService
+from .response_cache import LLMResponseCache
+from dear_moments.service.circuit_breaker import CircuitBreaker
+from dear_moments.service.hedging import RequestHedger
 
 
 class LLMServiceFactory:
@@ -13,19 +20,83 @@ class LLMServiceFactory:
         创建LLM服务实例
 
         Args:
-            service_type (str): LLM服务类型，如 'gemini'
-            **kwargs: LLM服务特定的参数
+            service_type (str): LLM服务类型，如 'gemini', 'local', 'routing'
+            **kwargs: LLM服务特定的参数, 其中 cache 为响应缓存配置, hedging 为请求对冲配置
 
         Returns:
             LLMService: LLM服务实例
         """
+        cache_config = kwargs.pop("cache", None)
+        hedger = RequestHedger.from_config(kwargs.pop("hedging", None))
+        service = LLMServiceFactory._create_backend(type, **kwargs)
+
+        # 对冲包在缓存内层, 缓存命中的请求不计入延迟统计和对冲预算
+        if hedger is not None:
+            service = HedgedLLMService(service, hedger)
+
+        if cache_config and cache_config.get("enabled", True):
+            cache = LLMResponseCache(
+                ttl=cache_config.get("ttl", 3600),
+                max_entries=cache_config.get("max_entries", 1024),
+                semantic_threshold=cache_config.get("semantic_threshold"),
+                persist_path=cache_config.get("persist_path"),
+            )
+            service = CachedLLMService(service, cache)
+        return service
+
+    @staticmethod
+    def _create_backend(type: str, **kwargs) -> LLMService:
+        """创建实际发起请求的LLM服务实例"""
         if type == "gemini":
             api_key = kwargs.get("api_key")
             if not api_key:
                 raise ValueError("使用Gemini LLM服务需要提供api_key")
             model = kwargs.get("model", "gemini-2.0-flash")
             timeout = kwargs.get("timeout", 30)
-            return GeminiLLMService(api_key, model, timeout)
+            return GeminiLLMService(
+                api_key, model, timeout, context_cache=kwargs.get("context_cache")
+            )
+
+        elif type == "local":
+            return LocalLLMService(
+                model=kwargs.get("model", "local"),
+                latency_per_token=kwargs.get("latency_per_token", 0.0),
+                context_cache=kwargs.get("context_cache"),
+            )
+
+        elif type == "routing":
+            backends = kwargs.get("backends")
+            if not backends:
+                raise ValueError("使用路由LLM服务需要提供backends")
+            return RoutingLLMService(
+                [LLMServiceFactory._create_route(backend) for backend in backends]
+            )
 
         else:
             raise ValueError(f"不支持的LLM服务类型: {type}")
+
+    @staticmethod
+    def _create_route(config: dict) -> LLMRoute:
+        """
+        根据单个后端的配置创建路由
+
+        Args:
+            config (dict): 后端配置, 除服务参数外还可以包含 name, max_prompt_tokens, circuit_breaker
+
+        Returns:
+            LLMRoute: 路由
+        """
+        config = dict(config)
+        name = config.pop("name", None) or config.get("model", config.get("type"))
+        max_prompt_tokens = config.pop("max_prompt_tokens", None)
+        breaker_config = config.pop("circuit_breaker", {}) or {}
+        return LLMRoute(
+            name=name,
+            service=LLMServiceFactory.create(**config),
+            max_prompt_tokens=max_prompt_tokens,
+            breaker=CircuitBreaker(
+                failure_threshold=breaker_config.get("failure_threshold", 5),
+                reset_timeout=breaker_config.get("reset_timeout", 30),
+                half_open_max_calls=breaker_config.get("half_open_max_calls", 1),
+            ),
+        )
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, Dict, Optional
+from ..llm_service import LLMService
+from ..call_stats import LLMCallRecord, LLMCallStats
+from dear_moments.utils.tokens import estimate_tokens
+
+
+class LocalLLMService(LLMService):
+    """
+    本地替身LLM服务, 不发起网络请求
+
+    用于离线开发和压测: 结构化请求返回符合schema的空白结果,
+    并按token数模拟延迟, 同时模拟Gemini的上下文缓存以便统计前缀缓存的收益
+    """
+
+    def __init__(
+        self,
+        model: str = "local",
+        latency_per_token: float = 0.0,
+        context_cache: Optional[dict] = None,
+    ) -> None:
+        """
+        初始化本地LLM服务
+
+        Args:
+            model (str): 模型名称, 只用于标识
+            latency_per_token (float): 每个未缓存的提示词token模拟的延迟(秒)
+            context_cache (Optional[dict]): 上下文缓存配置, 包含 enabled, ttl
+        """
+        self.model = model
+        self.latency_per_token = latency_per_token
+        self.stats = LLMCallStats()
+
+        self.context_cache_ttl = None
+        if context_cache and context_cache.get("enabled", True):
+            self.context_cache_ttl = context_cache.get("ttl", 600)
+        self._cached_prefixes: Dict[str, float] = {}
+
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
+        """
+        模拟一次文本请求
+
+        Args:
+            prompt (str): 输入提示文本
+            prefix (str): 固定不变的提示词前缀
+
+        Returns:
+            str: 空字符串
+        """
+        await self._simulate(prompt, prefix)
+        return ""
+
+    async def get_structured(self, prompt: str, schema: dict, prefix: str = "") -> Any:
+        """
+        模拟一次结构化请求
+
+        Args:
+            prompt (str): 输入提示文本
+            schema (dict): 期望的JSON Schema
+            prefix (str): 固定不变的提示词前缀
+
+        Returns:
+            Any: 符合schema的空白结果
+        """
+        await self._simulate(prompt, prefix)
+        return self._skeleton(schema)
+
+    async def _simulate(self, prompt: str, prefix: str) -> None:
+        """模拟上下文缓存和请求延迟, 并记录调用统计"""
+        start_time = time.perf_counter()
+        prefix_tokens = estimate_tokens(prefix)
+        cached_tokens = prefix_tokens if self._hit_prefix(prefix) else 0
+        prompt_tokens = prefix_tokens + estimate_tokens(prompt)
+
+        delay = (prompt_tokens - cached_tokens) * self.latency_per_token
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        self.stats.record(
+            LLMCallRecord(
+                latency=time.perf_counter() - start_time,
+                prompt_tokens=prompt_tokens,
+                cached_tokens=cached_tokens,
+            )
+        )
+
+    def _hit_prefix(self, prefix: str) -> bool:
+        """前缀是否命中模拟的上下文缓存, 未命中时写入"""
+        if not prefix or self.context_cache_ttl is None:
+            return False
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        now = time.time()
+        hit = self._cached_prefixes.get(key, 0) > now
+        # 与Gemini一致, 每次使用都会续期
+        self._cached_prefixes[key] = now + self.context_cache_ttl
+        return hit
+
+    @classmethod
+    def _skeleton(cls, schema: dict) -> Any:
+        """根据schema生成空白结果"""
+        schema_type = str(schema.get("type", "STRING")).upper()
+        if schema_type == "OBJECT":
+            return {
+                name: cls._skeleton(sub_schema)
+                for name, sub_schema in schema.get("properties", {}).items()
+            }
+        if schema_type == "ARRAY":
+            return []
+        if schema_type in ("NUMBER", "INTEGER"):
+            return 0
+        if schema_type == "BOOLEAN":
+            return False
+        return ""
+
+    def get_statistics(self) -> dict:
+        """获取调用统计信息"""
+        return self.stats.to_dict()
+
+    async def close(self):
+        """本地服务没有需要释放的资源"""
+        self._cached_prefixes.clear()
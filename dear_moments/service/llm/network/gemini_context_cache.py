@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import aiohttp
+
+from dear_moments.app_context import AppContext
+from dear_moments.tracing import tracer
+
+CACHED_CONTENTS_URL = "https://generativelanguage.googleapis.com/v1beta/cachedContents"
+
+
+@dataclass
+class _CachedPrefix:
+    # Gemini返回的缓存资源名, 形如 cachedContents/xxxx
+    name: str
+    # 本地记录的过期时间戳
+    expire_at: float
+    # 缓存的前缀token数, 由Gemini返回
+    token_count: int = 0
+
+
+class GeminiContextCache:
+    """
+    Gemini上下文缓存(cachedContents)管理器
+
+    每个 (模型, 固定前缀) 只上传一次, 在TTL到期前刷新;
+    前缀过短等原因导致无法创建缓存时, 在一个TTL内不再重试, 调用方退回到直接发送完整提示词
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        get_client: Callable[[], aiohttp.ClientSession],
+        ttl: int = 600,
+        refresh_margin: int = 60,
+        max_entries: int = 64,
+        timeout: int = 30,
+    ):
+        """
+        初始化上下文缓存管理器
+
+        Args:
+            api_key (str): Gemini API密钥
+            model (str): 模型名称, 缓存与模型绑定
+            get_client (Callable): 返回共享HTTP客户端的函数
+            ttl (int): 缓存存活时间(秒)
+            refresh_margin (int): 距离过期还剩多少秒时刷新
+            max_entries (int): 最多保留的缓存数量, 超出时删除最久未使用的
+            timeout (int): 请求超时时间(秒)
+        """
+        self.api_key = api_key
+        self.model = model
+        self.get_client = get_client
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.logger = AppContext.get_instance().get("logger")
+
+        self._entries: "OrderedDict[str, _CachedPrefix]" = OrderedDict()
+        self._uncacheable: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+        self.created = 0
+        self.refreshed = 0
+        self.failed = 0
+
+    async def get(self, prefix: str) -> Optional[_CachedPrefix]:
+        """
+        获取前缀对应的缓存, 不存在或即将过期时创建或刷新
+
+        Args:
+            prefix (str): 固定的提示词前缀
+
+        Returns:
+            Optional[_CachedPrefix]: 可用的缓存, 无法缓存时返回None
+        """
+        key = hashlib.sha256(f"{self.model}\n{prefix}".encode("utf-8")).hexdigest()
+        now = time.time()
+
+        if now < self._uncacheable.get(key, 0):
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expire_at - now > self.refresh_margin:
+            self._entries.move_to_end(key)
+            return entry
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # 等待锁期间其他协程可能已经完成了创建或刷新
+            entry = self._entries.get(key)
+            now = time.time()
+            if entry is not None and entry.expire_at - now > self.refresh_margin:
+                return entry
+
+            try:
+                if entry is not None and entry.expire_at > now:
+                    await self._refresh(entry)
+                else:
+                    entry = await self._create(prefix)
+                    self._entries[key] = entry
+                    await self._evict()
+            except Exception as e:
+                self.failed += 1
+                self._entries.pop(key, None)
+                self._uncacheable[key] = now + self.ttl
+                self.logger.warning(f"无法创建Gemini上下文缓存, 退回完整提示词: {e}")
+                return None
+
+            self._entries.move_to_end(key)
+            return entry
+
+    async def _create(self, prefix: str) -> _CachedPrefix:
+        """上传前缀, 创建新的缓存"""
+        payload = {
+            "model": f"models/{self.model}",
+            "systemInstruction": {"parts": [{"text": prefix}]},
+            "ttl": f"{self.ttl}s",
+        }
+        data = await self._request("POST", CACHED_CONTENTS_URL, payload)
+        self.created += 1
+        return _CachedPrefix(
+            name=data["name"],
+            expire_at=time.time() + self.ttl,
+            token_count=data.get("usageMetadata", {}).get("totalTokenCount", 0),
+        )
+
+    async def _refresh(self, entry: _CachedPrefix) -> None:
+        """延长缓存的TTL"""
+        url = f"https://generativelanguage.googleapis.com/v1beta/{entry.name}"
+        await self._request("PATCH", url, {"ttl": f"{self.ttl}s"}, update_mask="ttl")
+        entry.expire_at = time.time() + self.ttl
+        self.refreshed += 1
+
+    async def _evict(self) -> None:
+        """超出容量时删除最久未使用的缓存"""
+        while len(self._entries) > self.max_entries:
+            _, entry = self._entries.popitem(last=False)
+            await self._delete(entry)
+
+    async def _delete(self, entry: _CachedPrefix) -> None:
+        """删除远端缓存, 失败时等待其自然过期"""
+        url = f"https://generativelanguage.googleapis.com/v1beta/{entry.name}"
+        try:
+            await self._request("DELETE", url)
+        except Exception as e:
+            self.logger.debug(f"删除Gemini上下文缓存失败: {e}")
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        payload: Optional[dict] = None,
+        update_mask: Optional[str] = None,
+    ) -> dict:
+        """发送cachedContents相关的请求"""
+        params = {"key": self.api_key}
+        if update_mask:
+            params["updateMask"] = update_mask
+        with tracer().span("gemini.cached_contents", method=method):
+            async with self.get_client().request(
+                method, url, params=params, json=payload, timeout=self.timeout
+            ) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise Exception(f"Gemini缓存API错误: {resp.status}, {error_text}")
+                return await resp.json()
+
+    def get_statistics(self) -> dict:
+        """获取上下文缓存的统计信息"""
+        return {
+            "cached_prefixes": len(self._entries),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
+
+    async def close(self) -> None:
+        """删除所有远端缓存, 避免继续产生存储费用"""
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            await self._delete(entry)
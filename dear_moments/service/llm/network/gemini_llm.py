@@ -1,5 +1,20 @@
 import aiohttp
+import time
+from typing import Any, Optional
 from ..llm_service import LLMService
+from ..call_stats import LLMCallRecord, LLMCallStats
+from .gemini_context_cache import GeminiContextCache
+from dear_moments.service.rate_limit import RateLimitError, RateLimitMonitor
+from dear_moments.utils.json_repair import loads_tolerant
+from dear_moments.metrics import metrics
+from dear_moments.tracing import current_span, tracer
+
+_calls_total = metrics().counter(
+    "gemini_calls_total", "Gemini API调用次数, 按服务和HTTP状态码"
+)
+_tokens_total = metrics().counter(
+    "gemini_tokens_total", "Gemini消耗的token数, kind为 prompt/cached/output"
+)
 
 
 class GeminiLLMService(LLMService):
@@ -8,13 +23,39 @@ class GeminiLLMService(LLMService):
     """
 
     def __init__(
-        self, api_key: str, model: str = "gemini-2.0-flash", timeout: int = 30
+        self,
+        api_key: str,
+        model: str = "gemini-2.0-flash",
+        timeout: int = 30,
+        context_cache: Optional[dict] = None,
     ) -> None:
+        """
+        初始化Gemini LLM服务
+
+        Args:
+            api_key (str): Gemini API密钥
+            model (str): 模型名称
+            timeout (int): 请求超时时间(秒)
+            context_cache (Optional[dict]): 上下文缓存配置, 包含 enabled, ttl, refresh_margin
+        """
         self.api_key = api_key
         self.model = model
         self.timeout = timeout
         self.base_url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
         self.client = None
+        self.stats = LLMCallStats()
+
+        self.context_cache = None
+        if context_cache and context_cache.get("enabled", True):
+            self.context_cache = GeminiContextCache(
+                api_key,
+                model,
+                self._ensure_client,
+                ttl=context_cache.get("ttl", 600),
+                refresh_margin=context_cache.get("refresh_margin", 60),
+                max_entries=context_cache.get("max_entries", 64),
+                timeout=timeout,
+            )
 
     def _ensure_client(self):
         """确保异步HTTP客户端已创建"""
@@ -22,58 +63,154 @@ class GeminiLLMService(LLMService):
             self.client = aiohttp.ClientSession()
         return self.client
 
-    async def get_response(self, prompt: str) -> str:
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
         """
         异步获取llm的回复
 
         Args:
             prompt (str): 输入提示文本
+            prefix (str): 固定不变的提示词前缀, 开启上下文缓存时只上传一次
 
         Returns:
             str: LLM的回复文本
         """
-        client = self._ensure_client()
+        payload = await self._build_payload(
+            prompt, prefix, {"responseModalities": ["Text"]}
+        )
+        return await self._generate(payload)
 
-        # 构建请求头
-        headers = {"Content-Type": "application/json"}
+    async def get_structured(self, prompt: str, schema: dict, prefix: str = "") -> Any:
+        """
+        使用Gemini的responseSchema获取结构化响应
+
+        Args:
+            prompt (str): 输入提示文本
+            schema (dict): 期望的JSON Schema
+            prefix (str): 固定不变的提示词前缀, 开启上下文缓存时只上传一次
+
+        Returns:
+            Any: 解析后的JSON对象
+        """
+        payload = await self._build_payload(
+            prompt,
+            prefix,
+            {"responseMimeType": "application/json", "responseSchema": schema},
+        )
+        response_text = await self._generate(payload)
+        # 受约束解码下几乎总是合法JSON, 但输出被截断时仍需要修复
+        return loads_tolerant(response_text)
 
-        # 构建请求体
+    async def _build_payload(
+        self, prompt: str, prefix: str, generation_config: dict
+    ) -> dict:
+        """
+        构建请求体, 前缀可以缓存时只发送变化的部分
+
+        Args:
+            prompt (str): 输入提示文本
+            prefix (str): 固定不变的提示词前缀
+            generation_config (dict): 生成配置
+
+        Returns:
+            dict: 请求体
+        """
+        cached = None
+        if prefix and self.context_cache is not None:
+            cached = await self.context_cache.get(prefix)
+
+        text = prompt if cached is not None else prefix + prompt
         payload = {
-            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
-            "generationConfig": {"responseModalities": ["Text"]},
+            "contents": [{"role": "user", "parts": [{"text": text}]}],
+            "generationConfig": generation_config,
         }
+        if cached is not None:
+            payload["cachedContent"] = cached.name
+        return payload
+
+    async def _generate(self, payload: dict) -> str:
+        """
+        发送generateContent请求并提取回复文本
+
+        Args:
+            payload (dict): 请求体
+
+        Returns:
+            str: LLM的回复文本
+        """
+        client = self._ensure_client()
+
+        # 构建请求头
+        headers = {"Content-Type": "application/json"}
 
         # 发送请求
-        async with client.post(
-            self.base_url, json=payload, headers=headers, timeout=self.timeout
-        ) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Gemini API错误: {resp.status}, {error_text}")
-
-            try:
-                response_data = await resp.json()
-            except Exception as e:
-                text = await resp.text()
-                raise Exception(f"Gemini返回了非JSON数据: {text}")
-
-            # 解析响应
-            if "candidates" not in response_data:
-                raise Exception(f"Gemini返回异常结果: {response_data}")
-
-            candidate = response_data["candidates"][0]
-            if "content" in candidate and "parts" in candidate["content"]:
-                parts = candidate["content"]["parts"]
-                response_text = ""
-                for part in parts:
-                    if "text" in part:
-                        response_text += part["text"]
-                return response_text
-
-            raise Exception(f"无法从Gemini响应中提取文本: {response_data}")
+        start_time = time.perf_counter()
+        with tracer().span("gemini.generate", model=self.model):
+            async with client.post(
+                self.base_url, json=payload, headers=headers, timeout=self.timeout
+            ) as resp:
+                _calls_total.inc(service="llm", status=str(resp.status))
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    if resp.status == 429:
+                        RateLimitMonitor.get_instance().record("llm")
+                        raise RateLimitError(
+                            f"Gemini API错误: {resp.status}, {error_text}"
+                        )
+                    raise Exception(f"Gemini API错误: {resp.status}, {error_text}")
+
+                try:
+                    response_data = await resp.json()
+                except Exception as e:
+                    text = await resp.text()
+                    raise Exception(f"Gemini返回了非JSON数据: {text}")
+
+                self._record_usage(response_data, time.perf_counter() - start_time)
+
+                # 解析响应
+                if "candidates" not in response_data:
+                    raise Exception(f"Gemini返回异常结果: {response_data}")
+
+                candidate = response_data["candidates"][0]
+                if "content" in candidate and "parts" in candidate["content"]:
+                    parts = candidate["content"]["parts"]
+                    response_text = ""
+                    for part in parts:
+                        if "text" in part:
+                            response_text += part["text"]
+                    return response_text
+
+                raise Exception(f"无法从Gemini响应中提取文本: {response_data}")
+
+    def _record_usage(self, response_data: dict, latency: float) -> None:
+        """记录单次调用的延迟和token使用情况"""
+        usage = response_data.get("usageMetadata", {})
+        record = LLMCallRecord(
+            latency=latency,
+            prompt_tokens=usage.get("promptTokenCount", 0),
+            cached_tokens=usage.get("cachedContentTokenCount", 0),
+            output_tokens=usage.get("candidatesTokenCount", 0),
+        )
+        self.stats.record(record)
+        span = current_span()
+        if span is not None:
+            span.set_attribute("prompt_tokens", record.prompt_tokens)
+            span.set_attribute("cached_tokens", record.cached_tokens)
+            span.set_attribute("output_tokens", record.output_tokens)
+        _tokens_total.inc(record.prompt_tokens, kind="prompt")
+        _tokens_total.inc(record.cached_tokens, kind="cached")
+        _tokens_total.inc(record.output_tokens, kind="output")
+
+    def get_statistics(self) -> dict:
+        """获取调用统计信息"""
+        stats = self.stats.to_dict()
+        if self.context_cache is not None:
+            stats["context_cache"] = self.context_cache.get_statistics()
+        return stats
 
     async def close(self):
         """关闭HTTP客户端"""
+        if self.context_cache is not None and self.client is not None:
+            await self.context_cache.close()
         if self.client:
             await self.client.close()
             self.client = None
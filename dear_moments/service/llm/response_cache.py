@@ -0,0 +1,329 @@
+"""
+LLM响应缓存, 支持精确匹配和语义匹配两种命中方式
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+from dear_moments.metrics import metrics
+
+_WHITESPACE = re.compile(r"\s+")
+
+_lookups_total = metrics().counter(
+    "llm_response_cache_total", "LLM响应缓存查找次数, result为 exact_hit/semantic_hit/miss"
+)
+
+
+@dataclass
+class CacheEntry:
+    # 缓存的响应, 文本或结构化对象
+    value: Any
+    # 命名空间, 由模型和生成配置决定, 语义匹配只在同一命名空间内进行
+    namespace: str
+    # 写入时间戳
+    created_at: float = field(default_factory=time.time)
+    # 原始调用耗时(秒), 命中时计入节省的延迟
+    latency: float = 0.0
+    # 原始调用的token估算值, 命中时计入节省的token
+    tokens: int = 0
+    # 提示词的嵌入向量, 仅在开启语义匹配时存在
+    embedding: Optional[np.ndarray] = None
+
+
+class LLMResponseCache:
+    """
+    LLM响应缓存
+
+    - 精确命中: 模型、生成配置和归一化后提示词的哈希
+    - 语义命中: 提示词嵌入向量的余弦相似度超过严格阈值
+    - 条目按TTL过期, 超过容量时按LRU淘汰, 可选用sqlite持久化
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        max_entries: int = 1024,
+        semantic_threshold: Optional[float] = None,
+        persist_path: Optional[str] = None,
+    ):
+        """
+        初始化响应缓存
+
+        Args:
+            ttl (float): 条目存活时间(秒)
+            max_entries (int): 最大条目数
+            semantic_threshold (Optional[float]): 语义命中的相似度阈值, 为None时关闭语义匹配
+            persist_path (Optional[str]): sqlite持久化文件路径, 为None时只保存在内存中
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self.saved_latency = 0.0
+
+        if persist_path:
+            self._open_db(persist_path)
+
+    @property
+    def semantic_enabled(self) -> bool:
+        """是否开启语义匹配"""
+        return self.semantic_threshold is not None
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """归一化提示词, 合并连续空白"""
+        return _WHITESPACE.sub(" ", prompt).strip()
+
+    @staticmethod
+    def make_namespace(model: str, generation_config: Optional[dict] = None) -> str:
+        """由模型名称和生成配置计算命名空间"""
+        raw = json.dumps(
+            {"model": model, "config": generation_config or {}},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def make_key(cls, namespace: str, prompt: str) -> str:
+        """计算精确匹配的键"""
+        raw = f"{namespace}\n{cls.normalize_prompt(prompt)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(
+        self, key: str, embedding: Optional[np.ndarray] = None, namespace: str = ""
+    ) -> Tuple[bool, Any]:
+        """
+        查找缓存, 先精确匹配再语义匹配
+
+        Args:
+            key (str): 精确匹配的键
+            embedding (Optional[np.ndarray]): 提示词嵌入向量, 用于语义匹配
+            namespace (str): 命名空间, 语义匹配只在同一命名空间内进行
+
+        Returns:
+            Tuple[bool, Any]: (是否命中, 缓存的响应)
+        """
+        hit, value = self.get_exact(key)
+        if hit:
+            return hit, value
+        return self.get_semantic(embedding, namespace)
+
+    def get_exact(self, key: str) -> Tuple[bool, Any]:
+        """
+        只做精确匹配, 未命中时不计入未命中次数, 调用方接着进行语义匹配
+
+        Args:
+            key (str): 精确匹配的键
+
+        Returns:
+            Tuple[bool, Any]: (是否命中, 缓存的响应)
+        """
+        entry = self._get_live(key)
+        if entry is None:
+            return False, None
+        self.exact_hits += 1
+        _lookups_total.inc(result="exact_hit")
+        return True, self._record_hit(key, entry)
+
+    def get_semantic(
+        self, embedding: Optional[np.ndarray], namespace: str
+    ) -> Tuple[bool, Any]:
+        """
+        只做语义匹配, 精确匹配已经未命中时调用
+
+        Args:
+            embedding (Optional[np.ndarray]): 提示词嵌入向量, 为None时直接记为未命中
+            namespace (str): 命名空间, 语义匹配只在同一命名空间内进行
+
+        Returns:
+            Tuple[bool, Any]: (是否命中, 缓存的响应)
+        """
+        if embedding is not None and self.semantic_enabled:
+            match = self._semantic_lookup(embedding, namespace)
+            if match is not None:
+                self.semantic_hits += 1
+                _lookups_total.inc(result="semantic_hit")
+                return True, self._record_hit(*match)
+
+        self.misses += 1
+        _lookups_total.inc(result="miss")
+        return False, None
+
+    def put(
+        self,
+        key: str,
+        value: Any,
+        namespace: str,
+        latency: float = 0.0,
+        tokens: int = 0,
+        embedding: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        写入缓存
+
+        Args:
+            key (str): 精确匹配的键
+            value (Any): 响应内容, 需要能被JSON序列化
+            namespace (str): 命名空间
+            latency (float): 原始调用耗时(秒)
+            tokens (int): 原始调用的token估算值
+            embedding (Optional[np.ndarray]): 提示词嵌入向量
+        """
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        entry = CacheEntry(
+            value=value,
+            namespace=namespace,
+            latency=latency,
+            tokens=tokens,
+            embedding=embedding,
+        )
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._delete_persisted(old_key)
+        self._persist(key, entry)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+            ),
+            "saved_tokens": self.saved_tokens,
+            "saved_latency_seconds": round(self.saved_latency, 3),
+        }
+
+    def close(self) -> None:
+        """关闭持久化连接"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # ===================================================
+    #                     内部实现
+    # ===================================================
+
+    def _expired(self, entry: CacheEntry, now: Optional[float] = None) -> bool:
+        return (now or time.time()) - entry.created_at > self.ttl
+
+    def _get_live(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            del self._entries[key]
+            self._delete_persisted(key)
+            return None
+        return entry
+
+    def _record_hit(self, key: str, entry: CacheEntry) -> Any:
+        self._entries.move_to_end(key)
+        self.saved_tokens += entry.tokens
+        self.saved_latency += entry.latency
+        return entry.value
+
+    def _semantic_lookup(
+        self, embedding: np.ndarray, namespace: str
+    ) -> Optional[Tuple[str, CacheEntry]]:
+        now = time.time()
+        candidates: List[Tuple[str, CacheEntry]] = [
+            (k, e)
+            for k, e in self._entries.items()
+            if e.embedding is not None
+            and e.namespace == namespace
+            and not self._expired(e, now)
+        ]
+        if not candidates:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        matrix = np.stack([e.embedding for _, e in candidates])
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = matrix @ query / np.maximum(norms, 1e-12)
+        best = int(np.argmax(scores))
+        if scores[best] < self.semantic_threshold:
+            return None
+        return candidates[best]
+
+    def _open_db(self, path: str) -> None:
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                namespace TEXT,
+                value TEXT,
+                created_at REAL,
+                latency REAL,
+                tokens INTEGER,
+                embedding BLOB
+            )
+            """
+        )
+        self._db.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,)
+        )
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT key, namespace, value, created_at, latency, tokens, embedding "
+            "FROM llm_cache ORDER BY created_at DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for key, namespace, value, created_at, latency, tokens, blob in reversed(rows):
+            self._entries[key] = CacheEntry(
+                value=json.loads(value),
+                namespace=namespace,
+                created_at=created_at,
+                latency=latency,
+                tokens=tokens,
+                embedding=(
+                    np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+                ),
+            )
+
+    def _persist(self, key: str, entry: CacheEntry) -> None:
+        if self._db is None:
+            return
+        blob = entry.embedding.tobytes() if entry.embedding is not None else None
+        self._db.execute(
+            "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                entry.namespace,
+                json.dumps(entry.value, ensure_ascii=False),
+                entry.created_at,
+                entry.latency,
+                entry.tokens,
+                blob,
+            ),
+        )
+        self._db.commit()
+
+    def _delete_persisted(self, key: str) -> None:
+        if self._db is None:
+            return
+        self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        self._db.commit()
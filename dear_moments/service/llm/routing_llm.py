@@ -0,0 +1,156 @@
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, List, Optional
+
+from .llm_service import LLMService
+from dear_moments.app_context import AppContext
+from dear_moments.metrics import metrics
+from dear_moments.service.circuit_breaker import CircuitBreaker
+from dear_moments.utils.tokens import estimate_tokens
+
+_retries_total = metrics().counter("llm_retries_total", "LLM重试次数, 按原因")
+
+
+@dataclass
+class LLMRoute:
+    # 路由名称, 用于日志和统计
+    name: str
+    # 后端LLM服务
+    service: LLMService
+    # 该后端适合处理的最大提示词token数, None表示不限制
+    max_prompt_tokens: Optional[int] = None
+    # 后端的熔断器
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    # 成功调用次数
+    calls: int = 0
+    # 失败调用次数
+    failures: int = 0
+
+
+class RoutingLLMService(LLMService):
+    """
+    路由LLM服务, 持有多个后端, 按提示词大小和失败历史选择后端
+
+    后端按配置顺序排列, 通常便宜的小模型在前、大模型在后:
+    - 提示词超过某个后端的 max_prompt_tokens 时跳过它, 直接交给更大的模型
+    - 熔断中的后端被跳过, 主后端降级时流量转移到健康的后端
+    - 请求失败或结构化结果无法解析时升级到下一个后端
+    """
+
+    def __init__(self, routes: List[LLMRoute]) -> None:
+        """
+        初始化路由LLM服务
+
+        Args:
+            routes (List[LLMRoute]): 后端路由, 按优先级排序
+        """
+        if not routes:
+            raise ValueError("路由LLM服务至少需要一个后端")
+        self.routes = routes
+        self.model = routes[0].name
+        self.logger = AppContext.get_instance().get("logger")
+
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
+        """
+        获取LLM的回复, 自动选择后端
+
+        Args:
+            prompt (str): 输入提示文本
+            prefix (str): 固定不变的提示词前缀
+
+        Returns:
+            str: LLM的回复文本
+        """
+        return await self._route(
+            estimate_tokens(prefix) + estimate_tokens(prompt),
+            lambda service: service.get_response(prompt, prefix=prefix),
+        )
+
+    async def get_structured(self, prompt: str, schema: dict, prefix: str = "") -> Any:
+        """
+        获取结构化响应, 自动选择后端
+
+        Args:
+            prompt (str): 输入提示文本
+            schema (dict): 期望的JSON Schema
+            prefix (str): 固定不变的提示词前缀
+
+        Returns:
+            Any: 解析后的JSON对象
+        """
+        return await self._route(
+            estimate_tokens(prefix) + estimate_tokens(prompt),
+            lambda service: service.get_structured(prompt, schema, prefix=prefix),
+        )
+
+    def candidates(self, prompt_tokens: int) -> List[LLMRoute]:
+        """
+        按提示词大小排列候选后端, 能容纳提示词的后端优先
+
+        Args:
+            prompt_tokens (int): 估算的提示词token数
+
+        Returns:
+            List[LLMRoute]: 候选后端
+        """
+        fits = [
+            route
+            for route in self.routes
+            if route.max_prompt_tokens is None or prompt_tokens <= route.max_prompt_tokens
+        ]
+        # 所有后端都容纳不下时仍然按顺序尝试, 由后端自行报错
+        return fits or list(self.routes)
+
+    async def _route(
+        self, prompt_tokens: int, call: Callable[[LLMService], Awaitable[Any]]
+    ) -> Any:
+        """依次尝试候选后端, 返回第一个成功的结果"""
+        last_error: Optional[Exception] = None
+        for route in self.candidates(prompt_tokens):
+            if not route.breaker.allow_request():
+                continue
+            try:
+                result = await call(route.service)
+            except ValueError as e:
+                # 结构化结果无法解析不是后端故障, 升级到下一个后端但不计入熔断
+                route.breaker.record_success()
+                last_error = e
+                _retries_total.inc(reason="escalate_unparsable")
+                self.logger.warning(f"LLM后端 {route.name} 返回结果无法解析, 尝试升级: {e}")
+                continue
+            except Exception as e:
+                route.failures += 1
+                route.breaker.record_failure()
+                last_error = e
+                _retries_total.inc(reason="escalate_error")
+                self.logger.warning(f"LLM后端 {route.name} 请求失败, 尝试下一个后端: {e}")
+                continue
+            except BaseException:
+                # 请求被取消, 既不算成功也不算失败, 归还探测名额
+                route.breaker.release()
+                raise
+            route.calls += 1
+            route.breaker.record_success()
+            return result
+
+        if last_error is not None:
+            raise last_error
+        raise Exception("没有可用的LLM后端, 所有后端都处于熔断状态")
+
+    def get_statistics(self) -> dict:
+        """获取各后端的路由统计信息"""
+        stats = {}
+        for route in self.routes:
+            route_stats = {
+                "calls": route.calls,
+                "failures": route.failures,
+                "breaker": route.breaker.get_statistics(),
+            }
+            if hasattr(route.service, "get_statistics"):
+                route_stats["backend"] = route.service.get_statistics()
+            stats[route.name] = route_stats
+        return stats
+
+    async def close(self):
+        """关闭所有后端服务"""
+        for route in self.routes:
+            await route.service.close()
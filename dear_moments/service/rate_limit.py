@@ -0,0 +1,70 @@
+"""
+限流监控: 记录后端返回的429, 供自动扩缩容等组件避免把并发加到限流之上
+"""
+
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+
+class RateLimitError(Exception):
+    """后端返回了429 (请求过多)"""
+
+
+class RateLimitMonitor:
+    """
+    单例模式, 记录最近一段时间内各服务收到的429
+    """
+
+    _instance = None
+
+    def __init__(self, window: float = 300):
+        """
+        Args:
+            window (float): 保留最近多少秒的记录
+        """
+        self.window = window
+        self._events: Deque[Tuple[float, str]] = deque()
+        self.total = 0
+
+    @classmethod
+    def get_instance(cls) -> "RateLimitMonitor":
+        """获取限流监控实例"""
+        if cls._instance is None:
+            cls._instance = RateLimitMonitor()
+        return cls._instance
+
+    def record(self, service: str) -> None:
+        """
+        记录一次429
+
+        Args:
+            service (str): 服务名称, 如 "llm"、"embedding"
+        """
+        now = time.monotonic()
+        self._events.append((now, service))
+        self.total += 1
+        self._expire(now)
+
+    def recent(self, seconds: float, service: Optional[str] = None) -> int:
+        """
+        最近 seconds 秒内收到的429次数
+
+        Args:
+            seconds (float): 时间范围
+            service (Optional[str]): 只统计指定服务, 为None时统计全部
+
+        Returns:
+            int: 429次数
+        """
+        now = time.monotonic()
+        self._expire(now)
+        return sum(
+            1
+            for at, name in self._events
+            if now - at <= seconds and (service is None or name == service)
+        )
+
+    def _expire(self, now: float) -> None:
+        while self._events and now - self._events[0][0] > self.window:
+            self._events.popleft()
@@ -1,15 +1,56 @@
-from dear_moments.service.embedding import EmbeddingService, EmbeddingServiceFactory
-from dear_moments.service.llm import LLMService, LLMServiceFactory
-from typing import Dict, Type, TypeVar, Any
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Type, TypeVar
 from dear_moments import DearMomentsConfig
 
+if TYPE_CHECKING:
+    from dear_moments.service.embedding import EmbeddingService
+    from dear_moments.service.llm import LLMService
+    from dear_moments.store import EmbeddingDB, KeywordIndex
+
 T = TypeVar("T")
 
 
+def _create_embedding_service() -> "EmbeddingService":
+    from dear_moments.service.embedding import EmbeddingServiceFactory
+
+    embedding_config = DearMomentsConfig.get_instance().get("services.embedding")
+    if not embedding_config:
+        raise ValueError("嵌入服务配置缺失")
+    return EmbeddingServiceFactory.create(**embedding_config)
+
+
+def _create_llm_service() -> "LLMService":
+    from dear_moments.service.llm import LLMServiceFactory
+
+    llm_config = DearMomentsConfig.get_instance().get("services.llm")
+    if not llm_config:
+        raise ValueError("LLM服务配置缺失")
+    return LLMServiceFactory.create(**llm_config)
+
+
+def _create_vector_storage() -> "EmbeddingDB":
+    from dear_moments.store import MemoryEmbeddingDB
+
+    # 在进程池中搜索时向量矩阵放在共享内存中
+    shared = DearMomentsConfig.get_instance().get("query.search_executor") == "process"
+    return MemoryEmbeddingDB(shared=shared)
+
+
+def _create_keyword_index() -> "KeywordIndex":
+    from dear_moments.store import KeywordIndex
+
+    # 关键词索引与向量库使用相同的记录ID
+    return KeywordIndex()
+
+
 class Services:
     """
     单例模式
     所有服务的集合
+
+    服务在第一次使用时才创建, 服务模块(及其依赖的aiohttp、numpy)也在那时才导入:
+    阶段进程只创建它用到的服务, 命令行和路由器进程不需要加载它们
     """
 
     _instance = None
@@ -24,28 +65,20 @@ class Services:
         if Services._initialized:
             return
         self._services: Dict[str, Any] = {}
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        # 服务可能在执行器线程中第一次被访问, 创建过程加锁, 保证每种服务只创建一次
+        self._lock = threading.Lock()
 
-        self._init_all_services()
+        self._register_all_factories()
 
         Services._initialized = True
 
-    def _init_all_services(self) -> None:
-        """初始化所有服务"""
-        config = DearMomentsConfig.get_instance()
-
-        # 初始化嵌入服务
-        embedding_config = config.get("services.embedding")
-        if not embedding_config:
-            raise ValueError("嵌入服务配置缺失")
-        self.register_service(
-            EmbeddingService, EmbeddingServiceFactory.create(**embedding_config)
-        )
-
-        # 初始化LLM服务
-        llm_config = config.get("services.llm")
-        if not llm_config:
-            raise ValueError("LLM服务配置缺失")
-        self.register_service(LLMService, LLMServiceFactory.create(**llm_config))
+    def _register_all_factories(self) -> None:
+        """注册所有服务的创建函数"""
+        self.register_factory("EmbeddingService", _create_embedding_service)
+        self.register_factory("LLMService", _create_llm_service)
+        self.register_factory("EmbeddingDB", _create_vector_storage)
+        self.register_factory("KeywordIndex", _create_keyword_index)
 
     @classmethod
     def get_instance(cls) -> "Services":
@@ -58,31 +91,83 @@ class Services:
         """注册服务实例"""
         self._services[service_type.__name__] = instance
 
+    def register_factory(self, service_name: str, factory: Callable[[], Any]) -> None:
+        """
+        注册服务的创建函数, 服务在第一次获取时创建
+
+        Args:
+            service_name (str): 服务类型的类名
+            factory (Callable[[], Any]): 无参数的创建函数
+        """
+        self._factories[service_name] = factory
+
+    def _get(self, service_name: str) -> Any:
+        service = self._services.get(service_name)
+        if service is not None:
+            return service
+        with self._lock:
+            if service_name not in self._services:
+                if service_name not in self._factories:
+                    raise KeyError(f"服务 {service_name} 未注册")
+                self._services[service_name] = self._factories[service_name]()
+            return self._services[service_name]
+
     def get_service(self, service_type: Type[T]) -> T:
         """获取指定类型的服务实例"""
-        service_name = service_type.__name__
-        if service_name not in self._services:
-            raise KeyError(f"服务 {service_name} 未注册")
-        return self._services[service_name]
-
-    def get_embedding_service(self) -> EmbeddingService:
+        return self._get(service_type.__name__)
+
+    def warm_up(self) -> Dict[str, float]:
+        """
+        创建所有尚未创建的服务, 把导入和创建的耗时从第一个请求移到启动阶段
+
+        Returns:
+            Dict[str, float]: 每个新创建的服务的耗时(秒)
+        """
+        timings = {}
+        for service_name in list(self._factories):
+            if service_name in self._services:
+                continue
+            start_time = time.perf_counter()
+            self._get(service_name)
+            timings[service_name] = time.perf_counter() - start_time
+        return timings
+
+    def get_embedding_service(self) -> "EmbeddingService":
         """获取嵌入服务"""
-        return self.get_service(EmbeddingService)
+        return self._get("EmbeddingService")
 
-    def get_llm_service(self) -> LLMService:
+    def get_llm_service(self) -> "LLMService":
         """获取LLM服务"""
-        return self.get_service(LLMService)
+        return self._get("LLMService")
+
+    def get_vector_storage(self) -> "EmbeddingDB":
+        """获取向量存储"""
+        return self._get("EmbeddingDB")
+
+    def get_keyword_index(self) -> "KeywordIndex":
+        """获取关键词索引"""
+        return self._get("KeywordIndex")
 
     @classmethod
-    def embedding_service(cls) -> EmbeddingService:
+    def embedding_service(cls) -> "EmbeddingService":
         """通过类名直接访问嵌入服务"""
         return cls.get_instance().get_embedding_service()
 
     @classmethod
-    def llm_service(cls) -> LLMService:
+    def llm_service(cls) -> "LLMService":
         """通过类名直接访问LLM服务"""
         return cls.get_instance().get_llm_service()
 
+    @classmethod
+    def vector_storage(cls) -> "EmbeddingDB":
+        """通过类名直接访问向量存储"""
+        return cls.get_instance().get_vector_storage()
+
+    @classmethod
+    def keyword_index(cls) -> "KeywordIndex":
+        """通过类名直接访问关键词索引"""
+        return cls.get_instance().get_keyword_index()
+
     @classmethod
     def service(cls, service_type: Type[T]) -> T:
         """通过类名直接访问指定类型的服务"""
@@ -90,7 +175,7 @@ class Services:
 
     @classmethod
     async def close(cls) -> None:
-        """关闭所有服务"""
-        for service in cls.get_instance()._services.values():
+        """关闭所有已经创建的服务"""
+        for service in list(cls.get_instance()._services.values()):
             if hasattr(service, "close"):
                 await service.close()
@@ -0,0 +1,8 @@
+from .embedding import EmbeddingDB, MemoryEmbeddingDB
+from .keyword import KeywordIndex
+
+__all__ = [
+    "EmbeddingDB",
+    "MemoryEmbeddingDB",
+    "KeywordIndex",
+]
@@ -0,0 +1,6 @@
+from .embedding_db import EmbeddingDB, MemoryEmbeddingDB
+
+__all__ = [
+    "EmbeddingDB",
+    "MemoryEmbeddingDB",
+]
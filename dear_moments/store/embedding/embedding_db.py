@@ -2,8 +2,274 @@
 embedding数据库, 持久化存储
 """
 
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import itertools
 
-class EmbeddingDB:
+import numpy as np
+
+from dear_moments.utils.shared_array import SharedArray, SharedArrayHandle
+
+
+class EmbeddingDB(ABC):
     """
     向量数据库接口
     """
+
+    @abstractmethod
+    async def store(
+        self, item: Any, embedding: np.ndarray, metadata: Optional[Dict] = None
+    ) -> str:
+        """
+        存储一条记录及其向量
+
+        Args:
+            item (Any): 要存储的内容, 如事件框架
+            embedding (np.ndarray): 嵌入向量
+            metadata (Optional[Dict]): 附加信息
+
+        Returns:
+            str: 记录ID
+        """
+        pass
+
+    @abstractmethod
+    async def search(
+        self,
+        embedding: np.ndarray,
+        top_k: int = 5,
+        executor: Optional[Executor] = None,
+    ) -> List[Dict]:
+        """
+        按余弦相似度查找最相近的记录
+
+        Args:
+            embedding (np.ndarray): 查询向量
+            top_k (int): 返回的记录数
+            executor (Optional[Executor]): 执行相似度计算的线程池或进程池,
+                为None时在事件循环中直接计算
+
+        Returns:
+            List[Dict]: 记录列表, 每条包含 id、item、metadata 和 score, 按相似度降序
+        """
+        pass
+
+    @abstractmethod
+    async def export(self, memory_ids: Set[str]) -> List[Tuple[Dict, np.ndarray]]:
+        """
+        取出属于这些记忆的记录和向量, 用于把记忆迁移到其他节点
+
+        Args:
+            memory_ids (Set[str]): 记忆ID, 与记录 metadata 中的 memory_id 比较
+
+        Returns:
+            List[Tuple[Dict, np.ndarray]]: (记录, 向量) 列表
+        """
+        pass
+
+    @abstractmethod
+    async def delete(self, record_ids: Set[str]) -> int:
+        """
+        删除记录
+
+        Args:
+            record_ids (Set[str]): 记录ID
+
+        Returns:
+            int: 实际删除的记录数
+        """
+        pass
+
+    @abstractmethod
+    def memory_ids(self) -> Set[str]:
+        """所有记录涉及的记忆ID"""
+        pass
+
+    async def close(self):
+        """
+        关闭数据库，释放资源
+        """
+        pass
+
+
+def top_k_search(
+    matrix, size: int, query: np.ndarray, top_k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    在归一化的向量矩阵前 size 行中查找与 query 最相似的 top_k 行
+
+    定义在模块级别, 可以直接提交到进程池; matrix 为共享内存句柄时在工作进程中映射
+
+    Args:
+        matrix (Union[np.ndarray, SharedArrayHandle]): 向量矩阵或其共享内存句柄
+        size (int): 有效行数
+        query (np.ndarray): 归一化后的查询向量
+        top_k (int): 返回的行数
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (行号, 相似度), 按相似度降序
+    """
+    if isinstance(matrix, SharedArrayHandle):
+        matrix = matrix.attach()
+    scores = matrix[:size] @ query
+
+    top_k = min(top_k, size)
+    indexes = np.argpartition(-scores, top_k - 1)[:top_k]
+    indexes = indexes[np.argsort(-scores[indexes])]
+    return indexes, scores[indexes]
+
+
+class MemoryEmbeddingDB(EmbeddingDB):
+    """
+    内存向量数据库, 向量归一化后按行存放在矩阵中, 查询是一次矩阵乘法
+
+    shared 为True时矩阵分配在共享内存中, 进程池里的搜索只需要传递句柄
+    """
+
+    def __init__(self, shared: bool = False):
+        """
+        Args:
+            shared (bool): 是否把向量矩阵放在共享内存中
+        """
+        self.shared = shared
+        self._ids = itertools.count(1)
+        self._records: List[Dict] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._shared: Optional[SharedArray] = None
+        # 执行器中尚未结束的搜索引用的共享内存及其搜索数,
+        # 排队中的搜索还没有映射内存, 被替换的矩阵要等这些搜索结束后才能释放
+        self._readers: Dict[SharedArray, int] = {}
+        self._retired: Set[SharedArray] = set()
+        self._size = 0
+
+    def _allocate(self, rows: int, dim: int) -> None:
+        """分配新的矩阵, 并复制已有的向量"""
+        if self.shared:
+            old = self._shared
+            self._shared = SharedArray((rows, dim), np.float32)
+            matrix = self._shared.array
+        else:
+            old = None
+            matrix = np.empty((rows, dim), dtype=np.float32)
+        if self._matrix is not None:
+            matrix[: self._size] = self._matrix[: self._size]
+        self._matrix = matrix
+        if old is not None:
+            if self._readers.get(old):
+                self._retired.add(old)
+            else:
+                old.close()
+
+    def _release_reader(self, shared: SharedArray) -> None:
+        """执行器中的一次搜索结束, 被替换的矩阵没有其他搜索引用时释放"""
+        count = self._readers.get(shared, 0) - 1
+        if count > 0:
+            self._readers[shared] = count
+            return
+        self._readers.pop(shared, None)
+        if shared in self._retired:
+            self._retired.discard(shared)
+            shared.close()
+
+    async def store(
+        self, item: Any, embedding: np.ndarray, metadata: Optional[Dict] = None
+    ) -> str:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+        if self._matrix is None:
+            self._allocate(16, vector.shape[0])
+        elif self._size == self._matrix.shape[0]:
+            # 容量翻倍, 均摊后每次写入是O(1)
+            self._allocate(self._size * 2, self._matrix.shape[1])
+        self._matrix[self._size] = vector
+        self._size += 1
+
+        record_id = str(next(self._ids))
+        self._records.append(
+            {"id": record_id, "item": item, "metadata": metadata or {}}
+        )
+        return record_id
+
+    async def search(
+        self,
+        embedding: np.ndarray,
+        top_k: int = 5,
+        executor: Optional[Executor] = None,
+    ) -> List[Dict]:
+        if self._size == 0:
+            return []
+        # 在执行器中搜索期间记录可能被删除, 使用搜索开始时的记录列表和矩阵
+        records = self._records
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        if executor is None:
+            indexes, scores = top_k_search(self._matrix, self._size, query, top_k)
+        elif self._shared is None:
+            indexes, scores = await asyncio.get_running_loop().run_in_executor(
+                executor, top_k_search, self._matrix, self._size, query, top_k
+            )
+        else:
+            # 进程池只接收共享内存句柄, 不序列化整个矩阵;
+            # 搜索在执行器中真正结束(包括等待方被取消的情况)之前保留这块共享内存
+            loop = asyncio.get_running_loop()
+            shared = self._shared
+            self._readers[shared] = self._readers.get(shared, 0) + 1
+            future = executor.submit(
+                top_k_search, shared.handle, self._size, query, top_k
+            )
+            future.add_done_callback(
+                lambda _: loop.call_soon_threadsafe(self._release_reader, shared)
+            )
+            indexes, scores = await asyncio.wrap_future(future)
+        return [
+            {**records[i], "score": float(score)}
+            for i, score in zip(indexes.tolist(), scores.tolist())
+        ]
+
+    async def export(self, memory_ids: Set[str]) -> List[Tuple[Dict, np.ndarray]]:
+        return [
+            (record, self._matrix[i].copy())
+            for i, record in enumerate(self._records)
+            if record["metadata"].get("memory_id") in memory_ids
+        ]
+
+    async def delete(self, record_ids: Set[str]) -> int:
+        keep = [i for i, r in enumerate(self._records) if r["id"] not in record_ids]
+        removed = self._size - len(keep)
+        if removed == 0:
+            return 0
+        # 写入新矩阵而不是原地压缩, 执行器中正在进行的搜索仍然读取旧矩阵
+        kept = self._matrix[: self._size][keep]
+        capacity, dim = self._matrix.shape
+        self._size = 0
+        self._allocate(capacity, dim)
+        self._matrix[: len(keep)] = kept
+        self._size = len(keep)
+        self._records = [self._records[i] for i in keep]
+        return removed
+
+    def memory_ids(self) -> Set[str]:
+        return {
+            record["metadata"]["memory_id"]
+            for record in self._records
+            if record["metadata"].get("memory_id") is not None
+        }
+
+    async def close(self):
+        """释放共享内存, 包括仍被未结束的搜索引用的旧矩阵"""
+        for shared in self._retired:
+            shared.close()
+        self._retired.clear()
+        self._readers.clear()
+        if self._shared is not None:
+            self._matrix = None
+            self._size = 0
+            self._shared.close()
+            self._shared = None
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,7 @@
+from .keyword_index import KeywordIndex, text_of, tokenize
+
+__all__ = [
+    "KeywordIndex",
+    "text_of",
+    "tokenize",
+]
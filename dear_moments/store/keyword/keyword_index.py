@@ -0,0 +1,144 @@
+"""
+关键词倒排索引, 与向量检索互补: 人名、地名等专有名词按字面精确匹配
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Set
+
+# 拉丁字母和数字按单词切分, 汉字按相邻两字切分, 不依赖分词库
+_TOKEN = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    把文本切分为检索词
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        List[str]: 检索词, 汉字为二元组, 单个汉字保留原样
+    """
+    tokens: List[str] = []
+    for match in _TOKEN.findall(text.lower()):
+        if match[0] >= "一" and len(match) > 1:
+            tokens.extend(match[i : i + 2] for i in range(len(match) - 1))
+        else:
+            tokens.append(match)
+    return tokens
+
+
+def text_of(value: Any) -> str:
+    """提取事件框架等嵌套结构中的所有文本值, 忽略键名"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return " ".join(text_of(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return " ".join(text_of(v) for v in value)
+    return ""
+
+
+class KeywordIndex:
+    """
+    内存中的倒排索引, 按BM25打分
+
+    记录ID与向量库的记录ID一致, 两路检索的结果可以按ID合并
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            k1 (float): 词频饱和参数
+            b (float): 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        # 检索词 -> {记录ID: 词频}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._items: Dict[str, Any] = {}
+        # 记录ID -> 该记录出现过的检索词, 删除记录时用来清理倒排表
+        self._terms: Dict[str, List[str]] = {}
+        self._total_length = 0
+
+    async def store(self, record_id: str, item: Any, tokens: List[str]) -> None:
+        """
+        索引一条记录
+
+        Args:
+            record_id (str): 记录ID
+            item (Any): 记录内容, 检索时原样返回
+            tokens (List[str]): 记录的检索词
+        """
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            self._postings.setdefault(token, {})[record_id] = count
+        self._lengths[record_id] = len(tokens)
+        self._items[record_id] = item
+        self._terms[record_id] = list(counts)
+        self._total_length += len(tokens)
+
+    async def delete(self, record_ids: Set[str]) -> int:
+        """
+        删除记录
+
+        Args:
+            record_ids (Set[str]): 记录ID
+
+        Returns:
+            int: 实际删除的记录数
+        """
+        removed = 0
+        for record_id in record_ids:
+            terms = self._terms.pop(record_id, None)
+            if terms is None:
+                continue
+            for token in terms:
+                postings = self._postings[token]
+                del postings[record_id]
+                if not postings:
+                    del self._postings[token]
+            self._total_length -= self._lengths.pop(record_id)
+            del self._items[record_id]
+            removed += 1
+        return removed
+
+    async def search(self, tokens: List[str], top_k: int = 5) -> List[Dict]:
+        """
+        检索包含查询词的记录
+
+        Args:
+            tokens (List[str]): 查询的检索词
+            top_k (int): 返回的记录数
+
+        Returns:
+            List[Dict]: 记录列表, 每条包含 id、item 和 score, 按得分降序
+        """
+        if not self._lengths:
+            return []
+        total = len(self._lengths)
+        avg_length = self._total_length / total
+        scores: Dict[str, float] = {}
+        for token in set(tokens):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for record_id, tf in postings.items():
+                length = self._lengths[record_id] / avg_length
+                norm = self.k1 * (1 - self.b + self.b * length)
+                score = idf * tf * (self.k1 + 1) / (tf + norm)
+                scores[record_id] = scores.get(record_id, 0.0) + score
+
+        ranked = sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:top_k]
+        return [
+            {"id": record_id, "item": self._items[record_id], "score": score}
+            for record_id, score in ranked
+        ]
+
+    def __len__(self) -> int:
+        return len(self._lengths)
@@ -0,0 +1,13 @@
+from .span import Span, current_span
+from .tracer import Tracer, tracer
+from .exporters import JsonLinesExporter, OTLPExporter, SpanExporter
+
+__all__ = [
+    "Span",
+    "current_span",
+    "Tracer",
+    "tracer",
+    "SpanExporter",
+    "JsonLinesExporter",
+    "OTLPExporter",
+]
@@ -0,0 +1,152 @@
+"""
+追踪导出器: 本地JSON Lines文件, 或 OTLP/HTTP(JSON编码)收集器
+"""
+
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .span import Span
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+class SpanExporter(ABC):
+    """追踪导出器基类, 追踪器在后台批量调用 export"""
+
+    @abstractmethod
+    async def export(self, spans: List[Span]) -> None:
+        """
+        导出一批已经结束的span
+
+        Args:
+            spans (List[Span]): span列表
+        """
+        pass
+
+    async def close(self) -> None:
+        """释放资源"""
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """
+    每个span写一行JSON, 按天分文件: {directory}/traces-YYYYMMDD.jsonl
+    """
+
+    def __init__(self, directory: str = "data/traces"):
+        """
+        Args:
+            directory (str): 输出目录
+        """
+        self.directory = directory
+
+    def _write(self, lines: List[str]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"traces-{time.strftime('%Y%m%d')}.jsonl"
+        )
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def export(self, spans: List[Span]) -> None:
+        lines = [
+            json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+            for span in spans
+        ]
+        # 文件写入放在线程中, 不阻塞事件循环
+        await asyncio.to_thread(self._write, lines)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter(SpanExporter):
+    """
+    以 OTLP/HTTP JSON 格式发送到收集器的 /v1/traces
+    """
+
+    def __init__(
+        self,
+        endpoint: str = "http://127.0.0.1:4318",
+        service_name: str = "dear_moments",
+        timeout: float = 5.0,
+    ):
+        """
+        Args:
+            endpoint (str): 收集器地址
+            service_name (str): 上报的服务名
+            timeout (float): 请求超时时间(秒)
+        """
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+        self.client: Optional["aiohttp.ClientSession"] = None
+
+    def _encode_span(self, span: Span) -> Dict[str, Any]:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            # SPAN_KIND_INTERNAL
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in span.attributes.items()
+            ],
+            # STATUS_CODE_OK / STATUS_CODE_ERROR
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    async def export(self, spans: List[Span]) -> None:
+        if self.client is None:
+            # 只有使用OTLP导出时才需要aiohttp
+            import aiohttp
+
+            self.client = aiohttp.ClientSession()
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "dear_moments"},
+                            "spans": [self._encode_span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        async with self.client.post(
+            self.url, json=payload, timeout=self.timeout
+        ) as resp:
+            if resp.status >= 300:
+                raise Exception(f"OTLP导出失败: {resp.status}, {await resp.text()}")
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
@@ -0,0 +1,159 @@
+"""
+追踪片段(span): 一次请求在某个阶段或某次外部调用上花费的时间
+"""
+
+import contextvars
+import random
+import time
+from typing import Any, Dict, Optional
+
+# 当前任务中正在进行的span, 外部调用(如Gemini请求)据此挂到所属请求的追踪下
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "dear_moments_current_span", default=None
+)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """
+    追踪片段, 时间使用纳秒级的墙上时间, 便于和其他系统的追踪对齐
+
+    可以作为上下文管理器使用: 进入时成为当前span, 退出时结束并交给追踪器导出
+    """
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+        start_ns: Optional[int] = None,
+    ):
+        """
+        Args:
+            tracer (Tracer): 负责导出的追踪器
+            name (str): span名称
+            trace_id (Optional[str]): 所属追踪的ID, 为None时开始一个新的追踪
+            parent_id (Optional[str]): 父span的ID
+            attributes (Optional[Dict[str, Any]]): 属性
+            start_ns (Optional[int]): 开始时间(纳秒), 默认为当前时间
+        """
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id or _new_id(128)
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = attributes or {}
+        self.error: Optional[str] = None
+        self._token = None
+
+    def child(self, name: str, **attributes) -> "Span":
+        """
+        创建子span
+
+        Args:
+            name (str): 子span名称
+            **attributes: 属性
+
+        Returns:
+            Span: 子span, 还没有开始计入当前上下文
+        """
+        return Span(self.tracer, name, self.trace_id, self.span_id, attributes)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """设置属性"""
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        """标记span失败"""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        """结束span并提交导出, 重复调用时忽略"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.tracer.submit(self)
+
+    @property
+    def duration_ms(self) -> float:
+        """持续时间(毫秒), 未结束时为0"""
+        if self.end_ns is None:
+            return 0.0
+        return (self.end_ns - self.start_ns) / 1_000_000
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可以序列化为JSON的字典"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.record_error(exc)
+        _current_span.reset(self._token)
+        self._token = None
+        self.end()
+
+
+class _NoopSpan:
+    """未采样时使用的空span, 所有操作都不做任何事"""
+
+    __slots__ = ()
+
+    def child(self, name: str, **attributes) -> "_NoopSpan":
+        return self
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span() -> Optional[Span]:
+    """获取当前任务中正在进行的span, 没有被采样时为None"""
+    return _current_span.get()
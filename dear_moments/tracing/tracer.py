@@ -0,0 +1,162 @@
+"""
+追踪器: 决定是否采样, 收集结束的span并在后台批量导出
+"""
+
+import asyncio
+import random
+from typing import List, Optional, Union
+
+from dear_moments.app_context import AppContext
+from .exporters import JsonLinesExporter, OTLPExporter, SpanExporter
+from .span import NOOP_SPAN, Span, _NoopSpan, current_span
+
+
+class Tracer:
+    """
+    单例模式, 全局追踪器
+
+    采样在请求进入管道时决定一次(头部采样), 未采样的请求不创建任何span,
+    整条链路上只剩一次 None 判断, 关闭采样时几乎没有开销
+    """
+
+    _instance = None
+
+    def __init__(self):
+        self.logger = AppContext.get_instance().get("logger")
+        # 采样率, 0表示关闭追踪
+        self.sample_rate = 0.0
+        self.exporter: Optional[SpanExporter] = None
+        self.flush_interval = 5.0
+        # 等待导出的span上限, 导出跟不上时丢弃新的span而不是无限占用内存
+        self.max_buffer = 10000
+        self._buffer: List[Span] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.exported_spans = 0
+        self.dropped_spans = 0
+        self.export_errors = 0
+
+    @classmethod
+    def get_instance(cls) -> "Tracer":
+        """获取追踪器实例"""
+        if cls._instance is None:
+            cls._instance = Tracer()
+        return cls._instance
+
+    def configure(self, config: Optional[dict]) -> None:
+        """
+        根据配置设置采样率和导出器
+
+        Args:
+            config (Optional[dict]): 追踪配置, 未配置或 enabled 为False时关闭追踪;
+                exporter 为 "jsonl" 时写入 path 目录, 为 "otlp" 时发送到 endpoint
+        """
+        if not config or not config.get("enabled", False):
+            self.sample_rate = 0.0
+            return
+        self.sample_rate = config.get("sample_rate", 0.01)
+        self.flush_interval = config.get("flush_interval", 5.0)
+        self.max_buffer = config.get("max_buffer", 10000)
+
+        exporter = config.get("exporter", "jsonl")
+        if exporter == "jsonl":
+            self.exporter = JsonLinesExporter(config.get("path", "data/traces"))
+        elif exporter == "otlp":
+            self.exporter = OTLPExporter(
+                config.get("endpoint", "http://127.0.0.1:4318"),
+                config.get("service_name", "dear_moments"),
+            )
+        else:
+            raise ValueError(f"不支持的追踪导出器: {exporter}")
+
+    def start_trace(self, name: str, **attributes) -> Optional[Span]:
+        """
+        按采样率开始一个新的追踪
+
+        Args:
+            name (str): 根span名称
+            **attributes: 属性
+
+        Returns:
+            Optional[Span]: 根span, 未被采样时为None
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return Span(self, name, attributes=attributes)
+
+    def span(self, name: str, **attributes) -> Union[Span, _NoopSpan]:
+        """
+        在当前span下创建子span, 用于外部调用等没有显式传递追踪上下文的地方
+
+        Args:
+            name (str): span名称
+            **attributes: 属性
+
+        Returns:
+            Union[Span, _NoopSpan]: 子span, 当前请求未被采样时为空span
+        """
+        parent = current_span()
+        if parent is None:
+            return NOOP_SPAN
+        return parent.child(name, **attributes)
+
+    def submit(self, span: Span) -> None:
+        """收集结束的span, 等待后台导出"""
+        if self.exporter is None:
+            return
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped_spans += 1
+            return
+        self._buffer.append(span)
+
+    async def flush(self) -> None:
+        """立即导出所有等待中的span"""
+        if not self._buffer or self.exporter is None:
+            return
+        spans, self._buffer = self._buffer, []
+        try:
+            await self.exporter.export(spans)
+            self.exported_spans += len(spans)
+        except Exception as e:
+            self.export_errors += 1
+            self.dropped_spans += len(spans)
+            self.logger.warning(f"追踪导出失败, 丢弃 {len(spans)} 个span: {e}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        """启动后台导出任务, 关闭追踪时不做任何事"""
+        if self.sample_rate <= 0 or self.exporter is None or self._flush_task:
+            return
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """停止后台导出, 导出剩余的span并关闭导出器"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self.exporter is not None:
+            await self.exporter.close()
+
+    def get_statistics(self) -> dict:
+        """获取追踪器的统计信息"""
+        return {
+            "sample_rate": self.sample_rate,
+            "pending_spans": len(self._buffer),
+            "exported_spans": self.exported_spans,
+            "dropped_spans": self.dropped_spans,
+            "export_errors": self.export_errors,
+        }
+
+
+def tracer() -> Tracer:
+    """获取全局追踪器"""
+    return Tracer.get_instance()
@@ -0,0 +1,68 @@
+"""
+LLM响应缓存的作用域
+
+语义匹配会把相似但不同的提示词视为同一个请求, 不同记忆(租户)的对话即使很像也不能共用结果;
+调用方在处理某个记忆时用 cache_scope 标明作用域, 语义匹配只在同一作用域内进行,
+没有作用域的调用只做精确匹配
+
+缓存的结果没有通过调用方的校验时, 用相同提示词重试需要在 cache_refresh 中进行,
+否则重试只会从缓存拿回同一个错误结果
+"""
+
+import contextlib
+import contextvars
+from typing import Iterator, Optional
+
+_current_scope: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "dear_moments_cache_scope", default=None
+)
+_refresh: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "dear_moments_cache_refresh", default=False
+)
+
+
+@contextlib.contextmanager
+def cache_scope(scope: Optional[str]) -> Iterator[None]:
+    """
+    在当前任务中设置LLM响应缓存的作用域
+
+    Args:
+        scope (Optional[str]): 作用域, 通常是 memory_id, 为None时只做精确匹配
+    """
+    token = _current_scope.set(scope)
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+
+def current_cache_scope() -> Optional[str]:
+    """
+    当前任务的缓存作用域
+
+    Returns:
+        Optional[str]: 作用域, 没有设置时为None
+    """
+    return _current_scope.get()
+
+
+@contextlib.contextmanager
+def cache_refresh() -> Iterator[None]:
+    """
+    在当前任务中跳过LLM响应缓存的查找, 结果仍然写入缓存并覆盖旧的条目
+    """
+    token = _refresh.set(True)
+    try:
+        yield
+    finally:
+        _refresh.reset(token)
+
+
+def cache_refreshing() -> bool:
+    """
+    当前任务是否跳过缓存查找
+
+    Returns:
+        bool: 在 cache_refresh 中时为True
+    """
+    return _refresh.get()
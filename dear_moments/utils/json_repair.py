@@ -0,0 +1,138 @@
+"""
+容错JSON解析, 用于修复LLM返回的"差一点"合法的JSON
+"""
+
+import json
+import re
+from typing import Any, List, Tuple
+
+_CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.S)
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def loads_tolerant(text: str) -> Any:
+    """
+    解析LLM返回的JSON, 能够容忍常见的格式问题:
+    代码块包裹、前后多余的说明文字、尾随逗号、被截断的对象/数组
+
+    Args:
+        text (str): LLM返回的文本
+
+    Returns:
+        Any: 解析后的对象
+
+    Raises:
+        ValueError: 无法修复为合法JSON时抛出
+    """
+    if not isinstance(text, str):
+        raise ValueError(f"无法解析非字符串类型: {type(text).__name__}")
+
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    cleaned = _strip_wrapping(text)
+    repaired, cut_points, stack, in_string = _scan(cleaned)
+
+    candidates = []
+    if not stack and not in_string:
+        candidates.append(repaired)
+    else:
+        # 被截断: 先尝试直接补全, 再依次回退到更早的安全截断点
+        tail = repaired + ('"' if in_string else "")
+        candidates.append(_close(tail, stack))
+        for pos, snapshot in reversed(cut_points):
+            candidates.append(_close(repaired[:pos], snapshot))
+
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    raise ValueError(f"无法修复LLM返回的JSON: {text[:200]}")
+
+
+def _strip_wrapping(text: str) -> str:
+    """去除代码块标记和JSON前后的多余文本"""
+    match = _CODE_FENCE.search(text)
+    if match:
+        text = match.group(1)
+
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text.strip()
+    text = text[min(starts) :]
+
+    # 只有在括号完整时才去除尾部文本, 截断的情况交给补全逻辑处理
+    ends = max(text.rfind("}"), text.rfind("]"))
+    if ends != -1 and _balanced(text[: ends + 1]):
+        text = text[: ends + 1]
+    return text.strip()
+
+
+def _balanced(text: str) -> bool:
+    """检查字符串外的括号是否配对完整"""
+    _, _, stack, in_string = _scan(text)
+    return not stack and not in_string
+
+
+def _scan(text: str) -> Tuple[str, List[Tuple[int, Tuple[str, ...]]], List[str], bool]:
+    """
+    逐字符扫描, 去除尾随逗号并记录可以安全截断的位置
+
+    Returns:
+        Tuple: (修复后的文本, 安全截断点列表, 未闭合的括号栈, 是否停在字符串内部)
+    """
+    out: List[str] = []
+    length = 0
+    stack: List[str] = []
+    cut_points: List[Tuple[int, Tuple[str, ...]]] = []
+    in_string = False
+    escaped = False
+
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            length += 1
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+            out.append(ch)
+            length += 1
+            cut_points.append((length, tuple(stack)))
+            continue
+        elif ch in "}]":
+            # 去除尾随逗号
+            while out and out[-1].isspace():
+                out.pop()
+                length -= 1
+            if out and out[-1] == ",":
+                out.pop()
+                length -= 1
+            if stack:
+                stack.pop()
+        elif ch == ",":
+            cut_points.append((length, tuple(stack)))
+
+        out.append(ch)
+        length += 1
+
+    return "".join(out), cut_points, stack, in_string
+
+
+def _close(text: str, stack) -> str:
+    """为截断的文本补全缺失的括号"""
+    text = text.rstrip()
+    while text and text[-1] in ",:":
+        text = text[:-1].rstrip()
+    return text + "".join(_CLOSERS[ch] for ch in reversed(stack))
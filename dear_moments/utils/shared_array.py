@@ -0,0 +1,87 @@
+"""
+共享内存中的NumPy数组, 传给进程池时只传递名称和形状, 不复制数据
+"""
+
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+# 当前进程已经映射的共享内存, 同一块内存在每个进程里只映射一次
+_attached: Dict[str, Tuple[shared_memory.SharedMemory, np.ndarray]] = {}
+_MAX_ATTACHED = 8
+
+
+@dataclass(frozen=True)
+class SharedArrayHandle:
+    """
+    共享数组的句柄, 可以低成本地序列化后传给其他进程
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    def attach(self) -> np.ndarray:
+        """
+        映射共享内存, 返回共享同一块内存的数组(只读视图)
+
+        Returns:
+            np.ndarray: 数组视图
+        """
+        cached = _attached.get(self.name)
+        if cached is None:
+            if len(_attached) >= _MAX_ATTACHED:
+                # 数组扩容后旧的共享内存不再使用, 释放最早映射的
+                oldest = next(iter(_attached))
+                _attached.pop(oldest)[0].close()
+            shm = _open(self.name)
+            array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+            array.flags.writeable = False
+            cached = _attached[self.name] = (shm, array)
+        return cached[1]
+
+
+def _open(name: str) -> shared_memory.SharedMemory:
+    """
+    映射已有的共享内存
+
+    进程池的子进程与创建者共用同一个资源跟踪器, 重复注册不会导致内存被提前删除;
+    Python 3.13 起直接关闭跟踪
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedArray:
+    """
+    分配在共享内存中的数组, 由创建者负责释放
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype=np.float32):
+        """
+        Args:
+            shape (Tuple[int, ...]): 数组形状
+            dtype: 数据类型
+        """
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * self.dtype.itemsize, 1)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @property
+    def handle(self) -> SharedArrayHandle:
+        """可以传给其他进程的句柄"""
+        return SharedArrayHandle(self._shm.name, self.array.shape, self.dtype.str)
+
+    def close(self) -> None:
+        """释放共享内存"""
+        if self._shm is None:
+            return
+        self.array = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
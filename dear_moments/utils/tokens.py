@@ -0,0 +1,21 @@
+"""
+token数量估算, 用于预算控制和指标统计, 不追求与模型分词器完全一致
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数量
+
+    中日韩字符大致按一个字符一个token计算, 其余字符按4个字符一个token计算
+
+    Args:
+        text (str): 输入文本
+
+    Returns:
+        int: 估算的token数量
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "⺀" <= ch <= "鿿" or "가" <= ch <= "힯")
+    return cjk + (len(text) - cjk + 3) // 4
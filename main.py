@@ -6,9 +6,124 @@ def show_help():
     print("DearMoments - 一个结合大语言模型的高性能AI记忆模块")
     print("\n可用命令:")
     print("  chat        启动聊天窗口")
+    print("  serve       启动HTTP记忆服务, 可选 --host 和 --port")
+    print("  router      启动集群路由器, 可选 --host、--port 和 --shards")
     print("  --help      显示帮助信息")
     print("\n示例:")
     print("  python main.py chat --api_key YOUR_API_KEY --model gemini-1.5-flash")
+    print("  python main.py serve --host 127.0.0.1 --port 8700")
+    print("  python main.py router --shards a=http://host-a:8700,b=http://host-b:8700")
+
+
+def serve(args):
+    """启动HTTP记忆服务, 收到 SIGINT/SIGTERM 后停止接收请求并排空管道"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="main.py serve")
+    parser.add_argument(
+        "--host",
+        help="监听地址, 默认使用配置 app.server.host; 监听非本机地址前先配置 cluster.token",
+    )
+    parser.add_argument("--port", type=int, help="监听端口, 默认使用配置 app.server.port")
+    parser.add_argument(
+        "--data-dir", help="本节点的数据目录, 同一台机器上运行多个节点时各自指定"
+    )
+    options = parser.parse_args(args)
+    # 解析参数之后再导入, --help 和参数错误不需要加载事件循环和服务模块
+    import asyncio
+    import os
+
+    async def run():
+        import platform
+        import signal
+
+        from DearMoments import DearMoments
+        from dear_moments import DearMomentsConfig
+        from dear_moments.server import MemoryServer
+
+        config = DearMomentsConfig.get_instance()
+        if options.data_dir:
+            # 检查点和换出的上下文属于单个节点, 多个节点共用目录会互相回放和覆盖
+            for key, name in (
+                ("storage.context_list.spill_dir", "contexts"),
+                ("app.shutdown.checkpoint_dir", "checkpoints"),
+                ("app.tracing.path", "traces"),
+            ):
+                config.set(key, os.path.join(options.data_dir, name))
+        server_config = dict(config.get("app.server", {}))
+        if options.host:
+            server_config["host"] = options.host
+        if options.port:
+            server_config["port"] = options.port
+
+        dear_moments = await DearMoments().initialize()
+        server = MemoryServer.from_config(dear_moments, server_config)
+        await server.start()
+
+        loop = asyncio.get_running_loop()
+        if platform.system() != "Windows":
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, dear_moments.stop_event.set)
+        try:
+            await dear_moments.stop_event.wait()
+        finally:
+            # 先停止HTTP服务并等待处理中的请求, 再排空管道
+            await server.stop()
+            await dear_moments.shutdown()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def router(args):
+    """启动集群路由器, 收到 SIGINT/SIGTERM 后停止"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="main.py router")
+    parser.add_argument("--host", help="监听地址, 默认使用配置 cluster.router.host")
+    parser.add_argument("--port", type=int, help="监听端口, 默认使用配置 cluster.router.port")
+    parser.add_argument("--shards", help="分片列表, 如 a=http://127.0.0.1:8701,b=...")
+    options = parser.parse_args(args)
+    import asyncio
+
+    async def run():
+        import platform
+        import signal
+
+        from dear_moments import DearMomentsConfig
+        from dear_moments.cluster import ClusterRouter
+
+        config = dict(DearMomentsConfig.get_instance().get("cluster", {}))
+        config["router"] = dict(config.get("router", {}))
+        if options.host:
+            config["router"]["host"] = options.host
+        if options.port:
+            config["router"]["port"] = options.port
+        if options.shards:
+            config["shards"] = dict(
+                shard.split("=", 1) for shard in options.shards.split(",")
+            )
+        if not config.get("shards"):
+            parser.error("没有配置分片, 使用 --shards 或配置 cluster.shards")
+
+        cluster_router = ClusterRouter.from_config(config)
+        await cluster_router.start()
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if platform.system() != "Windows":
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop_event.set)
+        try:
+            await stop_event.wait()
+        finally:
+            await cluster_router.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
 
 
 def main():
@@ -27,6 +142,10 @@ def main():
             chat_main()
         except ImportError as e:
             print(f"加载聊天模块失败: {str(e)}")
+    elif command == "serve":
+        serve(sys.argv[2:])
+    elif command == "router":
+        router(sys.argv[2:])
     else:
         print(f"未知命令: {command}")
         show_help()
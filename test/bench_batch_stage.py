@@ -0,0 +1,76 @@
+"""
+批处理阶段的吞吐量基准测试
+
+模拟一个批量接口: 每次调用有固定的往返开销, 每条数据再增加少量耗时,
+对比不同 max_batch_size 下单个阶段的吞吐量
+
+用法: python test/bench_batch_stage.py [请求数]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+# 每次调用的固定开销和每条数据的耗时(秒), 与一次嵌入API请求的量级接近
+CALL_OVERHEAD = 0.02
+PER_ITEM = 0.001
+WORKERS = 2
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+
+
+async def fake_single(item):
+    await asyncio.sleep(CALL_OVERHEAD + PER_ITEM)
+    return item
+
+
+async def fake_batch(items):
+    await asyncio.sleep(CALL_OVERHEAD + PER_ITEM * len(items))
+    return items
+
+
+async def run(batch_size: int, requests: int) -> float:
+    pipeline = BasePipeline(f"bench-{batch_size}")
+    if batch_size == 1:
+        stage = PipelineStage("bench", fake_single, requests, WORKERS)
+    else:
+        stage = PipelineStage(
+            "bench",
+            max_queue_size=requests,
+            workers=WORKERS,
+            process_batch=fake_batch,
+            max_batch_size=batch_size,
+            max_linger_ms=5,
+        )
+    pipeline.add_stage(stage)
+    await pipeline.start()
+
+    start_time = time.perf_counter()
+    pending = [await pipeline.process(i) for i in range(requests)]
+    results = await asyncio.gather(*[request.future for request in pending])
+    elapsed = time.perf_counter() - start_time
+
+    await pipeline.stop()
+    assert results == list(range(requests))
+    return requests / elapsed
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    throughputs = [(size, await run(size, requests)) for size in BATCH_SIZES]
+
+    best = max(t for _, t in throughputs)
+    print(f"{requests} 个请求, {WORKERS} 个工作者")
+    print(f"{'batch':>6} {'req/s':>10}")
+    for size, throughput in throughputs:
+        bar = "#" * int(50 * throughput / best)
+        print(f"{size:>6} {throughput:>10.1f} {bar}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
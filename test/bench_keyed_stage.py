@@ -0,0 +1,79 @@
+"""
+按键保序阶段的吞吐量基准测试
+
+模拟消息处理阶段: 每条消息一次LLM调用, 消息分属若干个 memory_id,
+对比不同工作者数量下的吞吐量, 并检查每个 memory_id 内的处理顺序
+
+用法: python test/bench_keyed_stage.py [消息数] [memory_id数]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+# 单次调用耗时(秒), 带随机抖动, 不保序时同一个记忆的消息很容易乱序
+CALL_TIME = 0.02
+WORKER_COUNTS = [1, 2, 4, 8, 16]
+
+
+@dataclass
+class FakeMessage:
+    memory_id: str
+    seq: int
+
+
+async def run(workers: int, messages: list) -> tuple:
+    processed = defaultdict(list)
+
+    async def process(message: FakeMessage):
+        await asyncio.sleep(CALL_TIME * random.uniform(0.5, 1.5))
+        processed[message.memory_id].append(message.seq)
+        return message
+
+    stage = PipelineStage(
+        "bench",
+        process,
+        len(messages),
+        workers,
+        key_func=lambda message: message.memory_id,
+    )
+    pipeline = BasePipeline(f"bench-{workers}")
+    pipeline.add_stage(stage)
+    await pipeline.start()
+
+    start_time = time.perf_counter()
+    pending = [await pipeline.process(message) for message in messages]
+    await asyncio.gather(*[request.future for request in pending])
+    elapsed = time.perf_counter() - start_time
+    await pipeline.stop()
+
+    in_order = all(seqs == sorted(seqs) for seqs in processed.values())
+    return len(messages) / elapsed, in_order
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    keys = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    random.seed(0)
+    messages = [
+        FakeMessage(f"memory-{random.randrange(keys)}", i) for i in range(count)
+    ]
+
+    print(f"{count} 条消息, {keys} 个memory_id, 单次调用约 {CALL_TIME * 1000:.0f}ms")
+    print(f"{'workers':>8} {'msg/s':>10} {'in order':>9}")
+    for workers in WORKER_COUNTS:
+        throughput, in_order = await run(workers, messages)
+        print(f"{workers:>8} {throughput:>10.1f} {str(in_order):>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+跨进程阶段传输方式的基准测试
+
+模拟批量嵌入计算阶段放在独立进程中: 每个请求返回一个3072维float32向量,
+下游阶段在主进程中读取向量, 对比各传输方式的吞吐量和主进程的CPU开销
+
+用法: python test/bench_stage_transport.py [请求数]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+DIM = 3072
+# 与 storage.embedding_batch 的默认批大小一致
+BATCH_SIZE = 16
+PLACEMENTS = [
+    ("in-process", None),
+    ("queue", {"transport": "queue"}),
+    ("unix", {"transport": "unix"}),
+    ("tcp", {"transport": "tcp"}),
+    ("shm", {"transport": "shm", "ring_dim": DIM}),
+]
+
+
+async def embed(texts: list):
+    return [
+        {
+            "text": text,
+            "embedding": np.random.default_rng(int(text)).standard_normal(
+                DIM, dtype=np.float32
+            ),
+        }
+        for text in texts
+    ]
+
+
+def checksum(data):
+    return float(data["embedding"][:8].sum())
+
+
+async def run(placement, count: int) -> tuple:
+    pipeline = BasePipeline("bench")
+    pipeline.add_stage(
+        PipelineStage(
+            "嵌入",
+            max_queue_size=count,
+            workers=4,
+            process_batch=embed,
+            max_batch_size=BATCH_SIZE,
+            max_linger_ms=5,
+            placement=placement,
+        )
+    )
+    pipeline.add_stage(PipelineStage("读取", checksum, count, 1))
+    await pipeline.start()
+
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    pending = [await pipeline.process(str(i)) for i in range(count)]
+    results = await asyncio.gather(*[request.future for request in pending])
+    elapsed = time.perf_counter() - start_time
+    cpu = time.process_time() - start_cpu
+    await pipeline.stop()
+    return count / elapsed, cpu * 1e6 / count, sum(results)
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"{count} 个请求, 每批 {BATCH_SIZE} 个, 每个返回 {DIM} 维float32向量")
+    # 主进程CPU时间不含阶段进程, 反映传输方式给主进程事件循环带来的负担
+    print(f"{'transport':>10} {'req/s':>10} {'main cpu us/req':>16} {'checksum':>12}")
+    for name, placement in PLACEMENTS:
+        throughput, cpu, total = await run(placement, count)
+        print(f"{name:>10} {throughput:>10.1f} {cpu:>16.1f} {total:>12.4f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
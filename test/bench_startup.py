@@ -0,0 +1,78 @@
+"""
+冷启动基准测试
+
+测量命令行入口和常用模块的导入耗时(每项启动一个新的解释器, 取最小值),
+以及一个阶段进程从启动到处理完第一个请求的耗时
+
+用法: python test/bench_startup.py [重复次数]
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORTS = [
+    ("python", "pass"),
+    ("dear_moments", "import dear_moments"),
+    ("dear_moments.service", "import dear_moments.service"),
+    ("dear_moments.core.pipeline", "import dear_moments.core.pipeline"),
+    ("DearMoments", "import DearMoments"),
+    ("dear_moments.server", "import dear_moments.server"),
+    ("cluster router", "from dear_moments.cluster import ClusterRouter"),
+]
+COMMANDS = [
+    ("main.py --help", ["main.py", "--help"]),
+    ("main.py router --help", ["main.py", "router", "--help"]),
+    ("main.py serve --help", ["main.py", "serve", "--help"]),
+]
+
+
+def echo(data):
+    """阶段进程中的处理函数, 需要是模块级函数"""
+    return data
+
+
+def best_of(repeat: int, args: list) -> float:
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args],
+            cwd=ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start_time)
+    return min(timings) * 1000
+
+
+async def spawn_stage() -> float:
+    from dear_moments.core.pipeline import RemoteStage
+
+    stage = RemoteStage.from_config("bench", echo, None, {"transport": "unix"})
+    start_time = time.perf_counter()
+    await stage.start()
+    await stage.call("item", "ping")
+    elapsed = time.perf_counter() - start_time
+    await stage.stop()
+    return elapsed * 1000
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'':<32} {'ms':>8}")
+    for name, statement in IMPORTS:
+        print(f"{'import ' + name:<32} {best_of(repeat, ['-c', statement]):>8.1f}")
+    for name, args in COMMANDS:
+        print(f"{name:<32} {best_of(repeat, args):>8.1f}")
+    spawn = min(asyncio.run(spawn_stage()) for _ in range(repeat))
+    print(f"{'stage process spawn':<32} {spawn:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
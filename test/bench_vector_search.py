@@ -0,0 +1,82 @@
+"""
+向量搜索阶段的执行器基准测试
+
+对比在事件循环、线程池和进程池中执行相似度计算时的搜索吞吐量,
+以及同一时间事件循环的最大调度延迟(衡量搜索是否阻塞了其他阶段和网络I/O)
+
+用法: python test/bench_vector_search.py [向量数] [查询数]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+from dear_moments.store import MemoryEmbeddingDB
+
+DIM = 768
+
+
+async def measure_lag(stop: asyncio.Event, started: float) -> float:
+    """每毫秒醒来一次, 记录两次醒来之间超出预期的最大间隔"""
+    worst = 0.0
+    previous = started
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        worst = max(worst, now - previous - 0.001)
+        previous = now
+    return worst
+
+
+async def run(executor, vectors: np.ndarray, queries: np.ndarray):
+    db = MemoryEmbeddingDB(shared=executor == "process")
+    for i, vector in enumerate(vectors):
+        await db.store({"i": i}, vector)
+
+    workers = os.cpu_count() if executor else 1
+
+    async def search(query):
+        return await db.search(query, top_k=5, executor=stage.executor)
+
+    stage = PipelineStage("search", search, len(queries), workers, executor=executor)
+    pipeline = BasePipeline(f"bench-{executor}")
+    pipeline.add_stage(stage)
+    await pipeline.start()
+
+    stop = asyncio.Event()
+    start_time = time.perf_counter()
+    lag = asyncio.create_task(measure_lag(stop, start_time))
+    pending = [await pipeline.process(query) for query in queries]
+    await asyncio.gather(*[request.future for request in pending])
+    elapsed = time.perf_counter() - start_time
+    stop.set()
+    worst_lag = await lag
+
+    await pipeline.stop()
+    await db.close()
+    return len(queries) / elapsed, worst_lag * 1000
+
+
+async def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((size, DIM), dtype=np.float32)
+    queries = rng.standard_normal((count, DIM), dtype=np.float32)
+
+    print(f"{size} 个向量, {count} 次查询, {os.cpu_count()} 核")
+    print(f"{'executor':>9} {'query/s':>10} {'max lag ms':>11}")
+    for executor in (None, "thread", "process"):
+        throughput, lag = await run(executor, vectors, queries)
+        print(f"{str(executor):>9} {throughput:>10.1f} {lag:>11.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
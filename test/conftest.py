@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dear_moments.config import DearMomentsConfig
+from dear_moments.core.storage_processors.context_window import ContextWindowManager
+from dear_moments.models import ContextList
+from dear_moments.service import Services
+
+
+@pytest.fixture(autouse=True)
+def isolated_data(tmp_path):
+    """
+    每个测试使用新的 ContextList、Services 和 ContextWindowManager,
+    换出的上下文和检查点写入临时目录
+    """
+    config = DearMomentsConfig.get_instance()
+    config.set("storage.context_list.spill_dir", str(tmp_path / "contexts"))
+    config.set("app.shutdown.checkpoint_dir", str(tmp_path / "checkpoints"))
+    ContextList._instance = None
+    ContextList._initialized = False
+    Services._instance = None
+    Services._initialized = False
+    ContextWindowManager._instance = None
+    ContextWindowManager._initialized = False
+    yield tmp_path
+    ContextList._instance = None
+    ContextList._initialized = False
+    Services._instance = None
+    Services._initialized = False
+    ContextWindowManager._instance = None
+    ContextWindowManager._initialized = False
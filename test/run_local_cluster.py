@@ -0,0 +1,79 @@
+"""
+在本机启动一个多进程集群: N 个记忆节点(main.py serve)和一个路由器(main.py router)
+
+节点端口从 --base-port 开始递增, 分片名称为 shard0、shard1..., 每个节点的数据目录为
+data/cluster/<端口>; 按 Ctrl+C 停止所有进程.
+启动后可以通过路由器增加分片来触发迁移, 例如先用 --nodes 3 --shards 2 启动, 再执行:
+    curl -X POST http://127.0.0.1:8600/v1/cluster/shards \\
+        -d '{"name": "shard2", "url": "http://127.0.0.1:8702"}'
+
+用法: python test/run_local_cluster.py [--nodes 3] [--shards 2] [--base-port 8700]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=3, help="启动的记忆节点数")
+    parser.add_argument("--shards", type=int, help="路由器初始使用的节点数, 默认全部")
+    parser.add_argument("--base-port", type=int, default=8700)
+    parser.add_argument("--router-port", type=int, default=8600)
+    options = parser.parse_args()
+
+    ports = [options.base_port + i for i in range(options.nodes)]
+    initial = ports[: options.shards or options.nodes]
+    shards = ",".join(
+        f"shard{i}=http://127.0.0.1:{port}" for i, port in enumerate(initial)
+    )
+
+    processes = []
+    try:
+        for port in ports:
+            data_dir = os.path.join("data", "cluster", str(port))
+            command = [
+                sys.executable,
+                "main.py",
+                "serve",
+                "--port",
+                str(port),
+                "--data-dir",
+                data_dir,
+            ]
+            processes.append(subprocess.Popen(command, cwd=ROOT))
+        # 节点初始化完成后再启动路由器, 路由器的 /readyz 会显示各分片的状态
+        time.sleep(3)
+        processes.append(
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "main.py",
+                    "router",
+                    "--port",
+                    str(options.router_port),
+                    "--shards",
+                    shards,
+                ],
+                cwd=ROOT,
+            )
+        )
+        print(f"路由器: http://127.0.0.1:{options.router_port}, 分片: {shards}")
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
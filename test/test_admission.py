@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from dear_moments.core.pipeline import PipelineOverloadedError
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_request import PipelineTimeoutError
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+
+def test_full_queue_rejects_requests_with_deadline():
+    async def main():
+        release = asyncio.Event()
+
+        async def block(item):
+            await release.wait()
+            return item
+
+        pipeline = BasePipeline("准入")
+        pipeline.add_stage(PipelineStage("阻塞", block, max_queue_size=1))
+        await pipeline.start()
+        await pipeline.process(0, timeout=5)
+        await asyncio.sleep(0)
+        await pipeline.process(1, timeout=5)
+        with pytest.raises(PipelineOverloadedError):
+            await pipeline.process(2, timeout=5)
+        release.set()
+        await pipeline.stop()
+        return pipeline.shed_items["queue_full"]
+
+    assert asyncio.run(main()) == 1
+
+
+def test_estimated_wait_over_deadline_is_rejected():
+    async def main():
+        pipeline = BasePipeline("准入")
+        stage = PipelineStage("慢", lambda x: x)
+        pipeline.add_stage(stage)
+        stage.avg_item_time = 10.0
+        await pipeline.start()
+        with pytest.raises(PipelineOverloadedError):
+            await pipeline.process("x", timeout=1)
+        # 不带截止时间的调用方接受背压, 不做准入检查
+        result = await pipeline.process("y", wait=True)
+        await pipeline.stop()
+        return result, pipeline.shed_items["queue_time"]
+
+    assert asyncio.run(main()) == ("y", 1)
+
+
+def test_expired_request_is_shed_before_next_stage():
+    calls = []
+
+    async def slow(item):
+        await asyncio.sleep(0.1)
+        return item
+
+    async def main():
+        pipeline = BasePipeline("截止时间")
+        pipeline.add_stage(PipelineStage("慢", slow))
+        pipeline.add_stage(PipelineStage("昂贵", calls.append))
+        await pipeline.start()
+        with pytest.raises(PipelineTimeoutError):
+            await pipeline.process("x", wait=True, timeout=0.05)
+        await asyncio.sleep(0.15)
+        await pipeline.stop()
+        return pipeline.stages[1].shed_items
+
+    shed = asyncio.run(main())
+    assert calls == []
+    assert shed["abandoned"] + shed["deadline"] == 1
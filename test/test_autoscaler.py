@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from dear_moments.core.pipeline.autoscaler import StageAutoscaler
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+from dear_moments.service.rate_limit import RateLimitMonitor
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limit_monitor():
+    RateLimitMonitor._instance = None
+    yield
+    RateLimitMonitor._instance = None
+
+
+async def backlogged_stage(release: asyncio.Event, **kwargs):
+    async def wait(item):
+        await release.wait()
+        return item
+
+    pipeline = BasePipeline("扩缩容")
+    stage = PipelineStage("慢", wait, 100, 1, max_workers=3, **kwargs)
+    pipeline.add_stage(stage)
+    await pipeline.start()
+    for i in range(10):
+        await pipeline.process(i)
+    await asyncio.sleep(0)
+    return pipeline, stage
+
+
+def test_scales_up_on_backlog_and_respects_max_workers():
+    async def main():
+        release = asyncio.Event()
+        pipeline, stage = await backlogged_stage(release)
+        scaler = StageAutoscaler([stage], cooldown=0)
+        for _ in range(5):
+            scaler.tick()
+        workers = stage.workers
+        release.set()
+        await pipeline.stop()
+        return workers, scaler.scale_ups
+
+    assert asyncio.run(main()) == (3, 2)
+
+
+def test_scales_down_when_idle():
+    async def main():
+        pipeline = BasePipeline("扩缩容")
+        stage = PipelineStage("空闲", lambda x: x, 10, 3, min_workers=1)
+        pipeline.add_stage(stage)
+        await pipeline.start()
+        await asyncio.sleep(0)
+        scaler = StageAutoscaler([stage], cooldown=0, scale_down_ticks=2)
+        scaler.tick()
+        after_one = stage.workers
+        for _ in range(10):
+            scaler.tick()
+        await pipeline.stop()
+        return after_one, stage.workers
+
+    assert asyncio.run(main()) == (3, 1)
+
+
+def test_rate_limited_stage_shrinks_instead_of_growing():
+    async def main():
+        release = asyncio.Event()
+        pipeline, stage = await backlogged_stage(release, rate_limited=True)
+        stage.add_worker()
+        RateLimitMonitor.get_instance().record("llm")
+        scaler = StageAutoscaler([stage], cooldown=0)
+        scaler.tick()
+        workers = stage.workers
+        release.set()
+        await pipeline.stop()
+        return workers, scaler.scale_ups, scaler.rate_limited_downs
+
+    assert asyncio.run(main()) == (1, 0, 1)
+
+
+def test_rate_limit_only_affects_stages_calling_that_service():
+    async def main():
+        release = asyncio.Event()
+        pipeline, stage = await backlogged_stage(
+            release, rate_limited=True, rate_limit_service="llm"
+        )
+        RateLimitMonitor.get_instance().record("embedding")
+        scaler = StageAutoscaler([stage], cooldown=0)
+        scaler.tick()
+        workers = stage.workers
+        release.set()
+        await pipeline.stop()
+        return workers, scaler.rate_limited_downs
+
+    assert asyncio.run(main()) == (2, 0)
@@ -0,0 +1,139 @@
+import asyncio
+
+from dear_moments.core.storage_processors.message_processor import MessageProcessor
+from dear_moments.models import Context, ContextList, Message
+from dear_moments.resources import EVENT_FRAME_BATCH_SCHEMA, StoragePrompts
+from dear_moments.service import Services
+from dear_moments.service.llm import LLMService
+from dear_moments.utils.tokens import estimate_tokens
+
+
+def frame(label):
+    return {
+        "type": label,
+        "participants": {"user": "用户", "others": []},
+        "time": "",
+        "location": "",
+        "cause": "",
+        "result": "",
+        "manner": "",
+        "facts": [],
+    }
+
+
+class ScriptedLLM(LLMService):
+    """批量请求返回给定的结果, 单条请求按提示词中的对话返回对应记忆的事件框架"""
+
+    def __init__(self, batch_response, fail=""):
+        self.batch_response = batch_response
+        self.fail = fail
+        self.single_prompts = []
+
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
+        raise NotImplementedError
+
+    async def get_structured(self, prompt: str, schema: dict, prefix: str = ""):
+        if schema is EVENT_FRAME_BATCH_SCHEMA:
+            return self.batch_response
+        self.single_prompts.append(prompt)
+        for memory_id in "abc":
+            if f"来自{memory_id}" in prompt and memory_id not in self.fail:
+                return frame(memory_id)
+        return {}
+
+    async def close(self):
+        pass
+
+
+def incoming(memory_id):
+    context = Context(memory_id=memory_id, context=[])
+    ContextList.add(context)
+    message = Message(
+        id=memory_id,
+        memory_id=memory_id,
+        content=f"来自{memory_id}",
+        sender="用户",
+        context=context,
+    )
+    context.add(message)
+    return message
+
+
+def extract(batch_response, fail=""):
+    llm = ScriptedLLM(batch_response, fail)
+    Services.get_instance().register_factory("LLMService", lambda: llm)
+    messages = [incoming(memory_id) for memory_id in "abc"]
+    event_frames = asyncio.run(MessageProcessor().messages_to_event_frames(messages))
+    return event_frames, llm
+
+
+def test_results_are_routed_by_key_not_position():
+    event_frames, llm = extract(
+        [
+            {"key": "c2", "event_frame": frame("c")},
+            {"key": "c0", "event_frame": frame("a")},
+            {"key": "c1", "event_frame": frame("b")},
+        ]
+    )
+    assert [event_frame["type"] for event_frame in event_frames] == ["a", "b", "c"]
+    assert llm.single_prompts == []
+
+
+def test_duplicate_and_foreign_keys_are_ignored():
+    event_frames, llm = extract(
+        [
+            {"key": "c0", "event_frame": frame("a")},
+            # 重复的编号只接受第一个, 其他批次或编造的编号直接丢弃
+            {"key": "c0", "event_frame": frame("b")},
+            {"key": "c9", "event_frame": frame("b")},
+            {"key": "a", "event_frame": frame("b")},
+            {"key": "c1", "event_frame": frame("b")},
+            {"key": "c2", "event_frame": frame("c")},
+        ]
+    )
+    assert [event_frame["type"] for event_frame in event_frames] == ["a", "b", "c"]
+
+
+def test_missing_and_invalid_sections_fall_back_to_single_extraction():
+    event_frames, llm = extract(
+        [
+            {"key": "c0", "event_frame": frame("a")},
+            {"key": "c1", "event_frame": {"type": "缺少字段"}},
+        ]
+    )
+    assert [event_frame["type"] for event_frame in event_frames] == ["a", "b", "c"]
+    # 回退的单条提取只看到自己记忆的对话
+    assert len(llm.single_prompts) == 2
+    assert all("来自a" not in prompt for prompt in llm.single_prompts)
+    assert ContextList.get_by_memory_id("b").extracted_until == 1
+
+
+def test_failed_sections_are_released_for_the_next_extraction():
+    event_frames, _ = extract([{"key": "c0", "event_frame": frame("a")}], fail="bc")
+    assert event_frames[0]["type"] == "a"
+    assert event_frames[1:] == [None, None]
+    assert ContextList.get_by_memory_id("a").extracted_until == 1
+    assert ContextList.get_by_memory_id("b").extracted_until == 0
+
+
+def test_plan_batches_respects_token_budget_and_size():
+    sections = [
+        {"key": f"c{i}", "system_prompt": "", "conversations": "对话内容" * (i + 1) * 20}
+        for i in range(8)
+    ]
+    base = estimate_tokens(
+        StoragePrompts.get_batch_information_extract_prompt([], "", "")
+    )
+    budget = base + 400
+    batches = MessageProcessor.plan_batches(sections, budget, max_batch_size=3)
+
+    planned = [section["key"] for batch in batches for section in batch]
+    assert planned == [section["key"] for section in sections]
+    assert 1 < len(batches) < len(sections)
+    for batch in batches:
+        assert len(batch) <= 3
+        tokens = base + sum(
+            estimate_tokens(s["system_prompt"] + s["conversations"]) + 16 for s in batch
+        )
+        # 单个区段超过预算时独占一批
+        assert tokens <= budget or len(batch) == 1
@@ -0,0 +1,72 @@
+import asyncio
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+
+def test_requests_are_grouped_into_batches():
+    sizes = []
+
+    def double_all(items):
+        sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        pipeline = BasePipeline("批处理")
+        pipeline.add_stage(
+            PipelineStage(
+                "批", process_batch=double_all, max_batch_size=4, max_linger_ms=50
+            )
+        )
+        await pipeline.start()
+        results = await asyncio.gather(
+            *[pipeline.process(i, wait=True) for i in range(10)]
+        )
+        await pipeline.stop()
+        return results
+
+    assert asyncio.run(main()) == [i * 2 for i in range(10)]
+    assert max(sizes) <= 4
+    assert sum(sizes) == 10
+    assert len(sizes) < 10
+
+
+def test_item_error_fails_only_that_request():
+    def check(items):
+        return [ValueError(item) if item < 0 else item for item in items]
+
+    async def main():
+        pipeline = BasePipeline("批处理")
+        pipeline.add_stage(
+            PipelineStage("批", process_batch=check, max_batch_size=8, max_linger_ms=20)
+        )
+        await pipeline.start()
+        results = await asyncio.gather(
+            *[pipeline.process(i, wait=True) for i in (1, -1, 2)],
+            return_exceptions=True,
+        )
+        await pipeline.stop()
+        return results
+
+    ok, failed, other = asyncio.run(main())
+    assert (ok, other) == (1, 2)
+    assert isinstance(failed, ValueError)
+
+
+def test_wrong_result_length_fails_whole_batch():
+    async def main():
+        pipeline = BasePipeline("批处理")
+        pipeline.add_stage(
+            PipelineStage(
+                "批", process_batch=lambda items: [], max_batch_size=2, max_linger_ms=20
+            )
+        )
+        await pipeline.start()
+        results = await asyncio.gather(
+            *[pipeline.process(i, wait=True) for i in range(2)],
+            return_exceptions=True,
+        )
+        await pipeline.stop()
+        return results
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(main()))
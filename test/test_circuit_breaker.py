@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+
+from dear_moments.service.circuit_breaker import CircuitBreaker
+from dear_moments.service.llm import LLMRoute, LLMService, RoutingLLMService
+
+
+class SlowLLM(LLMService):
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
+        self.started.set()
+        await asyncio.sleep(10)
+        return "回复"
+
+    async def close(self):
+        pass
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker._opened_at = time.monotonic() - breaker.reset_timeout
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_half_open_allows_one_probe_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_cancelled_probe_releases_slot():
+    async def main():
+        backend = SlowLLM()
+        route = LLMRoute("slow", backend, breaker=CircuitBreaker(failure_threshold=1))
+        open_breaker(route.breaker)
+        service = RoutingLLMService([route])
+
+        task = asyncio.create_task(service.get_response("提示词"))
+        await backend.started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return route.breaker
+
+    breaker = asyncio.run(main())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
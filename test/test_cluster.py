@@ -0,0 +1,218 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from dear_moments.cluster import (
+    ClusterRouter,
+    HashRing,
+    ShardError,
+    delete_memories,
+    export_memories,
+    prepare_export,
+)
+from dear_moments.core.pipeline import PipelineTimeoutError
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+from dear_moments.models import Context, ContextList
+
+OLD = HashRing({"a": "http://a", "b": "http://b"}, vnodes=16)
+NEW = OLD.with_shard("c", "http://c")
+
+
+def ids_on_a(target: str, count: int):
+    """旧哈希环上属于分片a、新哈希环上属于 target 的记忆ID"""
+    ids = (f"m{i}" for i in range(10000))
+    return [m for m in ids if OLD.shard_for(m) == "a" and NEW.shard_for(m) == target][
+        :count
+    ]
+
+
+def test_adding_a_shard_only_moves_keys_to_it():
+    keys = [f"m{i}" for i in range(2000)]
+    moved = [k for k in keys if OLD.shard_for(k) != NEW.shard_for(k)]
+    assert moved
+    assert all(NEW.shard_for(k) == "c" for k in moved)
+    assert len(moved) < len(keys) / 2
+    assert HashRing.from_dict(NEW.to_dict()).shard_for("m1") == NEW.shard_for("m1")
+
+
+def test_export_waits_for_pending_storage_requests():
+    (memory_id,) = ids_on_a("c", 1)
+    (staying,) = ids_on_a("a", 1)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def store(message):
+            await release.wait()
+            return message
+
+        pipeline = BasePipeline("存储")
+        pipeline.add_stage(PipelineStage("写入", store))
+        await pipeline.start()
+        await pipeline.process(SimpleNamespace(memory_id=memory_id))
+        await pipeline.process(SimpleNamespace(memory_id=staying))
+
+        with pytest.raises(PipelineTimeoutError):
+            await prepare_export(NEW, "a", pipeline, drain_timeout=0.05)
+        export = asyncio.create_task(prepare_export(NEW, "a", pipeline, 5))
+        await asyncio.sleep(0.05)
+        assert not export.done()
+        release.set()
+        moving = await export
+        await pipeline.stop()
+        return moving, pipeline.pending_tenants()
+
+    moving, pending = asyncio.run(main())
+    # 只在管道中出现过的新对话也要迁出
+    assert moving == {memory_id}
+    assert pending == set()
+
+
+def test_spilled_contexts_are_exported(isolated_data):
+    (memory_id,) = ids_on_a("c", 1)
+
+    async def main():
+        # 只有上下文、还没有向量记录的记忆, 上下文已经换出到磁盘
+        ContextList.add(Context(memory_id=memory_id, context=[], summary="摘要"))
+        ContextList.spill_all()
+        moving = await prepare_export(NEW, "a")
+        entries = [entry async for entry in export_memories(moving)]
+        deleted = await delete_memories([], moving)
+        return moving, entries, deleted
+
+    moving, entries, deleted = asyncio.run(main())
+    assert moving == {memory_id}
+    assert [entry["kind"] for entry in entries] == ["context", "end"]
+    assert entries[0]["context"]["summary"] == "摘要"
+    assert deleted["contexts"] == 1
+    # 迁出之后不留下换出文件
+    assert list((isolated_data / "contexts").iterdir()) == []
+
+
+class FakeNode:
+    """只实现迁移接口的记忆节点, 数据是 memory_id -> 记录列表"""
+
+    def __init__(self, name, log, memories=None, fail_export=False, truncate=False):
+        self.name = name
+        self.log = log
+        self.memories = {m: list(records) for m, records in (memories or {}).items()}
+        self.fail_export = fail_export
+        self.truncate = truncate
+        self.server = None
+
+    async def export(self, request):
+        body = await request.json()
+        self.log.append(("export", self.name))
+        if self.fail_export:
+            return web.json_response({"error": "导出失败"}, status=500)
+        ring = HashRing.from_dict(body["ring"])
+        moving = sorted(m for m in self.memories if ring.shard_for(m) != body["node"])
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for memory_id in moving:
+            for item in self.memories[memory_id]:
+                line = {"kind": "record", "memory_id": memory_id, "item": item}
+                await response.write((json.dumps(line) + "\n").encode())
+        if not self.truncate:
+            end = {"kind": "end", "record_ids": moving, "memory_ids": moving}
+            await response.write((json.dumps(end) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def import_(self, request):
+        created = []
+        async for line in request.content:
+            entry = json.loads(line)
+            self.memories.setdefault(entry["memory_id"], []).append(entry["item"])
+            created.append(entry["memory_id"])
+        self.log.append(("import", self.name))
+        return web.json_response(
+            {"record_ids": created, "memory_ids": sorted(set(created))}
+        )
+
+    async def delete(self, request):
+        body = await request.json()
+        for memory_id in body["memory_ids"]:
+            self.memories.pop(memory_id, None)
+        self.log.append(("delete", self.name))
+        return web.json_response({"records": len(body["record_ids"])})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/cluster/export", self.export)
+        app.router.add_post("/v1/cluster/import", self.import_)
+        app.router.add_post("/v1/cluster/delete", self.delete)
+        self.server = TestServer(app, host="127.0.0.1")
+        await self.server.start_server()
+        return str(self.server.make_url("")).rstrip("/")
+
+
+def migrate(sources, target):
+    async def main():
+        urls = {node.name: await node.start() for node in sources}
+        target_url = await target.start()
+        router = ClusterRouter(urls, port=0, vnodes=16)
+        await router.start()
+        try:
+            try:
+                stats = await router.add_shard(target.name, target_url)
+            except ShardError:
+                stats = None
+            return stats, sorted(router.ring.shards)
+        finally:
+            await router.stop()
+            for node in [*sources, target]:
+                await node.server.close()
+
+    return asyncio.run(main())
+
+
+def seeded(log, **kwargs):
+    memories = {f"m{i}": [f"事件{i}"] for i in range(40)}
+    ring = HashRing({"a": "", "b": ""}, vnodes=16)
+    return [
+        FakeNode(
+            name,
+            log,
+            {m: r for m, r in memories.items() if ring.shard_for(m) == name},
+            **kwargs.get(name, {}),
+        )
+        for name in ("a", "b")
+    ]
+
+
+def test_ring_switches_before_sources_are_deleted():
+    log = []
+    a, b = seeded(log)
+    c = FakeNode("c", log)
+    stats, shards = migrate([a, b], c)
+
+    assert shards == ["a", "b", "c"]
+    assert stats["moved"]["a"]["records"] + stats["moved"]["b"]["records"] > 0
+    # 所有原分片都导入完成之后才删除
+    deletes = [i for i, (action, _) in enumerate(log) if action == "delete"]
+    imports = [i for i, (action, _) in enumerate(log) if action == "import"]
+    assert len(imports) == 2 and max(imports) < min(deletes)
+    ring = HashRing({"a": "", "b": "", "c": ""}, vnodes=16)
+    for node in (a, b, c):
+        assert all(ring.shard_for(m) == node.name for m in node.memories)
+
+
+@pytest.mark.parametrize("failure", [{"fail_export": True}, {"truncate": True}])
+def test_failed_migration_keeps_sources_and_rolls_back_target(failure):
+    log = []
+    a, b = seeded(log, b=failure)
+    before = (dict(a.memories), dict(b.memories))
+    c = FakeNode("c", log)
+    stats, shards = migrate([a, b], c)
+
+    assert stats is None
+    assert shards == ["a", "b"]
+    assert (a.memories, b.memories) == before
+    assert c.memories == {}
+    assert ("delete", "a") not in log and ("delete", "b") not in log
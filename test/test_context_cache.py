@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from dear_moments.resources import StoragePrompts
+from dear_moments.service.llm import LocalLLMService
+from dear_moments.service.llm.network.gemini_context_cache import GeminiContextCache
+
+
+class FakeContextCache(GeminiContextCache):
+    """记录cachedContents请求而不访问网络"""
+
+    def __init__(self, fail=False, **kwargs):
+        super().__init__("key", "gemini-test", lambda: None, **kwargs)
+        self.fail = fail
+        self.requests = []
+
+    async def _request(self, method, url, payload=None, update_mask=None):
+        self.requests.append(method)
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise Exception("前缀太短, 无法缓存")
+        return {"name": f"cachedContents/{len(self.requests)}"}
+
+
+def test_concurrent_requests_upload_a_prefix_once():
+    async def main():
+        cache = FakeContextCache()
+        entries = await asyncio.gather(*[cache.get("固定前缀") for _ in range(5)])
+        return cache, entries
+
+    cache, entries = asyncio.run(main())
+    assert cache.requests == ["POST"]
+    assert len({entry.name for entry in entries}) == 1
+
+
+def test_prefix_is_refreshed_before_it_expires():
+    async def main():
+        cache = FakeContextCache(ttl=600, refresh_margin=60)
+        entry = await cache.get("固定前缀")
+        entry.expire_at = time.time() + 30
+        refreshed = await cache.get("固定前缀")
+        return cache, entry, refreshed
+
+    cache, entry, refreshed = asyncio.run(main())
+    assert cache.requests == ["POST", "PATCH"]
+    assert refreshed is entry
+    assert entry.expire_at > time.time() + 500
+
+
+def test_uncacheable_prefix_is_not_retried_within_ttl():
+    async def main():
+        cache = FakeContextCache(fail=True)
+        first = await cache.get("短前缀")
+        second = await cache.get("短前缀")
+        return cache, first, second
+
+    cache, first, second = asyncio.run(main())
+    assert first is None and second is None
+    assert cache.requests == ["POST"]
+    assert cache.failed == 1
+
+
+def test_least_recently_used_prefix_is_deleted():
+    async def main():
+        cache = FakeContextCache(max_entries=2)
+        for prefix in ("a", "b", "a", "c"):
+            await cache.get(prefix)
+        return cache
+
+    cache = asyncio.run(main())
+    assert cache.requests == ["POST", "POST", "POST", "DELETE"]
+    assert cache.get_statistics()["cached_prefixes"] == 2
+
+
+def test_extraction_prefix_does_not_depend_on_conversation():
+    parts = [
+        StoragePrompts.get_information_extract_prompt_parts(
+            system_prompt="系统提示词",
+            examples="",
+            conversations=conversations,
+            topic_examples="",
+        )
+        for conversations in ("用户: 你好", "用户: 今天下雨了")
+    ]
+    assert parts[0][0] == parts[1][0]
+    assert "今天下雨了" in parts[1][1]
+
+
+def test_local_service_counts_cached_prefix_tokens():
+    async def main():
+        llm = LocalLLMService(context_cache={"enabled": True, "ttl": 600})
+        await llm.get_response("第一次", prefix="很长的固定指令" * 50)
+        await llm.get_response("第二次", prefix="很长的固定指令" * 50)
+        return llm.get_statistics()
+
+    stats = asyncio.run(main())
+    assert stats["calls"] == 2
+    assert stats["cached_calls"] == 1
+    assert stats["cached_tokens"] > 0
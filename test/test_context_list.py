@@ -0,0 +1,95 @@
+import os
+import time
+
+from dear_moments.core.storage_processors.context_window import ContextWindowManager
+from dear_moments.models import Context, ContextList, Message
+
+
+def new_context(memory_id, count=2):
+    context = Context(memory_id=memory_id, context=[])
+    for i in range(count):
+        context.add(
+            Message(
+                id=f"{memory_id}-{i}",
+                memory_id=memory_id,
+                content=f"消息{i}",
+                sender="用户",
+                context=context,
+            )
+        )
+    return context
+
+
+def bounded_list(max_contexts=2, idle_seconds=None):
+    contexts = ContextList.get_instance()
+    contexts.max_contexts = max_contexts
+    contexts.idle_seconds = idle_seconds
+    return contexts
+
+
+def test_spilled_context_is_loaded_back_intact(isolated_data):
+    contexts = bounded_list()
+    original = new_context("a", 3)
+    original.summary = "摘要"
+    original.extracted_until = 2
+    ContextList.add(original)
+    ContextList.spill_all()
+    assert contexts.memory_id_to_context == {}
+    assert os.listdir(isolated_data / "contexts")
+
+    loaded = ContextList.get_by_memory_id("a")
+    assert loaded is not original
+    assert loaded.to_record() == original.to_record()
+    assert loaded.to_str() == original.to_str()
+    # 加载之后磁盘文件被删除, 以内存中的为准
+    assert os.listdir(isolated_data / "contexts") == []
+    assert contexts.loads == 1
+
+
+def test_capacity_evicts_least_recently_used():
+    contexts = bounded_list(max_contexts=2)
+    for memory_id in "abc":
+        ContextList.add(new_context(memory_id))
+        if memory_id == "b":
+            ContextList.get_by_memory_id("a")
+    assert list(contexts.memory_id_to_context) == ["a", "c"]
+    assert contexts.evictions == 1
+    assert ContextList.get_by_memory_id("b").memory_id == "b"
+
+
+def test_idle_contexts_are_evicted():
+    contexts = bounded_list(max_contexts=10, idle_seconds=60)
+    ContextList.add(new_context("old"))
+    contexts._last_access["old"] = time.monotonic() - 120
+    ContextList.add(new_context("new"))
+    assert list(contexts.memory_id_to_context) == ["new"]
+
+
+def test_pinned_context_is_not_evicted():
+    contexts = bounded_list(max_contexts=1)
+    ContextList.add(new_context("a"))
+    ContextList.pin("a")
+    ContextList.add(new_context("b"))
+    assert "a" in contexts.memory_id_to_context
+    ContextList.unpin("a")
+    ContextList.add(new_context("c"))
+    assert "a" not in contexts.memory_id_to_context
+
+
+def test_claimed_context_stays_resident_until_released():
+    contexts = bounded_list(max_contexts=1)
+    window = ContextWindowManager.get_instance()
+    context = new_context("a", 3)
+    ContextList.add(context)
+    start, end, _ = window.claim(context)
+
+    # 提取期间其他记忆的消息不会把它换出, 失败后归还的区间没有丢失
+    ContextList.add(new_context("b"))
+    assert ContextList.get_instance().memory_id_to_context.get("a") is context
+    window.release(context, start, end)
+    ContextList.add(new_context("c"))
+    assert "a" not in contexts.memory_id_to_context
+
+    loaded = ContextList.get_by_memory_id("a")
+    assert loaded.extracted_until == 0
+    assert window.claim(loaded)[:2] == (0, 3)
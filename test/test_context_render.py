@@ -0,0 +1,63 @@
+from dear_moments.models import Context, Message
+from dear_moments.utils.tokens import estimate_tokens
+
+
+def message(context, index, content=None):
+    return Message(
+        id=str(index),
+        memory_id=context.memory_id,
+        content=content or f"消息{index}",
+        sender="用户",
+        context=context,
+    )
+
+
+def filled_context(count):
+    context = Context(memory_id="m", context=[])
+    for i in range(count):
+        context.add(message(context, i))
+    return context
+
+
+def test_models_use_slots():
+    context = filled_context(1)
+    assert not hasattr(context, "__dict__")
+    assert not hasattr(context.context[0], "__dict__")
+
+
+def test_full_render_is_cached_until_messages_change():
+    context = filled_context(3)
+    rendered = context.to_str()
+    assert context.to_str() is rendered
+    assert rendered.splitlines() == [msg.line for msg in context.context]
+
+    context.add(message(context, 3))
+    assert context.to_str() is not rendered
+    assert context.to_str().endswith("用户: 消息3")
+
+
+def test_line_is_formatted_once():
+    context = filled_context(1)
+    msg = context.context[0]
+    line = msg.line
+    msg.content = "修改之后"
+    assert msg.line is line
+    assert line.endswith("用户: 消息0")
+
+
+def test_ranges_use_absolute_positions_after_fold():
+    context = filled_context(5)
+    context.fold(2, "摘要")
+    assert context.summarized_count == 2
+    assert context.total_count == 5
+    assert context.to_str(3, 4) == context.context[1].line
+    # 已经折叠的消息不会被渲染
+    assert context.to_str(0).splitlines() == [msg.line for msg in context.context]
+
+
+def test_token_count_tracks_add_and_fold():
+    context = filled_context(4)
+    expected = sum(estimate_tokens(msg.line) for msg in context.context)
+    assert context.token_count == expected
+    context.fold(3, "摘要")
+    assert context.token_count == estimate_tokens(context.context[0].line)
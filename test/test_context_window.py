@@ -0,0 +1,77 @@
+from dear_moments.core.storage_processors.context_window import ContextWindowManager
+from dear_moments.models import Context, Message
+
+
+def new_context(count):
+    context = Context(memory_id="m", context=[])
+    append(context, count)
+    return context
+
+
+def append(context, count):
+    for _ in range(count):
+        index = context.total_count
+        context.add(
+            Message(
+                id=str(index),
+                memory_id="m",
+                content=f"消息{index}",
+                sender="用户",
+                context=context,
+            )
+        )
+
+
+def test_release_without_later_claim_rolls_back():
+    window = ContextWindowManager.get_instance()
+    context = new_context(3)
+    start, end, _ = window.claim(context)
+    window.release(context, start, end)
+    append(context, 2)
+    assert window.claim(context)[:2] == (0, 5)
+
+
+def test_release_keeps_later_claims():
+    window = ContextWindowManager.get_instance()
+    context = new_context(3)
+    first = window.claim(context)
+    append(context, 2)
+    second = window.claim(context)
+    assert second[:2] == (3, 5)
+
+    window.release(context, *first[:2])
+    assert context.extracted_until == 5
+    assert context.foldable_until == 0
+
+    # 失败的区间被重新领取, 之后的消息不会被重复提取
+    start, end, conversations = window.claim(context)
+    assert (start, end) == (0, 3)
+    assert "消息2" in conversations and "消息3" not in conversations
+    assert window.claim(context) is None
+
+
+def test_release_merges_adjacent_failed_ranges():
+    window = ContextWindowManager.get_instance()
+    context = new_context(3)
+    first = window.claim(context)
+    append(context, 2)
+    second = window.claim(context)
+
+    window.release(context, *first[:2])
+    window.release(context, *second[:2])
+    assert context.extracted_until == 0
+    assert context.released == []
+    assert window.claim(context)[:2] == (0, 5)
+
+
+def test_released_ranges_survive_records():
+    window = ContextWindowManager.get_instance()
+    context = new_context(3)
+    first = window.claim(context)
+    append(context, 2)
+    window.claim(context)
+    window.release(context, *first[:2])
+
+    restored = Context.from_record(context.to_record())
+    assert restored.released == [(0, 3)]
+    assert window.claim(restored)[:2] == (0, 3)
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.join_stage import JoinStage
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+
+def diamond(left, right) -> BasePipeline:
+    pipeline = BasePipeline("分叉")
+    pipeline.add_stage(PipelineStage("入口", lambda x: x))
+    pipeline.add_stage(PipelineStage("左", left), after="入口")
+    pipeline.add_stage(PipelineStage("右", right), after="入口")
+    pipeline.add_stage(JoinStage("汇合", lambda branches: branches), after=["左", "右"])
+    return pipeline
+
+
+def test_join_merges_branch_outputs_per_request():
+    async def slow_left(x):
+        await asyncio.sleep(0.01 * (3 - x))
+        return x + 100
+
+    async def main():
+        pipeline = diamond(slow_left, lambda x: x * 2)
+        await pipeline.start()
+        results = await asyncio.gather(
+            *[pipeline.process(i, wait=True) for i in range(3)]
+        )
+        await pipeline.stop()
+        return results
+
+    assert asyncio.run(main()) == [
+        {"左": i + 100, "右": i * 2} for i in range(3)
+    ]
+
+
+def test_filtered_branch_joins_as_none():
+    async def main():
+        pipeline = diamond(lambda x: None, lambda x: x)
+        await pipeline.start()
+        result = await pipeline.process(1, wait=True)
+        await pipeline.stop()
+        return result
+
+    assert asyncio.run(main()) == {"左": None, "右": 1}
+
+
+def test_failed_branch_fails_request_and_frees_partial():
+    def fail(x):
+        raise ValueError(x)
+
+    async def main():
+        pipeline = diamond(fail, lambda x: x)
+        await pipeline.start()
+        with pytest.raises(ValueError):
+            await pipeline.process(1, wait=True)
+        await asyncio.sleep(0.01)
+        waiting = pipeline.get_stage("汇合").get_statistics()["waiting_for_branches"]
+        await pipeline.stop()
+        return waiting
+
+    assert asyncio.run(main()) == 0
+
+
+def test_invalid_topologies_are_rejected():
+    pipeline = BasePipeline("分叉")
+    pipeline.add_stage(PipelineStage("入口", lambda x: x))
+    pipeline.add_stage(PipelineStage("左", lambda x: x), after="入口")
+    with pytest.raises(ValueError):
+        pipeline.add_stage(JoinStage("汇合", dict), after="左")
+    with pytest.raises(ValueError):
+        pipeline.add_stage(PipelineStage("合并", dict), after=["入口", "左"])
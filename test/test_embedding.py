@@ -2,9 +2,6 @@ import aiohttp
 import asyncio
 import json
 
-API_KEY = input("API_KEY:")
-URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-embedding-exp-03-07:embedContent?key={API_KEY}"
-
 
 async def get_embedding(text):
     headers = {"Content-Type": "application/json"}
@@ -46,4 +43,8 @@ async def main():
     #     print(f"Text: {text} \n Embedding: {embedding}\n")
 
 
-asyncio.run(main())
+if __name__ == "__main__":
+    # 手动运行的脚本, 被 pytest 收集时不读取输入
+    API_KEY = input("API_KEY:")
+    URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-embedding-exp-03-07:embedContent?key={API_KEY}"
+    asyncio.run(main())
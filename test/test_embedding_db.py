@@ -0,0 +1,40 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from dear_moments.store import EmbeddingDB, MemoryEmbeddingDB
+
+
+def test_backends_must_implement_migration_methods():
+    class SearchOnly(EmbeddingDB):
+        async def store(self, item, embedding, metadata=None):
+            return "1"
+
+        async def search(self, embedding, top_k=5, executor=None):
+            return []
+
+    with pytest.raises(TypeError):
+        SearchOnly()
+
+
+def test_export_and_delete_by_memory():
+    async def main():
+        db = MemoryEmbeddingDB()
+        ids = {}
+        for i, memory_id in enumerate(["a", "b", "a", "c"]):
+            vector = np.eye(4, dtype=np.float32)[i]
+            ids[i] = await db.store(f"事件{i}", vector, {"memory_id": memory_id})
+        exported = await db.export({"a"})
+        removed = await db.delete({record["id"] for record, _ in exported})
+        results = await db.search(np.eye(4, dtype=np.float32)[1], top_k=4)
+        return exported, removed, db.memory_ids(), results, ids
+
+    exported, removed, memory_ids, results, ids = asyncio.run(main())
+    assert [record["item"] for record, _ in exported] == ["事件0", "事件2"]
+    assert exported[1][1].tolist() == [0.0, 0.0, 1.0, 0.0]
+    assert removed == 2
+    assert memory_ids == {"b", "c"}
+    # 删除之后剩余记录的向量和ID仍然对应
+    assert results[0]["id"] == ids[1]
+    assert results[0]["score"] == pytest.approx(1.0)
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from dear_moments.service.hedging import RequestHedger
+
+
+def primed_hedger(**kwargs):
+    hedger = RequestHedger(min_samples=5, min_delay=0.01, **kwargs)
+    for _ in range(5):
+        hedger.latency.record(0.01)
+    return hedger
+
+
+class Backend:
+    """第一个请求很慢, 之后的请求很快; 记录被取消并已经退出的请求"""
+
+    def __init__(self, slow=1.0):
+        self.slow = slow
+        self.calls = 0
+        self.cancelled = []
+
+    async def call(self):
+        index = self.calls
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.slow if index == 0 else 0)
+        except asyncio.CancelledError:
+            self.cancelled.append(index)
+            raise
+        return index
+
+
+def test_no_hedge_before_enough_samples():
+    async def main():
+        hedger = RequestHedger(min_samples=5, min_delay=0.01)
+        backend = Backend(slow=0.05)
+        return await hedger.run(backend.call), backend.calls, hedger.hedged
+
+    assert asyncio.run(main()) == (0, 1, 0)
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    async def main():
+        hedger = primed_hedger(max_extra_load=1.0)
+        backend = Backend()
+        result = await hedger.run(backend.call)
+        # run 返回之前, 落败的请求已经被取消并退出
+        return result, backend.cancelled, hedger.hedge_wins
+
+    assert asyncio.run(main()) == (1, [0], 1)
+
+
+def test_cancelling_the_caller_cancels_both_requests():
+    async def main():
+        hedger = primed_hedger(max_extra_load=1.0)
+        backend = Backend()
+
+        async def slow_both():
+            index = backend.calls
+            backend.calls += 1
+            try:
+                await asyncio.sleep(1.0)
+            except asyncio.CancelledError:
+                backend.cancelled.append(index)
+                raise
+
+        task = asyncio.create_task(hedger.run(slow_both))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return backend.calls, sorted(backend.cancelled)
+
+    assert asyncio.run(main()) == (2, [0, 1])
+
+
+def test_hedges_stay_within_budget():
+    async def main():
+        hedger = primed_hedger(max_extra_load=0.25)
+        for _ in range(8):
+            await hedger.run(Backend(slow=0).call)
+        # 最近8次都没有对冲, 之后的慢请求最多对冲到窗口的25%
+        for _ in range(3):
+            await hedger.run(Backend(slow=0.2).call)
+        return hedger.hedged, hedger.budget_denied
+
+    assert asyncio.run(main()) == (2, 1)
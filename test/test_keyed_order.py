@@ -0,0 +1,104 @@
+import asyncio
+import random
+
+import pytest
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+
+def test_same_key_is_processed_in_order_across_workers():
+    seen = {}
+    active = set()
+    overlaps = []
+
+    async def handle(item):
+        key, index = item
+        if key in active:
+            overlaps.append(item)
+        active.add(key)
+        await asyncio.sleep(random.random() * 0.005)
+        active.discard(key)
+        seen.setdefault(key, []).append(index)
+        return item
+
+    async def main():
+        pipeline = BasePipeline("保序")
+        pipeline.add_stage(
+            PipelineStage("处理", handle, 100, 4, key_func=lambda item: item[0])
+        )
+        await pipeline.start()
+        requests = [
+            await pipeline.process((key, i)) for i in range(10) for key in "abc"
+        ]
+        await asyncio.gather(*[request.future for request in requests])
+        await pipeline.stop()
+
+    asyncio.run(main())
+    assert overlaps == []
+    assert seen == {key: list(range(10)) for key in "abc"}
+
+
+def test_different_keys_run_in_parallel():
+    async def main():
+        started = asyncio.Event()
+        running = 0
+
+        async def handle(item):
+            nonlocal running
+            running += 1
+            if running == 2:
+                started.set()
+            await asyncio.wait_for(started.wait(), 1)
+            running -= 1
+            return item
+
+        pipeline = BasePipeline("保序")
+        pipeline.add_stage(PipelineStage("处理", handle, 10, 2, key_func=str))
+        await pipeline.start()
+        results = await asyncio.gather(
+            pipeline.process("a", wait=True), pipeline.process("b", wait=True)
+        )
+        await pipeline.stop()
+        return results
+
+    assert asyncio.run(main()) == ["a", "b"]
+
+
+def test_keyed_stage_rejects_batch_mode():
+    with pytest.raises(ValueError):
+        PipelineStage("批", process_batch=list, max_batch_size=4, key_func=str)
+
+
+def test_hot_key_backlog_is_capped():
+    async def main():
+        release = asyncio.Event()
+
+        async def handle(item):
+            await release.wait()
+            return item
+
+        stage = PipelineStage(
+            "处理", handle, 4, 3, key_func=lambda item: "热点", max_parked=2
+        )
+        pipeline = BasePipeline("保序")
+        pipeline.add_stage(stage)
+        await pipeline.start()
+        # 1个正在处理, 2个积压, 之后工作者不再取请求, 队列重新填满
+        requests = [await pipeline.process(i) for i in range(7)]
+        blocked = asyncio.ensure_future(pipeline.process(100))
+        await asyncio.sleep(0.05)
+        parked, queued = stage._parked, stage.input_queue.qsize()
+        put_blocked = not blocked.done()
+
+        release.set()
+        requests.append(await blocked)
+        results = await asyncio.gather(*[request.future for request in requests])
+        await pipeline.stop()
+        return parked, queued, put_blocked, results
+
+    parked, queued, put_blocked, results = asyncio.run(main())
+    assert parked == 2
+    assert queued == 4
+    assert put_blocked
+    assert results == [0, 1, 2, 3, 4, 5, 6, 100]
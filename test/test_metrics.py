@@ -0,0 +1,42 @@
+import pytest
+
+from dear_moments.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_percentiles_are_within_relative_error():
+    histogram = Histogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+    assert histogram.count == 1000
+    assert histogram.max == pytest.approx(1.0)
+    assert histogram.percentile(0.5) == pytest.approx(0.5, rel=0.04)
+    assert histogram.percentile(0.99) == pytest.approx(0.99, rel=0.04)
+
+
+def test_empty_histogram_has_no_percentiles():
+    assert Histogram().percentile(0.5) is None
+
+
+def test_render_counters_gauges_and_summaries():
+    registry = MetricsRegistry(prefix="test")
+    counter = registry.counter("requests_total", "请求数")
+    counter.inc(stage="a")
+    counter.inc(2, stage="a")
+    assert registry.counter("requests_total", "重复注册") is counter
+    registry.gauge("depth", "队列深度", lambda: {(("stage", "a"),): 7})
+    registry.histogram("latency_seconds", "耗时").observe(0.25, stage='q"x')
+
+    text = registry.render()
+    assert 'test_requests_total{stage="a"} 3' in text
+    assert 'test_depth{stage="a"} 7' in text
+    assert 'test_latency_seconds_count{stage="q\\"x"} 1' in text
+    assert '# TYPE test_latency_seconds summary' in text
+
+
+def test_failing_gauge_does_not_break_render():
+    registry = MetricsRegistry(prefix="test")
+    registry.gauge("broken", "出错的仪表", lambda: 1 / 0)
+    registry.counter("ok_total", "正常").inc()
+    text = registry.render()
+    assert "# test_broken unavailable" in text
+    assert "test_ok_total 1" in text
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+
+def make_pipeline(*funcs) -> BasePipeline:
+    pipeline = BasePipeline("测试管道")
+    for i, func in enumerate(funcs):
+        pipeline.add_stage(PipelineStage(f"阶段{i}", func, 10, 2))
+    return pipeline
+
+
+def test_wait_returns_result_of_last_stage():
+    async def main():
+        pipeline = make_pipeline(lambda x: x + 1, lambda x: x * 10)
+        await pipeline.start()
+        results = await asyncio.gather(
+            *[pipeline.process(i, wait=True) for i in range(5)]
+        )
+        await pipeline.stop()
+        return results
+
+    assert asyncio.run(main()) == [10, 20, 30, 40, 50]
+
+
+def test_envelope_future_resolves_later():
+    async def main():
+        pipeline = make_pipeline(lambda x: x.upper())
+        await pipeline.start()
+        request = await pipeline.process("abc")
+        result = await request.future
+        await pipeline.stop()
+        return result
+
+    assert asyncio.run(main()) == "ABC"
+
+
+def test_stage_error_propagates_to_caller():
+    def fail(x):
+        raise KeyError(x)
+
+    async def main():
+        pipeline = make_pipeline(lambda x: x, fail)
+        await pipeline.start()
+        try:
+            with pytest.raises(KeyError):
+                await pipeline.process("bad", wait=True)
+            # 失败的请求不影响后续请求
+            pipeline.stages[1].process_func = lambda x: x
+            assert await pipeline.process("ok", wait=True) == "ok"
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(main())
+
+
+def test_filtered_request_resolves_to_none():
+    async def main():
+        pipeline = make_pipeline(lambda x: None, lambda x: pytest.fail("不应到达"))
+        await pipeline.start()
+        result = await pipeline.process("x", wait=True)
+        await pipeline.stop()
+        return result
+
+    assert asyncio.run(main()) is None
@@ -0,0 +1,107 @@
+import asyncio
+
+from dear_moments.core.query_processors import Prefetcher, recent_window
+from dear_moments.models import Context, ContextList, Message
+from dear_moments.service.rate_limit import RateLimitMonitor
+
+
+class FakeStage:
+    def __init__(self):
+        self.queued = 0
+
+    def backlog(self):
+        return self.queued
+
+
+class FakePipeline:
+    def __init__(self):
+        self.accepting = True
+        self.stages = [FakeStage()]
+        self.requests = []
+
+    async def process(self, text, **kwargs):
+        self.requests.append((text, kwargs))
+        return [{"content": f"记忆: {text}"}]
+
+
+def add_context(memory_id, count=2):
+    context = Context(memory_id=memory_id, context=[])
+    for i in range(count):
+        context.add(
+            Message(
+                id=f"{memory_id}-{i}",
+                memory_id=memory_id,
+                content=f"消息{i}",
+                sender="用户",
+                context=context,
+            )
+        )
+    ContextList.add(context)
+    return context
+
+
+def new_prefetcher(pipeline, **kwargs):
+    RateLimitMonitor._instance = None
+    return Prefetcher(pipeline, idle_after=0, **kwargs)
+
+
+def test_tick_prefetches_idle_contexts_and_caches_results():
+    async def main():
+        pipeline = FakePipeline()
+        prefetcher = new_prefetcher(pipeline)
+        context = add_context("m")
+        assert prefetcher.tick() == 1
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        # 缓存仍然有效时不重复预检索
+        assert prefetcher.tick() == 0
+        return pipeline, prefetcher, context
+
+    pipeline, prefetcher, context = asyncio.run(main())
+    text = recent_window(context)
+    assert pipeline.requests[0][1]["priority"] == "batch"
+    assert prefetcher.lookup("m", text) == [{"content": f"记忆: {text}"}]
+    assert prefetcher.lookup("m", "其他查询") is None
+
+
+def test_lookup_is_stale_after_new_message():
+    prefetcher = new_prefetcher(FakePipeline())
+    context = add_context("m")
+    text = recent_window(context)
+    prefetcher.store("m", context.total_count, text, [{"content": "旧结果"}])
+    context.add(
+        Message(id="new", memory_id="m", content="新消息", sender="用户", context=context)
+    )
+    assert prefetcher.lookup("m", text) is None
+    assert prefetcher.get_statistics()["entries"] == 0
+
+
+def test_tick_respects_budget_and_in_flight_limit():
+    async def main():
+        pipeline = FakePipeline()
+        prefetcher = new_prefetcher(pipeline, budget_per_minute=2, max_in_flight=5)
+        for i in range(4):
+            add_context(f"m{i}")
+        started = prefetcher.tick()
+        await asyncio.sleep(0)
+        return started
+
+    assert asyncio.run(main()) == 2
+
+
+def test_busy_pipeline_or_rate_limit_skips_prefetch():
+    async def main():
+        pipeline = FakePipeline()
+        prefetcher = new_prefetcher(pipeline)
+        add_context("m")
+
+        pipeline.stages[0].queued = 1
+        busy = prefetcher.tick()
+        pipeline.stages[0].queued = 0
+
+        RateLimitMonitor.get_instance().record("llm")
+        limited = prefetcher.tick()
+        return busy, limited
+
+    assert asyncio.run(main()) == (0, 0)
+    RateLimitMonitor._instance = None
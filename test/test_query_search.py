@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from dear_moments.core.pipeline.query_pipeline import QueryPipeline
+from dear_moments.service import Services
+from dear_moments.store import MemoryEmbeddingDB
+
+
+class FakeEmbedding:
+    async def get_embedding(self, text):
+        return np.ones(4, dtype=np.float32)
+
+
+async def filled_db(count):
+    db = MemoryEmbeddingDB()
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        await db.store(f"事件{i}", rng.random(4), {"memory_id": "m"})
+    return db
+
+
+def test_vector_search_stage_uses_configured_top_k():
+    async def main():
+        db = await filled_db(10)
+        services = Services.get_instance()
+        services.register_factory("EmbeddingService", FakeEmbedding)
+        services.register_factory("EmbeddingDB", lambda: db)
+
+        pipeline = QueryPipeline()
+        await pipeline.create_query_embedding_stage(workers=1)
+        await pipeline.create_vector_search_stage(workers=1, top_k=3)
+        await pipeline.create_result_processing_stage(workers=1)
+        await pipeline.start()
+        results = await pipeline.process("查询", wait=True)
+        await pipeline.stop()
+        return results
+
+    assert len(asyncio.run(main())) == 3
+
+
+def test_search_in_executor_matches_inline_search():
+    async def main():
+        db = await filled_db(50)
+        query = np.arange(4, dtype=np.float32)
+        inline = await db.search(query, top_k=5)
+        with ThreadPoolExecutor(2) as executor:
+            offloaded = await db.search(query, top_k=5, executor=executor)
+        return inline, offloaded
+
+    inline, offloaded = asyncio.run(main())
+    assert [r["id"] for r in inline] == [r["id"] for r in offloaded]
+    scores = [r["score"] for r in inline]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_queued_search_survives_matrix_replacement():
+    async def main():
+        db = MemoryEmbeddingDB(shared=True)
+        rng = np.random.default_rng(0)
+        ids = [await db.store(f"事件{i}", rng.random(4)) for i in range(20)]
+        blocker = threading.Event()
+        with ThreadPoolExecutor(1) as executor:
+            # 占住唯一的工作线程, 搜索在执行器中排队时删除记录并替换共享矩阵
+            executor.submit(blocker.wait)
+            search = asyncio.ensure_future(
+                db.search(np.ones(4), top_k=3, executor=executor)
+            )
+            await asyncio.sleep(0)
+            await db.delete({ids[0]})
+            blocker.set()
+            results = await search
+        retired = len(db._retired)
+        await db.close()
+        return results, retired
+
+    results, retired = asyncio.run(main())
+    assert len(results) == 3
+    assert retired == 0
@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+from dear_moments.core.pipeline.queues import FairPriorityQueue, PriorityGate
+
+
+def item(name, priority="batch", tenant=None):
+    return SimpleNamespace(name=name, priority=priority, tenant=tenant)
+
+
+def drain(queue):
+    return [queue.get_nowait().name for _ in range(queue.qsize())]
+
+
+def test_higher_priority_is_served_first():
+    async def main():
+        queue = FairPriorityQueue()
+        queue.put_nowait(item("b1"))
+        queue.put_nowait(item("i1", "interactive"))
+        queue.put_nowait(item("u1", "unknown"))
+        queue.put_nowait(item("i2", "interactive"))
+        return drain(queue)
+
+    assert asyncio.run(main()) == ["i1", "i2", "b1", "u1"]
+
+
+def test_bursty_tenant_does_not_starve_others():
+    async def main():
+        queue = FairPriorityQueue()
+        for i in range(4):
+            queue.put_nowait(item(f"a{i}", tenant="a"))
+        queue.put_nowait(item("b0", tenant="b"))
+        queue.put_nowait(item("b1", tenant="b"))
+        return drain(queue)
+
+    order = asyncio.run(main())
+    assert order.index("b0") <= 1
+    assert order.index("b1") <= 3
+    assert [n for n in order if n.startswith("a")] == ["a0", "a1", "a2", "a3"]
+
+
+def test_tenant_weights():
+    async def main():
+        queue = FairPriorityQueue(weights={"heavy": 3})
+        for i in range(6):
+            queue.put_nowait(item(f"h{i}", tenant="heavy"))
+            queue.put_nowait(item(f"l{i}", tenant="light"))
+        return drain(queue)[:4]
+
+    assert sorted(asyncio.run(main())) == ["h0", "h1", "h2", "l0"]
+
+
+def test_gate_hands_slot_to_highest_priority_waiter():
+    async def main():
+        gate = PriorityGate(1)
+        await gate.acquire("batch")
+        order = []
+
+        async def wait(priority):
+            await gate.acquire(priority)
+            order.append(priority)
+            gate.release()
+
+        tasks = [asyncio.create_task(wait(p)) for p in ("batch", "interactive")]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        return order, gate.in_use
+
+    assert asyncio.run(main()) == (["interactive", "batch"], 0)
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def main():
+        gate = PriorityGate(1)
+        await gate.acquire("batch")
+        waiter = asyncio.create_task(gate.acquire("interactive"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        gate.release()
+        return gate.in_use
+
+    assert asyncio.run(main()) == 0
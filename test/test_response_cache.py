@@ -0,0 +1,124 @@
+import asyncio
+
+import numpy as np
+
+from dear_moments.core.storage_processors.message_processor import MessageProcessor
+from dear_moments.service import Services
+from dear_moments.service.llm import CachedLLMService, LLMResponseCache, LLMService
+from dear_moments.utils.cache_scope import cache_scope
+
+
+class FakeEmbedding:
+    """所有提示词的嵌入向量相同, 任意两个提示词都满足语义匹配的阈值"""
+
+    calls = 0
+
+    async def get_embedding(self, text):
+        FakeEmbedding.calls += 1
+        return np.ones(4, dtype=np.float32)
+
+
+class FakeLLM(LLMService):
+    def __init__(self):
+        self.calls = 0
+
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
+        self.calls += 1
+        return f"回复{self.calls}: {prompt}"
+
+    async def close(self):
+        pass
+
+
+def cached_service():
+    FakeEmbedding.calls = 0
+    Services.get_instance().register_factory("EmbeddingService", FakeEmbedding)
+    backend = FakeLLM()
+    cache = LLMResponseCache(semantic_threshold=0.9)
+    return CachedLLMService(backend, cache), backend
+
+
+def test_semantic_hit_only_within_same_scope():
+    async def main():
+        service, backend = cached_service()
+        with cache_scope("alice"):
+            first = await service.get_response("我喜欢猫")
+            same_scope = await service.get_response("我很喜欢猫")
+        with cache_scope("bob"):
+            other_scope = await service.get_response("我很喜欢猫")
+        return first, same_scope, other_scope, backend.calls
+
+    first, same_scope, other_scope, calls = asyncio.run(main())
+    assert same_scope == first
+    assert other_scope != first
+    assert calls == 2
+
+
+def test_exact_hit_skips_embedding():
+    async def main():
+        service, backend = cached_service()
+        with cache_scope("alice"):
+            await service.get_response("我喜欢猫")
+            embeddings = FakeEmbedding.calls
+            await service.get_response("我喜欢猫")
+        return embeddings, backend.calls, service.cache.get_statistics()
+
+    embeddings, calls, stats = asyncio.run(main())
+    assert embeddings == 1
+    assert FakeEmbedding.calls == 1
+    assert calls == 1
+    assert stats["exact_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_unscoped_calls_only_match_exactly():
+    async def main():
+        service, backend = cached_service()
+        await service.get_response("我喜欢猫")
+        await service.get_response("我很喜欢猫")
+        await service.get_response("我喜欢猫")
+        return backend.calls
+
+    assert asyncio.run(main()) == 2
+    assert FakeEmbedding.calls == 0
+
+
+VALID_FRAME = {
+    "type": "聊天",
+    "participants": {"user": "用户", "others": []},
+    "time": "",
+    "location": "",
+    "cause": "",
+    "result": "",
+    "manner": "",
+    "facts": [],
+}
+
+
+class ScriptedLLM(FakeLLM):
+    """依次返回预先给定的结构化结果"""
+
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+
+    async def get_structured(self, prompt: str, schema: dict, prefix: str = ""):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def test_retry_after_invalid_frame_skips_cached_result():
+    async def main():
+        backend = ScriptedLLM([{"type": "缺少字段"}, VALID_FRAME])
+        service = CachedLLMService(backend, LLMResponseCache())
+        Services.get_instance().register_factory("LLMService", lambda: service)
+        processor = MessageProcessor()
+        event_frame = await processor.conversation_to_event_frame("m", "用户: 你好")
+        # 之后相同的提取直接命中重试写入的正确结果
+        replayed = await processor.conversation_to_event_frame("m", "用户: 你好")
+        return event_frame, replayed, backend.calls
+
+    event_frame, replayed, calls = asyncio.run(main())
+    assert event_frame == VALID_FRAME
+    assert replayed == VALID_FRAME
+    assert calls == 2
@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from dear_moments.cluster import cluster_request_allowed
+from dear_moments.core.pipeline import PipelineOverloadedError
+from dear_moments.server import MemoryServer
+
+
+class FakeDearMoments:
+    running = True
+    storage_pipeline = None
+    query_pipeline = None
+
+    async def store_message(self, message):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result("record-1")
+        return SimpleNamespace(future=future)
+
+    async def query(self, query_text, timeout=None, memory_id=None):
+        if query_text == "busy":
+            raise PipelineOverloadedError("过载")
+        return [{"id": "1", "item": query_text}]
+
+    async def recall(self, memory_id, timeout=None):
+        return [{"id": "2", "memory_id": memory_id}]
+
+
+def run(scenario, **kwargs):
+    async def main():
+        app = MemoryServer(FakeDearMoments(), **kwargs).create_app()
+        async with TestClient(TestServer(app, host="127.0.0.1")) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+def test_store_and_batch_results():
+    async def scenario(client):
+        single = await client.post(
+            "/v1/messages", json={"memory_id": "m", "content": "hi", "sender": "u"}
+        )
+        batch = await client.post(
+            "/v1/messages",
+            json=[
+                {"memory_id": "m", "content": "a", "sender": "u", "wait": True},
+                {"memory_id": "m"},
+            ],
+        )
+        return single.status, await batch.json()
+
+    status, results = run(scenario)
+    assert status == 202
+    assert results[0]["record_id"] == "record-1"
+    assert results[1]["status"] == "error"
+
+
+def test_query_errors_map_to_status_codes():
+    async def scenario(client):
+        ok = await client.post("/v1/query", json={"query": "q"})
+        recall = await client.post("/v1/query", json={"memory_id": "m"})
+        bad = await client.post("/v1/query", json={"top_k": 1})
+        busy = await client.post("/v1/query", json={"query": "busy"})
+        return (
+            (await ok.json())["results"][0]["item"],
+            (await recall.json())["results"][0]["memory_id"],
+            bad.status,
+            busy.status,
+            busy.headers.get("Retry-After"),
+        )
+
+    assert run(scenario) == ("q", "m", 400, 503, "1")
+
+
+def test_cluster_endpoints_require_token():
+    body = {"record_ids": [], "memory_ids": []}
+
+    async def scenario(client):
+        missing = await client.post("/v1/cluster/delete", json=body)
+        wrong = await client.post(
+            "/v1/cluster/delete", json=body, headers={"X-Cluster-Token": "x"}
+        )
+        right = await client.post(
+            "/v1/cluster/delete", json=body, headers={"X-Cluster-Token": "secret"}
+        )
+        return missing.status, wrong.status, right.status
+
+    assert run(scenario, cluster_token="secret") == (403, 403, 200)
+
+
+def test_without_token_only_loopback_is_allowed():
+    assert cluster_request_allowed({}, "127.0.0.1", None)
+    assert cluster_request_allowed({}, "::1", "")
+    assert not cluster_request_allowed({}, "10.0.0.8", None)
+    assert not cluster_request_allowed({}, None, None)
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from dear_moments.service import Services
+
+
+class Counted:
+    created = 0
+
+    def __init__(self):
+        Counted.created += 1
+
+
+def test_services_are_created_on_first_use():
+    Counted.created = 0
+    services = Services.get_instance()
+    services.register_factory("EmbeddingService", Counted)
+    assert Counted.created == 0
+
+    first = Services.embedding_service()
+    assert Services.embedding_service() is first
+    assert Counted.created == 1
+
+
+def test_concurrent_first_use_creates_once():
+    Counted.created = 0
+    services = Services.get_instance()
+    services.register_factory("KeywordIndex", Counted)
+    threads = [threading.Thread(target=Services.keyword_index) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert Counted.created == 1
+
+
+def test_warm_up_creates_remaining_services():
+    services = Services.get_instance()
+    for name in ("EmbeddingService", "LLMService", "EmbeddingDB", "KeywordIndex"):
+        services.register_factory(name, Counted)
+    existing = Services.vector_storage()
+
+    timings = services.warm_up()
+    assert set(timings) == {"EmbeddingService", "LLMService", "KeywordIndex"}
+    assert Services.vector_storage() is existing
+    assert services.warm_up() == {}
+
+
+def test_unknown_service_raises():
+    with pytest.raises(KeyError):
+        Services.get_instance()._get("Missing")
+
+
+def test_importing_services_does_not_load_backends():
+    code = (
+        "import sys; import dear_moments.service; "
+        "print(any(m.startswith('dear_moments.service.llm') for m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.strip() == "False"
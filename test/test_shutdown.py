@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from dear_moments.core.pipeline import PipelineOverloadedError
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.checkpoint import PipelineCheckpoint
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+
+
+def make_pipeline(path, prepare, finish) -> BasePipeline:
+    pipeline = BasePipeline("关闭")
+    pipeline.add_stage(PipelineStage("准备", prepare))
+    pipeline.add_stage(PipelineStage("完成", finish))
+    pipeline.checkpoint = PipelineCheckpoint(str(path))
+    return pipeline
+
+
+def test_stop_drains_queued_requests(tmp_path):
+    done = []
+
+    async def slow(item):
+        await asyncio.sleep(0.01)
+        done.append(item)
+
+    async def main():
+        pipeline = make_pipeline(tmp_path / "ckpt", lambda x: x, slow)
+        await pipeline.start()
+        for i in range(5):
+            await pipeline.process(i)
+        await pipeline.stop(drain_timeout=5)
+        with pytest.raises(RuntimeError):
+            await pipeline.process(5)
+
+    asyncio.run(main())
+    assert done == [0, 1, 2, 3, 4]
+    assert not (tmp_path / "ckpt").exists()
+
+
+def test_draining_pipeline_rejects_new_requests(tmp_path):
+    async def main():
+        release = asyncio.Event()
+
+        async def block(item):
+            await release.wait()
+
+        pipeline = make_pipeline(tmp_path / "ckpt", lambda x: x, block)
+        await pipeline.start()
+        await pipeline.process(0)
+        stopping = asyncio.create_task(pipeline.stop(drain_timeout=5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(PipelineOverloadedError):
+            await pipeline.process(1)
+        release.set()
+        await stopping
+
+    asyncio.run(main())
+
+
+def test_unfinished_requests_resume_at_their_stage(tmp_path):
+    prepared = []
+    finished = []
+
+    def prepare(item):
+        prepared.append(item)
+        return item * 10
+
+    async def hang(item):
+        await asyncio.Event().wait()
+
+    async def first_run():
+        pipeline = make_pipeline(tmp_path / "ckpt", prepare, hang)
+        await pipeline.start()
+        requests = [await pipeline.process(i) for i in range(3)]
+        await asyncio.sleep(0.05)
+        await pipeline.stop(drain_timeout=0.05)
+        return [request.future.cancelled() for request in requests]
+
+    async def second_run():
+        pipeline = make_pipeline(tmp_path / "ckpt", prepare, finished.append)
+        await pipeline.start()
+        replayed = await pipeline.replay()
+        await pipeline.stop(drain_timeout=5)
+        return replayed
+
+    assert asyncio.run(first_run()) == [True, True, True]
+    assert (tmp_path / "ckpt").exists()
+    assert asyncio.run(second_run()) == 3
+    # 准备阶段已经完成的请求不会重新执行
+    assert prepared == [0, 1, 2]
+    assert finished == [0, 10, 20]
+    assert not (tmp_path / "ckpt").exists()
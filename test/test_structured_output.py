@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from dear_moments.core.storage_processors.message_processor import MessageProcessor
+from dear_moments.service.llm import LLMService
+from dear_moments.utils.json_repair import loads_tolerant
+
+
+class TextOnlyLLM(LLMService):
+    """只实现文本接口的服务, 结构化请求走基类的默认实现"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    async def get_response(self, prompt: str, prefix: str = "") -> str:
+        self.prompts.append(prompt)
+        return self.reply
+
+    async def close(self):
+        pass
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"a": 1}', {"a": 1}),
+        ('```json\n{"a": [1, 2]}\n```', {"a": [1, 2]}),
+        ('结果如下: {"a": 1, "b": [1, 2,],} 以上', {"a": 1, "b": [1, 2]}),
+        ('{"a": 1, "b": {"c": "截断', {"a": 1, "b": {"c": "截断"}}),
+        ('[{"a": 1}, {"a": 2', [{"a": 1}, {"a": 2}]),
+    ],
+)
+def test_loads_tolerant_repairs_common_problems(text, expected):
+    assert loads_tolerant(text) == expected
+
+
+@pytest.mark.parametrize("text", ["完全不是JSON", None])
+def test_loads_tolerant_rejects_unrepairable_input(text):
+    with pytest.raises(ValueError):
+        loads_tolerant(text)
+
+
+def test_default_get_structured_sends_schema_and_parses_reply():
+    llm = TextOnlyLLM('```json\n{"type": "聊天",}\n```')
+    schema = {"type": "OBJECT", "properties": {"type": {"type": "STRING"}}}
+    result = asyncio.run(llm.get_structured("提取事件", schema))
+    assert result == {"type": "聊天"}
+    assert '"properties"' in llm.prompts[0]
+
+
+def test_validate_event_frame_accepts_text_and_rejects_incomplete_frames():
+    processor = MessageProcessor()
+    frame = (
+        '{"type": "聊天", "participants": {"user": "用户", "others": []},'
+        ' "time": "", "location": "", "cause": "", "result": "", "manner": "",'
+        ' "facts": []'
+    )
+    assert asyncio.run(processor.validate_event_frame(frame))["type"] == "聊天"
+    assert asyncio.run(processor.validate_event_frame('{"type": "聊天"}')) == {}
+    assert asyncio.run(processor.validate_event_frame("[1, 2]")) == {}
+    invalid_participants = frame.replace('{"user": "用户", "others": []}', '"用户"')
+    assert asyncio.run(processor.validate_event_frame(invalid_participants)) == {}
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from dear_moments.core.pipeline.base_pipeline import BasePipeline
+from dear_moments.core.pipeline.pipeline_stage import PipelineStage
+from dear_moments.tracing import SpanExporter, Tracer, tracer
+
+
+class ListExporter(SpanExporter):
+    def __init__(self):
+        self.spans = []
+
+    async def export(self, spans):
+        self.spans.extend(spans)
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    Tracer._instance = None
+    tracer().configure({"enabled": True, "sample_rate": 1.0, "path": str(tmp_path)})
+    tracer().exporter = ListExporter()
+    yield tracer().exporter
+    Tracer._instance = None
+
+
+def run_pipeline(*funcs):
+    async def main():
+        pipeline = BasePipeline("追踪")
+        for i, func in enumerate(funcs):
+            pipeline.add_stage(PipelineStage(f"阶段{i}", func))
+        await pipeline.start()
+        try:
+            await pipeline.process("x", wait=True)
+        except Exception:
+            pass
+        await pipeline.stop()
+        await tracer().flush()
+
+    asyncio.run(main())
+
+
+def test_stage_spans_belong_to_the_request_trace(exporter):
+    def nested(item):
+        with tracer().span("外部调用"):
+            return item
+
+    run_pipeline(str.upper, nested)
+    spans = {span.name: span for span in exporter.spans}
+    root = spans["追踪"]
+    assert root.parent_id is None
+    assert root.attributes["outcome"] == "ok"
+    for name in ("stage.阶段0", "stage.阶段1"):
+        assert spans[name].trace_id == root.trace_id
+        assert spans[name].parent_id == root.span_id
+    assert spans["外部调用"].parent_id == spans["stage.阶段1"].span_id
+
+
+def test_failed_stage_marks_span_and_trace(exporter):
+    def fail(item):
+        raise RuntimeError("坏了")
+
+    run_pipeline(fail)
+    spans = {span.name: span for span in exporter.spans}
+    assert spans["stage.阶段0"].error == "RuntimeError: 坏了"
+    assert spans["追踪"].attributes["outcome"] == "error"
+
+
+def test_unsampled_requests_create_no_spans(exporter):
+    tracer().sample_rate = 0.0
+    run_pipeline(str.upper)
+    assert exporter.spans == []
@@ -0,0 +1,101 @@
+import asyncio
+import gc
+
+import numpy as np
+import pytest
+
+from dear_moments.core.pipeline import RemoteStage
+from dear_moments.core.pipeline.transport import EmbeddingRing, RingSlot, _pack
+
+
+def embed(text):
+    """阶段进程中的处理函数, 需要是模块级函数"""
+    return {"text": text, "embedding": np.full(8, len(text), dtype=np.float32)}
+
+
+def fail(text):
+    raise KeyError(text)
+
+
+@pytest.fixture
+def ring():
+    owner = EmbeddingRing(slots=2, dim=8)
+    yield owner
+    owner.close()
+
+
+def test_ring_slots_are_reused_after_views_are_released(ring):
+    writer = ring.handle.attach()
+    first = writer.put(np.ones(8, dtype=np.float32))
+    second = writer.put(np.full(4, 2, dtype=np.float32))
+    assert {first.index, second.index} == {0, 1}
+    # 槽位用完时退回到直接传递数组
+    assert writer.put(np.ones(8, dtype=np.float32)) is None
+
+    view = ring.view(first)
+    derived = view[:2]
+    assert not view.flags.writeable
+    assert view.tolist() == [1.0] * 8
+    other = ring.view(second)
+    assert other.tolist() == [2.0] * 4
+
+    del view
+    gc.collect()
+    # 派生数组仍然引用槽位
+    assert writer.put(np.ones(8, dtype=np.float32)) is None
+    del derived
+    gc.collect()
+    reused = writer.put(np.full(8, 3, dtype=np.float32))
+    assert reused.index == first.index
+    assert ring.view(reused).tolist() == [3.0] * 8
+    del other
+    writer.close()
+
+
+def test_pack_falls_back_for_unsupported_arrays(ring):
+    message = {
+        "small": np.ones(4, dtype=np.float32),
+        "long": np.ones(16, dtype=np.float32),
+        "double": np.ones(4, dtype=np.float64),
+        "nested": [(1, "x")],
+    }
+    packed = _pack(message, ring)
+    assert isinstance(packed["small"], RingSlot)
+    assert isinstance(packed["long"], np.ndarray)
+    assert isinstance(packed["double"], np.ndarray)
+    assert packed["nested"] == [(1, "x")]
+
+
+@pytest.mark.parametrize("transport", ["queue", "unix", "shm"])
+def test_remote_stage_round_trip(transport):
+    async def main():
+        stage = RemoteStage.from_config(
+            "嵌入", embed, None, {"transport": transport, "ring_dim": 8}
+        )
+        await stage.start()
+        try:
+            results = await asyncio.gather(
+                *[stage.call("item", "x" * i) for i in range(1, 5)]
+            )
+        finally:
+            await stage.stop()
+        return results
+
+    results = asyncio.run(main())
+    assert [r["embedding"].tolist() for r in results] == [
+        [float(i)] * 8 for i in range(1, 5)
+    ]
+
+
+def test_remote_stage_error_reaches_caller():
+    async def main():
+        stage = RemoteStage.from_config("失败", fail, None, {"transport": "queue"})
+        await stage.start()
+        try:
+            await stage.call("item", "k")
+        finally:
+            await stage.stop()
+
+    with pytest.raises(Exception) as error:
+        asyncio.run(main())
+    assert "k" in str(error.value)